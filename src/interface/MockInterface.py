@@ -16,6 +16,7 @@ from RHInterface import FW_TEXT_BLOCK_SIZE, FW_VERSION_PREFIXSTR, \
 logger = logging.getLogger(__name__)
 
 UPDATE_SLEEP = float(os.environ.get('RH_UPDATE_INTERVAL', '0.5')) # Main update loop delay
+MOCK_SEED = os.environ.get('RH_MOCK_SEED') # Seed for repeatable mock signal generation
 
 MIN_RSSI_VALUE = 1               # reject RSSI readings below this value
 MAX_RSSI_VALUE = 999             # reject RSSI readings above this value
@@ -30,6 +31,7 @@ class MockInterface(BaseHardwareInterface):
         self.FW_PROCTYPE_PREFIXSTR = FW_PROCTYPE_PREFIXSTR
         self.update_thread = None # Thread for running the main update loop
         self.marshal_type = MarshalType.FULL_RSSI
+        self.random = random.Random(MOCK_SEED)
 
         self.config = kwargs['config'] # provides access to RH config
         self.nodes = [] # Array to hold each node object
@@ -93,7 +95,7 @@ class MockInterface(BaseHardwareInterface):
                 match self.config.get_item('GENERAL', 'MOCK_NODE_SIGNAL'):
                     case 2:
                         if self.mocknodedata[index]['is_crossing']:
-                            new_rssi = random.randrange(60,150)
+                            new_rssi = self.random.randrange(60,150)
                             pass_peak_rssi = max(self.mocknodedata[index]['pass_peak_rssi'], new_rssi)
                             node_data = {
                                 'lap_id': self.mocknodedata[index]['lap_number'],
@@ -112,11 +114,11 @@ class MockInterface(BaseHardwareInterface):
                                 'pn_history.nadirFirstTime': 0,
                                 'pn_history.nadirLastTime': 0
                             }
-                            if random.random() < 0.5:
+                            if self.random.random() < 0.5:
                                 self.mocknodedata[index]['is_crossing'] = False
                                 self.mocknodedata[index]['pass_nadir_rssi'] = 100
                         else:
-                            new_rssi = random.randrange(20,40)
+                            new_rssi = self.random.randrange(20,40)
                             pass_nadir_rssi = min(self.mocknodedata[index]['pass_nadir_rssi'], new_rssi)
                             node_data = {
                                 'lap_id': self.mocknodedata[index]['lap_number'],
@@ -135,7 +137,7 @@ class MockInterface(BaseHardwareInterface):
                                 'pn_history.nadirFirstTime': 0,
                                 'pn_history.nadirLastTime': 0
                             }
-                            if random.random() < 0.05:
+                            if self.random.random() < 0.05:
                                 self.mocknodedata[index]['lap_number'] += 1
                                 self.mocknodedata[index]['is_crossing'] = True
                                 self.mocknodedata[index]['pass_peak_rssi'] = 0
@@ -252,6 +254,16 @@ class MockInterface(BaseHardwareInterface):
     def force_end_crossing(self, node_index):
         pass
 
+    def mock_pass(self, node_index, lap_timestamp, peak_rssi=None):
+        '''Records a pass at the given monotonic timestamp as if detected by the node.'''
+        node = self.nodes[node_index]
+        node.lap_timestamp = lap_timestamp
+        node.enter_at_timestamp = node.exit_at_timestamp = 0
+        if peak_rssi is not None:
+            node.pass_peak_rssi = peak_rssi
+        if callable(self.pass_record_callback):
+            self.pass_record_callback(node, lap_timestamp, BaseHardwareInterface.LAP_SOURCE_REALTIME, peak=node.pass_peak_rssi)  #pylint: disable=not-callable
+
     def jump_to_bootloader(self):
         self.log("MockInterace - no jump-to-bootloader support")
 
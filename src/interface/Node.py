@@ -2,6 +2,8 @@
 
 class Node:
     '''Node class represents the arduino/rx pair.'''
+    concurrent_reads = False  # lap stats may be read alongside other nodes' reads
+
     def __init__(self):
         self.provider = None
         self.provider_type = None
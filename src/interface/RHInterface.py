@@ -6,6 +6,7 @@ import gevent # For threads and timing
 from time import monotonic # to capture read timing
 
 from Plugins import Plugins
+from util.Metrics import metrics
 from BaseHardwareInterface import BaseHardwareInterface, PeakNadirHistory, MarshalType
 
 READ_ADDRESS = 0x00         # Gets i2c address of arduino (1 byte)
@@ -220,33 +221,56 @@ class RHInterface(BaseHardwareInterface):
                 logger.exception('Exception in RHInterface update_loop():')
                 gevent.sleep(UPDATE_SLEEP*10)
 
+    def read_lap_stats(self, node):
+        '''Returns (data, readtime) for the node's current lap stats'''
+        if node.api_valid_flag or node.api_level >= 5:
+            if node.api_level >= 32:
+                data = node.read_block(self, READ_LAP_PASS_STATS, 8)
+                if data != None:
+                    data.extend(node.read_block(self, READ_LAP_EXTREMUMS, 8))
+            elif node.api_level >= 21:
+                data = node.read_block(self, READ_LAP_STATS, 16)
+            elif node.api_level >= 18:
+                data = node.read_block(self, READ_LAP_STATS, 19)
+            elif node.api_level >= 17:
+                data = node.read_block(self, READ_LAP_STATS, 28)
+            elif node.api_level >= 13:
+                data = node.read_block(self, READ_LAP_STATS, 20)
+            else:
+                data = node.read_block(self, READ_LAP_STATS, 18)
+            server_roundtrip = node.io_response - node.io_request
+            server_oneway = server_roundtrip / 2
+            readtime = node.io_response - server_oneway
+        else:
+            data = node.read_block(self, READ_LAP_STATS, 17)
+            readtime = 0
+        return data, readtime
+
+    def prefetch_lap_stats(self):
+        '''
+        Reads lap stats of nodes that support concurrent reads in parallel
+        greenlets, so each device's post-transaction chill time overlaps with
+        reads of the other devices (and buses). Returns {node.index: (data, readtime)}.
+        '''
+        nodes = [node for node in self.nodes if node.frequency and node.concurrent_reads]
+        if len(nodes) < 2:
+            return {}
+        jobs = [(node, gevent.spawn(self.read_lap_stats, node)) for node in nodes]
+        gevent.joinall([job for _node, job in jobs])
+        return {node.index: job.get() for node, job in jobs}
+
+    @metrics.timed('rh_interface_update_seconds', 'Time for one node interface update pass')
     def update(self):
         upd_list = []  # list of nodes with new laps (node, new_lap_id, lap_timestamp)
         cross_list = []  # list of nodes with crossing-flag changes
         startThreshLowerNode = None
+        prefetched = self.prefetch_lap_stats()
         for node in self.nodes:
             if node.frequency:
-                if node.api_valid_flag or node.api_level >= 5:
-                    if node.api_level >= 32:
-                        data = node.read_block(self, READ_LAP_PASS_STATS, 8)
-                        if data != None:
-                            data.extend(node.read_block(self, READ_LAP_EXTREMUMS, 8))
-                    elif node.api_level >= 21:
-                        data = node.read_block(self, READ_LAP_STATS, 16)
-                    elif node.api_level >= 18:
-                        data = node.read_block(self, READ_LAP_STATS, 19)
-                    elif node.api_level >= 17:
-                        data = node.read_block(self, READ_LAP_STATS, 28)
-                    elif node.api_level >= 13:
-                        data = node.read_block(self, READ_LAP_STATS, 20)
-                    else:
-                        data = node.read_block(self, READ_LAP_STATS, 18)
-                    server_roundtrip = node.io_response - node.io_request
-                    server_oneway = server_roundtrip / 2
-                    readtime = node.io_response - server_oneway
+                if node.index in prefetched:
+                    data, readtime = prefetched[node.index]
                 else:
-                    data = node.read_block(self, READ_LAP_STATS, 17)
-                    readtime = 0
+                    data, readtime = self.read_lap_stats(node)
 
                 if data != None and len(data) > 0:
                     lap_id = data[0]
@@ -0,0 +1,133 @@
+'''
+Sensor reading history.
+
+Fixed-size numeric ring buffers holding min/max/mean aggregates of a sensor
+reading at several resolutions. Samples are folded into the finest tier; each
+closed bucket is pushed into its tier's ring and cascaded into the next
+(coarser) tier, so memory use is constant however long the server runs.
+
+'''
+
+from array import array
+
+# (bucket seconds, bucket count): 10 minutes at 1 s, 8 hours at 1 min, 24 hours at 10 min
+DEFAULT_TIERS = ((1, 600), (60, 480), (600, 144))
+
+class RingBuffer:
+    '''Fixed number of (time, min, max, mean) entries; oldest entries are overwritten'''
+
+    def __init__(self, size):
+        self.size = size
+        self.times = array('d', [0.0]) * size
+        self.mins = array('d', [0.0]) * size
+        self.maxs = array('d', [0.0]) * size
+        self.means = array('d', [0.0]) * size
+        self.index = 0  # next slot to write
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, min_val, max_val, mean_val):
+        idx = self.index
+        self.times[idx] = timestamp
+        self.mins[idx] = min_val
+        self.maxs[idx] = max_val
+        self.means[idx] = mean_val
+        self.index = (idx + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def indices(self):
+        '''Slot indices, oldest first'''
+        start = (self.index - self.count) % self.size
+        return [(start + i) % self.size for i in range(self.count)]
+
+class HistoryTier:
+    '''Ring buffer plus the bucket currently being accumulated'''
+
+    def __init__(self, period, size):
+        self.period = period
+        self.buffer = RingBuffer(size)
+        self.bucket_start = None
+        self.min_val = 0.0
+        self.max_val = 0.0
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, timestamp, min_val, max_val, total, count):
+        '''
+        Fold an aggregate into the open bucket. Returns the aggregate of the
+        bucket that was closed by this sample, or None.
+        '''
+        bucket_start = timestamp - (timestamp % self.period)
+        closed = None
+        if self.count and bucket_start != self.bucket_start:
+            closed = self.close()
+        if not self.count:
+            self.bucket_start = bucket_start
+            self.min_val = min_val
+            self.max_val = max_val
+            self.total = total
+            self.count = count
+        else:
+            if min_val < self.min_val:
+                self.min_val = min_val
+            if max_val > self.max_val:
+                self.max_val = max_val
+            self.total += total
+            self.count += count
+        return closed
+
+    def close(self):
+        closed = (self.bucket_start, self.min_val, self.max_val, self.total, self.count)
+        self.buffer.append(self.bucket_start, self.min_val, self.max_val, self.total / self.count)
+        self.count = 0
+        return closed
+
+    def get(self, since=None):
+        '''Columns of bucket start times and aggregates, oldest first, including the open bucket'''
+        buf = self.buffer
+        result = {'time': [], 'min': [], 'max': [], 'mean': []}
+        for idx in buf.indices():
+            if since is None or buf.times[idx] >= since:
+                result['time'].append(buf.times[idx])
+                result['min'].append(buf.mins[idx])
+                result['max'].append(buf.maxs[idx])
+                result['mean'].append(buf.means[idx])
+        if self.count and (since is None or self.bucket_start >= since):
+            result['time'].append(self.bucket_start)
+            result['min'].append(self.min_val)
+            result['max'].append(self.max_val)
+            result['mean'].append(self.total / self.count)
+        return result
+
+class ReadingHistory:
+    '''Downsampled history of one numeric reading'''
+
+    def __init__(self, tiers=DEFAULT_TIERS, units=None):
+        self.units = units
+        self.tiers = [HistoryTier(period, size) for period, size in tiers]
+
+    def add(self, timestamp, value):
+        aggregate = (timestamp, value, value, value, 1)
+        for tier in self.tiers:
+            aggregate = tier.add(*aggregate)
+            if aggregate is None:
+                break
+
+    def resolutions(self):
+        return [tier.period for tier in self.tiers]
+
+    def get(self, resolution=None, since=None):
+        '''History at the finest tier no finer than resolution (seconds); coarsest tier if none is'''
+        tier = self.tiers[-1]
+        if resolution is not None:
+            for candidate in self.tiers:
+                if candidate.period >= resolution:
+                    tier = candidate
+                    break
+        result = tier.get(since)
+        result['resolution'] = tier.period
+        result['units'] = self.units
+        return result
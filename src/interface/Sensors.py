@@ -1,10 +1,22 @@
+import logging
+import numbers
+from time import time
+import gevent
 from Plugins import Plugins
+from SensorHistory import ReadingHistory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL = 10  # seconds between sensor updates
 
 class Sensors(Plugins):
     def __init__(self):
         Plugins.__init__(self, suffix='sensor')
         self.sensors_dict = {}
         self.environmental_data_update_tracker = 0
+        self.sample_intervals = {}  # sensor name -> seconds, from 'interval' in sensor config
+        self.history = {}  # sensor name -> reading name -> ReadingHistory
+        self.sampler_greenlets = []
 
     def update_environmental_data(self):
         '''Updates environmental data.'''
@@ -21,3 +33,65 @@ class Sensors(Plugins):
             self.data = []             # but just in case
         for sensor in self.data:
             self.sensors_dict[sensor.name] = sensor
+        config = kwargs.get('config') or {}
+        for sensor_config in config.values():
+            if isinstance(sensor_config, dict) and 'name' in sensor_config and 'interval' in sensor_config:
+                self.sample_intervals[sensor_config['name']] = sensor_config['interval']
+
+    def record(self, sensor, timestamp=None):
+        '''Adds the sensor's current (cached) numeric readings to its history'''
+        if timestamp is None:
+            timestamp = time()
+        sensor_history = self.history.setdefault(sensor.name, {})
+        for reading_name, reading in sensor.getReadings().items():
+            value = reading['value']
+            if isinstance(value, numbers.Real) and not isinstance(value, bool):
+                reading_history = sensor_history.get(reading_name)
+                if reading_history is None:
+                    reading_history = ReadingHistory(units=reading['units'])
+                    sensor_history[reading_name] = reading_history
+                reading_history.add(timestamp, value)
+
+    def sample(self, sensor):
+        sensor.update()
+        self.record(sensor)
+
+    def start_sampling(self, default_interval=DEFAULT_SAMPLE_INTERVAL):
+        '''Samples each sensor in its own greenlet, so a slow sensor only delays itself'''
+        if self.sampler_greenlets:
+            return
+        for index, sensor in enumerate(self.data):
+            interval = self.sample_intervals.get(sensor.name, default_interval)
+            # stagger start times so sensors on a shared bus are not read together
+            offset = interval * index / len(self.data)
+            self.sampler_greenlets.append(gevent.spawn_later(offset, self._sample_loop, sensor, interval))
+        if self.sampler_greenlets:
+            logger.debug('Sensor sampling started for {0} sensors'.format(len(self.sampler_greenlets)))
+
+    def stop_sampling(self):
+        if self.sampler_greenlets:
+            gevent.killall(self.sampler_greenlets, block=True, timeout=0.5)
+            self.sampler_greenlets = []
+            logger.debug('Sensor sampling stopped')
+
+    def _sample_loop(self, sensor, interval):
+        while True:
+            try:
+                self.sample(sensor)
+            except Exception as ex:
+                logger.warning('Error sampling sensor {0}: {1}'.format(sensor.name, ex))
+            gevent.sleep(interval)
+
+    def get_history(self, sensor_name, reading_name=None, resolution=None, since=None):
+        '''
+        Recorded history of one reading, or of all readings of the sensor
+        (dict by reading name) when reading_name is None. Returns None for an
+        unknown sensor or reading.
+        '''
+        sensor_history = self.history.get(sensor_name)
+        if sensor_history is None:
+            return None
+        if reading_name is not None:
+            reading_history = sensor_history.get(reading_name)
+            return reading_history.get(resolution, since) if reading_history else None
+        return {name: reading_history.get(resolution, since) for name, reading_history in sensor_history.items()}
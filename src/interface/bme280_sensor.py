@@ -33,13 +33,13 @@ def discover(config, i2c_helper, *args, **kwargs):
     sensors = []
     supported_bme280_addrs = [0x76, 0x77]
     for addr in supported_bme280_addrs:
-        url = I2CSensor.url(addr)
-        sensor_config = config.get(url, {})
-        name = sensor_config.get('name', "Climate")
-        try:
-            sensors.append(BME280Sensor(name, addr, i2c_helper))
-            logger.info("BME280 found at address 0x{:02x} ('{}')".format(addr, name))
-        except IOError:
-            if sensor_config:
-                logger.info("No BME280 found at address 0x{:02x}".format(addr))
+        for i2c_bus, url in I2CSensor.bus_urls(i2c_helper, addr):
+            sensor_config = config.get(url, {})
+            name = sensor_config.get('name', "Climate")
+            try:
+                sensors.append(BME280Sensor(name, addr, i2c_bus))
+                logger.info("BME280 found at address 0x{:02x} ('{}')".format(addr, name))
+            except IOError:
+                if sensor_config:
+                    logger.info("No BME280 found at address 0x{:02x}".format(addr))
     return sensors
@@ -5,54 +5,171 @@ try:
 except:
     from smbus import SMBus
 import gevent
+import gevent.event
+import gevent.lock
 import os
 import logging
 from time import monotonic
+from util.Metrics import metrics
 
-I2C_CHILL_TIME = float(os.environ.get('RH_I2C_SLEEP', '0.015')) # Delay after i2c read/write
+I2C_CHILL_TIME = float(os.environ.get('RH_I2C_SLEEP', '0.015')) # Delay after i2c read/write to the same device
+
+# transaction priorities; lower values are served first
+PRIORITY_NODE = 0    # lap-stat reads/writes to timer nodes
+PRIORITY_SENSOR = 1  # sensor reads, deferred while node transactions are waiting
 
 logger = logging.getLogger(__name__)
 
 
 class I2CBus(object):
-    def __init__(self, bus):
-        self.i2c = SMBus(bus) # Start i2c bus
+    '''
+    Schedules transactions on one I2C bus. Transactions are serialized, but
+    the chill time is tracked per device address, so a transaction to one
+    device does not wait out the chill time of another. Sensor-priority
+    transactions yield to any waiting node-priority transactions.
+    '''
+    def __init__(self, bus, i2c=None):
+        self.i2c = i2c if i2c is not None else SMBus(bus) # Start i2c bus
         self.i2c_rlock_obj = gevent.lock.RLock()  # for limiting i2c to 1 read/write at a time
+        self.i2c_owner = None  # greenlet holding the bus
+        self.i2c_depth = 0  # nested transactions of the owner
         self.i2c_timestamp = -1
         self.i2c_busnum = bus
+        self.device_timestamps = {}  # addr -> end time of last transaction
+        self.pending_node_count = 0  # node-priority transactions waiting for the bus
+        self.node_idle_event = gevent.event.Event()
+        self.node_idle_event.set()
+        self.stats_start = monotonic()
+        self.busy_time = 0
+        self.transaction_count = 0
 
-    def i2c_end(self):
+    def i2c_end(self, addr=None):
         self.i2c_timestamp = monotonic()
+        if addr is not None:
+            self.device_timestamps[addr] = self.i2c_timestamp
 
-    def i2c_sleep(self):
-        if self.i2c_timestamp == -1:
+    def i2c_sleep(self, addr=None):
+        timestamp = self.i2c_timestamp if addr is None else self.device_timestamps.get(addr, -1)
+        if timestamp == -1:
             return
-        time_remaining = self.i2c_timestamp + I2C_CHILL_TIME - monotonic()
+        time_remaining = timestamp + I2C_CHILL_TIME - monotonic()
         if (time_remaining > 0):
             # print("i2c sleep {0}".format(time_remaining))
             gevent.sleep(time_remaining)
 
-    def with_i2c(self, callback):
+    def _acquire(self, priority):
+        if self.i2c_owner is gevent.getcurrent():
+            self.i2c_rlock_obj.acquire()  # nested inside a transaction already holding the bus
+        elif priority == PRIORITY_NODE:
+            self.pending_node_count += 1
+            self.node_idle_event.clear()
+            try:
+                self.i2c_rlock_obj.acquire()
+            finally:
+                self.pending_node_count -= 1
+                if self.pending_node_count == 0:
+                    self.node_idle_event.set()
+        else:
+            while True:
+                self.node_idle_event.wait()
+                self.i2c_rlock_obj.acquire()
+                if self.pending_node_count == 0:
+                    break
+                self.i2c_rlock_obj.release()  # node transaction arrived meanwhile; let it go first
+        self.i2c_owner = gevent.getcurrent()
+        self.i2c_depth += 1
+
+    def _release(self):
+        self.i2c_depth -= 1
+        if self.i2c_depth == 0:
+            self.i2c_owner = None
+        self.i2c_rlock_obj.release()
+
+    def with_i2c(self, callback, addr=None, priority=PRIORITY_NODE):
+        '''
+        Run callback as one bus transaction. With an addr the chill time is
+        waited out per device (without holding the bus); without one, the
+        bus-wide chill time applies as before.
+        '''
         val = None
         if callable(callback):
-            with self.i2c_rlock_obj:
-                self.i2c_sleep()
-                val = callback()
-                self.i2c_end()
+            if addr is not None:
+                self.i2c_sleep(addr)
+            self._acquire(priority)
+            try:
+                self.i2c_sleep(addr)
+                start = monotonic()
+                try:
+                    val = callback()
+                finally:
+                    self.i2c_end(addr)
+                    self._record(start, priority)
+            finally:
+                self._release()
         return val
 
-    def with_i2c_quietly(self, callback):
+    def with_i2c_quietly(self, callback, addr=None, priority=PRIORITY_SENSOR):
         try:
-            self.with_i2c(callback)
+            self.with_i2c(callback, addr, priority)
         except IOError as err:
             logger.info('I2C error: {0}'.format(err))
-            self.i2c_end()
+            self.i2c_end(addr)
+
+    def _record(self, start, priority):
+        duration = self.i2c_timestamp - start
+        self.busy_time += duration
+        self.transaction_count += 1
+        metrics.observe('rh_i2c_transaction_seconds', duration, 'I2C transaction time',
+                        labels={'bus': self.i2c_busnum, 'priority': 'node' if priority == PRIORITY_NODE else 'sensor'})
+
+    def get_utilization(self):
+        '''Fraction of time the bus was busy with transactions since the last call'''
+        now = monotonic()
+        elapsed = now - self.stats_start
+        utilization = self.busy_time / elapsed if elapsed > 0 else 0
+        stats = {
+            'bus': self.i2c_busnum,
+            'utilization': utilization,
+            'transactions': self.transaction_count,
+        }
+        metrics.set('rh_i2c_bus_utilization', utilization, 'Fraction of time the I2C bus was busy',
+                    labels={'bus': self.i2c_busnum})
+        self.stats_start = now
+        self.busy_time = 0
+        self.transaction_count = 0
+        return stats
 
     def get_i2c_busnum(self):
         return self.i2c_busnum
 
+    def get_buses(self):
+        return [self]
+
+
+class I2CBusGroup(object):
+    '''
+    Several I2C buses used together (I2C_BUS configured as a list). Buses have
+    independent schedulers, so transactions on different buses do not wait on
+    each other. Attribute access falls through to the first bus for callers
+    that expect a single bus.
+    '''
+    def __init__(self, buses):
+        self.buses = buses
+
+    def __getattr__(self, name):
+        return getattr(self.buses[0], name)
+
+    def get_utilization(self):
+        return [bus.get_utilization() for bus in self.buses]
+
+    def get_buses(self):
+        return list(self.buses)
+
 
 def create(config):
     bus = config.get_item('HARDWARE', 'I2C_BUS')
+    if isinstance(bus, (list, tuple)):
+        logger.debug('Starting I2C on buses {0}'.format(bus))
+        return I2CBusGroup([I2CBus(num) for num in bus])
     logger.debug('Starting I2C on bus {0}'.format(bus))
     return I2CBus(bus)
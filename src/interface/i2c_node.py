@@ -3,6 +3,8 @@ import logging
 from time import monotonic
 
 from Node import Node
+from util.Metrics import metrics
+from i2c_helper import PRIORITY_NODE
 from RHInterface import READ_ADDRESS, READ_REVISION_CODE, MAX_RETRY_COUNT, \
                         READ_FW_VERSION, READ_FW_BUILDDATE, READ_FW_BUILDTIME, \
                         FW_TEXT_BLOCK_SIZE, validate_checksum, calculate_checksum, \
@@ -12,6 +14,8 @@ logger = logging.getLogger(__name__)
 
 
 class I2CNode(Node):
+    concurrent_reads = True  # bus scheduler interleaves reads across nodes
+
     def __init__(self, index, addr, i2c_helper):
         Node.__init__(self)
         self.index = index
@@ -36,10 +40,12 @@ class I2CNode(Node):
                         return _data
                     else:
                         return None
-                data = self.i2c_helper.with_i2c(_read)
+                data = self.i2c_helper.with_i2c(_read, self.i2c_addr, PRIORITY_NODE)
                 if data:
                     success = True
                     data = data[:-1]
+                    metrics.observe('rh_node_read_seconds', self.io_response - self.io_request,
+                                    'Node read_block round-trip time', labels={'interface': 'i2c'})
                 else:
                     # self.log('Invalid Checksum ({0}): {1}'.format(retry_count, data))
                     retry_count = retry_count + 1
@@ -51,7 +57,7 @@ class I2CNode(Node):
                     self.inc_read_error_count(interface)
             except IOError as err:
                 interface.log('Read Error: ' + str(err))
-                self.i2c_helper.i2c_end()
+                self.i2c_helper.i2c_end(self.i2c_addr)
                 retry_count = retry_count + 1
                 if retry_count <= max_retries:
                     if retry_count > 1:  # don't log the occasional single retry
@@ -79,12 +85,12 @@ class I2CNode(Node):
                     self.i2c_helper.i2c.write_i2c_block_data(self.i2c_addr, command, data_with_checksum)
                     # self.io_response = monotonic()
                     return True
-                success = self.i2c_helper.with_i2c(_write)
+                success = self.i2c_helper.with_i2c(_write, self.i2c_addr, PRIORITY_NODE)
                 if success is None:
                     success = False
             except IOError as err:
                 interface.log('Write Error: ' + str(err))
-                self.i2c_helper.i2c_end()
+                self.i2c_helper.i2c_end(self.i2c_addr)
                 retry_count = retry_count + 1
                 if retry_count <= MAX_RETRY_COUNT:
                     interface.log('Retry (IOError) in write_block:  addr={0} cmd={1} data={2} retry={3} ts={4}'.format(self.i2c_addr, command, data, retry_count, self.i2c_helper.i2c_timestamp))
@@ -145,11 +151,22 @@ def discover(idxOffset, i2c_helper, isS32BPillFlag=False, *args, **kwargs):
     if not isS32BPillFlag:
         logger.info("Searching for I2C nodes...")
     nodes = []
+    for i2c_bus in i2c_helper.get_buses():
+        bus_nodes = discover_bus(idxOffset, i2c_bus, isS32BPillFlag)
+        if bus_nodes:
+            idxOffset = bus_nodes[-1].index + 1
+            nodes.extend(bus_nodes)
+        elif isS32BPillFlag:
+            break
+    return nodes
+
+def discover_bus(idxOffset, i2c_helper, isS32BPillFlag=False):
+    nodes = []
     # Scans all i2c_addrs to populate nodes array
     i2c_addrs = [8, 10, 12, 14, 16, 18, 20, 22] # Software limited to 8 nodes
     for index, addr in enumerate(i2c_addrs):
         try:
-            i2c_helper.i2c.read_i2c_block_data(addr, READ_ADDRESS, 1)
+            i2c_helper.with_i2c(lambda: i2c_helper.i2c.read_i2c_block_data(addr, READ_ADDRESS, 1), addr)
             node = I2CNode(index+idxOffset, addr, i2c_helper) # New node instance
             # read NODE_API_LEVEL and verification value:
             data = node.read_block(None, READ_REVISION_CODE, 2, 2)
@@ -181,8 +198,8 @@ def discover(idxOffset, i2c_helper, isS32BPillFlag=False, *args, **kwargs):
         except IOError:
             if not isS32BPillFlag:
                 logger.info("...No I2C node at address {0}".format(addr))
-        i2c_helper.i2c_end()
-        i2c_helper.i2c_sleep()
+        i2c_helper.i2c_end(addr)
+        i2c_helper.i2c_sleep(addr)
         if isS32BPillFlag and len(nodes) == 0:
             break  # if S32_BPill and first I2C node not found then stop trying
     return nodes
@@ -40,13 +40,13 @@ def discover(config, i2c_helper, *args, **kwargs):
     sensors = []
     supported_ina219_addrs = [0x40, 0x41, 0x44, 0x45]
     for addr in supported_ina219_addrs:
-        url = I2CSensor.url(addr)
-        sensor_config = config.get(url, {})
-        name = sensor_config.get('name', "Battery")
-        try:
-            sensors.append(INA219Sensor(name, addr, i2c_helper, sensor_config))
-            logger.info("INA219 found at address 0x{:02x} ('{}')".format(addr, name))
-        except IOError:
-            if sensor_config:
-                logger.info("No INA219 found at address 0x{:02x}".format(addr))
+        for i2c_bus, url in I2CSensor.bus_urls(i2c_helper, addr):
+            sensor_config = config.get(url, {})
+            name = sensor_config.get('name', "Battery")
+            try:
+                sensors.append(INA219Sensor(name, addr, i2c_bus, sensor_config))
+                logger.info("INA219 found at address 0x{:02x} ('{}')".format(addr, name))
+            except IOError:
+                if sensor_config:
+                    logger.info("No INA219 found at address 0x{:02x}".format(addr))
     return sensors
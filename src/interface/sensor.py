@@ -33,12 +33,22 @@ class Sensor:
 
 class I2CSensor(Sensor):
     @staticmethod
-    def url(addr):
-        return 'i2c:' + hex(addr)
+    def url(addr, busnum=None):
+        if busnum is None:
+            return 'i2c:' + hex(addr)
+        return 'i2c:' + str(busnum) + ':' + hex(addr)
+
+    @staticmethod
+    def bus_urls(i2c_helper, addr):
+        '''(bus, url) for each bus; sensors on the first bus keep the plain address url'''
+        buses = i2c_helper.get_buses()
+        return [(i2c_bus, I2CSensor.url(addr, i2c_bus.get_i2c_busnum() if idx > 0 else None)) \
+                for idx, i2c_bus in enumerate(buses)]
 
     def __init__(self, name, i2c_helper):
         Sensor.__init__(self, name)
         self.i2c_helper = i2c_helper
 
     def update(self):
-        self.i2c_helper.with_i2c_quietly(self.readData)
+        # sensor priority: deferred while node reads are waiting for the bus
+        self.i2c_helper.with_i2c_quietly(self.readData, self.address)
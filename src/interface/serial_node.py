@@ -7,6 +7,7 @@ import time
 from time import monotonic
 
 from Node import Node
+from util.Metrics import metrics
 from RHInterface import READ_REVISION_CODE, READ_MULTINODE_COUNT, MAX_RETRY_COUNT, \
                         validate_checksum, calculate_checksum, pack_8, pack_16, unpack_8, unpack_16, \
                         WRITE_CURNODE_INDEX, READ_CURNODE_INDEX, READ_NODE_SLOTIDX, \
@@ -63,6 +64,8 @@ class SerialNode(Node):
                         if len(data) == size + 1:
                             success = True
                             data = data[:-1]
+                            metrics.observe('rh_node_read_seconds', self.io_response - self.io_request,
+                                            'Node read_block round-trip time', labels={'interface': 'serial'})
                         else:
                             retry_count = retry_count + 1
                             if check_multi_flag:  # log and count if regular query
@@ -24,6 +24,9 @@ class ANSIPixel:
     def setPixelColor(self, i, color):
         self.pixels[i] = color
 
+    def setPixels(self, colors):
+        self.pixels[:len(colors)] = colors
+
     def getPixelColor(self, i):
         return self.pixels[i]
 
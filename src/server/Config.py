@@ -46,6 +46,7 @@ class Config:
         self.config['LED']['LED_ROWS'] = 1  # Number of rows in LED array
         self.config['LED']['PANEL_ROTATE'] = 0
         self.config['LED']['INVERTED_PANEL_ROWS'] = False
+        self.config['LED']['PANEL_COUNT'] = 1  # Number of panels chained side by side (LED_ROWS rows each)
         self.config['LED']['SERIAL_CTRLR_PORT'] = None      # Serial port for LED-controller module
         self.config['LED']['SERIAL_CTRLR_BAUD'] = 115200    # Serial baud rate for LED-controller module
 
@@ -78,11 +79,17 @@ class Config:
         self.config['GENERAL']['SHUTDOWN_BUTTON_GPIOPIN'] = 18
         self.config['GENERAL']['SHUTDOWN_BUTTON_DELAYMS'] = 2500
         self.config['GENERAL']['DB_AUTOBKP_NUM_KEEP'] = 30
+        self.config['GENERAL']['DB_AUTOBKP_RACE_INTERVAL'] = 0  # back up database after every N saved races (0=off)
+        self.config['GENERAL']['DB_BKP_COMPRESS'] = False  # gzip database backup files
+        self.config['GENERAL']['DB_BKP_VERIFY'] = True  # integrity-check database backup files
         self.config['GENERAL']['RACE_START_DELAY_EXTRA_SECS'] = 0.9  # amount of extra time added to prestage time
         self.config['GENERAL']['LOG_SENSORS_DATA_RATE'] = 300  # rate at which to log sensor data
+        self.config['GENERAL']['SENSOR_SAMPLE_INTERVAL'] = 10  # default seconds between sensor samples
         self.config['GENERAL']['SERIAL_PORTS'] = []
         self.config['GENERAL']['MOCK_NODES'] = 0
         self.config['GENERAL']['MOCK_NODE_SIGNAL'] = 0
+        self.config['GENERAL']['METRICS'] = False  # collect timing metrics for /api/metrics
+        self.config['GENERAL']['IMDTABLER_CROSS_CHECK'] = False  # compare IMD rating against IMDTabler.jar at startup
         self.config['GENERAL']['LAST_MODIFIED_TIME'] = 0
 
         self.config['SECRETS']['ADMIN_USERNAME'] = 'admin'
@@ -112,6 +119,7 @@ class Config:
         self.config['TIMING']['startThreshLowerAmount'] = '0'
         self.config['TIMING']['startThreshLowerDuration'] = '0'
         self.config['TIMING']['calibrationMode'] = 1
+        self.config['TIMING']['autoFrequencyIMD'] = 0  # use IMD-aware planner for auto-frequency heats
         self.config['TIMING']['MinLapBehavior'] = 0
 
         # user-specified behavior
@@ -2,9 +2,13 @@
 Database module
 '''
 
+import collections
+import itertools
+import re
+import weakref
 import sqlalchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, scoped_session, sessionmaker, declarative_base
 import RHUtils
 import logging
 logger = logging.getLogger(__name__)
@@ -19,6 +23,102 @@ DB = sqlalchemy
 DB_POOL_SIZE=10
 DB_MAX_OVERFLOW=100
 
+# Write counters per table, for caches built from query results. Counted
+#  for every flush and every insert/update/delete statement run through a
+#  session, and for statements that write on other connections of the
+#  engine; 'DB_generation' changes whenever a database is (re)opened.
+#  Writes made outside the engine (a separate sqlite3 connection, another
+#  process) are not seen; call note_writes() after them.
+table_writes = collections.Counter()
+DB_generation = 0
+
+# For tables passed to watch_rows(): the table write count at the last
+#  flush touching each row id, and at the last statement not tied to ids.
+row_writes = {}
+unkeyed_writes = collections.Counter()
+
+@event.listens_for(Session, 'after_flush')
+def _count_flush_writes(session, _flush_context):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            table_writes[table] += 1
+            if table in row_writes:
+                row_writes[table][obj.id] = table_writes[table]
+
+@event.listens_for(Session, 'do_orm_execute')
+def _count_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(getattr(orm_execute_state.statement, 'table', None), 'name', None)
+        table_writes[table] += 1
+        if table in row_writes:
+            unkeyed_writes[table] = table_writes[table]
+
+# Connections in use by sessions; their insert/update/delete statements are counted by the events above
+session_connections = weakref.WeakSet()
+
+@event.listens_for(Session, 'after_begin')
+def _track_session_connection(_session, _transaction, connection):
+    session_connections.add(connection)
+
+UNWRITTEN_STATEMENT = re.compile(r'\s*(SELECT|PRAGMA|EXPLAIN|VACUUM|ANALYZE|REINDEX|BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+WRITE_STATEMENT = re.compile(r'\s*(?:INSERT|REPLACE|UPDATE|DELETE)(?:\s+OR\s+\w+)?(?:\s+INTO|\s+FROM)?\s+["`\[]?(\w+)', re.IGNORECASE)
+
+def _count_connection_writes(conn, _cursor, statement, _parameters, context, _executemany):
+    # statements run on a connection of the engine without a session (e.g. by restore or migration
+    #  helpers), and textual SQL on any connection; their rows can't be told, so watched tables are
+    #  marked written as a whole
+    table = None
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        if conn in session_connections:
+            return
+        table = getattr(getattr(getattr(context.compiled, 'statement', None), 'table', None), 'name', None)
+    if table is None:
+        if UNWRITTEN_STATEMENT.match(statement):
+            return
+        match = WRITE_STATEMENT.match(statement)
+        table = match.group(1) if match and match.group(1) in Base.metadata.tables else None
+    if table is None:
+        _count_unkeyed_writes(Base.metadata.tables)  # schema changes or unknown statements may write any table
+    else:
+        _count_unkeyed_writes((table,))
+
+def _count_unkeyed_writes(tables):
+    for table in tables:
+        table_writes[table] += 1
+        if table in row_writes:
+            unkeyed_writes[table] = table_writes[table]
+
+def note_writes(*models):
+    '''
+    Counts writes made where neither session nor engine events see them
+    (a separate sqlite3 connection, another process) to the given model
+    classes, or to all tables if none are given
+    '''
+    _count_unkeyed_writes([model.__tablename__ for model in models] if models else Base.metadata.tables)
+
+def data_version(*models):
+    '''
+    Changes whenever rows of the given model classes may have been written
+    through the engine; writes outside it are only seen after note_writes()
+    '''
+    return (DB_generation,) + tuple(table_writes[model.__tablename__] for model in models)
+
+def watch_rows(*models):
+    '''Track the 'id' of rows written for the given model classes'''
+    for model in models:
+        row_writes.setdefault(model.__tablename__, {})
+
+def rows_written_since(model, count):
+    '''
+    Ids of rows of a watched model written after its table write count was
+    'count' (as from data_version), or None if that can't be told by id.
+    '''
+    table = model.__tablename__
+    if unkeyed_writes[table] > count:
+        return None
+    return {row_id for row_id, written in row_writes[table].items() if written > count}
+
 #pylint: disable=no-member
 
 # Language placeholder (Overwritten after module init)
@@ -445,6 +545,10 @@ class GlobalSettings(Base):
 
 def initialize(db_uri=None):
     close_database()
+    global DB_generation
+    DB_generation += 1
+    for rows in row_writes.values():
+        rows.clear()
     global DB_URI
     if db_uri:
         DB_URI = db_uri
@@ -467,8 +571,8 @@ def initialize(db_uri=None):
         cursor.execute("PRAGMA busy_timeout=5000")
         cursor.close()
     
-    from sqlalchemy import event
     event.listen(DB_engine, 'connect', set_pragmas)
+    event.listen(DB_engine, 'before_cursor_execute', _count_connection_writes)
     
     global DB_session
     DB_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, \
@@ -0,0 +1,118 @@
+'''
+Database Backup
+
+Online backups of the live database file using the SQLite backup API. Pages
+are copied in steps on the gevent threadpool, so the database stays readable
+and writable while a backup is taken. Backups are checked with
+'PRAGMA quick_check', may be gzip-compressed, and a backup whose content is
+identical to the previous one for the same key is dropped in favor of the
+existing file.
+
+'''
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+import gevent
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_STEP = 256
+COMPRESSED_EXT = '.gz'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class DatabaseBackup:
+    def __init__(self, db_file_name, compress=False, verify=True, pages_per_step=PAGES_PER_STEP):
+        self.db_file_name = db_file_name
+        self.compress = compress
+        self.verify = verify
+        self.pages_per_step = pages_per_step
+        self._last_backups = {}  # dedupe key -> (content hash, backup file name)
+
+    def backup(self, bkp_name, dedupe_key=None):
+        '''
+        Copy the database to bkp_name (plus COMPRESSED_EXT when compressing).
+        Returns the name of the backup file, which is the previous backup's
+        when dedupe_key is given and the content has not changed. Blocks only
+        the calling greenlet.
+        '''
+        tmp_name = bkp_name + '.tmp'
+        try:
+            content_hash = self._run(self._copy, tmp_name)
+
+            if dedupe_key is not None:
+                last = self._last_backups.get(dedupe_key)
+                if last and last[0] == content_hash and os.path.isfile(last[1]):
+                    os.remove(tmp_name)
+                    logger.info('Database unchanged since backup:  ' + last[1])
+                    return last[1]
+
+            if self.compress:
+                bkp_name += COMPRESSED_EXT
+                self._run(self._compress, tmp_name, bkp_name)
+            else:
+                os.replace(tmp_name, bkp_name)
+        except Exception:
+            if os.path.isfile(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+        if dedupe_key is not None:
+            self._last_backups[dedupe_key] = (content_hash, bkp_name)
+        return bkp_name
+
+    @staticmethod
+    def _run(fn, *args):
+        return gevent.get_hub().threadpool.apply(fn, args)
+
+    def _copy(self, dest_name):
+        # runs on worker thread; returns content hash of the copy
+        src_conn = sqlite3.connect(self.db_file_name, timeout=30)
+        try:
+            dest_conn = sqlite3.connect(dest_name)
+            try:
+                src_conn.backup(dest_conn, pages=self.pages_per_step)
+                if self.verify:
+                    result = dest_conn.execute('PRAGMA quick_check').fetchone()
+                    if not result or result[0] != 'ok':
+                        raise sqlite3.DatabaseError('Backup verification failed: {}'.format(result))
+            finally:
+                dest_conn.close()
+        finally:
+            src_conn.close()
+        return file_hash(dest_name)
+
+    @staticmethod
+    def _compress(src_name, dest_name):
+        with open(src_name, 'rb') as src_file, gzip.open(dest_name, 'wb') as dest_file:
+            shutil.copyfileobj(src_file, dest_file)
+        os.remove(src_name)
+
+def file_hash(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file_obj:
+        for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_backup_file_name(file_name):
+    return file_name.endswith('.db') or file_name.endswith('.db' + COMPRESSED_EXT)
+
+@contextmanager
+def open_backup_file(file_name):
+    '''Yields a path to an uncompressed copy of the backup file'''
+    if not file_name.endswith(COMPRESSED_EXT):
+        yield file_name
+        return
+    tmp_fd, tmp_name = tempfile.mkstemp(suffix='.db')
+    try:
+        with os.fdopen(tmp_fd, 'wb') as dest_file, gzip.open(file_name, 'rb') as src_file:
+            shutil.copyfileobj(src_file, dest_file)
+        yield tmp_name
+    finally:
+        os.remove(tmp_name)
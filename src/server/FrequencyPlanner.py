@@ -0,0 +1,229 @@
+'''
+Frequency Planner
+
+IMD-aware seat assignment for auto-frequency heats. Chooses which of the
+profile's available seats the heat's pilots occupy (and so which channel set
+is in use) to maximize the IMD rating, while keeping pilots on the
+frequencies they used last and respecting D-band (digital) preferences.
+
+Search is depth-first branch-and-bound over pilots, most constrained first.
+The IMD penalty of a partial channel set never decreases as channels are
+added, so it serves as an admissible bound together with each remaining
+pilot's cheapest seat. Penalty terms for every product of the candidate
+channels are computed once per plan, and each search state carries the
+per-product scores of its channel subset so adding a channel only costs the
+change in score.
+
+'''
+
+import logging
+import IMDCalc
+
+logger = logging.getLogger(__name__)
+
+class FrequencyPlanner:
+    '''Auto-frequency calc_fn that assigns the whole heat at once via plan()'''
+
+    def __init__(self, change_cost=10, history_cost=5, band_cost=100, max_nodes=20000):
+        self.change_cost = change_cost  # pilot moved off last used frequency
+        self.history_cost = history_cost  # pilot moved to an older used frequency
+        self.band_cost = band_cost  # pilot moved across D-band / non-D-band
+        self.max_nodes = max_nodes  # search budget; best plan found so far is used
+
+    def __call__(self, _available_seats):
+        # stepwise protocol: planner makes no single assignments
+        return None, None, None
+
+    def seat_cost(self, history, seat):
+        if not history:
+            return 0
+        last = history[-1]
+        cost = 0
+        if seat['frq']['f'] != last['f']:
+            if any(seat['frq']['f'] == used['f'] for used in history):
+                cost += self.history_cost
+            else:
+                cost += self.change_cost
+        if (last.get('b') == 'D') != (seat['frq']['b'] == 'D'):
+            cost += self.band_cost
+        return cost
+
+    def plan(self, seats, pilots, fixed_frequencies=None):
+        '''
+        seats: available seats as built by run_auto_frequency
+        pilots: list of {'slot': slot, 'history': used frequencies (oldest first)}
+        fixed_frequencies: frequencies already in use by preassigned seats
+        Returns seat index (or None) for each pilot, in order
+        '''
+        fixed = [f for f in (fixed_frequencies or []) if f]
+        result = [None] * len(pilots)
+        if not pilots or not seats:
+            return result
+
+        if len(pilots) > len(seats):
+            logger.warning("Dropping {} pilots; not enough available nodes".format(len(pilots) - len(seats)))
+            placed_pilots = list(range(len(seats)))
+        else:
+            placed_pilots = list(range(len(pilots)))
+
+        seat_freqs = [seat['frq']['f'] for seat in seats]
+        costs = {p_idx: [self.seat_cost(pilots[p_idx]['history'], seat) for seat in seats] \
+                 for p_idx in placed_pilots}
+        min_costs = {p_idx: min(costs[p_idx]) for p_idx in placed_pilots}
+
+        # most constrained first; pilots without history are interchangeable and go last
+        order = sorted(placed_pilots, key=lambda p_idx: (
+            not pilots[p_idx]['history'],
+            sum(1 for c in costs[p_idx] if c == min_costs[p_idx]),
+            p_idx))
+        no_history = {p_idx for p_idx in placed_pilots if not pilots[p_idx]['history']}
+
+        n_final = len(fixed) + len(order)
+        model = IMDPenaltyModel(fixed + [seat['frq']['f'] for seat in seats])
+        base = len(fixed)  # model index of seat s_idx is base + s_idx
+
+        def imd_penalty(total):
+            return total // IMDCalc.RATING_SCALE_DIV // n_final
+
+        root = model.state()
+        for f_idx in range(len(fixed)):
+            root = root.add(f_idx)
+
+        # greedy starting plan
+        best = {'cost': None, 'assign': None}
+        assign = {}
+        state = root
+        cost = 0
+        for p_idx in order:
+            choice = min((s_idx for s_idx in range(len(seats)) if s_idx not in assign.values()),
+                key=lambda s_idx: costs[p_idx][s_idx] + imd_penalty(state.total + state.delta(base + s_idx)))
+            assign[p_idx] = choice
+            state = state.add(base + choice)
+            cost += costs[p_idx][choice]
+        best['cost'] = cost + imd_penalty(state.total)
+        best['assign'] = dict(assign)
+
+        remaining_min = [0] * (len(order) + 1)
+        for depth in range(len(order) - 1, -1, -1):
+            remaining_min[depth] = remaining_min[depth + 1] + min_costs[order[depth]]
+
+        nodes = [0]
+        assign = {}
+        used = set()
+
+        def search(depth, state, cost, last_seat):
+            if nodes[0] >= self.max_nodes:
+                return
+            nodes[0] += 1
+
+            if depth == len(order):
+                total = cost + imd_penalty(state.total)
+                if total < best['cost']:
+                    best['cost'] = total
+                    best['assign'] = dict(assign)
+                return
+
+            p_idx = order[depth]
+            candidates = []
+            for s_idx in range(len(seats)):
+                if s_idx in used:
+                    continue
+                if p_idx in no_history and s_idx < last_seat:
+                    continue  # interchangeable pilots take seats in increasing order
+                new_cost = cost + costs[p_idx][s_idx]
+                bound = new_cost + remaining_min[depth + 1]
+                if bound >= best['cost']:
+                    continue
+                bound += imd_penalty(state.total + state.delta(base + s_idx))
+                if bound < best['cost']:
+                    candidates.append((bound, s_idx, new_cost))
+            candidates.sort()
+
+            for bound, s_idx, new_cost in candidates:
+                if bound >= best['cost']:
+                    break
+                assign[p_idx] = s_idx
+                used.add(s_idx)
+                search(depth + 1, state.add(base + s_idx), new_cost,
+                       s_idx if p_idx in no_history else -1)
+                used.discard(s_idx)
+                del assign[p_idx]
+
+        search(0, root, 0, -1)
+
+        if nodes[0] >= self.max_nodes:
+            logger.debug('Frequency plan search stopped after {} nodes'.format(nodes[0]))
+
+        for p_idx, s_idx in best['assign'].items():
+            result[p_idx] = seats[s_idx]['idx']
+        return result
+
+class IMDPenaltyModel:
+    '''IMDCalc rating penalty over a fixed list of candidate frequencies, updated incrementally'''
+
+    def __init__(self, freqs):
+        self.freqs = freqs
+        limit = IMDCalc.RATING_DIFF_LIMIT
+        count = len(freqs)
+        # penalty[i][j] -> {k: penalty} for product 2*f[i] - f[j] falling near f[k]
+        self.penalty = [[{} for _j in range(count)] for _i in range(count)]
+        for i in range(count):
+            for j in range(count):
+                product = 2 * freqs[i] - freqs[j]
+                if i == j or not IMDCalc.IMDTable.in_range(product):
+                    continue
+                for k in range(count):
+                    diff = abs(product - freqs[k])
+                    if diff < limit:
+                        self.penalty[i][j][k] = (limit - diff) ** 2
+
+    def state(self):
+        return IMDPenaltyState(self, (), {}, 0)
+
+class IMDPenaltyState:
+    '''Penalty for a subset of model frequencies; each product scores against its nearest member'''
+
+    def __init__(self, model, members, pair_max, total):
+        self.model = model
+        self.members = members
+        self.pair_max = pair_max  # (row, col) -> current penalty
+        self.total = total
+
+    def _new_pairs(self, x):
+        penalty = self.model.penalty
+        member_set = set(self.members)
+        member_set.add(x)
+        for b in self.members:
+            for pair in ((x, b), (b, x)):
+                best = 0
+                for k, val in penalty[pair[0]][pair[1]].items():
+                    if val > best and k in member_set:
+                        best = val
+                yield pair, best
+
+    def delta(self, x):
+        '''Increase of total if model frequency x were added'''
+        penalty = self.model.penalty
+        result = 0
+        for (i, j), cur in self.pair_max.items():
+            val = penalty[i][j].get(x, 0)
+            if val > cur:
+                result += val - cur
+        for _pair, val in self._new_pairs(x):
+            result += val
+        return result
+
+    def add(self, x):
+        penalty = self.model.penalty
+        pair_max = {}
+        total = 0
+        for (i, j), cur in self.pair_max.items():
+            val = penalty[i][j].get(x, 0)
+            if val > cur:
+                cur = val
+            pair_max[(i, j)] = cur
+            total += cur
+        for pair, val in self._new_pairs(x):
+            pair_max[pair] = val
+            total += val
+        return IMDPenaltyState(self.model, self.members + (x,), pair_max, total)
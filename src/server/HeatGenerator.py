@@ -64,84 +64,91 @@ class HeatGeneratorManager():
         if generated_heats:
             result = self.apply(generator_id, generated_heats, generate_args)
 
-            if result is not False:
-                meta = generate_args
-                meta['generator'] = generator_id
-                store_value = json.dumps(meta)
-
-                self._racecontext.rhdata.alter_raceClass({
-                    'class_id': result,
-                    'class_attr': 'generate_args',
-                    'value': store_value,
-                })
+            if result:
+                output_class_id, heat_ids = result
 
                 self._events.trigger(Evt.HEAT_GENERATE, {
                     'generator': generator_id,
                     'generate_args': generate_args,
-                    'output_class_id': result
+                    'output_class_id': output_class_id,
+                    'heat_ids': heat_ids
                     })
+                return output_class_id
             else:
                 logger.warning("Failed generating heats: generator returned no data")
-            return result
+            return False
         else:
             logger.error("Generation stage failed or refused to produce output: see log")
             return False
 
     @catchLogExceptionsWrapper
     def apply(self, generator_id, generated_heats, generate_args):
+        # Heats and slots are written in bulk and committed once;
+        # per-heat events are replaced by the single HEAT_GENERATE event
+        rhdata = self._racecontext.rhdata
         pilot_pool = []
         filled_pool = False
         input_class = generate_args.get('input_class')  
         output_class = generate_args.get('output_class')
 
+        # refuse unsupported seed methods before anything is written
+        for heat_plan in generated_heats:
+            for seed_slot in heat_plan.slots:
+                if seed_slot.method not in (SeedMethod.INPUT, SeedMethod.HEAT_INDEX, SeedMethod.CLASS_INDEX):
+                    logger.error("Not a supported seed method: {}".format(seed_slot.method))
+                    return False
+
+        new_class = None
         if output_class is None:
-            new_class = self._racecontext.rhdata.add_raceClass()
-            all_class_names = [race_class.name for race_class in self._racecontext.rhdata.get_raceClasses()]
+            new_class = rhdata.add_raceClass()
+            all_class_names = [race_class.name for race_class in rhdata.get_raceClasses()]
             new_class.name = RHUtils.uniqueName(self._generators[generator_id].label, all_class_names)
             output_class = new_class.id
 
-        heat_id_mapping = []
-        for heat_plan in generated_heats:
-            new_heat = self._racecontext.rhdata.add_heat(init={
+        # resolve seeding source once for all slots
+        input_win_condition = None
+        if input_class:
+            race_class = rhdata.get_raceClass(input_class)
+            race_format = rhdata.get_raceFormat(race_class.format_id)
+            if race_format:
+                input_win_condition = race_format.win_condition
+
+        try:
+            new_heats, heat_slots_by_id = rhdata.add_heats_fast([{
                 'class_id': output_class,
                 'name': heat_plan.name,
                 'auto_frequency': True,
-                'defaultMethod': ProgramMethod.NONE
-                })
-            heat_id_mapping.append(new_heat.id)
+                } for heat_plan in generated_heats], ProgramMethod.NONE)
+            heat_id_mapping = [heat.id for heat in new_heats]
 
-        for h_idx, heat_plan in enumerate(generated_heats):
             heat_alterations = []
-            heat_slots = self._racecontext.rhdata.get_heatNodes_by_heat(heat_id_mapping[h_idx])
-
-            if len(heat_slots) < len(heat_plan.slots):
-                logger.warning("Not enough actual slots for requested heat generation")
-
-            for s_idx, heat_slot in enumerate(heat_slots):
-                if s_idx < len(heat_plan.slots):
-                    seed_slot = heat_plan.slots[s_idx]
-                    data = {
-                        'heat': heat_id_mapping[h_idx],
-                        'slot_id': heat_slot.id,
-                        'seed_rank': seed_slot.seed_rank,
-                        }
-                    if seed_slot.method == SeedMethod.INPUT:
-                        if input_class:
-                            win_condition = None
-                            race_class = self._racecontext.rhdata.get_raceClass(input_class)
-                            race_format = self._racecontext.rhdata.get_raceFormat(race_class.format_id)
-                            if race_format:
-                                win_condition = race_format.win_condition
-
-                            if win_condition:
+            for h_idx, heat_plan in enumerate(generated_heats):
+                heat_slots = heat_slots_by_id[heat_id_mapping[h_idx]]
+
+                if len(heat_slots) < len(heat_plan.slots):
+                    logger.warning("Not enough actual slots for requested heat generation")
+
+                for s_idx, heat_slot in enumerate(heat_slots):
+                    if s_idx < len(heat_plan.slots):
+                        seed_slot = heat_plan.slots[s_idx]
+                        data = {
+                            'slot_id': heat_slot.id,
+                            'seed_rank': seed_slot.seed_rank,
+                            }
+                        if seed_slot.method == SeedMethod.INPUT:
+                            if input_class and input_win_condition:
                                 data['method'] = ProgramMethod.CLASS_RESULT
                                 data['seed_class_id'] = input_class
                             else:
                                 # randomly seed
                                 if filled_pool == False:
-                                    class_result = self._racecontext.rhdata.get_results_raceClass(input_class)
-                                    for lb_line in class_result['by_race_time']:
-                                        pilot_pool.append(lb_line['pilot_id'])
+                                    if input_class:
+                                        class_result = rhdata.get_results_raceClass(input_class)
+                                        for lb_line in class_result['by_race_time']:
+                                            pilot_pool.append(lb_line['pilot_id'])
+                                    else:
+                                        for pilot in rhdata.get_pilots():
+                                            pilot_pool.append(pilot.id)
 
                                     random.shuffle(pilot_pool)
                                     filled_pool = True
@@ -153,42 +160,43 @@ class HeatGeneratorManager():
                                     logger.info("Unable to seed pilot: no available pilots left to seed")
                                     data['method'] = ProgramMethod.NONE
 
-                        else:
-                            # randomly seed 
-                            if filled_pool == False:
-                                for pilot in self._racecontext.rhdata.get_pilots():
-                                    pilot_pool.append(pilot.id)
+                        elif seed_slot.method == SeedMethod.HEAT_INDEX:
+                            data['method'] = ProgramMethod.HEAT_RESULT
+                            data['seed_heat_id'] = heat_id_mapping[seed_slot.seed_index]
 
-                                random.shuffle(pilot_pool)
-                                filled_pool = True
+                        elif seed_slot.method == SeedMethod.CLASS_INDEX:
+                            data['method'] = ProgramMethod.CLASS_RESULT
+                            data['seed_class_id'] = seed_slot.seed_index
 
-                            if len(pilot_pool):
-                                data['method'] = ProgramMethod.ASSIGN
-                                data['pilot'] = pilot_pool.pop()
-                            else:
-                                logger.info("Unable to seed pilot: no available pilots left to seed")
-                                data['method'] = ProgramMethod.NONE
-
-                    elif seed_slot.method == SeedMethod.HEAT_INDEX:
-                        data['method'] = ProgramMethod.HEAT_RESULT
-                        data['seed_heat_id'] = heat_id_mapping[seed_slot.seed_index]
-
-                    elif seed_slot.method == SeedMethod.CLASS_INDEX:
-                        data['method'] = ProgramMethod.CLASS_RESULT
-                        data['seed_class_id'] = seed_slot.seed_index
+                        heat_alterations.append(data)
 
-                    else:
-                        logger.error("Not a supported seed method: {}".format(seed_slot.method))
-                        return False
+            rhdata.alter_heatNodes_fast(heat_alterations, commit=False)
 
-                heat_alterations.append(data)
+            meta = generate_args
+            meta['generator'] = generator_id
+            rhdata.set_raceclass_attribute_fast(output_class, 'generate_args', json.dumps(meta))
+        except Exception:
+            self._discard(new_class)
+            raise
 
-            self._racecontext.rhdata.alter_heatNodes_fast(heat_alterations)
+        if not rhdata.commit():
+            self._discard(new_class)
+            logger.error("Generated heats not committed")
+            return False
 
         if filled_pool and len(pilot_pool):
             logger.info("{} unseeded pilots remaining in pool".format(len(pilot_pool)))
 
-        return output_class
+        logger.info('Generated {0} heats in class {1}'.format(len(heat_id_mapping), output_class))
+
+        return output_class, heat_id_mapping
+
+    def _discard(self, new_class):
+        # rolls back a failed apply; the output class was committed on creation, so remove it
+        rhdata = self._racecontext.rhdata
+        rhdata.rollback()
+        if new_class:
+            rhdata.delete_raceClass(new_class)
 
 class HeatGenerator():
     def __init__(self, label, generator_fn, default_args=None, settings:List[UIField]=None, name=None):
@@ -0,0 +1,225 @@
+'''
+IMD Calculator
+
+Native replacement for the IMDTabler JAR. Computes the intermodulation
+products for a set of video frequencies and produces the same rating value
+and HTML table as 'IMDTabler.jar -r' and '-t' (version 1.3).
+
+The rating is based on the two-tone third-order products (2*f1 - f2); each
+product closer than RATING_DIFF_LIMIT MHz to a used frequency is penalized
+by the square of its closeness. Second-order products (f1 + f2, f1 - f2) of
+5.8GHz frequencies fall far outside the band and do not affect the rating,
+but are available via 'imd_products' for completeness.
+
+Results are memoized by frequency set. Use 'run_in_worker' to evaluate on
+the gevent threadpool so large tables do not stall the event loop.
+
+'''
+
+import logging
+import subprocess
+from bisect import bisect_left
+from functools import lru_cache
+import gevent
+
+logger = logging.getLogger(__name__)
+
+VERSION_STR = 'IMDTabler Version 1.3 (native)'
+
+MIN_DISP_FREQ = 5100
+MAX_DISP_FREQ = 6099
+MIN_FREQ_SEP = 35
+RATING_MAX_VALUE = 100
+RATING_DIFF_LIMIT = 35
+RATING_SCALE_DIV = 5
+NO_CLR_DIFF = 150
+NO_NEAR_DIFF = 12198
+
+def parse_freqs(freq_list):
+    '''Convert list or space/comma separated string of frequencies to a tuple of ints'''
+    if isinstance(freq_list, str):
+        freq_list = freq_list.replace(',', ' ').split()
+    return tuple(int(str(f).strip()) for f in freq_list)
+
+def min_freq_separation(freqs):
+    '''Smallest spacing between any two frequencies in the set'''
+    sorted_freqs = sorted(freqs)
+    min_sep = NO_NEAR_DIFF
+    for idx in range(1, len(sorted_freqs)):
+        sep = sorted_freqs[idx] - sorted_freqs[idx - 1]
+        if sep < min_sep:
+            min_sep = sep
+    return min_sep
+
+def imd_products(freqs):
+    '''In-band 2nd- and 3rd-order products, keyed by order'''
+    freqs = parse_freqs(freqs)
+    products = {2: set(), 3: set()}
+    count = len(freqs)
+    for i in range(count):
+        for j in range(count):
+            if i == j:
+                continue
+            for val in (freqs[i] + freqs[j], abs(freqs[i] - freqs[j])):
+                if MIN_DISP_FREQ <= val <= MAX_DISP_FREQ:
+                    products[2].add(val)
+            val = 2 * freqs[i] - freqs[j]
+            if MIN_DISP_FREQ <= val <= MAX_DISP_FREQ:
+                products[3].add(val)
+            for k in range(j + 1, count):
+                if k == i:
+                    continue
+                val = freqs[i] + freqs[j] - freqs[k]
+                if MIN_DISP_FREQ <= val <= MAX_DISP_FREQ:
+                    products[3].add(val)
+                val = freqs[i] + freqs[k] - freqs[j]
+                if MIN_DISP_FREQ <= val <= MAX_DISP_FREQ:
+                    products[3].add(val)
+    return {order: sorted(vals) for order, vals in products.items()}
+
+class IMDTable:
+    '''Table of 2*f[row] - f[col] products for a frequency set'''
+    def __init__(self, freqs):
+        self.freqs = tuple(freqs)
+        self.min_separation = min_freq_separation(self.freqs)
+
+        # nearest set frequency for any product via bisect on sorted set;
+        # on equal distance the earliest entry in the set wins (as in the JAR)
+        order = sorted(range(len(self.freqs)), key=lambda i: self.freqs[i])
+        sorted_freqs = [self.freqs[i] for i in order]
+
+        self.cells = []  # [row][col] -> (product, diff, nearest)
+        self.rating_total = 0
+        for row, row_freq in enumerate(self.freqs):
+            row_cells = []
+            for col, col_freq in enumerate(self.freqs):
+                product = 2 * row_freq - col_freq
+                pos = bisect_left(sorted_freqs, product)
+                best_idx = None
+                best_diff = None
+                for cand in (pos - 1, pos):
+                    if 0 <= cand < len(order):
+                        idx = order[cand]
+                        diff = abs(product - self.freqs[idx])
+                        if best_diff is None or diff < best_diff or \
+                            (diff == best_diff and idx < best_idx):
+                            best_idx = idx
+                            best_diff = diff
+                if best_diff >= NO_NEAR_DIFF:  # no match inside the JAR's search limit
+                    best_idx = 0
+                    best_diff = abs(product - self.freqs[0])
+                nearest = self.freqs[best_idx]
+                row_cells.append((product, best_diff, nearest))
+
+                if row != col and self.in_range(product) and best_diff < RATING_DIFF_LIMIT:
+                    self.rating_total += (RATING_DIFF_LIMIT - best_diff) ** 2
+            self.cells.append(row_cells)
+
+        if self.freqs:
+            self.rating = RATING_MAX_VALUE - self.rating_total // RATING_SCALE_DIV // len(self.freqs)
+        else:
+            self.rating = RATING_MAX_VALUE
+
+    @staticmethod
+    def in_range(freq):
+        return MIN_DISP_FREQ <= freq <= MAX_DISP_FREQ
+
+    @staticmethod
+    def cell_color(diff):
+        if diff >= RATING_DIFF_LIMIT:
+            return None
+        val = 255 - (RATING_DIFF_LIMIT - diff) * NO_CLR_DIFF // RATING_DIFF_LIMIT
+        hex_str = '{:x}'.format(val)
+        if val <= 9:
+            hex_str = '0' + hex_str
+        return '#FF' + hex_str + hex_str
+
+    @staticmethod
+    def value_cell_html(value, bold=False, title=None, bgcolor=None):
+        html = '<td align="center"'
+        if title:
+            html += ' title="' + title + '"'
+        if bgcolor:
+            html += ' bgcolor="' + bgcolor + '"'
+        html += '>'
+        if bold:
+            html += '<b><i>' + str(value) + '</i></b>'
+        else:
+            html += str(value)
+        return html + '</td>'
+
+    @staticmethod
+    def blank_cell_html(value=0):
+        if value != 0:
+            return '<td align="center" title="' + str(value) + '"></td>'
+        return '<td align="center"></td>'
+
+    @staticmethod
+    def cell_info(cell):
+        product, diff, nearest = cell
+        return '{} is {}MHz away from {}'.format(product, diff, nearest)
+
+    def info_lines(self):
+        '''Descriptions of in-range products that fall near a used frequency'''
+        lines = []
+        for row, row_cells in enumerate(self.cells):
+            for col, cell in enumerate(row_cells):
+                if row != col and self.in_range(cell[0]) and cell[1] < RATING_DIFF_LIMIT:
+                    lines.append(self.cell_info(cell))
+        return lines
+
+    def to_html(self):
+        parts = []
+        if self.min_separation < MIN_FREQ_SEP:
+            parts.append('<b>Warning:  Minimum separation for entered frequencies is {}MHz</b><br><br>'.format(
+                self.min_separation))
+        parts.append('<table border="1" cellpadding="8">\n  <tbody>\n')
+        parts.append('    <tr>\n      ' + self.blank_cell_html() + '\n')
+        for freq in self.freqs:
+            parts.append('      ' + self.value_cell_html(freq, True) + '\n')
+        parts.append('    </tr>\n')
+        for row, row_cells in enumerate(self.cells):
+            parts.append('    <tr>\n      ' + self.value_cell_html(self.freqs[row], True) + '\n')
+            for col, cell in enumerate(row_cells):
+                if row == col:
+                    cell_html = self.blank_cell_html(cell[0])
+                elif self.in_range(cell[0]):
+                    cell_html = self.value_cell_html(cell[0], False, self.cell_info(cell), self.cell_color(cell[1]))
+                else:
+                    cell_html = self.blank_cell_html(0)
+                parts.append('      ' + cell_html + '\n')
+            parts.append('    </tr>\n')
+        parts.append('  </tbody>\n</table>\n<br>\n')
+        parts.append('IMD rating (100=best): {}<br><br>'.format(self.rating))
+        for line in self.info_lines():
+            parts.append(line + '<br>\n')
+        return ''.join(parts)
+
+@lru_cache(maxsize=256)
+def _get_table(freqs):
+    return IMDTable(freqs)
+
+def get_imd_table(freqs):
+    '''Memoized IMDTable for the given frequencies'''
+    return _get_table(parse_freqs(freqs))
+
+def imd_rating(freqs):
+    return get_imd_table(freqs).rating
+
+def imd_table_html(freqs):
+    return get_imd_table(freqs).to_html()
+
+def run_in_worker(fn, *args):
+    '''Run fn on the gevent threadpool; blocks only the calling greenlet'''
+    return gevent.get_hub().threadpool.apply(fn, args)
+
+def jar_cross_check(jar_path, freqs):
+    '''Compare native rating against IMDTabler.jar; returns True when they agree'''
+    freqs = parse_freqs(freqs)
+    jar_val = subprocess.check_output( \
+        'java -jar ' + jar_path + ' -r ' + ' '.join(str(f) for f in freqs), shell=True).decode("utf-8").strip()
+    native_val = imd_rating(freqs)
+    if jar_val != str(native_val):
+        logger.warning('IMD rating mismatch for {}: jar={}, native={}'.format(freqs, jar_val, native_val))
+        return False
+    return True
@@ -13,6 +13,7 @@ from time import monotonic
 from eventmanager import Evt
 import RHUtils
 import gevent
+from util.Metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +68,7 @@ class PageCache:
                         self.set_buildToken(False)
                         break
 
+    @metrics.timed('rh_page_cache_update_seconds', 'Time to rebuild the results page cache')
     def update_cache(self):
         dbg_trace_str = ""
         if logger.getEffectiveLevel() <= logging.DEBUG:  # if DEBUG msgs actually being logged
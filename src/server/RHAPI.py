@@ -1122,6 +1122,10 @@ class RaceAPI():
     def start_time_internal(self):
         return self._racecontext.race.start_time_monotonic
 
+    @property
+    def start_jitter(self):
+        return self._racecontext.race.start_jitter
+
     @property
     def end_time_internal(self):
         return self._racecontext.race.end_time
@@ -1338,6 +1342,9 @@ class SensorsAPI():
     def sensor_obj(self, name):
         return self._racecontext.sensors.sensors_dict[name]
 
+    def sensor_history(self, name, reading=None, resolution=None, since=None):
+        return self._racecontext.sensors.get_history(name, reading, resolution, since)
+
 
 #
 # Events
@@ -1438,6 +1445,12 @@ class ServerAPI():
     def set_restart_required(self):
         return self._racecontext.serverstate.set_restart_required()
 
+    def call_at(self, deadline, fn, *args, **kwargs):
+        return self._racecontext.timers.call_at(deadline, fn, *args, **kwargs)
+
+    def call_later(self, delay, fn, *args, **kwargs):
+        return self._racecontext.timers.call_later(delay, fn, *args, **kwargs)
+
 #
 # Filters
 #
@@ -1483,6 +1496,20 @@ class UtilsAPI():
 
         return RHUtils.format_phonetic_time_to_str(millis, timeformat=time_format)
 
+    # Convert a list of milliseconds values to 00:00.000
+    def format_times_to_str(self, values, time_format=None):
+        if not time_format:
+            time_format = self._racecontext.serverconfig.get_item('UI', 'timeFormat')
+
+        return RHUtils.format_times_to_str(values, timeformat=time_format)
+
+    # Convert a list of milliseconds values to phonetic callout strings
+    def format_phonetic_times_to_str(self, values, time_format=None):
+        if not time_format:
+            time_format = self._racecontext.serverconfig.get_item('UI', 'timeFormatPhonetic')
+
+        return RHUtils.format_phonetic_times_to_str(values, timeformat=time_format)
+
     # Generate unique name within a naming context: name, name 2..
     def generate_unique_name(self, desired_name, other_names):
         return RHUtils.uniqueName(desired_name, other_names)
@@ -7,18 +7,19 @@ import logging
 logger = logging.getLogger(__name__)
 
 import sqlalchemy
-from sqlalchemy import create_engine, MetaData, Table, inspect
+from sqlalchemy import create_engine, MetaData, inspect
 from sqlalchemy.exc import NoSuchTableError
 from datetime import datetime
 import os
 import traceback
-import shutil
 import json
 import glob
+import itertools
 import numbers
 import RHUtils
 import Database
 import Results
+from DatabaseBackup import DatabaseBackup, COMPRESSED_EXT
 from time import monotonic
 from eventmanager import Evt
 from filtermanager import Flt
@@ -26,12 +27,15 @@ from RHRace import RaceStatus, WinCondition, RacingMode, StagingTones
 from Database import ProgramMethod, HeatAdvanceType, RoundType, HeatStatus
 
 from FlaskAppObj import APP
+from util.Metrics import metrics
 APP.app_context().push()
 
 Position_place_strings = None
 
 class RHData():
     _OptionsCache = {} # Local Python cache for global settings
+    MIGRATION_SKIP_COLUMNS = ('results', 'cacheStatus', 'ranking', 'rankStatus')  # results caches; rebuilt after migration
+    MIGRATION_CHUNK_SIZE = 1000  # rows per bulk insert when streaming tables
     TEAM_NAMES_LIST = [str(chr(i)) for i in range(65, 91)]  # list of 'A' to 'Z' strings
 
     def __init__(self, Events, RaceContext, SERVER_API, DB_FILE_NAME, DB_BKP_DIR_NAME):
@@ -41,6 +45,7 @@ class RHData():
         self._DB_FILE_NAME = DB_FILE_NAME
         self._DB_BKP_DIR_NAME = DB_BKP_DIR_NAME
         self._filters = RaceContext.filters
+        self._db_backup = None
 
     def __(self, *args, **kwargs):
         return self._racecontext.language.__(*args, **kwargs)
@@ -133,7 +138,8 @@ class RHData():
 
     def commit(self):
         try:
-            Database.DB_session.commit()
+            with metrics.timer('rh_db_commit_seconds', 'Time to commit a database session'):
+                Database.DB_session.commit()
             return True
         except Exception as ex:
             logger.error('Error writing to database: ' + str(ex))
@@ -191,22 +197,32 @@ class RHData():
 
     # File Handling
 
-    def backup_db_file(self, copy_flag, prefix_str=None, use_filename=None):
-        self.close()
-        self.clean()
+    def get_db_backup(self):
+        if self._db_backup is None:
+            config = self._racecontext.serverconfig
+            self._db_backup = DatabaseBackup(self._DB_FILE_NAME,
+                compress=config.get_item('GENERAL', 'DB_BKP_COMPRESS'),
+                verify=config.get_item('GENERAL', 'DB_BKP_VERIFY'))
+        return self._db_backup
+
+    def backup_db_file(self, copy_flag, prefix_str=None, use_filename=None, dedupe=False):
+        # copies are taken from the live database (see DatabaseBackup);
+        # otherwise the database is closed and its file moved
         if not copy_flag:
+            self.close()
+            self.clean()
             Database.close_database()
-        
-        # Checkpoint WAL to flush all changes into main DB file before backup
-        try:
-            import sqlite3
-            conn = sqlite3.connect(self._DB_FILE_NAME)
-            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-            conn.close()
-            logger.debug('Checkpointed WAL before database backup')
-        except Exception as ex:
-            logger.warning('Failed to checkpoint WAL before backup: ' + str(ex))
-        
+
+            # Checkpoint WAL to flush all changes into main DB file before backup
+            try:
+                import sqlite3
+                conn = sqlite3.connect(self._DB_FILE_NAME)
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+                logger.debug('Checkpointed WAL before database backup')
+            except Exception as ex:
+                logger.warning('Failed to checkpoint WAL before backup: ' + str(ex))
+
         try:     # generate timestamp from last-modified time of database file
             time_str = datetime.fromtimestamp(os.stat(self._DB_FILE_NAME).st_mtime).strftime('%Y%m%d_%H%M%S')
         except:  # if error then use 'now' timestamp
@@ -222,11 +238,14 @@ class RHData():
             if not os.path.exists(self._DB_BKP_DIR_NAME):
                 os.makedirs(self._DB_BKP_DIR_NAME)
             RHUtils.checkSetFileOwnerPi(self._DB_BKP_DIR_NAME)
-            if os.path.isfile(bkp_name):  # if target file exists then use 'now' timestamp
+            if os.path.isfile(bkp_name) or os.path.isfile(bkp_name + COMPRESSED_EXT):  # if target file exists then use 'now' timestamp
                 time_str = datetime.now().strftime('%Y%m%d_%H%M%S')
                 bkp_name = self._DB_BKP_DIR_NAME + '/' + dbname + '_' + time_str + dbext
             if copy_flag:
-                shutil.copy2(self._DB_FILE_NAME, bkp_name)
+                new_name = self.get_db_backup().backup(bkp_name, (prefix_str or '') if dedupe else None)
+                if not new_name.startswith(bkp_name):
+                    return new_name  # database unchanged since previous backup
+                bkp_name = new_name
                 logger.info('Copied database file to:  ' + bkp_name)
             else:
                 Database.close_database()
@@ -247,7 +266,7 @@ class RHData():
                 if prefix_str:
                     dbname = prefix_str + dbname
                 file_list = list(filter(os.path.isfile, glob.glob(self._DB_BKP_DIR_NAME + \
-                                                        '/' + dbname + '*' + dbext)))
+                                                        '/' + dbname + '*' + dbext + '*')))
                 file_list.sort(key=os.path.getmtime)  # sort by last-modified time
                 if len(file_list) > num_keep_val:
                     if num_keep_val > 0:
@@ -267,21 +286,25 @@ class RHData():
 
     # Migration
 
+    def get_legacy_columns(self, metadata, table_name):
+        '''Names of columns to migrate from previous database table (results-cache columns are rebuilt, not copied)'''
+        if not table_name in metadata.tables:
+            raise NoSuchTableError
+        return [col.name for col in metadata.tables[table_name].columns if col.name not in self.MIGRATION_SKIP_COLUMNS]
+
+    @staticmethod
+    def get_legacy_select(table_name, columns):
+        return sqlalchemy.text("SELECT {} FROM \"{}\"".format(
+            ', '.join('"{}"'.format(col) for col in columns), table_name))
+
     def get_legacy_table_data(self, engine, metadata, table_name):
         try:
             output = []
+            columns = self.get_legacy_columns(metadata, table_name)
             with engine.begin() as conn:
-                if not table_name in metadata.tables:
-                    raise NoSuchTableError
-                table = Table(table_name, metadata, autoload=True)
-                data = conn.execute(sqlalchemy.text("SELECT * from {}".format(table_name))).all()
-                for row in data:
-                    d = {}
-                    cnt = 0
-                    for item in row:  # create dict of {columnName:columnValue} items for row
-                        d[table.columns[cnt].key] = item
-                        cnt += 1
-                    output.append(d)  # one for each row in table
+                data = conn.execute(self.get_legacy_select(table_name, columns))
+                for row in data:  # create dict of {columnName:columnValue} items for row
+                    output.append(dict(zip(columns, row)))  # one for each row in table
             return output
         except NoSuchTableError:
             logger.debug('Table "{}" not found in previous database'.format(table_name))
@@ -293,7 +316,7 @@ class RHData():
         if table_query_data:
             mapped_instance = inspect(class_type)
             table_name_str = "???"
-            was_empty_flag = len(class_type.query.all()) <= 0
+            was_empty_flag = class_type.query.first() is None
             try:
                 table_name_str = getattr(class_type, '__name__', '???')
                 logger.debug("Restoring database table '{}' (len={})".format(table_name_str, len(table_query_data)))
@@ -388,6 +411,95 @@ class RHData():
         else:
             logger.debug('Unable to restore "{}" table: no data'.format(getattr(class_type, '__name__', '???')))
 
+    def stream_restore_table(self, engine, metadata, class_type, row_fn=None, progress_fn=None, **kwargs):
+        '''
+        Restores an empty table from the previous database without loading it
+        into memory: rows are read in chunks, mapped to the new columns (mapping
+        worked out once per table) and bulk-inserted, all in one transaction.
+        row_fn may adjust each source row (dict) in place. Returns the number
+        of rows restored, or None if the table must be restored via restore_table.
+        '''
+        table_name = class_type.__tablename__
+        try:
+            columns = self.get_legacy_columns(metadata, table_name)
+        except NoSuchTableError:
+            logger.debug('Table "{}" not found in previous database'.format(table_name))
+            return 0
+
+        if class_type.query.first() is not None:
+            return None
+
+        defaults = kwargs['defaults']
+        copy_cols = []  # (column name, source index, python type, default)
+        fixed_vals = {}  # columns not in previous table
+        for col_key, col_obj in inspect(class_type).columns.items():
+            default = defaults.get(col_key) if col_key != 'id' else None
+            if default is None and col_obj.default is not None and col_obj.default.is_scalar:
+                default = col_obj.default.arg
+            if col_obj.name in columns:
+                try:
+                    col_type = col_obj.type.python_type if str(col_obj.type) != 'BLOB' else None
+                except Exception:
+                    col_type = None
+                copy_cols.append((col_obj.name, columns.index(col_obj.name), col_type, default))
+            else:
+                fixed_vals[col_obj.name] = default
+
+        Database.DB_session.commit()  # table is restored in its own transaction
+        insert_stmt = class_type.__table__.insert()
+        restored_row_count = 0
+        bad_value_count = 0
+        try:
+            with engine.connect() as conn:
+                total = conn.execute(sqlalchemy.text('SELECT COUNT(*) FROM "{}"'.format(table_name))).scalar()
+                result = conn.execution_options(stream_results=True).execute(self.get_legacy_select(table_name, columns))
+                while True:
+                    rows = result.fetchmany(self.MIGRATION_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    chunk = []
+                    for row in rows:
+                        if row_fn:
+                            row = dict(zip(columns, row))
+                            row_fn(row)
+                            row = [row[col] for col in columns]
+                        new_row = dict(fixed_vals)
+                        for col_name, idx, col_type, default in copy_cols:
+                            col_val = row[idx]
+                            if col_val is None:
+                                col_val = default
+                            elif col_type is not None:
+                                try:
+                                    col_val = col_type(col_val)  # explicitly cast value to new-DB column type
+                                except:
+                                    bad_value_count += 1
+                                    col_val = default
+                            new_row[col_name] = col_val
+                        chunk.append(new_row)
+                    Database.DB_session.execute(insert_stmt, chunk)
+                    restored_row_count += len(chunk)
+                    if progress_fn:
+                        progress_fn(table_name, restored_row_count, total)
+            Database.DB_session.commit()
+        except Exception as ex:
+            logger.warning('Unable to stream "{}" table from previous database: {}'.format(table_name, ex))
+            logger.debug(traceback.format_exc())
+            Database.DB_session.rollback()
+            return None
+
+        if bad_value_count:
+            logger.warning("Used defaults for {} mismatched value(s) in table '{}'".format(bad_value_count, table_name))
+        logger.info("Database table '{}' restored (rowcount={})".format(table_name, restored_row_count))
+        return restored_row_count
+
+    def stream_or_restore_table(self, engine, metadata, class_type, row_fn=None, progress_fn=None, **kwargs):
+        if self.stream_restore_table(engine, metadata, class_type, row_fn, progress_fn, **kwargs) is None:
+            table_query_data = self.get_legacy_table_data(engine, metadata, class_type.__tablename__)
+            if table_query_data and row_fn:
+                for row in table_query_data:
+                    row_fn(row)
+            self.restore_table(class_type, table_query_data, **kwargs)
+
     def recover_database(self, dbfile, **kwargs):
         recover_status = {
             'stage_0': False,
@@ -399,7 +511,6 @@ class RHData():
         options_query_data = None
         pilot_query_data = None
         heat_query_data = None
-        heatNode_query_data = None
         raceFormat_query_data = None
         profiles_query_data = None
         raceClass_query_data = None
@@ -426,17 +537,12 @@ class RHData():
 
             pilot_query_data = self.get_legacy_table_data(engine, metadata, 'pilot')
             heat_query_data = self.get_legacy_table_data(engine, metadata, 'heat')
-            heatNode_query_data = self.get_legacy_table_data(engine, metadata, 'heat_node')
             raceFormat_query_data = self.get_legacy_table_data(engine, metadata, 'race_format')
             profiles_query_data = self.get_legacy_table_data(engine, metadata, 'profiles')
             raceClass_query_data = self.get_legacy_table_data(engine, metadata, 'race_class')
-            raceMeta_query_data = self.get_legacy_table_data(engine, metadata, 'saved_race_meta')
-            racePilot_query_data = self.get_legacy_table_data(engine, metadata, 'saved_pilot_race')
-            raceLap_query_data = self.get_legacy_table_data(engine, metadata, 'saved_race_lap')
             pilotAttribute_query_data = self.get_legacy_table_data(engine, metadata, 'pilot_attribute')
             heatAttribute_query_data = self.get_legacy_table_data(engine, metadata, 'heat_attribute')
             raceClassAttribute_query_data = self.get_legacy_table_data(engine, metadata, 'race_class_attribute')
-            savedRaceAttribute_query_data = self.get_legacy_table_data(engine, metadata, 'saved_race_meta_attribute')
             raceFormatAttribute_query_data = self.get_legacy_table_data(engine, metadata, 'race_format_attribute')
 
             engine.dispose() # close connection after loading
@@ -506,23 +612,9 @@ class RHData():
                 for heat in heat_query_data:
                     if heat['class_id'] == 0:
                         heat['class_id'] = None
-                for heatNode in heatNode_query_data:
-                    if heatNode['pilot_id'] == 0:
-                        heatNode['pilot_id'] = None
                 for raceClass in raceClass_query_data:
                     if raceClass['format_id'] == 0:
                         raceClass['format_id'] = None
-                for raceMeta in raceMeta_query_data:
-                    if raceMeta['class_id'] == 0:
-                        raceMeta['class_id'] = None
-                    if raceMeta['format_id'] == 0:
-                        raceMeta['format_id'] = None
-                for racePilot in racePilot_query_data:
-                    if racePilot['pilot_id'] == 0:
-                        racePilot['pilot_id'] = None
-                for raceLap in raceLap_query_data:
-                    if raceLap['pilot_id'] == 0:
-                        raceLap['pilot_id'] = None
 
             recover_status['stage_0'] = True
         except Exception as ex:
@@ -530,10 +622,37 @@ class RHData():
             logger.debug(traceback.format_exc())
 
         if "startup" in kwargs:
-            self.backup_db_file(False)  # rename and move DB file
+            bkp_name = self.backup_db_file(False)  # rename and move DB file
+            if bkp_name:
+                dbfile = bkp_name  # large tables are streamed from the moved file
 
         self.db_init(nofill=True, migrateDbApi=migrate_db_api)
 
+        # large tables are streamed from the previous database instead of loaded in stage 0
+        progress_fn = kwargs.get('progress_fn')
+
+        def fix_pilot_id(row):
+            if migrate_db_api < 47 and row.get('pilot_id') == 0:  # zero-index semaphores to null
+                row['pilot_id'] = None
+
+        def fix_race_meta(row):
+            if migrate_db_api < 47:
+                if row.get('class_id') == 0:
+                    row['class_id'] = None
+                if row.get('format_id') == 0:
+                    row['format_id'] = None
+
+        def fix_race_lap(row):
+            fix_pilot_id(row)
+            if 'lap_time' in row and (type(row['lap_time']) == str or row['lap_time'] is None):
+                row['lap_time'] = 0
+
+        engine = None
+        if recover_status['stage_0'] == True:
+            engine = create_engine('sqlite:///%s' % dbfile)
+            metadata = MetaData()
+            metadata.reflect(engine)
+
         # stage 1: recover pilots, format, class, heats + heatnodes, profile, options
         if recover_status['stage_0'] == True:
             try:
@@ -710,7 +829,7 @@ class RHData():
                                 'group_id': 0,
                                 'auto_frequency': False
                             })
-                        self.restore_table(Database.HeatNode, heatNode_query_data, defaults={
+                        self.stream_or_restore_table(engine, metadata, Database.HeatNode, fix_pilot_id, progress_fn, defaults={
                                 'pilot_id': RHUtils.PILOT_ID_NONE,
                                 'color': None,
                                 'method': 0,
@@ -784,6 +903,7 @@ class RHData():
                     self._Events.trigger(Evt.DATABASE_RECOVER)
                 except:
                     logger.exception("Exception performing db reset in 'recover_database()'")
+                engine.dispose()
                 return recover_status
 
             # stage 2: recover race result data
@@ -793,14 +913,14 @@ class RHData():
                         # don't attempt to migrate race data older than 2.0
                         logger.warning('Race data older than v2.0; skipping results migration')
                     else:
-                        self.restore_table(Database.SavedRaceMeta, raceMeta_query_data, defaults={
+                        self.stream_or_restore_table(engine, metadata, Database.SavedRaceMeta, fix_race_meta, progress_fn, defaults={
                             'results': None,
                             '_cache_status': json.dumps({
                                 'data_ver': monotonic(),
                                 'build_ver': None
                             })
                         })
-                        self.restore_table(Database.SavedPilotRace, racePilot_query_data, defaults={
+                        self.stream_or_restore_table(engine, metadata, Database.SavedPilotRace, fix_pilot_id, progress_fn, defaults={
                             'history_values': None,
                             'history_times': None,
                             'penalty_time': None,
@@ -809,17 +929,11 @@ class RHData():
                             'exit_at': None,
                             'frequency': None,
                         })
-
-                        for lap in raceLap_query_data:
-                            if 'lap_time' in lap and (type(lap['lap_time']) == str or lap['lap_time'] is None):
-                                lap['lap_time'] = 0
-
-                        self.restore_table(Database.SavedRaceLap, raceLap_query_data, defaults={
+                        self.stream_or_restore_table(engine, metadata, Database.SavedRaceLap, fix_race_lap, progress_fn, defaults={
                             'source': None,
                             'deleted': False
                         })
-
-                        self.restore_table(Database.SavedRaceMetaAttribute, savedRaceAttribute_query_data, defaults={
+                        self.stream_or_restore_table(engine, metadata, Database.SavedRaceMetaAttribute, None, progress_fn, defaults={
                             'name': '',
                             'value': None
                         })
@@ -829,6 +943,9 @@ class RHData():
                     logger.warning('Error while writing data from previous database (stage 2):  ' + str(ex))
                     logger.debug(traceback.format_exc())
 
+        if engine:
+            engine.dispose()
+
         self.commit()
 
         self.primeCache() # refresh Options cache
@@ -982,28 +1099,104 @@ class RHData():
 
         race_list = []
         if 'callsign' in data or 'team_name' in data:
-            heatnodes = Database.HeatNode.query.filter_by(pilot_id=pilot_id).all()
-            if heatnodes:
-                for heatnode in heatnodes:
-                    heat = self.get_heat(heatnode.heat_id)
-                    self.clear_results_heat(heat)
+            race_list = self.clear_results_by_pilots([pilot_id])
 
-                    if heat.class_id != RHUtils.CLASS_ID_NONE:
-                        self.clear_results_raceClass(heat.class_id)
+        return pilot, race_list
 
-                    for race in Database.SavedRaceMeta.query.filter_by(heat_id=heatnode.heat_id).all():
-                        race_list.append(race)
+    def clear_results_by_pilots(self, pilot_ids):
+        # Clears results showing the pilots' callsign or team; returns the saved races cleared
+        race_list = []
+        heat_ids = set()
+        for heatnode in Database.HeatNode.query.filter(Database.HeatNode.pilot_id.in_(pilot_ids)).all():
+            if heatnode.heat_id in heat_ids:
+                continue
+            heat_ids.add(heatnode.heat_id)
+            heat = self.get_heat(heatnode.heat_id)
+            self.clear_results_heat(heat)
 
-            if len(race_list):
-                self._racecontext.pagecache.set_valid(False)
-                self.clear_results_event()
+            if heat.class_id != RHUtils.CLASS_ID_NONE:
+                self.clear_results_raceClass(heat.class_id)
 
-                for race in race_list:
-                    self.clear_results_savedRaceMeta(race)
+            for race in Database.SavedRaceMeta.query.filter_by(heat_id=heatnode.heat_id).all():
+                race_list.append(race)
 
-                self.commit()
+        if len(race_list):
+            self._racecontext.pagecache.set_valid(False)
+            self.clear_results_event()
 
-        return pilot, race_list
+            for race in race_list:
+                self.clear_results_savedRaceMeta(race)
+
+            self.commit()
+
+        return race_list
+
+    def upsert_pilots_fast(self, pilot_list):
+        # Adds or alters pilots in batch, matching on callsign; returns pilot ids in input order
+        # !! Unsafe for general use. Intentionally light type checking,             !!
+        # !! DOES NOT commit, trigger events, clear results, or update cached data !!
+        pilots_by_callsign = {pilot.callsign: pilot for pilot in self.get_pilots()}
+        attrs_by_key = {(attr.id, attr.name): attr for attr in Database.PilotAttribute.query.all()}
+
+        pilots = []
+        new_pilots = []
+        for pilot_data in pilot_list:
+            pilot = pilots_by_callsign.get(pilot_data.get('callsign'))
+            if pilot is None:
+                pilot = Database.Pilot(
+                    name=pilot_data.get('name', ''),
+                    callsign=pilot_data.get('callsign', ''),
+                    team=pilot_data.get('team', RHUtils.DEF_TEAM_NAME),
+                    phonetic=pilot_data.get('phonetic', ''),
+                    color=pilot_data.get('color', RHUtils.hslToHex(False, 100, 50)),
+                    used_frequencies=None)
+                Database.DB_session.add(pilot)
+                new_pilots.append((pilot, pilot_data))
+                if pilot.callsign:
+                    pilots_by_callsign[pilot.callsign] = pilot
+            else:
+                for key in ['name', 'callsign', 'team', 'phonetic', 'color']:
+                    if key in pilot_data:
+                        setattr(pilot, key, pilot_data[key])
+            pilots.append(pilot)
+
+        Database.DB_session.flush()
+
+        # ensure clean attributes on creation
+        new_ids = {pilot.id for pilot, _ in new_pilots}
+        Database.PilotAttribute.query.filter(Database.PilotAttribute.id.in_(new_ids)).\
+            delete(synchronize_session=False)
+
+        for pilot, pilot_data in new_pilots:
+            if 'name' not in pilot_data:
+                pilot.name = self.__('~Pilot %d Name') % (pilot.id)
+            if 'callsign' not in pilot_data:
+                pilot.callsign = self.__('~Callsign %d') % (pilot.id)
+            self._filters.run_filters(Flt.PILOT_ADD, pilot, {
+                'data': pilot_data
+            })
+
+        for pilot, pilot_data in zip(pilots, pilot_list):
+            if pilot.id in new_ids:
+                continue
+            for name, value in (pilot_data.get('attributes') or {}).items():
+                name = self._filters.run_filters(Flt.PILOT_ALTER_ATTRIBUTE, name, {
+                    'pilot_id': pilot.id
+                })
+                attribute = attrs_by_key.get((pilot.id, name))
+                if attribute:
+                    attribute.value = value
+                else:
+                    attribute = Database.PilotAttribute(id=pilot.id, name=name, value=value)
+                    Database.DB_session.add(attribute)
+                    attrs_by_key[(pilot.id, name)] = attribute
+            self._filters.run_filters(Flt.PILOT_ALTER, pilot, {
+                'data': pilot_data
+            })
+
+        logger.info('Pilots upserted: {0} added, {1} altered'.format(len(new_ids), len(pilots) - len(new_ids)))
+
+        return [pilot.id for pilot in pilots]
 
     def set_pilot_used_frequency(self, pilot_or_id, frequency):
         pilot = self.resolve_pilot_from_pilot_or_id(pilot_or_id) 
@@ -1097,6 +1290,13 @@ class RHData():
         pilot_id = self.resolve_id_from_pilot_or_id(pilot_or_id)
         return Database.PilotAttribute.query.filter_by(id=pilot_id).all()
 
+    def get_pilot_attributes_by_pilot(self):
+        '''All pilot attributes, grouped by pilot id'''
+        attrs_by_pilot = {}
+        for attr in Database.PilotAttribute.query.all():
+            attrs_by_pilot.setdefault(attr.id, []).append(attr)
+        return attrs_by_pilot
+
     def get_pilot_id_by_attribute(self, name, value):
         attrs = Database.PilotAttribute.query.filter_by(name=name, value=value).all()
         return [attr.id for attr in attrs]
@@ -1225,6 +1425,77 @@ class RHData():
 
         return new_heat
 
+    def add_heats_fast(self, heat_list, defaultMethod=ProgramMethod.ASSIGN):
+        # Adds heats and their heatNodes in batch; returns new heats and heatNodes by heat id
+        # !! Unsafe for general use. Intentionally light type checking,             !!
+        # !! DOES NOT commit, trigger events, clear results, or update cached data !!
+        race_classes = {race_class.id: race_class for race_class in self.get_raceClasses()}
+        auto_names = {}
+        for heat in self.get_heats():
+            race_class = race_classes.get(heat.class_id)
+            group_key = heat.group_id if race_class and race_class.round_type == RoundType.GROUPED else None
+            auto_names.setdefault((heat.class_id, group_key), []).append(heat.auto_name)
+
+        new_heats = []
+        for init in heat_list:
+            new_heat = Database.Heat(
+                class_id=RHUtils.CLASS_ID_NONE,
+                _cache_status=json.dumps({
+                    'data_ver': monotonic(),
+                    'build_ver': None
+                }),
+                order=None,
+                status=HeatStatus.PLANNED,
+                group_id=init.get('group_id', 0),
+                auto_frequency=init.get('auto_frequency', False),
+                name=init.get('name')
+                )
+
+            if int(init.get('class_id') or 0) > 0:
+                new_heat.class_id = int(init['class_id'])
+
+            race_class = race_classes.get(new_heat.class_id)
+            if race_class:
+                group_key = new_heat.group_id if race_class.round_type == RoundType.GROUPED else None
+                class_names = auto_names.setdefault((new_heat.class_id, group_key), [])
+                new_heat.auto_name = RHUtils.unique_name_from_base(race_class.display_name, class_names)
+                class_names.append(new_heat.auto_name)
+
+            Database.DB_session.add(new_heat)
+            new_heats.append(new_heat)
+
+        Database.DB_session.flush()
+
+        # ensure clean attributes on creation
+        Database.HeatAttribute.query.filter(Database.HeatAttribute.id.in_([heat.id for heat in new_heats])).\
+            delete(synchronize_session=False)
+
+        heat_nodes = {}
+        for new_heat in new_heats:
+            heat_nodes[new_heat.id] = []
+            for node_index in range(self._racecontext.race.num_nodes):
+                new_heatNode = Database.HeatNode(
+                    heat_id=new_heat.id,
+                    node_index=node_index,
+                    pilot_id=RHUtils.PILOT_ID_NONE,
+                    method=defaultMethod,
+                    seed_rank=None,
+                    seed_id=None
+                )
+                Database.DB_session.add(new_heatNode)
+                heat_nodes[new_heat.id].append(new_heatNode)
+
+        Database.DB_session.flush()
+
+        for new_heat, init in zip(new_heats, heat_list):
+            self._filters.run_filters(Flt.HEAT_ADD, new_heat, {
+                'data': init
+            })
+
+        logger.info('Heats added: {0} heats'.format(len(new_heats)))
+
+        return new_heats, heat_nodes
+
     def duplicate_heat(self, source_heat_or_id, **kwargs):
         # Add new heat by duplicating an existing one
         source_heat = self.resolve_heat_from_heat_or_id(source_heat_or_id)
@@ -1794,6 +2065,13 @@ class RHData():
         heat_id = self.resolve_id_from_heat_or_id(heat_or_id)
         return Database.HeatAttribute.query.filter_by(id=heat_id).all()
 
+    def get_heat_attributes_by_heat(self):
+        '''All heat attributes, grouped by heat id'''
+        attrs_by_heat = {}
+        for attr in Database.HeatAttribute.query.all():
+            attrs_by_heat.setdefault(attr.id, []).append(attr)
+        return attrs_by_heat
+
     def get_heat_id_by_attribute(self, name, value):
         attrs = Database.HeatAttribute.query.filter_by(name=name, value=value).all()
         return [attr.id for attr in attrs]
@@ -1820,6 +2098,19 @@ class RHData():
     def get_heatNodes_by_heat(self, heat_id):
         return Database.HeatNode.query.filter_by(heat_id=heat_id).order_by(Database.HeatNode.node_index).all()
 
+    def get_heatNodes_by_heats(self):
+        '''All heat nodes, grouped by heat id and ordered by node index'''
+        heatNodes_by_heat = {}
+        for heatNode in Database.HeatNode.query.order_by(Database.HeatNode.heat_id, Database.HeatNode.node_index).all():
+            heatNodes_by_heat.setdefault(heatNode.heat_id, []).append(heatNode)
+        return heatNodes_by_heat
+
+    def get_seeded_heatNodes(self):
+        return Database.HeatNode.query.filter(
+            Database.HeatNode.method.in_([ProgramMethod.HEAT_RESULT, ProgramMethod.CLASS_RESULT]),
+            Database.HeatNode.seed_id.isnot(None)
+            ).all()
+
     def add_heatNode(self, heat_id, node_index):
         new_heatNode = Database.HeatNode(
             heat_id=heat_id,
@@ -1839,14 +2130,16 @@ class RHData():
         else:
             return None
 
-    def alter_heatNodes_fast(self, slot_list):
+    def alter_heatNodes_fast(self, slot_list, commit=True):
         # Alters heatNodes quickly, in batch
         # !! Unsafe for general use. Intentionally light type checking,    !!
         # !! DOES NOT trigger events, clear results, or update cached data !!
 
+        slot_ids = [slot_data['slot_id'] for slot_data in slot_list]
+        slots = {slot.id: slot for slot in Database.HeatNode.query.filter(Database.HeatNode.id.in_(slot_ids)).all()}
+
         for slot_data in slot_list:
-            slot_id = slot_data['slot_id']
-            slot = Database.HeatNode.query.get(slot_id)
+            slot = slots[slot_data['slot_id']]
 
             if 'pilot' in slot_data:
                 if int(slot_data['pilot'] or 0) == 0:
@@ -1868,7 +2161,8 @@ class RHData():
             if 'seed_rank' in slot_data:
                 slot.seed_rank = slot_data['seed_rank']
 
-        self.commit()
+        if commit:
+            self.commit()
 
     def check_all_heat_nodes_filled(self, heat_id):
         heat_nodes = self.get_heatNodes_by_heat(heat_id)
@@ -2093,20 +2387,8 @@ class RHData():
         if 'class_format' in data or \
            'win_condition' in data or \
            'rank_settings' in data:
-            if len(race_list):
-                self._racecontext.pagecache.set_valid(False)
-                self.clear_results_event()
-                self.clear_results_raceClass(race_class)
-
-            if 'class_format' in data:
-                if int(data['class_format'] or 0):
-                    for race_meta in race_list:
-                        race_meta.format_id = data['class_format']
-                        self.clear_results_savedRaceMeta(race_meta)
-
-                    heats = Database.Heat.query.filter_by(class_id=race_class_id).all()
-                    for heat in heats:
-                        self.clear_results_heat(heat)
+            self.clear_results_by_raceClass(race_class, race_list,
+                data['class_format'] if 'class_format' in data else None)
 
         if 'class_attr' in data and 'value' in data:
             data['class_attr'] = self._filters.run_filters(Flt.CLASS_ALTER_ATTRIBUTE, data['class_attr'], {
@@ -2136,6 +2418,90 @@ class RHData():
 
         return race_class, race_list
 
+    def clear_results_by_raceClass(self, race_class, race_list, format_id=None):
+        # Clears results after a class's format or ranking changed; a new 'format_id' is also applied to the
+        # class's saved races ('race_list')
+        if len(race_list):
+            self._racecontext.pagecache.set_valid(False)
+            self.clear_results_event()
+            self.clear_results_raceClass(race_class)
+
+        if int(format_id or 0):
+            for race_meta in race_list:
+                race_meta.format_id = format_id
+                self.clear_results_savedRaceMeta(race_meta)
+
+            heats = Database.Heat.query.filter_by(class_id=race_class.id).all()
+            for heat in heats:
+                self.clear_results_heat(heat)
+
+    def upsert_raceClasses_fast(self, class_list):
+        # Adds or alters race classes in batch, matching on name; returns class ids in input order
+        # !! Unsafe for general use. Intentionally light type checking,             !!
+        # !! DOES NOT commit, trigger events, clear results, or update cached data !!
+        initStatus = json.dumps({
+            'data_ver': monotonic(),
+            'build_ver': None
+        })
+
+        classes_by_name = {race_class.name: race_class for race_class in self.get_raceClasses()}
+
+        race_classes = []
+        new_classes = []
+        for class_data in class_list:
+            race_class = classes_by_name.get(class_data.get('name'))
+            if race_class is None:
+                race_class = Database.RaceClass(
+                    name='',
+                    description='',
+                    format_id=RHUtils.FORMAT_ID_NONE,
+                    _cache_status=initStatus,
+                    _rank_status=initStatus,
+                    win_condition="",
+                    rank_settings=None,
+                    rounds=0,
+                    heat_advance_type=HeatAdvanceType.NEXT_HEAT,
+                    round_type=RoundType.RACES_PER_HEAT,
+                    order=None
+                    )
+                Database.DB_session.add(race_class)
+                new_classes.append((race_class, class_data))
+                if class_data.get('name'):
+                    classes_by_name[class_data['name']] = race_class
+            elif 'win_condition' in class_data:
+                race_class.rank_settings = None
+
+            for key in ['name', 'description', 'win_condition', 'heat_advance_type', 'round_type', 'order']:
+                if key in class_data:
+                    setattr(race_class, key, class_data[key])
+            if 'format_id' in class_data:
+                race_class.format_id = class_data['format_id'] if int(class_data['format_id'] or 0) else RHUtils.FORMAT_ID_NONE
+            if 'rounds' in class_data:
+                race_class.rounds = int(class_data['rounds'] or 0)
+            if class_data.get('rank_settings') and race_class.id:
+                src_settings = json.loads(race_class.rank_settings) if race_class.rank_settings else {}
+                dest_settings = class_data['rank_settings']
+                if isinstance(dest_settings, str):
+                    dest_settings = json.loads(dest_settings)
+                race_class.rank_settings = json.dumps({**src_settings, **dest_settings})
+
+            race_classes.append(race_class)
+
+        Database.DB_session.flush()
+
+        # ensure clean attributes on creation
+        Database.RaceClassAttribute.query.filter(Database.RaceClassAttribute.id.in_([c.id for c, _ in new_classes])).\
+            delete(synchronize_session=False)
+
+        for race_class, class_data in new_classes:
+            self._filters.run_filters(Flt.CLASS_ADD, race_class, {
+                'data': class_data
+            })
+
+        logger.info('Classes upserted: {0} added, {1} altered'.format(len(new_classes), len(race_classes) - len(new_classes)))
+
+        return [race_class.id for race_class in race_classes]
+
     def delete_raceClass(self, raceClass_or_id):
         race_class = self.resolve_raceClass_from_raceClass_or_id(raceClass_or_id)
 
@@ -2367,6 +2733,19 @@ class RHData():
         attrs = Database.RaceClassAttribute.query.filter_by(name=name, value=value).all()
         return [attr.id for attr in attrs]
 
+    def set_raceclass_attribute_fast(self, raceclass_or_id, name, value):
+        # !! DOES NOT commit, trigger events, or clear results !!
+        raceclass_id = self.resolve_id_from_raceClass_or_id(raceclass_or_id)
+        name = self._filters.run_filters(Flt.CLASS_ALTER_ATTRIBUTE, name, {
+            'race_class_id': raceclass_id
+        })
+
+        attribute = self.get_raceclass_attribute(raceclass_id, name)
+        if attribute:
+            attribute.value = value
+        else:
+            Database.DB_session.add(Database.RaceClassAttribute(id=raceclass_id, name=name, value=value))
+
     def raceclass_expand_heat_rounds(self, race_class_or_id, prime=False):
         race_class = self.resolve_raceClass_from_raceClass_or_id(race_class_or_id)
         if race_class.round_type == RoundType.GROUPED:
@@ -2530,6 +2909,57 @@ class RHData():
 
         return profile
 
+    def upsert_profiles_fast(self, profile_list):
+        # Adds or alters profiles in batch, matching on name; returns profile ids in input order
+        # !! Unsafe for general use. Intentionally light type checking,             !!
+        # !! DOES NOT commit, trigger events, clear results, or update cached data !!
+        profiles_by_name = {profile.name: profile for profile in self.get_profiles()}
+        seat_minimum = self._racecontext.race.num_nodes
+
+        profiles = []
+        new_profiles = []
+        for profile_data in profile_list:
+            profile = profiles_by_name.get(profile_data.get('name'))
+            if profile is None:
+                profile = Database.Profiles(
+                    name='',
+                    description='',
+                    frequencies=self._racecontext.race.profile.frequencies,
+                    enter_ats=self._racecontext.race.profile.enter_ats,
+                    exit_ats=self._racecontext.race.profile.exit_ats,
+                    f_ratio=100)
+                Database.DB_session.add(profile)
+                new_profiles.append((profile, profile_data))
+                if profile_data.get('name'):
+                    profiles_by_name[profile_data['name']] = profile
+
+            if 'name' in profile_data:
+                profile.name = profile_data['name']
+            if 'description' in profile_data:
+                profile.description = profile_data['description']
+            for key in ['frequencies', 'enter_ats', 'exit_ats']:
+                if key in profile_data:
+                    setattr(profile, key, profile_data[key] if isinstance(profile_data[key], str) else json.dumps(profile_data[key]))
+
+            freqs = json.loads(profile.frequencies)
+            if seat_minimum > min(len(freqs["b"]), len(freqs["c"]), len(freqs["f"])):
+                for key in ["b", "c", "f"]:
+                    freqs[key].extend([RHUtils.FREQUENCY_ID_NONE] * (seat_minimum - len(freqs[key])))
+                profile.frequencies = json.dumps(freqs)
+
+            profiles.append(profile)
+
+        Database.DB_session.flush()
+
+        for profile, profile_data in new_profiles:
+            self._filters.run_filters(Flt.PROFILE_ADD, profile, {
+                'data': profile_data
+            })
+
+        logger.info('Profiles upserted: {0} added, {1} altered'.format(len(new_profiles), len(profiles) - len(new_profiles)))
+
+        return [profile.id for profile in profiles]
+
     def delete_profile(self, profile_or_id):
         if len(self.get_profiles()) > 1: # keep one profile
             profile = self.resolve_profile_from_profile_or_id(profile_or_id)
@@ -2767,34 +3197,105 @@ class RHData():
         race_list = []
 
         if 'win_condition' in data or 'start_behavior' in data or 'points_method' in data or 'points_settings' in data:
-            race_list = Database.SavedRaceMeta.query.filter_by(format_id=race_format.id).all()
+            race_list = self.clear_results_by_raceFormat(race_format)
 
-            if len(race_list):
-                self._racecontext.pagecache.set_valid(False)
-                self.clear_results_event()
+        self._Events.trigger(Evt.RACE_FORMAT_ALTER, {
+            'race_format': race_format.id,
+            })
 
-                for race in race_list:
-                    self.clear_results_savedRaceMeta(race)
+        logger.info('Altered format {0} to {1}'.format(race_format.id, data))
 
-                classes = Database.RaceClass.query.filter_by(format_id=race_format.id).all()
+        return race_format, race_list
 
-                for race_class in classes:
-                    self.clear_results_raceClass(race_class)
+    def clear_results_by_raceFormat(self, race_format):
+        # Clears results scored with the format's win condition, start behavior or points; returns the saved races cleared
+        race_list = Database.SavedRaceMeta.query.filter_by(format_id=race_format.id).all()
 
-                    heats = Database.Heat.query.filter_by(class_id=race_class.id).all()
+        if len(race_list):
+            self._racecontext.pagecache.set_valid(False)
+            self.clear_results_event()
 
-                    for heat in heats:
-                        self.clear_results_heat(heat)
+            for race in race_list:
+                self.clear_results_savedRaceMeta(race)
 
-                self.commit()
+            classes = Database.RaceClass.query.filter_by(format_id=race_format.id).all()
 
-        self._Events.trigger(Evt.RACE_FORMAT_ALTER, {
-            'race_format': race_format.id,
+            for race_class in classes:
+                self.clear_results_raceClass(race_class)
+
+                heats = Database.Heat.query.filter_by(class_id=race_class.id).all()
+
+                for heat in heats:
+                    self.clear_results_heat(heat)
+
+            self.commit()
+
+        return race_list
+
+    def upsert_raceFormats_fast(self, format_list):
+        # Adds or alters race formats in batch, matching on name; returns format ids in input order
+        # Values are stored as given (as in a complete export); the active format is not altered during a race
+        # !! Unsafe for general use. Intentionally light type checking,             !!
+        # !! DOES NOT commit, trigger events, clear results, or update cached data !!
+        formats_by_name = {race_format.name: race_format for race_format in self.get_raceFormats()}
+        active_format_id = self.get_optionInt('currentFormat') \
+            if self._racecontext.race.race_status != RaceStatus.READY else None
+
+        race_formats = []
+        new_formats = []
+        for format_data in format_list:
+            race_format = formats_by_name.get(format_data.get('name'))
+            if race_format is None:
+                race_format = Database.RaceFormat(
+                    name='',
+                    unlimited_time=1,
+                    race_time_sec=0,
+                    lap_grace_sec=-1,
+                    staging_fixed_tones=0,
+                    staging_delay_tones=0,
+                    start_delay_min_ms=1000,
+                    start_delay_max_ms=1000,
+                    number_laps_win=0,
+                    win_condition=0,
+                    team_racing_mode=RacingMode.INDIVIDUAL,
+                    start_behavior=0,
+                    points_method=None)
+                Database.DB_session.add(race_format)
+                new_formats.append((race_format, format_data))
+                if format_data.get('name'):
+                    formats_by_name[format_data['name']] = race_format
+            elif race_format.id == active_format_id:
+                logger.warning('Preventing race format alteration: race in progress')
+                race_formats.append(race_format)
+                continue
+
+            for key in ['name', 'race_time_sec', 'lap_grace_sec', 'staging_fixed_tones', 'start_delay_min_ms',
+                        'start_delay_max_ms', 'start_behavior', 'win_condition', 'number_laps_win', 'points_method']:
+                if key in format_data:
+                    setattr(race_format, key, format_data[key])
+            if 'unlimited_time' in format_data:
+                race_format.unlimited_time = (1 if format_data['unlimited_time'] else 0)
+            if 'staging_delay_tones' in format_data:
+                race_format.staging_delay_tones = (2 if format_data['staging_delay_tones'] else 0)
+            if 'team_racing_mode' in format_data:
+                race_format.team_racing_mode = int(format_data['team_racing_mode']) if format_data['team_racing_mode'] else RacingMode.INDIVIDUAL
+
+            race_formats.append(race_format)
+
+        Database.DB_session.flush()
+
+        # ensure clean attributes on creation
+        Database.RaceFormatAttribute.query.filter(Database.RaceFormatAttribute.id.in_([f.id for f, _ in new_formats])).\
+            delete(synchronize_session=False)
+
+        for race_format, format_data in new_formats:
+            self._filters.run_filters(Flt.RACE_FORMAT_ADD, race_format, {
+                'data': format_data
             })
 
-        logger.info('Altered format {0} to {1}'.format(race_format.id, data))
+        logger.info('Formats upserted: {0} added, {1} altered'.format(len(new_formats), len(race_formats) - len(new_formats)))
 
-        return race_format, race_list
+        return [race_format.id for race_format in race_formats]
 
     def delete_raceFormat(self, format_id):
         # Prevent active race format change
@@ -3281,7 +3782,7 @@ class RHData():
 
         return race_meta, new_heat
 
-    def get_results_savedRaceMeta(self, savedRaceMeta_or_id, no_rebuild_flag=False):
+    def get_results_savedRaceMeta(self, savedRaceMeta_or_id, no_rebuild_flag=False, **build_params):
         race = self.resolve_savedRaceMeta_from_savedRaceMeta_or_id(savedRaceMeta_or_id)
 
         if not race:
@@ -3311,7 +3812,7 @@ class RHData():
 
         # cache rebuild
         logger.debug('Building Race {} (Heat {} Round {}) results'.format(race.id, race.heat_id, race.round_id))
-        build = Results.build_leaderboard_race(self._racecontext, heat_id=race.heat_id, round_id=race.round_id)
+        build = Results.build_leaderboard_race(self._racecontext, heat_id=race.heat_id, round_id=race.round_id, **build_params)
 
         # calc race points
         if race.format_id:
@@ -3330,6 +3831,16 @@ class RHData():
         self.set_results_savedRaceMeta(race, token, build)
         return build
 
+    def rebuild_results_savedRaceMeta_seats(self, savedRaceMeta_or_id, seats, previous_results):
+        '''
+        Rebuilds race results after the laps of 'seats' changed, re-deriving only
+        those seats' lines; the other lines are taken from 'previous_results'
+        '''
+        race = self.resolve_savedRaceMeta_from_savedRaceMeta_or_id(savedRaceMeta_or_id)
+
+        self.clear_results_savedRaceMeta(race)
+        return self.get_results_savedRaceMeta(race, reuse_results=previous_results, rebuild_seats=set(seats))
+
     def set_results_savedRaceMeta(self, savedRaceMeta_or_id, token, results):
         race = self.resolve_savedRaceMeta_from_savedRaceMeta_or_id(savedRaceMeta_or_id)
 
@@ -3390,6 +3901,13 @@ class RHData():
                 Database.SavedRaceMeta.round_id
             )).filter_by(heat_id=heat_id).scalar() or 0)
 
+    def get_max_rounds_by_heat(self):
+        '''Highest saved round for every heat with saved races'''
+        return {heat_id: int(max_round or 0) for heat_id, max_round in Database.DB_session.query(
+            Database.SavedRaceMeta.heat_id,
+            Database.DB.func.max(Database.SavedRaceMeta.round_id)
+            ).group_by(Database.SavedRaceMeta.heat_id).all()}
+
     def get_round_num_for_heat(self, heat_id):
         if heat_id and heat_id is not RHUtils.HEAT_ID_NONE:
             round_idx = self.get_max_round(heat_id)
@@ -3444,6 +3962,10 @@ class RHData():
     def savedPilotRaces_has_pilot(self, pilot_id):
         return bool(Database.SavedPilotRace.query.filter_by(pilot_id=pilot_id).count())
 
+    def get_pilot_ids_with_savedPilotRaces(self):
+        return {pilot_id for (pilot_id,) in Database.DB_session.query(
+            Database.SavedPilotRace.pilot_id).filter(Database.SavedPilotRace.pilot_id.isnot(None)).distinct()}
+
     # Race Laps
     def get_savedRaceLaps(self):
         return Database.SavedRaceLap.query.all()
@@ -3458,25 +3980,46 @@ class RHData():
         return Database.SavedRaceLap.query.filter(Database.SavedRaceLap.deleted != 1, Database.SavedRaceLap.pilotrace_id == pilotrace_id).order_by(Database.SavedRaceLap.lap_time_stamp).all()
 
     # Race general
+    SAVED_RACE_LAP_FIELDS = ('lap_time_stamp', 'lap_time', 'lap_time_formatted', 'peak_rssi', 'source', 'deleted')
+    SAVED_RACE_LAP_TIMING_FIELDS = {'lap_time_stamp', 'lap_time', 'deleted'}  # fields race results are derived from
+
     def replace_savedRaceLaps(self, data):
-        Database.SavedRaceLap.query.filter_by(pilotrace_id=data['pilotrace_id']).delete()
-
-        for lap in data['laps']:
-            Database.DB_session.add(Database.SavedRaceLap(
-                race_id=data['race_id'],
-                pilotrace_id=data['pilotrace_id'],
-                node_index=data['node_index'],
-                pilot_id=data['pilot_id'],
-                lap_time_stamp=lap['lap_time_stamp'],
-                lap_time=lap['lap_time'],
-                lap_time_formatted=lap['lap_time_formatted'],
-                peak_rssi = lap['peak_rssi'],
-                source = lap['source'],
-                deleted = lap['deleted']
-            ))
+        '''
+        Replaces the laps of a saved pilot race with 'data['laps']', writing only
+        the rows that differ; returns the set of lap fields that changed (all of
+        them when laps were added or removed)
+        '''
+        existing = Database.SavedRaceLap.query.filter_by(pilotrace_id=data['pilotrace_id']) \
+            .order_by(Database.SavedRaceLap.id).all()
+
+        changed = set()
+        for lap_row, lap in itertools.zip_longest(existing, data['laps']):
+            if lap is None:
+                Database.DB_session.delete(lap_row)
+                changed.update(self.SAVED_RACE_LAP_FIELDS)
+            elif lap_row is None:
+                Database.DB_session.add(Database.SavedRaceLap(
+                    race_id=data['race_id'],
+                    pilotrace_id=data['pilotrace_id'],
+                    node_index=data['node_index'],
+                    pilot_id=data['pilot_id'],
+                    lap_time_stamp=lap['lap_time_stamp'],
+                    lap_time=lap['lap_time'],
+                    lap_time_formatted=lap['lap_time_formatted'],
+                    peak_rssi = lap['peak_rssi'],
+                    source = lap['source'],
+                    deleted = lap['deleted']
+                ))
+                changed.update(self.SAVED_RACE_LAP_FIELDS)
+            else:
+                for field in self.SAVED_RACE_LAP_FIELDS:
+                    if getattr(lap_row, field) != lap[field]:
+                        setattr(lap_row, field, lap[field])
+                        changed.add(field)
 
-        self.commit()
-        return True
+        if changed:
+            self.commit()
+        return changed
 
     # Race general
     def add_race_data(self, data):
@@ -3628,6 +4171,34 @@ class RHData():
             Database.DB_session.add(Database.GlobalSettings(option_name=option, option_value=value))
         self.commit()
 
+    def set_options_fast(self, options):
+        # Sets options from dict in batch; returns the option values, to be cached with update_options_cache()
+        # !! DOES NOT commit or update the options cache !!
+        settings = {setting.option_name: setting for setting in self.get_options()}
+        cache_values = {}
+
+        for option, value in options.items():
+            value = self._filters.run_filters(Flt.OPTION_SET, value, {
+                'option': option
+            })
+
+            if isinstance(value, bool):
+                value = '1' if value else '0'
+
+            cache_values[option] = str(value)
+
+            if option in settings:
+                settings[option].option_value = value
+            else:
+                settings[option] = Database.GlobalSettings(option_name=option, option_value=value)
+                Database.DB_session.add(settings[option])
+
+        return cache_values
+
+    def update_options_cache(self, cache_values):
+        # Caches option values from set_options_fast() once they are committed
+        self._OptionsCache.update(cache_values)
+
     def get_optionInt(self, option, default_value=0):
         try:
             val = self._OptionsCache[option]
@@ -1,11 +1,13 @@
 '''Class to hold race management variables.'''
 import dataclasses
+import functools
 import logging
 import json
 import RHUtils
 import RHTimeFns
 import Results
 import gevent
+import gevent.event
 import random
 from dataclasses import dataclass
 from datetime import datetime
@@ -14,6 +16,8 @@ from time import monotonic
 from eventmanager import Evt
 from filtermanager import Flt
 from util.InvokeFuncQueue import InvokeFuncQueue
+from util.Metrics import metrics
+from util.PreciseSleep import sleep_until
 from RHUtils import catchLogExceptionsWrapper
 from led_event_manager import ColorVal
 from Database import RoundType
@@ -43,6 +47,8 @@ class Crossing(dict):
 
 class RHRace():
     '''Class to hold race management variables.'''
+    PASS_BATCH_MAX = 16  # most laps recorded before results and UI are updated
+
     def __init__(self, racecontext):
         # internal references
         self._racecontext = racecontext
@@ -60,6 +66,7 @@ class RHRace():
         self.scheduled_time = 0 # Start race when time reaches this value
         self.scheduler_forcing_save = False # Scheduler will force race status to ready by saving active race if needed
         self.start_token = False # Check start thread matches correct stage sequence
+        self._timers = [] # timers scheduled for the current race, cancelled when it stops
         # status
         self.race_status = RaceStatus.READY
         self.timer_running = False
@@ -68,6 +75,7 @@ class RHRace():
         self.start_time_formatted = ''
         self.start_time_monotonic = 0
         self.start_time_epoch_ms = 0 # ms since 1970-01-01
+        self.start_jitter = None # seconds the start was triggered after 'start_time_monotonic', for last race
         self.unlimited_time = True
         self.race_time_sec = 0
         self.show_init_time_flag = False  # True show 'race_time_sec' value on initial Run-page timer display (if nonzero)
@@ -90,9 +98,12 @@ class RHRace():
         self.phonetic_status_msg = '' # Phonetic version of 'status_message'
 
         self.team_results = None # current race results
+        self.team_aggregates = Results.TeamAggregates() # per-team sums reused between team leaderboard builds
         self.team_cacheStatus = None # whether cache is valid
 
         self.win_status = WinStatus.NONE # whether race is won
+        self.win_state = Results.WinConditionState() # race order and lap count bounds for win condition checks
+        self.gap_tracker = Results.GapTracker() # race order from lap events, for gap info
         self.race_winner_name = ''
         self.race_winner_phonetic = ''
         self.race_winner_lap_id = 0
@@ -109,8 +120,15 @@ class RHRace():
         self.db_id = None
         self._seat_colors = []
         self.external_flag = False # is race data controlled externally (from cluster)
-        self.pass_invoke_func_queue_obj = InvokeFuncQueue(logger)
-
+        # unbounded so that reading pass records never waits on lap processing;
+        #  laps recorded while more passes are queued are processed together when the queue empties
+        self.pass_invoke_func_queue_obj = InvokeFuncQueue(logger, maxQueueSize=None, idleFn=self.flush_recorded_laps)
+        self._queued_passes = 0  # pass records waiting in the queue (other queued calls are not counted)
+        self._recorded_laps = []  # (process function, ingest time, seat) for laps awaiting events and UI updates
+        self._node_data_pending = False
+        self.pass_latency = None  # seconds from ingest to processed, for last lap
+
+        self._results_changed_seats = None  # seats with lap changes since results were built (None: any)
         self.clear_results()
 
 
@@ -329,6 +347,7 @@ class RHRace():
                     self.start_time_monotonic = self.stage_time_monotonic + (staging_total_ms / 1000 )
 
                 self.start_time_epoch_ms = self._racecontext.serverstate.monotonic_to_epoch_millis(self.start_time_monotonic)
+                self.start_jitter = None
                 self.start_token = random.random()
 
                 if immediate:
@@ -435,18 +454,22 @@ class RHRace():
                             logger.info("Not lowering EnterAt/ExitAt values for node {0} because current RSSI ({1}) >= EnterAt ({2})"\
                                     .format(node.index+1, node.current_rssi, node.enter_at_level))
 
-            # do non-blocking delay before time-critical code
-            while (monotonic() < self.start_time_monotonic - 0.5):
-                gevent.sleep(0.1)
+            # do non-blocking delay before time-critical code; woken by the shared timers instead of polling
+            start_soon = gevent.event.Event()
+            self._racecontext.timers.call_at(self.start_time_monotonic - 0.5, start_soon.set)
+            start_soon.wait()
 
             if self.race_status == RaceStatus.STAGING and \
                 self.start_token == start_token:
                 # Only start a race if it is not already in progress
                 # Null this thread if token has changed (race stopped/started quickly)
 
-                # do blocking delay until race start
-                while monotonic() < self.start_time_monotonic:
-                    pass
+                # wait until race start; other greenlets keep running until the last fraction of a millisecond
+                start_jitter = sleep_until(self.start_time_monotonic)
+
+                # race may have been stopped or restaged while waiting
+                if self.race_status != RaceStatus.STAGING or self.start_token != start_token:
+                    return
 
                 # !!! RACE STARTS NOW !!!
 
@@ -457,6 +480,9 @@ class RHRace():
                     })
 
                 # do secondary start tasks (small delay is acceptable)
+                self.start_jitter = start_jitter
+                metrics.observe('rh_race_start_jitter_seconds', start_jitter, 'Time race start was triggered after its scheduled instant',
+                                buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
                 self.start_time = datetime.now() # record start time as datetime object
                 self.start_time_formatted = RHTimeFns.datetimeToFormattedStr(self.start_time) # record standard-formatted time
 
@@ -475,46 +501,74 @@ class RHRace():
                 self._racecontext.interface.set_race_status(RaceStatus.RACING)
                 self.timer_running = True # indicate race timer is running
 
-                # kick off race expire processing
+                # schedule race expire processing
                 race_format = self.format
                 if race_format and race_format.unlimited_time == 0: # count down
-                    gevent.spawn(self.race_expire_thread, start_token)
+                    self.call_at(self.start_time_monotonic + race_format.race_time_sec, self.race_time_expired, start_token)
 
                 self._racecontext.rhui.emit_race_status() # Race page, to set race button states
-                logger.info('Race started at {:.3f} ({:.0f}) time={}'.format(self.start_time_monotonic, self.start_time_epoch_ms, \
-                                                                                     self.start_time_formatted))
+                logger.info('Race started at {:.3f} ({:.0f}) time={} jitter={:.3f}ms'.format(self.start_time_monotonic, self.start_time_epoch_ms, \
+                                                                                     self.start_time_formatted, 1000 * start_jitter))
+
+    def call_at(self, deadline, fn, *args, **kwargs):
+        '''Schedules a callback at a monotonic deadline; pending callbacks are cancelled when the race stops'''
+        self._timers = [timer for timer in self._timers if timer.pending]
+        timer = self._racecontext.timers.call_at(deadline, fn, *args, **kwargs)
+        self._timers.append(timer)
+        return timer
+
+    def cancel_timers(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
 
     @catchLogExceptionsWrapper
-    def race_expire_thread(self, start_token):
+    def race_time_expired(self, start_token):
         APP.app_context().push()
         with self._racecontext.rhdata.get_db_session_handle():  # make sure DB session/connection is cleaned up
             race_format = self.format
-            if race_format and race_format.unlimited_time == 0: # count down
-                gevent.sleep(race_format.race_time_sec)
-                # if race still in progress and is still same race
-                if self.race_status == RaceStatus.RACING and self.start_token == start_token:
-                    logger.info("Race count-down timer reached expiration")
-                    self.timer_running = False # indicate race timer no longer running
-                    self._racecontext.events.trigger(Evt.RACE_FINISH, {
-                        'heat_id': self.current_heat,
-                        })
-                    self.pass_invoke_func_queue_obj.waitForQueueEmpty()  # wait until any active pass-record processing is finished
-                    self.check_win_condition(at_finish=True, start_token=start_token)
-                    self._racecontext.rhui.emit_current_leaderboard()
-                    if race_format.lap_grace_sec > -1:
-                        gevent.sleep((self.start_time_monotonic + race_format.race_time_sec + race_format.lap_grace_sec) - monotonic())
-                        if self.race_status == RaceStatus.RACING and self.start_token == start_token:
-                            self.stop()
-                            logger.debug("Race grace period reached")
-                        else:
-                            logger.debug("Grace period timer {} is unused".format(start_token))
-                else:
-                    logger.debug("Race-time-expire thread {} is unused".format(start_token))
+            # if race still in progress and is still same race
+            if self.race_status == RaceStatus.RACING and self.start_token == start_token:
+                logger.info("Race count-down timer reached expiration")
+                self.timer_running = False # indicate race timer no longer running
+                self._racecontext.events.trigger(Evt.RACE_FINISH, {
+                    'heat_id': self.current_heat,
+                    })
+                if race_format.lap_grace_sec > -1:
+                    self.call_at(self.start_time_monotonic + race_format.race_time_sec + race_format.lap_grace_sec, \
+                                 self.race_grace_expired, start_token)
+                self.pass_invoke_func_queue_obj.waitForQueueEmpty()  # wait until any active pass-record processing is finished
+                self.check_win_condition(at_finish=True, start_token=start_token)
+                self._racecontext.rhui.emit_current_leaderboard()
+            else:
+                logger.debug("Race-time-expire timer {} is unused".format(start_token))
+
+    @catchLogExceptionsWrapper
+    def win_consideration_expired(self, start_token):
+        APP.app_context().push()
+        with self._racecontext.rhdata.get_db_session_handle():  # make sure DB session/connection is cleaned up
+            if self.start_token == start_token:
+                logger.info("Maximum win condition consideration time has expired.")
+                self.check_win_condition(forced=True)
+                self._racecontext.rhui.emit_current_leaderboard()
+
+    @catchLogExceptionsWrapper
+    def race_grace_expired(self, start_token):
+        APP.app_context().push()
+        with self._racecontext.rhdata.get_db_session_handle():  # make sure DB session/connection is cleaned up
+            if self.race_status == RaceStatus.RACING and self.start_token == start_token:
+                self.stop()
+                logger.debug("Race grace period reached")
+            else:
+                logger.debug("Grace period timer {} is unused".format(start_token))
 
     @catchLogExceptionsWrapper
     def stop(self, doSave=False):
         '''Stops the race and stops registering laps.'''
         with self._racecontext.rhdata.get_db_session_handle():  # make sure DB session/connection is cleaned up
+            self.cancel_timers()
+            self.process_recorded_laps()  # laps recorded before the stop get their events while the race is running
+
             if self._racecontext.cluster:
                 self._racecontext.cluster.emitToSplits('stop_race')
 
@@ -529,7 +583,7 @@ class RHRace():
                         self._racecontext.interface.force_end_crossing(node.index)
                         any_forced_flag = True
                 if any_forced_flag:  # give forced end-crossings a chance to complete before stopping race
-                    gevent.spawn_later(0.5, self.do_stop_race_actions_thread, doSave)
+                    self._racecontext.timers.call_later(0.5, self.do_stop_race_actions_thread, doSave)
                 else:
                     self.do_stop_race_actions(doSave)
             else:
@@ -567,6 +621,7 @@ class RHRace():
                 'color': ColorVal.RED
             })
             self.pass_invoke_func_queue_obj.waitForQueueEmpty()  # wait until any active pass-record processing is finished
+            self.process_recorded_laps()
             self.check_win_condition()
 
             if self._racecontext.cluster and self._racecontext.cluster.hasSecondaries():
@@ -608,7 +663,7 @@ class RHRace():
 
         if doSave:
             # do with a bit of delay to prevent clearing results before stop event-actions can process them
-            gevent.spawn_later(0.05, self.do_save_actions)
+            self._racecontext.timers.call_later(0.05, self.do_save_actions)
 
     @catchLogExceptionsWrapper
     def save(self):
@@ -627,6 +682,8 @@ class RHRace():
             return False
 
         with (self._racecontext.rhdata.get_db_session_handle()):  # make sure DB session/connection is cleaned up
+            self.process_recorded_laps()  # saved results include every recorded lap
+
             if self.current_heat == RHUtils.HEAT_ID_NONE:
                 self.discard_laps(saved=True)
                 return False
@@ -735,6 +792,10 @@ class RHRace():
 
                 self.discard_laps(saved=True) # Also clear the current laps
 
+                # reseed heats which depend on this result
+                if self._racecontext.heatautomator.calc_dependent_heats(heat):
+                    self._racecontext.rhui.emit_heat_data()
+
                 regen_heat = False
                 if heat.class_id:
                     raceclass = self._racecontext.rhdata.get_raceClass(heat.class_id)
@@ -772,7 +833,19 @@ class RHRace():
             Results.build_atomic_results(self._racecontext.rhdata, params)
             self._racecontext.rhui.emit_result_data()
 
+    def queue_pass(self, node, lap_timestamp_absolute, source, **kwargs):
+        '''Queues pass record for processing; never blocks the caller.'''
+        self._queued_passes += 1
+        self.pass_invoke_func_queue_obj.put(self.add_queued_pass, node, lap_timestamp_absolute, source, \
+                                            ingest_time=monotonic(), **kwargs)
+
+    def add_queued_pass(self, node, lap_timestamp_absolute, source, **kwargs):
+        '''Handles a pass record taken from the queue.'''
+        self._queued_passes -= 1
+        self.add_lap(node, lap_timestamp_absolute, source, **kwargs)
+
     @catchLogExceptionsWrapper
+    @metrics.timed('rh_add_lap_seconds', 'Time to process a lap pass record')
     def add_lap(self, node, lap_timestamp_absolute, source, **kwargs):
         '''Handles pass records from the nodes.'''
         APP.app_context().push()
@@ -783,7 +856,10 @@ class RHRace():
                          .format(node.index+1, lap_timestamp_absolute, source, self._racecontext.interface.get_lap_source_str(source)))
             node.pass_crossing_flag = False  # clear the "synchronized" version of the crossing flag
             node.debug_pass_count += 1
-            self._racecontext.rhui.emit_node_data() # For updated triggers and peaks
+            if self.defer_lap_processing(kwargs):
+                self._node_data_pending = True
+            else:
+                self._racecontext.rhui.emit_node_data() # For updated triggers and peaks
 
             profile_freqs = json.loads(self.profile.frequencies)
             if profile_freqs["f"][node.index] != RHUtils.FREQUENCY_ID_NONE :
@@ -830,8 +906,9 @@ class RHRace():
                                 min_first_lap = self._racecontext.rhdata.get_optionInt("MinFirstCrossingSec")
                                 min_lap_behavior = self._racecontext.serverconfig.get_item_int('TIMING', "MinLapBehavior")
 
-                            lap_time_fmtstr = RHUtils.format_time_to_str(lap_time, self._racecontext.serverconfig.get_item('UI', 'timeFormat'))
-                            lap_ts_fmtstr = RHUtils.format_time_to_str(lap_time_stamp, self._racecontext.serverconfig.get_item('UI', 'timeFormat'))
+                            format_time_fn = RHUtils.compile_time_format(self._racecontext.serverconfig.get_item('UI', 'timeFormat'))
+                            lap_time_fmtstr = format_time_fn(lap_time)
+                            lap_ts_fmtstr = format_time_fn(lap_time_stamp)
                             pilot_obj = self._racecontext.rhdata.get_pilot(pilot_id)
                             if pilot_obj:
                                 pilot_namestr = pilot_obj.callsign
@@ -925,11 +1002,9 @@ class RHRace():
 
                                 if logger.getEffectiveLevel() <= logging.DEBUG:  # if DEBUG msgs actually being logged
                                     late_str = " (late lap)" if lap_late_flag else ""
-                                    enter_fmtstr = RHUtils.format_time_to_str((node.enter_at_timestamp-self.start_time_monotonic)*1000, \
-                                                                       self._racecontext.serverconfig.get_item('UI', 'timeFormat')) \
+                                    enter_fmtstr = format_time_fn((node.enter_at_timestamp-self.start_time_monotonic)*1000) \
                                                    if node.enter_at_timestamp else "0"
-                                    exit_fmtstr = RHUtils.format_time_to_str((node.exit_at_timestamp-self.start_time_monotonic)*1000, \
-                                                                      self._racecontext.serverconfig.get_item('UI', 'timeFormat')) \
+                                    exit_fmtstr = format_time_fn((node.exit_at_timestamp-self.start_time_monotonic)*1000) \
                                                    if node.exit_at_timestamp else "0"
                                     logger.debug('Lap pass{}: Node={}, lap={}, lapTime={}, sinceStart={}, abs_ts={:.3f}, passtime={}, source={}, enter={}, exit={}, dur={:.0f}ms, pilot: {}' \
                                                 .format(late_str, node.index+1, lap_number, lap_time_fmtstr, lap_ts_fmtstr, \
@@ -954,100 +1029,23 @@ class RHRace():
                                 lap_data.peak_rssi = kwargs.get('peak', None)
 
                                 self.node_laps[node.index].append(lap_data)
-
-                                self.clear_results()
-
-                                self._racecontext.events.trigger(Evt.RACE_LAP_RECORDED, {
-                                    'pilot_id': pilot_id,
-                                    'node_index': node.index,
-                                    'peak_rssi': node.pass_peak_rssi,
-                                    'frequency': node.frequency,
-                                    'color': self.seat_colors[node.index],
-                                    'lap': lap_data,
-                                    'results': self.get_results(),
-                                    'gap_info': Results.get_gap_info(self._racecontext, node.index),
-                                    'pilot_done_flag': pilot_done_flag,
-                                    })
-
-                                self._racecontext.rhui.emit_current_laps() # update all laps on the race page
-                                self._racecontext.rhui.emit_current_leaderboard() # generate and update leaderboard
-
-                                if lap_number == 0:
-                                    self._racecontext.rhui.emit_first_pass_registered(node.index) # play first-pass sound
-                                    if not self.race_initial_pass_flag:
-                                        self.race_initial_pass_flag = True
-                                        self._racecontext.events.trigger(Evt.RACE_INITIAL_PASS)
-
-                                if race_format.start_behavior == StartBehavior.FIRST_LAP:
-                                    lap_number += 1
-
-                                # announce lap
-                                if lap_number > 0:
-                                    check_leader = race_format.win_condition != WinCondition.NONE and \
-                                                   self.win_status != WinStatus.DECLARED
-                                    # announce pilot lap number unless winner declared and pilot has finished final lap
-                                    lap_id = lap_number if self.win_status != WinStatus.DECLARED or \
-                                                           (not node_finished_flag) else None
-                                    if race_format.team_racing_mode == RacingMode.TEAM_ENABLED:
-                                        team_name = pilot_obj.team if pilot_obj else ""
-                                        team_laps = self.team_results['meta']['teams'][team_name]['laps']
-                                        if not lap_late_flag:
-                                            logger.debug('Lap pass: Node={}, lap={}, pilot={} -> Team {} lap {}' \
-                                                  .format(node.index+1, lap_number, pilot_namestr, team_name, team_laps))
-                                        # if winning team has been declared then don't announce team lap number
-                                        if self.win_status == WinStatus.DECLARED:
-                                            team_phonetic = ' '
-                                            team_short_phonetic = None
-                                        else:
-                                            team_phonetic = self.__("Team") + " " + team_name + ", " + self.__("Lap") + \
-                                                            " " + str(team_laps)
-                                            team_short_phonetic = self.__("Lap") + " " + str(team_laps)
-                                        self._racecontext.rhui.emit_phonetic_data(pilot_id, lap_id, lap_time, team_phonetic, \
-                                                        (check_leader and \
-                                                         team_name == Results.get_leading_team_name(self.team_results)), \
-                                                        node_finished_flag, node.index)
-                                    elif race_format.team_racing_mode == RacingMode.COOP_ENABLED:
-                                        coop_laps = self.team_results['by_race_time'][0]['laps']
-                                        if not lap_late_flag:
-                                            logger.debug('Lap pass: Node={}, lap={}, pilot={} -> Co-op lap {}' \
-                                                         .format(node.index+1, lap_number, pilot_namestr, coop_laps))
-                                        # if win has been declared then don't announce coop lap number
-                                        if self.win_status == WinStatus.DECLARED:
-                                            team_phonetic = ' '
-                                            team_short_phonetic = None
-                                        else:
-                                            team_phonetic =  self.__("Co-op") + " " +  self.__("Lap") + " " + str(coop_laps)
-                                            team_short_phonetic = self.__("Lap") + " " + str(coop_laps)
-                                        self._racecontext.rhui.emit_phonetic_data(pilot_id, lap_id, lap_time, \
-                                                            team_phonetic, False, node_finished_flag, node.index, \
-                                                            team_short_phonetic=team_short_phonetic)
-                                    else:
-                                        if check_leader:
-                                            leader_pilot_id, leader_node_idx = Results.get_leading_pilot_id_and_node_idx(
-                                                            self, self._racecontext.interface, True)
-                                        else:
-                                            leader_pilot_id = RHUtils.PILOT_ID_NONE
-                                            leader_node_idx = -1
-                                        self._racecontext.rhui.emit_phonetic_data(pilot_id, lap_id, lap_time, None, \
-                                                        (pilot_id == leader_pilot_id), node_finished_flag, node.index)
-                                        if leader_pilot_id != RHUtils.PILOT_ID_NONE:
-                                            # if new leading pilot was not called out above (different pilot) then call out now
-                                            if leader_pilot_id != pilot_id:
-                                                self._racecontext.rhui.emit_phonetic_leader(leader_pilot_id)
-                                                leader_pilot_obj = self._racecontext.rhdata.get_pilot(leader_pilot_id)
-                                                if leader_pilot_obj:
-                                                    logger.info('Pilot {} is leading'.format(leader_pilot_obj.callsign))
-                                            else:
-                                                logger.info('Pilot {} is leading'.format(pilot_namestr))
-                                            self._racecontext.events.trigger(Evt.RACE_PILOT_LEADING, {
-                                                'pilot_id': leader_pilot_id,
-                                                'node_index': leader_node_idx
-                                            })
-
-                                    # check for and announce possible winner and trigger possible pilot-done events
-                                    #  (but wait until pass-record processings are finished)
-                                    self.pass_invoke_func_queue_obj.put(self.finish_add_lap_processing, \
-                                                    pilot_done_flag, pilot_id, pilot_obj, node, emit_leaderboard_on_win=True)
+                                if not lap_data.deleted:
+                                    self.win_state.add_crossing(node.index, lap_data.lap_time)
+                                    if self.current_heat == RHUtils.HEAT_ID_NONE:
+                                        self.gap_tracker.add_crossing(node.index, lap_data, None, pilot_namestr)
+                                    elif pilot_obj:
+                                        # leaderboard has one line per pilot, from the pilot's first seat
+                                        line_seat = next((idx for idx, seat_pilot in self.node_pilots.items() \
+                                                          if seat_pilot == pilot_id), None)
+                                        self.gap_tracker.add_crossing(node.index, lap_data, pilot_id, pilot_obj.callsign, \
+                                                                      has_line=(line_seat == node.index))
+
+                                self._recorded_laps.append((functools.partial(self.process_recorded_lap, node, pilot_id, \
+                                    pilot_obj, pilot_namestr, lap_data, lap_number, lap_time, lap_late_flag, \
+                                    node_finished_flag, pilot_done_flag, race_format), kwargs.get('ingest_time'), node.index))
+
+                                if not self.defer_lap_processing(kwargs):
+                                    self.process_recorded_laps()
 
                             else:
                                 # record lap as 'invalid'
@@ -1072,6 +1070,142 @@ class RHRace():
                 logger.debug('Pass record dismissed: Node {}, Frequency not defined (abs_ts={:.3f}, source={})' \
                     .format(node.index+1, lap_timestamp_absolute, self._racecontext.interface.get_lap_source_str(source)))
 
+    def defer_lap_processing(self, kwargs):
+        '''True if more queued passes should be recorded before updating results and UI.'''
+        return kwargs.get('ingest_time') is not None and \
+            self._queued_passes > 0 and \
+            len(self._recorded_laps) < self.PASS_BATCH_MAX
+
+    def process_recorded_laps(self):
+        '''Rebuilds results once for all recorded laps, then runs their events and callouts.'''
+        if self._node_data_pending:
+            self._node_data_pending = False
+            self._racecontext.rhui.emit_node_data()
+        if not self._recorded_laps:
+            return
+        recorded_laps = self._recorded_laps
+        self._recorded_laps = []
+
+        self.clear_results(seats=[seat for _process_fn, _ingest_time, seat in recorded_laps])
+        for idx, (process_fn, _ingest_time, _seat) in enumerate(recorded_laps):
+            process_fn(emit_flag=(idx == len(recorded_laps) - 1))
+
+        now = monotonic()
+        metrics.observe('rh_pass_batch_size', len(recorded_laps), 'Laps processed per results update',
+                        buckets=(1, 2, 4, 8, 16))
+        for _process_fn, ingest_time, _seat in recorded_laps:
+            if ingest_time is not None:
+                self.pass_latency = now - ingest_time
+                metrics.observe('rh_pass_latency_seconds', self.pass_latency, 'Time from pass ingest to lap processed')
+
+    def recorded_laps_pending(self):
+        '''True if laps are recorded in node_laps but results have not been rebuilt for them.'''
+        return bool(self._recorded_laps)
+
+    @catchLogExceptionsWrapper
+    def flush_recorded_laps(self):
+        '''Processes laps deferred while passes were queued (called when pass queue empties).'''
+        if self._recorded_laps or self._node_data_pending:
+            APP.app_context().push()
+            with self._racecontext.rhdata.get_db_session_handle():
+                self.process_recorded_laps()
+
+    def process_recorded_lap(self, node, pilot_id, pilot_obj, pilot_namestr, lap_data, lap_number, lap_time, \
+                             lap_late_flag, node_finished_flag, pilot_done_flag, race_format, emit_flag=True):
+        '''Triggers events, UI updates and callouts for a lap added to node_laps.'''
+        gap_info = Results.get_gap_info(self._racecontext, node.index)  # before the leaderboard is rebuilt
+        self._racecontext.events.trigger(Evt.RACE_LAP_RECORDED, {
+            'pilot_id': pilot_id,
+            'node_index': node.index,
+            'peak_rssi': node.pass_peak_rssi,
+            'frequency': node.frequency,
+            'color': self.seat_colors[node.index],
+            'lap': lap_data,
+            'results': self.get_results(),
+            'gap_info': gap_info,
+            'pilot_done_flag': pilot_done_flag,
+            })
+
+        if emit_flag:
+            self._racecontext.rhui.emit_current_laps() # update all laps on the race page
+            self._racecontext.rhui.emit_current_leaderboard() # generate and update leaderboard
+
+        if lap_number == 0:
+            self._racecontext.rhui.emit_first_pass_registered(node.index) # play first-pass sound
+            if not self.race_initial_pass_flag:
+                self.race_initial_pass_flag = True
+                self._racecontext.events.trigger(Evt.RACE_INITIAL_PASS)
+
+        if race_format.start_behavior == StartBehavior.FIRST_LAP:
+            lap_number += 1
+
+        # announce lap
+        if lap_number > 0:
+            check_leader = race_format.win_condition != WinCondition.NONE and \
+                           self.win_status != WinStatus.DECLARED
+            # announce pilot lap number unless winner declared and pilot has finished final lap
+            lap_id = lap_number if self.win_status != WinStatus.DECLARED or \
+                                   (not node_finished_flag) else None
+            if race_format.team_racing_mode == RacingMode.TEAM_ENABLED:
+                team_name = pilot_obj.team if pilot_obj else ""
+                team_laps = self.team_results['meta']['teams'][team_name]['laps']
+                if not lap_late_flag:
+                    logger.debug('Lap pass: Node={}, lap={}, pilot={} -> Team {} lap {}' \
+                          .format(node.index+1, lap_number, pilot_namestr, team_name, team_laps))
+                # if winning team has been declared then don't announce team lap number
+                if self.win_status == WinStatus.DECLARED:
+                    team_phonetic = ' '
+                    team_short_phonetic = None
+                else:
+                    team_phonetic = self.__("Team") + " " + team_name + ", " + self.__("Lap") + \
+                                    " " + str(team_laps)
+                    team_short_phonetic = self.__("Lap") + " " + str(team_laps)
+                self._racecontext.rhui.emit_phonetic_data(pilot_id, lap_id, lap_time, team_phonetic, \
+                                (check_leader and \
+                                 team_name == Results.get_leading_team_name(self.team_results)), \
+                                node_finished_flag, node.index)
+            elif race_format.team_racing_mode == RacingMode.COOP_ENABLED:
+                coop_laps = self.team_results['by_race_time'][0]['laps']
+                if not lap_late_flag:
+                    logger.debug('Lap pass: Node={}, lap={}, pilot={} -> Co-op lap {}' \
+                                 .format(node.index+1, lap_number, pilot_namestr, coop_laps))
+                # if win has been declared then don't announce coop lap number
+                if self.win_status == WinStatus.DECLARED:
+                    team_phonetic = ' '
+                    team_short_phonetic = None
+                else:
+                    team_phonetic =  self.__("Co-op") + " " +  self.__("Lap") + " " + str(coop_laps)
+                    team_short_phonetic = self.__("Lap") + " " + str(coop_laps)
+                self._racecontext.rhui.emit_phonetic_data(pilot_id, lap_id, lap_time, \
+                                    team_phonetic, False, node_finished_flag, node.index, \
+                                    team_short_phonetic=team_short_phonetic)
+            else:
+                if check_leader:
+                    leader_pilot_id, leader_node_idx = Results.get_leading_pilot_id_and_node_idx(
+                                    self, self._racecontext.interface, True)
+                else:
+                    leader_pilot_id = RHUtils.PILOT_ID_NONE
+                    leader_node_idx = -1
+                self._racecontext.rhui.emit_phonetic_data(pilot_id, lap_id, lap_time, None, \
+                                (pilot_id == leader_pilot_id), node_finished_flag, node.index)
+                if leader_pilot_id != RHUtils.PILOT_ID_NONE:
+                    # if new leading pilot was not called out above (different pilot) then call out now
+                    if leader_pilot_id != pilot_id:
+                        self._racecontext.rhui.emit_phonetic_leader(leader_pilot_id)
+                        leader_pilot_obj = self._racecontext.rhdata.get_pilot(leader_pilot_id)
+                        if leader_pilot_obj:
+                            logger.info('Pilot {} is leading'.format(leader_pilot_obj.callsign))
+                    else:
+                        logger.info('Pilot {} is leading'.format(pilot_namestr))
+                    self._racecontext.events.trigger(Evt.RACE_PILOT_LEADING, {
+                        'pilot_id': leader_pilot_id,
+                        'node_index': leader_node_idx
+                    })
+
+            # check for and announce possible winner and trigger possible pilot-done events
+            #  (but wait until pass-record processings are finished)
+            self.pass_invoke_func_queue_obj.put(self.finish_add_lap_processing, \
+                            pilot_done_flag, pilot_id, pilot_obj, node, emit_leaderboard_on_win=True)
     # check for and announce possible winner and trigger possible pilot-done events
     @catchLogExceptionsWrapper
     def finish_add_lap_processing(self, pilot_done_flag, done_pilot_id, done_pilot_obj, done_node_obj, **kwargs):
@@ -1183,6 +1317,8 @@ class RHRace():
             elif db_next:
                 db_next.lap_time = db_next.lap_time_stamp
                 db_next.lap_time_formatted = RHUtils.format_time_to_str(db_next.lap_time, self._racecontext.serverconfig.get_item('UI', 'timeFormat'))
+            self.win_state.sync(self.node_laps)
+            self.gap_tracker.sync(self.node_laps)
 
             try:  # delete any split laps for deleted lap
                 lap_splits = self._racecontext.rhdata.get_lapSplits_by_lap(node_index, lap_number)
@@ -1198,7 +1334,7 @@ class RHRace():
 
             logger.info('Lap deleted: Node {0} LapIndex {1}'.format(node_index+1, lap_index))
 
-            self.clear_results()
+            self.clear_results(seats=(node_index,))
             self.pass_invoke_func_queue_obj.waitForQueueEmpty()  # wait until any active pass-record processing is finished
             self.get_results()  # update leaderboard before checking possible updated winner/leader
             self.check_win_condition(deletedLap=True)  # handle possible change in win status
@@ -1240,9 +1376,11 @@ class RHRace():
             lap_objs.append(lap_data)
 
         self.node_laps[node] = lap_objs
+        self.win_state.sync(self.node_laps)
+        self.gap_tracker.sync(self.node_laps)
 
         self.clear_lap_results()
-        self.clear_results()
+        self.clear_results(seats=(node,))
 
         self._racecontext.rhui.emit_current_leaderboard()
         self._racecontext.rhui.emit_current_laps()
@@ -1280,6 +1418,8 @@ class RHRace():
                         lap.lap_time_formatted = RHUtils.format_time_to_str(lap.lap_time, self._racecontext.serverconfig.get_item('UI', 'timeFormat'))
                     last_lap_ts = lap.lap_time_stamp
                     lap_number += 1
+            self.win_state.sync(self.node_laps)
+            self.gap_tracker.sync(self.node_laps)
 
             self._racecontext.events.trigger(Evt.LAP_RESTORE_DELETED, {
                 'node_index': node_index,
@@ -1287,7 +1427,7 @@ class RHRace():
 
             logger.info('Restored deleted lap: Node {0} LapIndex {1}'.format(node_index+1, lap_index))
 
-            self.clear_results()
+            self.clear_results(seats=(node_index,))
             self.pass_invoke_func_queue_obj.waitForQueueEmpty()  # wait until any active pass-record processing is finished
             self.get_results()  # update leaderboard before checking possible updated winner/leader
             self.check_win_condition(deletedLap=True)  # handle possible change in win status
@@ -1354,6 +1494,12 @@ class RHRace():
         self.node_laps = {}
         for idx in range(self.num_nodes):
             self.node_laps[idx] = []
+        self.win_state.reset()
+        self.gap_tracker.reset()
+        self.team_aggregates.reset()
+        # drop laps deferred while passes were queued; they belong to the cleared race
+        self._recorded_laps = []
+        self._node_data_pending = False
 
         self.clear_results()
         logger.debug('Database current laps reset')
@@ -1604,12 +1750,11 @@ class RHRace():
                     logger.info("Race status msg:  Race Tied: Overtime")
                     self._racecontext.rhui.emit_phonetic_text(self.status_message, 'race_winner')
 
-            if 'max_consideration' in win_status_dict:
+            if 'max_consideration' in win_status_dict and 'start_token' in kwargs:
                 logger.info("Waiting {0}ms to declare winner.".format(win_status_dict['max_consideration']))
-                gevent.sleep(win_status_dict['max_consideration'] / 1000)
-                if 'start_token' in kwargs and self.start_token == kwargs['start_token']:
-                    logger.info("Maximum win condition consideration time has expired.")
-                    self.check_win_condition(forced=True)
+                # not tied to the race timers, so a winner can still be declared if the race is stopped meanwhile
+                self._racecontext.timers.call_at(monotonic() + win_status_dict['max_consideration'] / 1000, \
+                                                 self.win_consideration_expired, kwargs['start_token'])
 
             if 'emit_leaderboard_on_win' in kwargs:
                 if self.win_status != WinStatus.NONE:
@@ -1745,8 +1890,17 @@ class RHRace():
 
         # cache rebuild
         # logger.debug('Building current race results')
+        changed_seats = self._results_changed_seats
+        self._results_changed_seats = set()
         build = Results.calc_leaderboard(self._racecontext, current_race=self, current_profile=self.profile)
         self.set_results(token, build)
+        if self.cacheStatus['build_ver'] == token:
+            if self._filters.has_filters(Flt.RACE_RESULTS):
+                changed_seats = None  # filters may alter any line
+            if self.results:
+                self.team_aggregates.results_built(self.results.get('by_race_time'), changed_seats)
+        elif changed_seats is not None and self._results_changed_seats is not None:
+            self._results_changed_seats |= changed_seats  # build not taken; its seats carry over to the next one
         return build
 
     def get_team_results(self):
@@ -1821,10 +1975,16 @@ class RHRace():
         }
         return True
 
-    def clear_results(self, token=None):
+    def clear_results(self, token=None, seats=None):
+        '''Invalidates results; 'seats' names the seats whose laps changed, if only those did.'''
         if token is None:
             token = monotonic()
 
+        if seats is None:
+            self._results_changed_seats = None
+        elif self._results_changed_seats is not None:
+            self._results_changed_seats.update(seats)
+
         self.lap_cacheStatus = {
             'data_ver': token,
             'build_ver': None
@@ -11,7 +11,6 @@ from flask_socketio import emit
 from eventmanager import Evt
 import json
 import os
-import subprocess
 import urllib3
 import re
 from collections import OrderedDict
@@ -19,7 +18,9 @@ import gevent
 from packaging import version
 import RHUtils
 from RHUtils import catchLogExceptionsWrapper
-from Database import ProgramMethod, RoundType
+import IMDCalc
+from Database import ProgramMethod, RoundType, Heat, HeatNode, HeatAttribute, RaceClass, SavedRaceMeta, \
+    Pilot, PilotAttribute, SavedPilotRace, data_version, watch_rows, rows_written_since
 from RHRace import RacingMode, RaceStatus
 from filtermanager import Flt
 import logging
@@ -140,6 +141,9 @@ class RHUI():
         self._quickbuttons = []
         self._markdowns = []
         self._UI_server_messages = {}
+        self._heat_views = None  # (key, heat list rows) for 'heat_data'
+        self._pilot_views = None  # rows by pilot id for 'pilot_data', with the data version they reflect
+        watch_rows(Pilot, PilotAttribute)
 
     # Pilot Attributes
     def register_pilot_attribute(self, field:UIField):
@@ -741,6 +745,19 @@ class RHUI():
         else:
             self._socket.emit('environmental_data', emit_payload)
 
+    def emit_sensor_history(self, sensor_name, reading_name=None, resolution=None, since=None, **params):
+        '''Emits recorded history of a sensor's readings.'''
+        emit_payload = {
+            'sensor': sensor_name,
+            'reading': reading_name,
+            'history': self._racecontext.sensors.get_history(sensor_name, reading_name, resolution, since)
+        }
+
+        if ('nobroadcast' in params):
+            emit('sensor_history', emit_payload)
+        else:
+            self._socket.emit('sensor_history', emit_payload)
+
     def emit_enter_and_exit_at_levels(self, **params):
         '''Emits enter-at and exit-at levels for nodes.'''
         profile = self._racecontext.race.profile
@@ -1228,8 +1245,43 @@ class RHUI():
                 types[attr.name] = attr.field_type
                 attrs.append(attr.frontend_repr())
 
+        heats = [dict(heat, slots=[dict(slot) for slot in heat['slots']]) for heat in self.get_heat_views(types)]
+
+        emit_payload = {
+            'heats': heats,
+            'attributes': attrs
+        }
+
+        emit_payload = self._filters.run_filters(Flt.EMIT_HEAT_DATA, emit_payload)
+
+        if ('nobroadcast' in params):
+            emit('heat_data', emit_payload)
+        elif ('noself' in params):
+            emit('heat_data', emit_payload, broadcast=True, include_self=False)
+        else:
+            self._socket.emit('heat_data', emit_payload)
+
+    def get_heat_views(self, types):
+        '''
+        Heat list rows for 'heat_data', built from one query per table and kept
+        until heats, slots, heat attributes, saved races or classes are written.
+        '''
+        key = (data_version(Heat, HeatNode, HeatAttribute, SavedRaceMeta, RaceClass), tuple(types.items()),
+               self._racecontext.serverconfig.get_item('UI', 'currentLanguage'))
+        if self._heat_views is None or self._heat_views[0] != key:
+            self._heat_views = (key, self.build_heat_views(types))
+        return self._heat_views[1]
+
+    def build_heat_views(self, types):
+        rhdata = self._racecontext.rhdata
+        heatNodes_by_heat = rhdata.get_heatNodes_by_heats()
+        max_rounds = rhdata.get_max_rounds_by_heat()  # only heats with saved races
+        attrs_by_heat = rhdata.get_heat_attributes_by_heat()
+        # held so Heat.display_name finds its class in the session instead of querying per heat
+        raceClasses = rhdata.get_raceClasses()
+
         heats = []
-        for heat in self._racecontext.rhdata.get_heats():
+        for heat in rhdata.get_heats():
             current_heat = {}
             current_heat['id'] = heat.id
             current_heat['displayname'] = heat.display_name
@@ -1245,19 +1297,12 @@ class RHUI():
                                     if isinstance(heat.coop_best_time, (int, float)) and \
                                                         heat.coop_best_time >= 0.001 else ''
             current_heat['coop_num_laps'] = heat.coop_num_laps
-            current_heat['next_round'] = self._racecontext.rhdata.get_max_round(heat.id)
+            current_heat['next_round'] = max_rounds.get(heat.id, 0)
 
             current_heat['slots'] = []
 
-            heatNodes = self._racecontext.rhdata.get_heatNodes_by_heat(heat.id)
-            def heatNodeSorter(x):
-                if not x.node_index:
-                    return -1
-                return x.node_index
-            heatNodes.sort(key=heatNodeSorter)
-
             is_dynamic = False
-            for heatNode in heatNodes:
+            for heatNode in heatNodes_by_heat.get(heat.id, []):
                 current_node = {}
                 current_node['id'] = heatNode.id
                 current_node['node_index'] = heatNode.node_index
@@ -1272,28 +1317,14 @@ class RHUI():
                     is_dynamic = True
 
             current_heat['dynamic'] = is_dynamic
-            current_heat['locked'] = bool(self._racecontext.rhdata.savedRaceMetas_has_heat(heat.id))
+            current_heat['locked'] = heat.id in max_rounds
 
-            heat_attributes = self._racecontext.rhdata.get_heat_attributes(heat)
-            for attr in heat_attributes:
+            for attr in attrs_by_heat.get(heat.id, []):
                 if types.get(attr.name):
                     current_heat[attr.name] = attr.value != '0' if types.get(attr.name) == UIFieldType.CHECKBOX else attr.value
 
             heats.append(current_heat)
-
-        emit_payload = {
-            'heats': heats,
-            'attributes': attrs
-        }
-
-        emit_payload = self._filters.run_filters(Flt.EMIT_HEAT_DATA, emit_payload)
-
-        if ('nobroadcast' in params):
-            emit('heat_data', emit_payload)
-        elif ('noself' in params):
-            emit('heat_data', emit_payload, broadcast=True, include_self=False)
-        else:
-            self._socket.emit('heat_data', emit_payload)
+        return heats
 
     def emit_heat_attribute_types(self, **params):
         '''Emits heat attribute meta.'''
@@ -1525,8 +1556,6 @@ class RHUI():
 
     def emit_pilot_data(self, **params):
         '''Emits pilot data.'''
-        pilots_list = []
-
         attrs = []
         types = {}
         for attr in self.pilot_attributes:
@@ -1534,34 +1563,7 @@ class RHUI():
                 types[attr.name] = attr.field_type
                 attrs.append(attr.frontend_repr())
 
-        for pilot in self._racecontext.rhdata.get_pilots():
-            opts_str = '' # create team-options string for each pilot, with current team selected
-            for name in self._racecontext.rhdata.TEAM_NAMES_LIST:
-                opts_str += '<option value="' + name + '"'
-                if name == pilot.team:
-                    opts_str += ' selected'
-                opts_str += '>' + name + '</option>'
-
-            locked = self._racecontext.rhdata.savedPilotRaces_has_pilot(pilot.id)
-
-            pilot_data = {
-                'pilot_id': pilot.id,
-                'callsign': pilot.callsign,
-                'team': pilot.team,
-                'phonetic': pilot.phonetic,
-                'name': pilot.name,
-                'active': pilot.active,
-                'team_options': opts_str,
-                'color': pilot.color,
-                'locked': locked,
-            }
-
-            pilot_attributes = self._racecontext.rhdata.get_pilot_attributes(pilot)
-            for attr in pilot_attributes:
-                if types.get(attr.name):
-                    pilot_data[attr.name] = attr.value != '0' if types.get(attr.name) == UIFieldType.CHECKBOX else attr.value
-
-            pilots_list.append(pilot_data)
+        pilots_list = [dict(pilot) for pilot in self.get_pilot_views(types).values()]
 
         if self._racecontext.serverconfig.get_item('UI', 'pilotSort') == 'callsign':
             pilots_list.sort(key=lambda x: (x['callsign'].casefold(), x['name'].casefold()))
@@ -1570,6 +1572,7 @@ class RHUI():
 
         emit_payload = {
             'pilots': pilots_list,
+            'teams': self._racecontext.rhdata.TEAM_NAMES_LIST,
             'pilotSort': self._racecontext.serverconfig.get_item('UI', 'pilotSort'),
             'attributes': attrs
         }
@@ -1583,6 +1586,72 @@ class RHUI():
         else:
             self._socket.emit('pilot_data', emit_payload)
 
+    def get_pilot_views(self, types):
+        '''
+        Pilot list rows for 'pilot_data' by pilot id. Built from bulk loads, then
+        patched for just the pilots written since; rebuilt when those can't be
+        told apart, the database is reopened or the attribute types change.
+        '''
+        version = data_version(Pilot, PilotAttribute, SavedPilotRace)
+        types_key = tuple(types.items())
+        cache = self._pilot_views
+        if cache and cache['version'] == version and cache['types'] == types_key:
+            return cache['rows']
+
+        rhdata = self._racecontext.rhdata
+        changed = None
+        if cache and cache['types'] == types_key and cache['version'][0] == version[0]:
+            pilot_ids = rows_written_since(Pilot, cache['version'][1])
+            attr_pilot_ids = rows_written_since(PilotAttribute, cache['version'][2])
+            if pilot_ids is not None and attr_pilot_ids is not None:
+                changed = pilot_ids | attr_pilot_ids
+
+        if changed is None:
+            locked = rhdata.get_pilot_ids_with_savedPilotRaces()
+            attrs_by_pilot = rhdata.get_pilot_attributes_by_pilot()
+            rows = {pilot.id: self.build_pilot_view(pilot, pilot.id in locked, attrs_by_pilot.get(pilot.id, []), types) \
+                    for pilot in rhdata.get_pilots()}
+        else:
+            rows = cache['rows']
+            locked = cache['locked']
+            if cache['version'][3] != version[3]:
+                locked = rhdata.get_pilot_ids_with_savedPilotRaces()
+                for row in rows.values():
+                    row['locked'] = row['pilot_id'] in locked
+
+            for pilot_id in changed:
+                pilot = rhdata.get_pilot(pilot_id)
+                if pilot:
+                    rows[pilot_id] = self.build_pilot_view(pilot, pilot_id in locked, rhdata.get_pilot_attributes(pilot_id), types)
+                else:
+                    rows.pop(pilot_id, None)
+
+        self._pilot_views = {
+            'version': version,
+            'types': types_key,
+            'rows': rows,
+            'locked': locked,
+        }
+        return rows
+
+    def build_pilot_view(self, pilot, locked, pilot_attributes, types):
+        pilot_data = {
+            'pilot_id': pilot.id,
+            'callsign': pilot.callsign,
+            'team': pilot.team,
+            'phonetic': pilot.phonetic,
+            'name': pilot.name,
+            'active': pilot.active,
+            'color': pilot.color,
+            'locked': locked,
+        }
+
+        for attr in pilot_attributes:
+            if types.get(attr.name):
+                pilot_data[attr.name] = attr.value != '0' if types.get(attr.name) == UIFieldType.CHECKBOX else attr.value
+
+        return pilot_data
+
     def emit_seat_data(self, **params):
         """Emits seat data."""
         seat_list = []
@@ -1886,29 +1955,25 @@ class RHUI():
         if callouts:
             emit('callouts', json.loads(callouts))
 
-    def emit_imdtabler_page(self, IMDTABLER_JAR_NAME, Use_imdtabler_jar_flag, **_params):
+    def get_imdtabler_freqs(self):
+        '''Unique non-zero frequencies of current profile.'''
+        profile_freqs = json.loads(self._racecontext.race.profile.frequencies)
+        fi_list = list(OrderedDict.fromkeys(profile_freqs['f'][:self._racecontext.race.num_nodes]))  # remove duplicates
+        return [str(val) for val in fi_list if val > 0]  # drop any zero entries
+
+    def emit_imdtabler_page(self, **params):
         '''Emits IMDTabler page, using current profile frequencies.'''
-        if Use_imdtabler_jar_flag:
-            try:                          # get IMDTabler version string
-                imdtabler_ver = subprocess.check_output( \
-                                    'java -jar ' + IMDTABLER_JAR_NAME + ' -v', shell=True).decode("utf-8").rstrip()
-                profile_freqs = json.loads(self._racecontext.race.profile.frequencies)
-                fi_list = list(OrderedDict.fromkeys(profile_freqs['f'][:self._racecontext.race.num_nodes]))  # remove duplicates
-                fs_list = []
-                for val in fi_list:  # convert list of integers to list of strings
-                    if val > 0:      # drop any zero entries
-                        fs_list.append(str(val))
-                self.emit_imdtabler_data(IMDTABLER_JAR_NAME, fs_list, imdtabler_ver)
-            except Exception:
-                logger.exception('emit_imdtabler_page exception')
-
-    def emit_imdtabler_data(self, IMDTABLER_JAR_NAME, fs_list, imdtabler_ver=None, **params):
+        try:
+            self.emit_imdtabler_data(self.get_imdtabler_freqs(), IMDCalc.VERSION_STR, **params)
+        except Exception:
+            logger.exception('emit_imdtabler_page exception')
+
+    def emit_imdtabler_data(self, fs_list, imdtabler_ver=None, **params):
         '''Emits IMDTabler data for given frequencies.'''
         try:
             imdtabler_data = None
-            if len(fs_list) > 2:  # if 3+ then invoke jar; get response
-                imdtabler_data = subprocess.check_output( \
-                            'java -jar ' + IMDTABLER_JAR_NAME + ' -t ' + ' '.join(fs_list), shell=True).decode("utf-8")
+            if len(fs_list) > 2:  # if 3+ then calculate table (off the event loop)
+                imdtabler_data = IMDCalc.run_in_worker(IMDCalc.imd_table_html, fs_list)
         except Exception:
             imdtabler_data = None
             logger.exception('emit_imdtabler_data exception')
@@ -1922,19 +1987,13 @@ class RHUI():
         else:
             self._socket.emit('imdtabler_data', emit_payload)
 
-    def emit_imdtabler_rating(self, IMDTABLER_JAR_NAME):
+    def emit_imdtabler_rating(self):
         '''Emits IMDTabler rating for current profile frequencies.'''
         try:
-            profile_freqs = json.loads(self._racecontext.race.profile.frequencies)
             imd_val = None
-            fi_list = list(OrderedDict.fromkeys(profile_freqs['f'][:self._racecontext.race.num_nodes]))  # remove duplicates
-            fs_list = []
-            for val in fi_list:  # convert list of integers to list of strings
-                if val > 0:      # drop any zero entries
-                    fs_list.append(str(val))
+            fs_list = self.get_imdtabler_freqs()
             if len(fs_list) > 2:
-                imd_val = subprocess.check_output(  # invoke jar; get response
-                            'java -jar ' + IMDTABLER_JAR_NAME + ' -r ' + ' '.join(fs_list), shell=True).decode("utf-8").rstrip()
+                imd_val = str(IMDCalc.run_in_worker(IMDCalc.imd_rating, fs_list))
         except Exception:
             imd_val = None
             logger.exception('emit_imdtabler_rating exception')
@@ -1943,6 +2002,16 @@ class RHUI():
             }
         self._socket.emit('imdtabler_rating', emit_payload)
 
+    def emit_database_recover_progress(self, table_name, count, total):
+        '''Emits progress of database recovery for one table.'''
+        emit_payload = {
+            'table': table_name,
+            'count': count,
+            'total': total
+        }
+        self._socket.emit('database_recover_progress', emit_payload)
+        gevent.sleep(0)  # let the message go out while recovery continues
+
     @catchLogExceptionsWrapper
     def emit_pass_record(self, node, lap_time_stamp):
         '''Emits 'pass_record' message (will be consumed by primary timer in cluster, livetime, etc).'''
@@ -10,6 +10,7 @@ import subprocess
 import glob
 import socket
 import random
+import string
 import numbers
 import functools
 import traceback
@@ -30,22 +31,126 @@ RHGPIO_S32ID_PIN = 25  # GPIO input is tied low on S32_BPill PCB
 Is_sys_raspberry_pi_flag = True  # set by 'idAndLogSystemInfo()'
 S32_BPill_board_flag = False  # set by 'idAndLogSystemInfo()'
 
-def format_time_to_str(millis, timeformat='{m}:{s}.{d}'):
-    '''Convert milliseconds to 00:00.000'''
-    if not isinstance(millis, (int, float)):
-        return ''
+TIME_FORMAT_FIELDS = ('m', 's', 'd')  # minutes, seconds, and milliseconds (or tenths) fields of a time format
+
+def _compile_format_template(timeformat, field_codes):
+    '''
+    Converts a timeFormat template to a %-style template, using field_codes
+    ('%' conversion per field, or '' to drop the field). Returns the template
+    and the TIME_FORMAT_FIELDS index of each conversion, or None if the
+    template uses anything beyond plain {m}, {s} and {d} fields.
+    '''
+    parts = []
+    indices = []
+    try:
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(timeformat):
+            parts.append(literal.replace('%', '%%'))
+            if field_name is None:
+                continue
+            if field_name not in TIME_FORMAT_FIELDS or format_spec or conversion:
+                return None
+            code = field_codes[field_name]
+            if code:
+                parts.append(code)
+                indices.append(TIME_FORMAT_FIELDS.index(field_name))
+    except ValueError:
+        return None
+    return ''.join(parts), tuple(indices)
+
+def _template_formatter(compiled):
+    '''Callable applying a compiled template to (minutes, seconds, fraction)'''
+    template, indices = compiled
+    return lambda vals: template % tuple([vals[idx] for idx in indices])
+
+@functools.lru_cache(maxsize=32)
+def compile_time_format(timeformat='{m}:{s}.{d}'):
+    '''Parses a timeFormat template once; returns a callable equivalent to format_time_to_str'''
+    if not timeformat:
+        timeformat = '{m}:{s}.{d}'
+
+    compiled = _compile_format_template(timeformat, {'m': '%d', 's': '%02d', 'd': '%03d'})
 
-    millis = int(round(millis, 0)) # round to nearest ms
-    minutes = millis // 60000
-    over = millis % 60000
-    seconds = over // 1000
-    over = over % 1000
-    milliseconds = over
+    if compiled and compiled[1] == (0, 1, 2):
+        # fast path for templates with each field once, in order
+        template = compiled[0]
 
+        def format_fn(millis):
+            if millis.__class__ is not int:
+                if not isinstance(millis, (int, float)):
+                    return ''
+                millis = int(round(millis, 0)) # round to nearest ms
+            over = millis % 60000
+            return template % (millis // 60000, over // 1000, over % 1000)
+
+        return format_fn
+
+    if compiled:
+        apply_template = _template_formatter(compiled)
+    else:
+        apply_template = lambda vals: timeformat.format(m=str(vals[0]), s=str(vals[1]).zfill(2), d=str(vals[2]).zfill(3))
+
+    def format_fn(millis):
+        if not isinstance(millis, (int, float)):
+            return ''
+        millis = int(round(millis, 0)) # round to nearest ms
+        over = millis % 60000
+        return apply_template((millis // 60000, over // 1000, over % 1000))
+
+    return format_fn
+
+@functools.lru_cache(maxsize=32)
+def compile_phonetic_time_format(timeformat='{m} {s}.{d}'):
+    '''Parses a phonetic timeFormat template once; returns a callable equivalent to format_phonetic_time_to_str'''
     if not timeformat:
-        timeformat = '{m}:{s}.{d}'
+        timeformat = '{m} {s}.{d}'
+
+    compiled = _compile_format_template(timeformat, {'m': '%d', 's': '%02d', 'd': '%d'})
+    compiled_no_mins = _compile_format_template(timeformat, {'m': '', 's': '%d', 'd': '%d'})
+
+    if compiled and compiled[1] == (0, 1, 2) and compiled_no_mins[1] == (1, 2):
+        # fast path for templates with each field once, in order
+        template = compiled[0]
+        template_no_mins = compiled_no_mins[0]
+
+        def format_fn(millis):
+            if millis.__class__ is not int:
+                if not isinstance(millis, (int, float)):
+                    return ''
+                millis = int(millis) # strip fractional part
+            minutes = millis // 60000
+            over = millis % 60000
+            if minutes <= 0:
+                return template_no_mins % (over // 1000, over % 1000 // 100)
+            return template % (minutes, over // 1000, over % 1000 // 100) # floor at tenths
+
+        return format_fn
+
+    if compiled and compiled_no_mins:
+        apply_template = _template_formatter(compiled)
+        apply_template_no_mins = _template_formatter(compiled_no_mins)
+    else:
+        apply_template = lambda vals: timeformat.format(m=str(vals[0]), s=str(vals[1]).zfill(2), d=str(vals[2]))
+        apply_template_no_mins = lambda vals: timeformat.format(m='', s=str(vals[1]), d=str(vals[2]))
+
+    def format_fn(millis):
+        if not isinstance(millis, (int, float)):
+            return ''
+        millis = int(millis) # strip fractional part
+        over = millis % 60000
+        vals = (millis // 60000, over // 1000, over % 1000 // 100) # floor at tenths
+        if vals[0] <= 0:
+            return apply_template_no_mins(vals)
+        return apply_template(vals)
+
+    return format_fn
+
+def format_time_to_str(millis, timeformat='{m}:{s}.{d}'):
+    '''Convert milliseconds to 00:00.000'''
+    return compile_time_format(timeformat)(millis)
 
-    return timeformat.format(m=str(minutes), s=str(seconds).zfill(2), d=str(milliseconds).zfill(3))
+def format_times_to_str(values, timeformat='{m}:{s}.{d}'):
+    '''Convert a sequence of milliseconds values; returns list of strings'''
+    return list(map(compile_time_format(timeformat), values))
 
 def format_split_time_to_str(millis, timeformat='{m}:{s}.{d}'):
     '''Convert milliseconds to 00:00.000 with leading zeros removed'''
@@ -59,23 +164,11 @@ def format_split_time_to_str(millis, timeformat='{m}:{s}.{d}'):
 
 def format_phonetic_time_to_str(millis, timeformat='{m} {s}.{d}'):
     '''Convert milliseconds to phonetic callout string'''
-    if not isinstance(millis, (int, float)):
-        return ''
+    return compile_phonetic_time_format(timeformat)(millis)
 
-    millis = int(millis) # strip fractional part
-    minutes = millis // 60000
-    over = millis % 60000
-    seconds = over // 1000
-    over = over % 1000
-    tenths = over // 100 # floor at tenths
-
-    if not timeformat:
-        timeformat = '{m} {s}.{d}'
-
-    if minutes <= 0:
-        return timeformat.format(m='', s=str(seconds), d=str(tenths))
-    else:
-        return timeformat.format(m=str(minutes), s=str(seconds).zfill(2), d=str(tenths))
+def format_phonetic_times_to_str(values, timeformat='{m} {s}.{d}'):
+    '''Convert a sequence of milliseconds values to phonetic callout strings; returns list of strings'''
+    return list(map(compile_phonetic_time_format(timeformat), values))
 
 # Formats the given seconds value to a time-duration string in the form MM:SS:mmm
 def format_secs_to_duration_str(secs_val):
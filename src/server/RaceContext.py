@@ -8,6 +8,7 @@ import logging
 from eventmanager import Evt
 from led_event_manager import NoLEDManager
 from interface_mapper import InterfaceType
+from util.TimerWheel import TimerWheel
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +42,8 @@ class RaceContext():
         self.plugin_manager = None
         self.server_start_background_threads_fn = None
 
+        self.timers = TimerWheel() # shared scheduler for callbacks at monotonic deadlines
+
         self.serverconfig = Config.Config(self, config_file_name, cfg_bkp_dir_name)
         self.serverstate = ServerState(self)
 
@@ -76,6 +79,7 @@ class RaceContext():
         self.last_race.team_results = self.race.team_results
         self.last_race.team_cacheStatus = self.race.team_cacheStatus
         self.last_race.win_status = self.race.win_status
+        self.last_race.win_state = copy.copy(self.race.win_state)
 
         self.last_race.db_id = self.race.db_id
 
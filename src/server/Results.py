@@ -5,14 +5,18 @@ from typing import List
 from RHUI import UIField
 from eventmanager import Evt
 from filtermanager import Flt
+import bisect
 import copy
 import json
+import math
 import gevent
+import gevent.lock
 import RHUtils
 from RHUtils import catchLogExceptionsWrapper, cleanVarName
 import logging
 from time import monotonic
-from Database import RoundType
+from util.Metrics import metrics
+from Database import RoundType, Heat, SavedRaceMeta, data_version, watch_rows, rows_written_since
 from RHRace import RaceStatus, StartBehavior, WinCondition, WinStatus, RacingMode
 
 logger = logging.getLogger(__name__)
@@ -28,6 +32,9 @@ class RaceClassRankManager():
     def __init__(self, RHAPI, Events):
         self._methods = {}
         self._rhapi = RHAPI
+        self._changes = {}  # (method name, class id) -> RaceClassRankChanges
+        self._changes_lock = gevent.lock.RLock()
+        watch_rows(SavedRaceMeta, Heat)
 
         Events.trigger(Evt.CLASS_RANK_INITIALIZE, {
             'register_fn': self.registerMethod
@@ -51,14 +58,32 @@ class RaceClassRankManager():
         if method_id == "":
             return False, False
 
-        lb, meta = self.methods[method_id].rank(self._rhapi, race_class, args)
+        method = self.methods[method_id]
+        if method.incremental:
+            with self._changes_lock:
+                changes = self._changes.get((method_id, race_class.id))
+                if changes is None:
+                    changes = RaceClassRankChanges(self._rhapi, race_class.id)
+                    self._changes[(method_id, race_class.id)] = changes
+
+                changes.update(args)
+                try:
+                    lb, meta = method.rank(self._rhapi, race_class, args, changes)
+                except Exception:
+                    changes.reset()
+                    raise
+                if lb is False:
+                    changes.reset()
+        else:
+            lb, meta = method.rank(self._rhapi, race_class, args)
+
         if 'method_label' not in meta:
             meta['method_label'] = self.methods[method_id].label
 
         return lb, meta
 
 class RaceClassRankMethod():
-    def __init__(self, label, rank_fn, default_args=None, settings:List[UIField]=None, name=None):
+    def __init__(self, label, rank_fn, default_args=None, settings:List[UIField]=None, name=None, incremental=False):
         if name is None:
             self.name = cleanVarName(label)
         else:
@@ -68,9 +93,98 @@ class RaceClassRankMethod():
         self.rank_fn = rank_fn
         self.default_args = default_args
         self.settings = settings
+        self.incremental = incremental  # rank_fn takes a RaceClassRankChanges argument
+
+    def rank(self, rhapi, race_class, localArgs, *changes):
+        return self.rank_fn(rhapi, race_class, {**(self.default_args if self.default_args else {}), **(localArgs if localArgs else {})}, *changes)
+
+class RaceClassRankChanges():
+    '''
+    Input for incremental class ranking methods: the results of the class's
+    races and heats written since the method last ranked the class, and
+    'state', a dict the method keeps its per-pilot aggregates in between
+    rankings. 'state' starts empty and everything in the class is reported
+    when changes can't be told apart: on the first ranking, after the
+    database is reloaded, when heats are added to or removed from the class,
+    after bulk writes, or when the ranking arguments change.
+    '''
+    def __init__(self, rhapi, class_id):
+        self._rhapi = rhapi
+        self.class_id = class_id
+        self.heats = []  # heats of the class, in order
+        self.state = {}
+        self._args = None
+        self._heat_ids = None
+        self._version = None
+        self._changed_races = None
+        self._changed_heats = None
+        self._race_orders = {}  # race id -> (heat position, round, race id) of races reported
+
+    def reset(self):
+        self.state = {}
+        self._version = None
+
+    def update(self, args):
+        '''Collects the races and heats written since the previous ranking; returns False if 'state' was reset'''
+        version = data_version(SavedRaceMeta, Heat)
+        self.heats = self._rhapi.db.heats_by_class(self.class_id)
+        heat_ids = [heat.id for heat in self.heats]
+
+        self._changed_races = None
+        self._changed_heats = None
+        if self._version and self._version[0] == version[0] and self._args == args and self._heat_ids == heat_ids:
+            self._changed_races = rows_written_since(SavedRaceMeta, self._version[1])
+            self._changed_heats = rows_written_since(Heat, self._version[2])
+
+        self._args = copy.deepcopy(args)
+        self._heat_ids = heat_ids
+        self._version = version
+
+        if self._changed_races is None or self._changed_heats is None:
+            self._changed_races = None
+            self._changed_heats = None
+            self.state = {}
+            return False
+        return True
+
+    def race_results(self):
+        '''
+        Results of the class's races written since the previous ranking, by race
+        id: None for races no longer in the class, False if results are unavailable
+        '''
+        if self._changed_races is None:
+            race_results = {}
+            for heat_pos, heat in enumerate(self.heats):
+                for race in self._rhapi.db.races_by_heat(heat.id):
+                    self._race_orders[race.id] = (heat_pos, race.round_id, race.id)
+                    race_results[race.id] = self._rhapi.db.race_results(race)
+            return race_results
+
+        race_results = {}
+        for race_id in sorted(self._changed_races):
+            race = self._rhapi.db.race_by_id(race_id)
+            if race and race.heat_id in self._heat_ids:
+                self._race_orders[race_id] = (self._heat_ids.index(race.heat_id), race.round_id, race_id)
+                race_results[race_id] = self._rhapi.db.race_results(race)
+            else:
+                self._race_orders.pop(race_id, None)
+                race_results[race_id] = None
+        return race_results
+
+    def race_order(self, race_id):
+        '''
+        Sort key of a race reported by 'race_results', in the order of the
+        class's races: by heat, then round. Ties between pilots broken by
+        this key match a ranking read race by race in heat order.
+        '''
+        return self._race_orders[race_id]
+
+    def heat_results(self):
+        '''Results of the class's heats written since the previous ranking, by heat id'''
+        if self._changed_heats is None:
+            return {heat.id: self._rhapi.db.heat_results(heat) for heat in self.heats}
 
-    def rank(self, rhapi, race_class, localArgs):
-        return self.rank_fn(rhapi, race_class, {**(self.default_args if self.default_args else {}), **(localArgs if localArgs else {})})
+        return {heat.id: self._rhapi.db.heat_results(heat) for heat in self.heats if heat.id in self._changed_heats}
 
 class RacePointsManager():
     def __init__(self, RHAPI, Events):
@@ -254,6 +368,7 @@ def build_atomic_results(rhDataObj, params):
 def is_in_calc_leaderboard_fn():
     return in_calc_leaderboard_fn_flag
 
+@metrics.timed('rh_calc_leaderboard_seconds', 'Time to calculate a leaderboard')
 def calc_leaderboard(racecontext, **params):
     dbg_trace_str = ""
     if logger.getEffectiveLevel() <= logging.DEBUG:  # if DEBUG msgs actually being logged
@@ -348,6 +463,13 @@ def _do_calc_leaderboard(racecontext, **params):
     do_gevent_sleep()
 
     leaderboard = []
+    reused_rows = set()  # ids of rows taken from previous results; already complete
+
+    if params.get('reuse_results'):
+        reuse_lines = race_lines_for_reuse(racecontext, params['reuse_results'], race_format, consecutivesCount,
+                                           params.get('rebuild_seats', ()))
+    else:
+        reuse_lines = {}
 
     # collect data for processing
     if USE_CURRENT and raceObj.current_heat == RHUtils.HEAT_ID_NONE:
@@ -422,6 +544,19 @@ def _do_calc_leaderboard(racecontext, **params):
         for pilot_race in racecontext.rhdata.get_savedPilotRaces_by_savedRaceMeta(raceObj.id):
             if pilot_race.pilot_id:
                 pilot = racecontext.rhdata.get_pilot(pilot_race.pilot_id)
+
+                line = reuse_lines.get(pilot_race.node_index)
+                if line and line['pilot_id'] == pilot.id:
+                    source = {
+                        'round': round_num,
+                        'heat': current_heat_id,
+                        'displayname': heat_displayname,
+                    }
+                    row = reuse_race_line(line, pilot, pilot_race.node_index, source)
+                    reused_rows.add(id(row))
+                    leaderboard.append(row)
+                    continue
+
                 pilot_laps = []
                 total_laps = 0
 
@@ -463,6 +598,8 @@ def _do_calc_leaderboard(racecontext, **params):
                         leader_laps[lnum] = [ chk_pilot, chk_lap ]
 
     for result_pilot in leaderboard:
+        if id(result_pilot) in reused_rows:
+            continue
         if logger.getEffectiveLevel() <= logging.DEBUG:  # if DEBUG msgs actually being logged
             logger.debug("Calculating leaderboard data for pilot_id {}".format(result_pilot.get('pilot_id', -1)))
         do_gevent_sleep()
@@ -555,6 +692,8 @@ def _do_calc_leaderboard(racecontext, **params):
 
     # Combine leaderboard
     for result_pilot in leaderboard:
+        if id(result_pilot) in reused_rows:
+            continue
         # Clean up interim data
         result_pilot.pop('pilot_crossings')
         result_pilot.pop('pilot_laps')
@@ -571,11 +710,12 @@ def _do_calc_leaderboard(racecontext, **params):
         if race_format and race_format.start_behavior == StartBehavior.STAGGERED:
             result_pilot['total_time_raw'] = result_pilot['total_time_laps_raw']
 
-    leaderboard_output = {
-        'by_race_time': copy.deepcopy(leaderboard),
-        'by_fastest_lap': copy.deepcopy(leaderboard),
-        'by_consecutives': copy.deepcopy(leaderboard)
-    }
+    # pilot rows are shared by all views until each view is materialized in rank order
+    leaderboard_output = {}
+    for view, rank_fn in LEADERBOARD_VIEW_RANKERS:
+        ordered_rows, positions = rank_fn(leaderboard, consecutivesCount)
+        leaderboard_output[view] = materialize_view(view, ordered_rows, positions)
+        do_gevent_sleep()
 
     if race_format and race_format.win_condition == WinCondition.FASTEST_CONSECUTIVE:
         primary_leaderboard = 'by_consecutives'
@@ -598,47 +738,136 @@ def _do_calc_leaderboard(racecontext, **params):
     if meta_points_flag:
         leaderboard_output['meta']['primary_points'] = True
 
-    leaderboard_output = sort_and_rank_leaderboards(racecontext, leaderboard_output)
+    leaderboard_output = racecontext.filters.run_filters(Flt.LEADERBOARD_SORT_AND_RANK, leaderboard_output)
     leaderboard_output = format_leaderboard_times(racecontext, leaderboard_output)
     leaderboard_output = add_fastest_race_lap_meta(racecontext, leaderboard_output)
 
     return leaderboard_output
 
+REUSED_TIME_FIELDS = ('total_time', 'total_time_laps', 'last_lap', 'average_lap', 'fastest_lap', 'time_behind', 'consecutives')
+
+def race_lines_for_reuse(racecontext, results, race_format, consecutivesCount, rebuild_seats):
+    '''
+    Lines of a saved race's previous results by seat, leaving out the seats
+    whose laps changed. None are reused when the lap statistics were taken with
+    other settings or when leaderboard filters may have altered the lines.
+    '''
+    meta = results.get('meta') or {}
+    if meta.get('consecutives_count') != consecutivesCount or \
+        meta.get('start_behavior') != (race_format.start_behavior if race_format else None) or \
+        racecontext.filters.has_filters(Flt.LEADERBOARD_SORT_AND_RANK) or \
+        racecontext.filters.has_filters(Flt.LEADERBOARD_BUILD_RACE):
+        return {}
+
+    return {line['node']: line for line in results.get('by_race_time', []) if line['node'] not in rebuild_seats}
+
+def reuse_race_line(line, pilot, node_index, source):
+    '''Combined leaderboard row for a seat with unchanged laps, taken from its previous results line'''
+    row = {
+        'pilot_id': pilot.id,
+        'callsign': pilot.callsign,
+        'team_name': pilot.team,
+        'laps': line['laps'],
+        'starts': line['starts'],
+        'node': node_index,
+    }
+    for key in REUSED_TIME_FIELDS:
+        row[key] = line.get(key + '_raw')
+    row['consecutives_base'] = line['consecutives_base']
+    row['consecutive_lap_start'] = line['consecutive_lap_start']
+    row['fastest_lap_source'] = source if row['laps'] else None
+    row['consecutives_source'] = source if row['laps'] else None
+    for key in REUSED_TIME_FIELDS:
+        row[key + '_raw'] = row[key]
+    return row
+
 def format_leaderboard_times(racecontext, all_leaderboards):
     time_format = racecontext.serverconfig.get_item('UI', 'timeFormat')
     for key, leaderboard in all_leaderboards.items():
         if key != 'meta':
+            for field in ('total_time', 'total_time_laps', 'average_lap', 'fastest_lap', 'consecutives'):
+                column = RHUtils.format_times_to_str([result_pilot[field + '_raw'] for result_pilot in leaderboard], time_format)
+                for result_pilot, time_str in zip(leaderboard, column):
+                    result_pilot[field] = time_str
+
+            format_fn = RHUtils.compile_time_format(time_format)
             for result_pilot in leaderboard:
-                result_pilot['total_time'] = RHUtils.format_time_to_str(result_pilot['total_time_raw'], time_format)
-                result_pilot['total_time_laps'] = RHUtils.format_time_to_str(result_pilot['total_time_laps_raw'], time_format)
-                result_pilot['average_lap'] = RHUtils.format_time_to_str(result_pilot['average_lap_raw'], time_format)
-                result_pilot['fastest_lap'] = RHUtils.format_time_to_str(result_pilot['fastest_lap_raw'], time_format)
                 if result_pilot.get('time_behind_raw'):
-                    result_pilot['time_behind'] = RHUtils.format_time_to_str(result_pilot['time_behind_raw'], time_format)
+                    result_pilot['time_behind'] = format_fn(result_pilot['time_behind_raw'])
                 else:
                     result_pilot.pop('time_behind', None)
                     result_pilot.pop('time_behind_raw', None)
-                result_pilot['consecutives'] = RHUtils.format_time_to_str(result_pilot['consecutives_raw'], time_format)
                 if result_pilot.get('last_lap_raw'):
-                    result_pilot['last_lap'] = RHUtils.format_time_to_str(result_pilot['last_lap_raw'], time_format)
+                    result_pilot['last_lap'] = format_fn(result_pilot['last_lap_raw'])
 
     return all_leaderboards
 
-def sort_and_rank_leaderboards(racecontext, all_leaderboards):
-    consecutivesCount = all_leaderboards['meta']['consecutives_count']
-
-    # Sort by race time
-    all_leaderboards['by_race_time'] = sorted(all_leaderboards['by_race_time'], key=lambda x: (
-        -x['laps'],  # reverse lap count
-        x['total_time_raw'] if x['total_time_raw'] and x['total_time_raw'] > 0 else float('inf')
-    # total time ascending except 0
-    ))
-
-    # determine ranking
+LEADERBOARD_VIEWS = ('by_race_time', 'by_fastest_lap', 'by_consecutives')
+
+_INF = float('inf')
+
+def _race_time_key(row):
+    total_time = row['total_time_raw']
+    return (
+        -row['laps'],  # reverse lap count
+        total_time if total_time and total_time > 0 else _INF  # total time ascending except 0
+    )
+
+def _fastest_lap_key(row):
+    fastest_lap = row['fastest_lap_raw']
+    total_time = row['total_time_raw']
+    return (
+        fastest_lap if fastest_lap and fastest_lap > 0 else _INF,  # fastest lap
+        total_time if total_time and total_time > 0 else _INF  # total time
+    )
+
+def _consecutives_key(row):
+    consecutives = row['consecutives_raw']
+    total_time = row['total_time_raw']
+    return (
+        -row['consecutives_base'] if row['consecutives_base'] else 0,
+        consecutives if consecutives and consecutives > 0 else _INF,  # fastest consecutives
+        -row['laps'],  # reverse lap count
+        total_time if total_time and total_time > 0 else _INF
+    )
+
+# sort key of a row, in LEADERBOARD_VIEWS order
+LEADERBOARD_VIEW_KEYS = (_race_time_key, _fastest_lap_key, _consecutives_key)
+
+def _tied_by_race_time(above, row, _consecutivesCount):
+    return above['laps'] == row['laps'] and above['total_time_raw'] == row['total_time_raw']
+
+def _tied_by_fastest_lap(above, row, _consecutivesCount):
+    return above['fastest_lap_raw'] == row['fastest_lap_raw']
+
+def _tied_by_consecutives(above, row, consecutivesCount):
+    if above['consecutives_raw'] != row['consecutives_raw']:
+        return False
+    if row['laps'] < consecutivesCount:
+        return above['laps'] == row['laps'] and above['total_time_raw'] == row['total_time_raw']
+    return True
+
+# test for "same position as the line above" in incremental rankings, in LEADERBOARD_VIEWS order;
+#  matches the position loops of the rank_by_* functions
+LEADERBOARD_VIEW_TIES = (_tied_by_race_time, _tied_by_fastest_lap, _tied_by_consecutives)
+
+# line the first row of a view is compared to, as if ranked below an empty line
+LEADERBOARD_ROW_BEFORE_FIRST = {
+    'laps': 0,
+    'total_time_raw': 0,
+    'fastest_lap_raw': 0,
+    'consecutives_raw': None,
+}
+
+def rank_by_race_time(rows, _consecutivesCount=None):
+    '''Rows in race-time order and their positions; rows are not modified'''
+    ordered_rows = sorted(rows, key=_race_time_key)
+
+    positions = []
     last_rank = None
     last_rank_laps = 0
     last_rank_time = 0
-    for i, row in enumerate(all_leaderboards['by_race_time'], start=1):
+    for i, row in enumerate(ordered_rows, start=1):
         if not row['total_time_raw']:
             pos = None
         else:
@@ -648,21 +877,18 @@ def sort_and_rank_leaderboards(racecontext, all_leaderboards):
         last_rank = pos
         last_rank_laps = row['laps']
         last_rank_time = row['total_time_raw']
+        positions.append(pos)
 
-        row['position'] = pos
-        row['behind'] = all_leaderboards['by_race_time'][0]['laps'] - row['laps']
+    return ordered_rows, positions
 
-    do_gevent_sleep()
-    # Sort by fastest laps
-    all_leaderboards['by_fastest_lap'] = sorted(all_leaderboards['by_fastest_lap'], key=lambda x: (
-        x['fastest_lap_raw'] if x['fastest_lap_raw'] and x['fastest_lap_raw'] > 0 else float('inf'),  # fastest lap
-        x['total_time_raw'] if x['total_time_raw'] and x['total_time_raw'] > 0 else float('inf')  # total time
-    ))
+def rank_by_fastest_lap(rows, _consecutivesCount=None):
+    '''Rows in fastest-lap order and their positions; rows are not modified'''
+    ordered_rows = sorted(rows, key=_fastest_lap_key)
 
-    # determine ranking
+    positions = []
     last_rank = None
     last_rank_fastest_lap = 0
-    for i, row in enumerate(all_leaderboards['by_fastest_lap'], start=1):
+    for i, row in enumerate(ordered_rows, start=1):
         if not row['total_time_raw']:
             pos = None
         else:
@@ -671,24 +897,20 @@ def sort_and_rank_leaderboards(racecontext, all_leaderboards):
                 pos = last_rank
         last_rank = pos
         last_rank_fastest_lap = row['fastest_lap_raw']
+        positions.append(pos)
 
-        row['position'] = pos
+    return ordered_rows, positions
 
-    do_gevent_sleep()
-    # Sort by consecutive laps
-    all_leaderboards['by_consecutives'] = sorted(all_leaderboards['by_consecutives'], key=lambda x: (
-        -x['consecutives_base'] if x['consecutives_base'] else 0,
-        x['consecutives_raw'] if x['consecutives_raw'] and x['consecutives_raw'] > 0 else float('inf'),  # fastest consecutives
-        -x['laps'],  # reverse lap count
-        x['total_time_raw'] if x['total_time_raw'] and x['total_time_raw'] > 0 else float('inf')
-    ))
-
-    # determine ranking
+def rank_by_consecutives(rows, consecutivesCount):
+    '''Rows in consecutive-laps order and their positions; rows are not modified'''
+    ordered_rows = sorted(rows, key=_consecutives_key)
+
+    positions = []
     last_rank = None
     last_rank_laps = 0
     last_rank_time = 0
     last_rank_consecutive = None
-    for i, row in enumerate(all_leaderboards['by_consecutives'], start=1):
+    for i, row in enumerate(ordered_rows, start=1):
         if not row['total_time_raw']:
             pos = None
         else:
@@ -703,8 +925,143 @@ def sort_and_rank_leaderboards(racecontext, all_leaderboards):
         last_rank_laps = row['laps']
         last_rank_time = row['total_time_raw']
         last_rank_consecutive = row['consecutives_raw']
+        positions.append(pos)
+
+    return ordered_rows, positions
+
+# full rank of a list of rows, by view
+LEADERBOARD_VIEW_RANKERS = (
+    ('by_race_time', rank_by_race_time),
+    ('by_fastest_lap', rank_by_fastest_lap),
+    ('by_consecutives', rank_by_consecutives),
+)
+
+class LeaderboardRanking:
+    '''
+    Orderings of leaderboard rows in one or more views with their positions,
+    kept up to date as rows are added or change one at a time (full ranks of
+    a list of rows use the 'rank_by_*' functions). Each row's sort key in
+    each view is kept; a view's ordering is a sorted list of (sort key, input
+    order, row id), so rows that tie on a key stay in input order, as with a
+    stable sort. A changed row is moved by binary search, and positions are
+    assigned again only from the first index that moved until they match the
+    previous ones.
+    '''
+    def __init__(self, consecutivesCount, views=LEADERBOARD_VIEWS):
+        self.consecutivesCount = consecutivesCount
+        self.views = views
+        self._view_indexes = [LEADERBOARD_VIEWS.index(view) for view in views]
+        self.rows = {}  # row id -> row
+        self._row_orders = {}  # row id -> input order
+        self._keys = [{} for _view in views]  # row id -> sort key the row is placed by, per view
+        self._orders = [[] for _view in views]  # sorted (sort key, input order, row id), per view
+        self._positions = [[] for _view in views]
+
+    def set_row(self, row_id, row, order):
+        '''Adds a row, or places a row again after its values changed; 'order' breaks ties'''
+        self.rows[row_id] = row
+        old_order = self._row_orders.get(row_id)
+        self._row_orders[row_id] = order
+        for v, view_index in enumerate(self._view_indexes):
+            ordering = self._orders[v]
+            positions = self._positions[v]
+            if old_order is not None:
+                old_index = bisect.bisect_left(ordering, (self._keys[v][row_id], old_order, row_id))
+                del ordering[old_index]
+                del positions[old_index]
+            key = LEADERBOARD_VIEW_KEYS[view_index](row)
+            self._keys[v][row_id] = key
+            index = bisect.bisect_left(ordering, (key, order, row_id))
+            ordering.insert(index, (key, order, row_id))
+            positions.insert(index, None)
+            if old_order is not None:
+                self._assign_positions(v, min(index, old_index), max(index, old_index))
+            else:
+                self._assign_positions(v, index, len(ordering) - 1)
+
+    def _assign_positions(self, v, first, last):
+        '''Positions from index 'first' on; past 'last' they stop once they match the previous ones'''
+        rows = self.rows
+        ordering = self._orders[v]
+        positions = self._positions[v]
+        tied = LEADERBOARD_VIEW_TIES[self._view_indexes[v]]
+        if first:
+            above = rows[ordering[first - 1][2]]
+            pos = positions[first - 1]
+        else:
+            above = LEADERBOARD_ROW_BEFORE_FIRST
+            pos = None
+        for index in range(first, len(ordering)):
+            row = rows[ordering[index][2]]
+            if not row['total_time_raw']:
+                pos = None
+            elif not tied(above, row, self.consecutivesCount):
+                pos = index + 1
+            if index > last and positions[index] == pos:
+                break
+            positions[index] = pos
+            above = row
+
+    def index(self, row_id, view):
+        '''Index of a row in a view's ordering'''
+        v = self.views.index(view)
+        return bisect.bisect_left(self._orders[v], (self._keys[v][row_id], self._row_orders[row_id], row_id))
 
+    def row_at(self, view, index):
+        '''Row at 'index' of a view's ordering and its position'''
+        v = self.views.index(view)
+        return self.rows[self._orders[v][index][2]], self._positions[v][index]
+
+    def ordered_rows(self, view):
+        return [self.rows[entry[2]] for entry in self._orders[self.views.index(view)]]
+
+    def positions(self, view):
+        return self._positions[self.views.index(view)]
+
+def _set_view_ranks(view, ordered_rows, positions):
+    for row, pos in zip(ordered_rows, positions):
         row['position'] = pos
+    if view == 'by_race_time' and ordered_rows:
+        leader_laps = ordered_rows[0]['laps']
+        for row in ordered_rows:
+            row['behind'] = leader_laps - row['laps']
+
+def materialize_view(view, ordered_rows, positions):
+    '''Per-view copies of shared pilot rows, with the view's position (and laps behind) columns'''
+    view_rows = [copy_leaderboard_row(row) for row in ordered_rows]
+    _set_view_ranks(view, view_rows, positions)
+    return view_rows
+
+def copy_leaderboard_row(row):
+    '''Copy of a leaderboard row that may be updated without affecting the original'''
+    row = dict(row)
+    for key in ('fastest_lap_source', 'consecutives_source'):
+        if row.get(key):
+            row[key] = dict(row[key])
+    return row
+
+def copy_leaderboards(all_leaderboards):
+    '''Copy of a results dict; replaces deep copies, since rows hold only flat values and lap sources'''
+    if not all_leaderboards:
+        return copy.deepcopy(all_leaderboards)
+    output = {}
+    for key, value in all_leaderboards.items():
+        if key == 'meta':
+            output[key] = dict(value)
+        elif isinstance(value, list):
+            output[key] = [copy_leaderboard_row(row) for row in value]
+        else:
+            output[key] = copy.deepcopy(value)
+    return output
+
+def sort_and_rank_leaderboards(racecontext, all_leaderboards):
+    consecutivesCount = all_leaderboards['meta']['consecutives_count']
+
+    for view, rank_fn in LEADERBOARD_VIEW_RANKERS:
+        ordered_rows, positions = rank_fn(all_leaderboards[view], consecutivesCount)
+        _set_view_ranks(view, ordered_rows, positions)
+        all_leaderboards[view] = ordered_rows
+        do_gevent_sleep()
 
     return racecontext.filters.run_filters(Flt.LEADERBOARD_SORT_AND_RANK, all_leaderboards)
 
@@ -747,8 +1104,8 @@ def add_fastest_race_lap_meta(racecontext, all_leaderboards):
 
     return all_leaderboards
 
-def build_leaderboard_race(racecontext, heat_id, round_id):
-    result = calc_leaderboard(racecontext, heat_id=heat_id, round_id=round_id)
+def build_leaderboard_race(racecontext, heat_id, round_id, **params):
+    result = calc_leaderboard(racecontext, heat_id=heat_id, round_id=round_id, **params)
     return racecontext.filters.run_filters(Flt.LEADERBOARD_BUILD_RACE, result, {
         'heat_id': heat_id,
         'round_id': round_id
@@ -803,14 +1160,14 @@ def build_leaderboard_event(racecontext):
     return racecontext.filters.run_filters(Flt.LEADERBOARD_BUILD_EVENT, leaderboard)
 
 def build_incremental(racecontext, merge_input, source_input, transient=False):
-    merge_result = copy.deepcopy(merge_input)
-    source_result = copy.deepcopy(source_input)
-
-    if not source_result:
-        return merge_result
+    # inputs are often cached results; only the rows written to are copied
+    if not source_input:
+        return copy_leaderboards(merge_input)
 
-    if not merge_result:
+    source_result = copy_leaderboards(source_input)
+    if not merge_input:
         return source_result
+    merge_result = merge_input
 
     output_result = {}
     for key, value in source_result.items():
@@ -833,45 +1190,50 @@ def build_incremental(racecontext, merge_input, source_input, transient=False):
                         output_result['meta']['primary_points'] = False
 
         else:
+            source_index = {}  # pilot_id -> index of first row for pilot
+            for idx, item in enumerate(source_result[key]):
+                source_index.setdefault(item['pilot_id'], idx)
+
             for lb_line in merge_result[key]:
-                for idx, item in enumerate(source_result[key]):
-                    if item['pilot_id'] == lb_line['pilot_id']:
-                        # simple incremental adds
-                        race_result_updates = {
-                            'laps': item['laps'] + lb_line['laps'],
-                            'starts': item['starts'] + lb_line['starts'],
-                            'total_time_raw': item['total_time_raw'] + lb_line['total_time_raw'],
-                            'total_time_laps_raw': item['total_time_laps_raw'] + lb_line['total_time_laps_raw'],
-                            'points': (item['points'] if 'points' in item else 0) + (lb_line['points'] if 'points' in lb_line else 0)
-                        }
+                idx = source_index.get(lb_line['pilot_id'])
+                if idx is not None:
+                    item = source_result[key][idx]
+                    # simple incremental adds
+                    race_result_updates = {
+                        'laps': item['laps'] + lb_line['laps'],
+                        'starts': item['starts'] + lb_line['starts'],
+                        'total_time_raw': item['total_time_raw'] + lb_line['total_time_raw'],
+                        'total_time_laps_raw': item['total_time_laps_raw'] + lb_line['total_time_laps_raw'],
+                        'points': (item['points'] if 'points' in item else 0) + (lb_line['points'] if 'points' in lb_line else 0)
+                    }
 
-                        # average lap
-                        if race_result_updates['laps']:
-                            race_result_updates['average_lap_raw'] = race_result_updates['total_time_laps_raw'] / race_result_updates['laps']
-
-                        # fastest lap & source
-                        if not item['fastest_lap_raw'] or (lb_line['fastest_lap_raw'] and lb_line['fastest_lap_raw'] < item['fastest_lap_raw']):
-                            race_result_updates['fastest_lap_raw'] = lb_line['fastest_lap_raw']
-                            race_result_updates['fastest_lap_source'] = lb_line['fastest_lap_source']
-
-                        # consecutives & source
-                        if lb_line['consecutives_base'] and \
-                            ( lb_line['consecutives_base'] > item['consecutives_base'] or \
-                              ( lb_line['consecutives_base'] == item['consecutives_base'] and \
-                              lb_line['consecutives_raw'] < item['consecutives_raw']) \
-                            ):
-                            race_result_updates['consecutives_base'] = lb_line['consecutives_base']
-                            race_result_updates['consecutives_raw'] = lb_line['consecutives_raw']
-                            race_result_updates['consecutive_lap_start'] = lb_line['consecutive_lap_start']
-                            race_result_updates['consecutives_source'] = lb_line['consecutives_source']
-
-                        output_result[key][idx].update(race_result_updates)
-                        output_result[key][idx].pop('time_behind', None)
-                        output_result[key][idx].pop('time_behind_raw', None)
-                        break
+                    # average lap
+                    if race_result_updates['laps']:
+                        race_result_updates['average_lap_raw'] = race_result_updates['total_time_laps_raw'] / race_result_updates['laps']
+
+                    # fastest lap & source
+                    if not item['fastest_lap_raw'] or (lb_line['fastest_lap_raw'] and lb_line['fastest_lap_raw'] < item['fastest_lap_raw']):
+                        race_result_updates['fastest_lap_raw'] = lb_line['fastest_lap_raw']
+                        race_result_updates['fastest_lap_source'] = copy.copy(lb_line['fastest_lap_source'])
+
+                    # consecutives & source
+                    if lb_line['consecutives_base'] and \
+                        ( lb_line['consecutives_base'] > item['consecutives_base'] or \
+                          ( lb_line['consecutives_base'] == item['consecutives_base'] and \
+                          lb_line['consecutives_raw'] < item['consecutives_raw']) \
+                        ):
+                        race_result_updates['consecutives_base'] = lb_line['consecutives_base']
+                        race_result_updates['consecutives_raw'] = lb_line['consecutives_raw']
+                        race_result_updates['consecutive_lap_start'] = lb_line['consecutive_lap_start']
+                        race_result_updates['consecutives_source'] = copy.copy(lb_line['consecutives_source'])
+
+                    item.update(race_result_updates)
+                    item.pop('time_behind', None)
+                    item.pop('time_behind_raw', None)
                 else:
                     # no match, make new line
-                    output_result[key].append(lb_line)
+                    source_index[lb_line['pilot_id']] = len(output_result[key])
+                    output_result[key].append(copy_leaderboard_row(lb_line))
 
     #re-sort lbs
     if not transient:
@@ -882,6 +1244,386 @@ def build_incremental(racecontext, merge_input, source_input, transient=False):
     return racecontext.filters.run_filters(Flt.LEADERBOARD_BUILD_INCREMENTAL, output_result)
 
 
+class ExactSum:
+    '''
+    Sum of numbers kept exactly as non-overlapping float partials, so a
+    value can be added and later taken out again without rounding drift.
+    The value is the correctly rounded sum (as 'math.fsum'), or an int when
+    only ints were added.
+    '''
+    def __init__(self):
+        self.partials = []
+        self.count = 0  # values in the sum
+        self._floats = 0  # float values in the sum
+
+    def add(self, value, sign=1):
+        if sign < 0:
+            value = -value
+        if isinstance(value, float):
+            self._floats += sign
+        self.count += sign
+        partials = self.partials
+        i = 0
+        for partial in partials:
+            if abs(value) < abs(partial):
+                value, partial = partial, value
+            high = value + partial
+            low = partial - (high - value)
+            if low:
+                partials[i] = low
+                i += 1
+            value = high
+        partials[i:] = [value]
+
+    def value(self, extra=0):
+        '''Returns the sum, plus 'extra' if given'''
+        if self._floats or isinstance(extra, float):
+            return math.fsum(self.partials + [extra])
+        return int(math.fsum(self.partials)) + extra
+
+class LineGroupSums:
+    '''
+    Sums over a group of results lines: one team's, or every line for the
+    co-op group. Lines are set or removed one at a time, and counts and times
+    change by that line's difference; times are exact sums (see 'ExactSum'),
+    so they equal a recalculation over the lines in any order. The group's
+    first line by the 'order' each line is given (its results order) always
+    counts in the combined times, as it did when lines were summed in turn.
+    '''
+    def __init__(self, win_condition, consecutivesCount, coop=False):
+        self.win_condition = win_condition
+        self.consecutivesCount = consecutivesCount
+        self.coop = coop
+        self.lines = {}  # member id -> results line
+        self.orders = {}  # member id -> position of line in results order
+        self.first = None  # member id of first line in results order
+        self.slowest = None  # member id of a line with the largest total time (co-op)
+        self.contributing = 0
+        self.laps = 0
+        self.total_time = ExactSum()
+        self.average_laps = ExactSum()
+        self.fastest_laps = ExactSum()
+        self.consecutives = ExactSum()
+        self._sums = None
+
+    def _values(self, line):
+        # (contributing, laps, then the times the line adds to each sum or None)
+        if self.win_condition == WinCondition.FASTEST_CONSECUTIVE:
+            contributing = line['laps'] >= (3 if self.coop else self.consecutivesCount)
+        else:
+            contributing = line['laps'] > 0
+        return (
+            int(contributing),
+            line['laps'],
+            line['total_time_raw'],
+            line['average_lap_raw'] or None,
+            line['fastest_lap_raw'] or None,
+            line['consecutives_raw'] if self._adds_consecutives(line) else None,
+        )
+
+    def _update(self, old_line, line):
+        # moves the sums from 'old_line' to 'line'; either may be None
+        old_values = self._values(old_line) if old_line is not None else (0, 0, None, None, None, None)
+        values = self._values(line) if line is not None else (0, 0, None, None, None, None)
+        self.contributing += values[0] - old_values[0]
+        self.laps += values[1] - old_values[1]
+        for total, old_value, value in zip((self.total_time, self.average_laps, self.fastest_laps, self.consecutives),
+                                           old_values[2:], values[2:]):
+            if value != old_value:
+                if old_value is not None:
+                    total.add(old_value, -1)
+                if value is not None:
+                    total.add(value)
+
+    def _adds_consecutives(self, line):
+        return line['consecutives_raw'] and (self.coop or line['consecutives_base'] >= self.consecutivesCount)
+
+    def _combined(self, total, value, added):
+        # the first line's value always counts; other lines' only where added
+        if not total.count:
+            return value
+        if added or not value:
+            return total.value()
+        return total.value(value)
+
+    def set_line(self, member_id, line, order):
+        old_line = self.lines.get(member_id)
+        old_order = self.orders.get(member_id)
+        self.lines[member_id] = line
+        self.orders[member_id] = order
+        self._update(old_line, line)
+        self._sums = None
+
+        if self.first is None or order < self.orders[self.first]:
+            self.first = member_id
+        elif member_id == self.first and order > old_order:
+            self.first = min(self.orders, key=self.orders.__getitem__)
+        if self.coop:
+            if self.slowest is None or line['total_time_raw'] > self.lines[self.slowest]['total_time_raw']:
+                self.slowest = member_id
+            elif member_id == self.slowest and line['total_time_raw'] < old_line['total_time_raw']:
+                self.slowest = max(self.lines, key=lambda member: self.lines[member]['total_time_raw'])
+
+    def remove_line(self, member_id):
+        self._update(self.lines.pop(member_id), None)
+        del self.orders[member_id]
+        self._sums = None
+        if member_id == self.first:
+            self.first = min(self.orders, key=self.orders.__getitem__) if self.orders else None
+        if member_id == self.slowest:
+            self.slowest = max(self.lines, key=lambda member: self.lines[member]['total_time_raw']) if self.lines else None
+
+    def first_order(self):
+        return self.orders[self.first]
+
+    def sums(self):
+        '''Group sums as summed over the lines in results order; the same dict until a line changes'''
+        if self._sums is None:
+            if not self.lines:
+                self._sums = {}
+                return self._sums
+            first = self.lines[self.first]
+            sums = {
+                'contributing': self.contributing,
+                'members': len(self.lines),
+                'laps': self.laps,
+            }
+            if self.coop:
+                slowest = self.lines[self.slowest]
+                sums['total_time_raw'] = self.total_time.value()
+                sums['coop_total_time_raw'] = round(slowest['total_time_raw'], 3)
+                sums['coop_total_time'] = slowest['total_time']
+            else:
+                sums['total_time_raw'] = round(self.total_time.value(), 3)
+            sums['combined_average_lap_raw'] = self._combined(self.average_laps, first['average_lap_raw'],
+                                                              first['average_lap_raw'])
+            sums['combined_fastest_lap_raw'] = self._combined(self.fastest_laps, first['fastest_lap_raw'],
+                                                              first['fastest_lap_raw'])
+            sums['combined_consecutives_raw'] = self._combined(self.consecutives, first['consecutives_raw'],
+                                                               self._adds_consecutives(first))
+            self._sums = sums
+        return self._sums
+
+class TeamAggregates:
+    '''
+    Per-team and co-op sums and leaderboard rows for the current race, kept
+    from one pilot's results line at a time. The race reports each new set
+    of results lines with the seats whose laps changed since the previous
+    one ('results_built'); only those lines are read again, and each moves
+    its team's and the co-op group's running sums by its difference. Rows
+    are rebuilt only when their group's sums change. Results lines that were
+    not reported, or changes of unknown extent (seats None), read all lines.
+    '''
+    MAX_PENDING_RESULTS = 8
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._members = {}  # member id (seat of line) -> (results line, order)
+        self._lines = None  # results lines '_members' was read from
+        self._pending = []  # (results lines, seats changed since previous results or None), oldest first
+        self._team_settings = None  # (win condition, consecutives count) of '_teams'
+        self._teams = {}  # team name -> LineGroupSums
+        self._team_rows = {}  # team name -> (team sums, time format, leaderboard row)
+        self._coop_settings = None  # win condition of '_coop'
+        self._coop = None  # LineGroupSums of all lines
+        self._coop_row = None  # (co-op sums, time format, leaderboard row)
+
+    def results_built(self, lines, seats):
+        '''Notes new results lines and the seats whose laps changed since the previous lines (None if not known)'''
+        if len(self._pending) >= self.MAX_PENDING_RESULTS:
+            seats = None
+            self._pending = []
+        self._pending.append((lines, seats))
+
+    @staticmethod
+    def _line_order(line):
+        # results order: race-time sort key, then leaderboard input order (pilot, or seat in practice)
+        return _race_time_key(line), line['node'] if line['pilot_id'] is None else line['pilot_id']
+
+    def _read(self, lines):
+        '''Brings member lines up to date with 'lines' '''
+        if lines is self._lines:
+            return
+        seats = None
+        for index, (pending_lines, _seats) in enumerate(self._pending):
+            if pending_lines is lines:
+                seats = set()
+                for _lines, changed in self._pending[:index + 1]:
+                    if changed is None:
+                        seats = None
+                        break
+                    seats.update(changed)
+                self._pending = self._pending[index + 1:]
+                break
+        else:
+            self._pending = []
+        if self._lines is None:
+            seats = None
+        self._lines = lines
+
+        if seats is None:
+            members = {line['node']: line for line in lines or ()}
+            for member_id in [member_id for member_id in self._members if member_id not in members]:
+                self._set_member(member_id, None)
+        elif seats:
+            members = {line['node']: line for line in lines if line['node'] in seats}
+            for member_id in [member_id for member_id in seats if member_id in self._members and member_id not in members]:
+                self._set_member(member_id, None)
+        else:
+            members = {}
+        for member_id, line in members.items():
+            self._set_member(member_id, line)
+
+    def _set_member(self, member_id, line):
+        old_line, _order = self._members.get(member_id, (None, None))
+        if line is None:
+            del self._members[member_id]
+        else:
+            order = self._line_order(line)
+            self._members[member_id] = (line, order)
+        if self._team_settings is not None:
+            if old_line is not None and (line is None or line['team_name'] != old_line['team_name']):
+                team = self._teams[old_line['team_name']]
+                team.remove_line(member_id)
+                if not team.lines:
+                    del self._teams[old_line['team_name']]
+            if line is not None:
+                self._team_group(line['team_name']).set_line(member_id, line, order)
+        if self._coop is not None:
+            if line is None:
+                self._coop.remove_line(member_id)
+            else:
+                self._coop.set_line(member_id, line, order)
+
+    def _team_group(self, team):
+        group = self._teams.get(team)
+        if group is None:
+            group = LineGroupSums(*self._team_settings)
+            self._teams[team] = group
+        return group
+
+    def build(self, results, race_format, consecutivesCount, time_format):
+        '''Returns team sums (by team, in order of first appearance) and the unsorted team leaderboard rows'''
+        self._read(results)
+        settings = (race_format.win_condition if race_format else None, consecutivesCount)
+        if self._team_settings != settings:
+            self._team_settings = settings
+            self._teams = {}
+            for member_id, (line, order) in self._members.items():
+                self._team_group(line['team_name']).set_line(member_id, line, order)
+
+        team_rows = {}
+        teams = {}
+        leaderboard = []
+        for team in sorted(self._teams, key=lambda team: self._teams[team].first_order()):
+            team_sums = self._teams[team].sums()
+            cached = self._team_rows.get(team)
+            if cached is None or cached[0] != team_sums or cached[1] != time_format:
+                cached = (team_sums, time_format, team_leaderboard_row(team, team_sums, time_format))
+            team_rows[team] = cached
+            teams[team] = dict(team_sums)
+            leaderboard.append(cached[2])
+        self._team_rows = team_rows
+        return teams, leaderboard
+
+    def build_coop(self, results, race_format, time_format):
+        '''Returns the co-op group sums and leaderboard row, rebuilt only when the group sums changed'''
+        self._read(results)
+        settings = race_format.win_condition if race_format else None
+        if self._coop is None or self._coop_settings != settings:
+            self._coop_settings = settings
+            self._coop = LineGroupSums(settings, None, coop=True)
+            for member_id, (line, order) in self._members.items():
+                self._coop.set_line(member_id, line, order)
+
+        coop_sums = self._coop.sums()
+        if self._coop_row is None or self._coop_row[0] != coop_sums or self._coop_row[1] != time_format:
+            self._coop_row = (coop_sums, time_format, coop_group_row(dict(coop_sums), time_format))
+        return dict(coop_sums), dict(self._coop_row[2])
+
+def sum_team_lines(lines, race_format, consecutivesCount):
+    '''Sums the results lines of one team, given in results order'''
+    group = LineGroupSums(race_format.win_condition if race_format else None, consecutivesCount)
+    for index, line in enumerate(lines):
+        group.set_line(index, line, index)
+    return dict(group.sums())
+
+def team_leaderboard_row(team, team_sums, time_format):
+    contribution_amt = float(team_sums['contributing']) / team_sums['members']
+    average_lap_raw = 0
+    average_fastest_lap_raw = 0
+    average_consecutives_raw = 0
+    if team_sums['contributing']:
+        if team_sums['combined_average_lap_raw']:
+            average_lap_raw = round(float(team_sums['combined_average_lap_raw']) / team_sums['contributing'], 3)
+
+        if team_sums['combined_fastest_lap_raw']:
+            average_fastest_lap_raw = round(float(team_sums['combined_fastest_lap_raw']) / team_sums['contributing'], 3)
+
+        if team_sums['combined_consecutives_raw']:
+            average_consecutives_raw = round(float(team_sums['combined_consecutives_raw']) / team_sums['contributing'], 3)
+
+    return {
+        'name': team,
+        'contributing': team_sums['contributing'],
+        'members': team_sums['members'],
+        'contribution_amt': contribution_amt,
+        'laps': team_sums['laps'],
+        'total_time_raw': team_sums['total_time_raw'],
+        'average_lap_raw': average_lap_raw,
+        'average_fastest_lap_raw': average_fastest_lap_raw,
+        'average_consecutives_raw': average_consecutives_raw,
+        'total_time': RHUtils.format_time_to_str(team_sums['total_time_raw'], time_format),
+        'average_lap': RHUtils.format_time_to_str(average_lap_raw, time_format),
+        'average_fastest_lap': RHUtils.format_time_to_str(average_fastest_lap_raw, time_format),
+        'average_consecutives': RHUtils.format_time_to_str(average_consecutives_raw, time_format),
+    }
+
+def coop_leaderboard_row(results, race_format, time_format):
+    '''Sums all results lines (given in results order) into the co-op group; returns the sums and the group leaderboard row'''
+    group = LineGroupSums(race_format.win_condition if race_format else None, None, coop=True)
+    for index, line in enumerate(results):
+        group.set_line(index, line, index)
+    coopGroup = dict(group.sums())
+    return coopGroup, coop_group_row(coopGroup, time_format)
+
+def coop_group_row(coopGroup, time_format):
+    '''Co-op group leaderboard row from the group sums'''
+    contribution_amt = 0
+    average_lap_raw = 0
+    average_fastest_lap_raw = 0
+    average_consecutives_raw = 0
+    if coopGroup.get('contributing'):
+        if coopGroup.get('members'):
+            contribution_amt = float(coopGroup['contributing']) / coopGroup['members']
+        if coopGroup.get('combined_average_lap_raw'):
+            average_lap_raw = round(float(coopGroup['combined_average_lap_raw']) / coopGroup['contributing'], 3)
+        if coopGroup.get('combined_fastest_lap_raw'):
+            average_fastest_lap_raw = round(float(coopGroup['combined_fastest_lap_raw']) / coopGroup['contributing'], 3)
+        if coopGroup.get('combined_consecutives_raw'):
+            average_consecutives_raw = round(float(coopGroup['combined_consecutives_raw']) / coopGroup['contributing'], 3)
+    coopGroup['coop_total_time_raw'] = round(coopGroup.get('coop_total_time_raw', 0), 3)
+
+    return {
+        'name': "Group",
+        'contributing': coopGroup.get('contributing', 0),
+        'members': coopGroup.get('members', 0),
+        'contribution_amt': contribution_amt,
+        'laps': coopGroup.get('laps'),
+        'total_time_raw': coopGroup.get('total_time_raw', 0),
+        'coop_total_time_raw': coopGroup.get('coop_total_time_raw', 0),
+        'coop_total_time': coopGroup.get('coop_total_time', 0),
+        'average_lap_raw': average_lap_raw,
+        'average_fastest_lap_raw': average_fastest_lap_raw,
+        'average_consecutives_raw': average_consecutives_raw,
+        'total_time': RHUtils.format_time_to_str(coopGroup.get('total_time_raw', 0), time_format),
+        'average_lap': RHUtils.format_time_to_str(average_lap_raw, time_format),
+        'average_fastest_lap': RHUtils.format_time_to_str(average_fastest_lap_raw, time_format),
+        'average_consecutives': RHUtils.format_time_to_str(average_consecutives_raw, time_format),
+    }
+
 def calc_team_leaderboard(racecontext):
     '''Calculates and returns team-racing info.'''
     raceObj = racecontext.race
@@ -894,81 +1636,13 @@ def calc_team_leaderboard(racecontext):
     if raceObj.results:
         results = raceObj.results['by_race_time']
 
-        teams = {}
-
-        for line in results:
-            contributing = 0
-            if race_format and race_format.win_condition == WinCondition.FASTEST_CONSECUTIVE:
-                if line['laps'] >= consecutivesCount:
-                    contributing = 1
-            else:
-                # race_format.win_condition == WinCondition.MOST_LAPS or \
-                # race_format.win_condition == WinCondition.FIRST_TO_LAP_X or \
-                # race_format.win_condition == WinCondition.FASTEST_LAP:
-                if line['laps'] > 0:
-                    contributing = 1
-
-            if line['team_name'] in teams:
-                teams[line['team_name']]['contributing'] += contributing
-                teams[line['team_name']]['members'] += 1
-                teams[line['team_name']]['laps'] += line['laps']
-                teams[line['team_name']]['total_time_raw'] += line['total_time_raw']
-                if line['average_lap_raw']:
-                    teams[line['team_name']]['combined_average_lap_raw'] += line['average_lap_raw']
-                if line['fastest_lap_raw']:
-                    teams[line['team_name']]['combined_fastest_lap_raw'] += line['fastest_lap_raw']
-                if line['consecutives_raw'] and line['consecutives_base'] >= consecutivesCount:
-                    teams[line['team_name']]['combined_consecutives_raw'] += line['consecutives_raw']
-
-            else:
-                teams[line['team_name']] = {}
-                teams[line['team_name']]['contributing'] = contributing
-                teams[line['team_name']]['members'] = 1
-                teams[line['team_name']]['laps'] = line['laps']
-                teams[line['team_name']]['total_time_raw'] = line['total_time_raw']
-                teams[line['team_name']]['combined_average_lap_raw'] = line['average_lap_raw']
-                teams[line['team_name']]['combined_fastest_lap_raw'] = line['fastest_lap_raw']
-                teams[line['team_name']]['combined_consecutives_raw'] = line['consecutives_raw']
-
-        # convert dict to list
-        leaderboard = []
-        for team in teams:
-            contribution_amt = float(teams[team]['contributing']) / teams[team]['members']
-            average_lap_raw = 0
-            average_fastest_lap_raw = 0
-            average_consecutives_raw = 0
-            if teams[team]['contributing']:
-                if teams[team]['combined_average_lap_raw']:
-                    average_lap_raw = round(float(teams[team]['combined_average_lap_raw']) / teams[team]['contributing'], 3)
-
-                if teams[team]['combined_fastest_lap_raw']:
-                    average_fastest_lap_raw = round(float(teams[team]['combined_fastest_lap_raw']) / teams[team]['contributing'], 3)
-
-                if teams[team]['combined_consecutives_raw']:
-                    average_consecutives_raw = round(float(teams[team]['combined_consecutives_raw']) / teams[team]['contributing'], 3)
-            teams[team]['total_time_raw'] = round(teams[team]['total_time_raw'], 3)
-
-            leaderboard.append({
-                'name': team,
-                'contributing': teams[team]['contributing'],
-                'members': teams[team]['members'],
-                'contribution_amt': contribution_amt,
-                'laps': teams[team]['laps'],
-                'total_time_raw': teams[team]['total_time_raw'],
-                'average_lap_raw': average_lap_raw,
-                'average_fastest_lap_raw': average_fastest_lap_raw,
-                'average_consecutives_raw': average_consecutives_raw,
-                'total_time': RHUtils.format_time_to_str(teams[team]['total_time_raw'], time_format),
-                'average_lap': RHUtils.format_time_to_str(average_lap_raw, time_format),
-                'average_fastest_lap': RHUtils.format_time_to_str(average_fastest_lap_raw, time_format),
-                'average_consecutives': RHUtils.format_time_to_str(average_consecutives_raw, time_format),
-            })
+        teams, leaderboard = raceObj.team_aggregates.build(results, race_format, consecutivesCount, time_format)
 
         # sort race_time
-        leaderboard_by_race_time = copy.deepcopy(sorted(leaderboard, key = lambda x: (
+        leaderboard_by_race_time = [dict(row) for row in sorted(leaderboard, key = lambda x: (
             -x['laps'],
             x['average_lap_raw'] if x['average_lap_raw'] > 0 else float('inf'),
-        )))
+        ))]
 
         # determine ranking
         last_rank = None
@@ -984,11 +1658,11 @@ def calc_team_leaderboard(racecontext):
             row['position'] = pos
 
         # sort fastest lap
-        leaderboard_by_fastest_lap = copy.deepcopy(sorted(leaderboard, key = lambda x: (
+        leaderboard_by_fastest_lap = [dict(row) for row in sorted(leaderboard, key = lambda x: (
             -x['contribution_amt'],
             x['average_fastest_lap_raw'] if x['average_fastest_lap_raw'] > 0 else float('inf'),
             -x['laps'],
-        )))
+        ))]
 
         # determine ranking
         last_rank = None
@@ -1004,11 +1678,11 @@ def calc_team_leaderboard(racecontext):
             row['position'] = pos
 
         # sort consecutives
-        leaderboard_by_consecutives = copy.deepcopy(sorted(leaderboard, key = lambda x: (
+        leaderboard_by_consecutives = [dict(row) for row in sorted(leaderboard, key = lambda x: (
             -x['contribution_amt'],
             x['average_consecutives_raw'] if x['average_consecutives_raw'] > 0 else float('inf'),
             -x['laps'],
-        )))
+        ))]
 
         # determine ranking
         last_rank = None
@@ -1073,77 +1747,8 @@ def calc_coop_leaderboard(racecontext):
     if raceObj.results:
         results = raceObj.results['by_race_time']
 
-        coopGroup = {}
-
-        for line in results:
-            contributing = 0
-            if race_format and race_format.win_condition == WinCondition.FASTEST_CONSECUTIVE:
-                if line['laps'] >= 3:
-                    contributing = 1
-            else:
-                # race_format.win_condition == WinCondition.MOST_LAPS or \
-                # race_format.win_condition == WinCondition.FIRST_TO_LAP_X or \
-                # race_format.win_condition == WinCondition.FASTEST_LAP:
-                if line['laps'] > 0:
-                    contributing = 1
-
-            if coopGroup:
-                coopGroup['contributing'] += contributing
-                coopGroup['members'] += 1
-                coopGroup['laps'] += line['laps']
-                coopGroup['total_time_raw'] += line['total_time_raw']
-                if line['total_time_raw'] > coopGroup['coop_total_time_raw']:
-                    coopGroup['coop_total_time_raw'] = line['total_time_raw']  # track last lap
-                    coopGroup['coop_total_time'] = line['total_time']
-                if line['average_lap_raw']:
-                    coopGroup['combined_average_lap_raw'] += line['average_lap_raw']
-                if line['fastest_lap_raw']:
-                    coopGroup['combined_fastest_lap_raw'] += line['fastest_lap_raw']
-                if line['consecutives_raw']:
-                    coopGroup['combined_consecutives_raw'] += line['consecutives_raw']
-            else:
-                coopGroup['contributing'] = contributing
-                coopGroup['members'] = 1
-                coopGroup['laps'] = line['laps']
-                coopGroup['total_time_raw'] = line['total_time_raw']
-                coopGroup['coop_total_time_raw'] = line['total_time_raw']
-                coopGroup['coop_total_time'] = line['total_time']
-                coopGroup['combined_average_lap_raw'] = line['average_lap_raw']
-                coopGroup['combined_fastest_lap_raw'] = line['fastest_lap_raw']
-                coopGroup['combined_consecutives_raw'] = line['consecutives_raw']
-
-        contribution_amt = 0
-        average_lap_raw = 0
-        average_fastest_lap_raw = 0
-        average_consecutives_raw = 0
-        if coopGroup.get('contributing'):
-            if coopGroup.get('members'):
-                contribution_amt = float(coopGroup['contributing']) / coopGroup['members']
-            if coopGroup.get('combined_average_lap_raw'):
-                average_lap_raw = round(float(coopGroup['combined_average_lap_raw']) / coopGroup['contributing'], 3)
-            if coopGroup.get('combined_fastest_lap_raw'):
-                average_fastest_lap_raw = round(float(coopGroup['combined_fastest_lap_raw']) / coopGroup['contributing'], 3)
-            if coopGroup.get('combined_consecutives_raw'):
-                average_consecutives_raw = round(float(coopGroup['combined_consecutives_raw']) / coopGroup['contributing'], 3)
-        coopGroup['coop_total_time_raw'] = round(coopGroup.get('coop_total_time_raw', 0), 3)
-
-        leaderboard = [{
-            'name': "Group",
-            'contributing': coopGroup.get('contributing', 0),
-            'members': coopGroup.get('members', 0),
-            'contribution_amt': contribution_amt,
-            'laps': coopGroup.get('laps'),
-            'total_time_raw': coopGroup.get('total_time_raw', 0),
-            'coop_total_time_raw': coopGroup.get('coop_total_time_raw', 0),
-            'coop_total_time': coopGroup.get('coop_total_time', 0),
-            'average_lap_raw': average_lap_raw,
-            'average_fastest_lap_raw': average_fastest_lap_raw,
-            'average_consecutives_raw': average_consecutives_raw,
-            'total_time': RHUtils.format_time_to_str(coopGroup.get('total_time_raw', 0), time_format),
-            'average_lap': RHUtils.format_time_to_str(average_lap_raw, time_format),
-            'average_fastest_lap': RHUtils.format_time_to_str(average_fastest_lap_raw, time_format),
-            'average_consecutives': RHUtils.format_time_to_str(average_consecutives_raw, time_format),
-        }]
+        coopGroup, coop_row = raceObj.team_aggregates.build_coop(results, race_format, time_format)
+        leaderboard = [coop_row]
 
         leaderboard_output = {
             'by_race_time': leaderboard
@@ -1192,32 +1797,46 @@ def calc_class_ranking_leaderboard(racecontext, race_class=None, class_id=None):
 
     return False
 
-def get_gap_info(racecontext, seat_index):
-    ''' Assembles current lap information for OSD '''
-
-    # select correct results
-    win_condition = racecontext.race.format.win_condition
-    consecutivesCount = racecontext.rhdata.get_optionInt('consecutivesCount', 3)
-
+def gap_view(win_condition):
+    '''Leaderboard view that ranks pilots for the given win condition'''
     if win_condition == WinCondition.FASTEST_CONSECUTIVE:
-        leaderboard = racecontext.race.results['by_consecutives']
+        return 'by_consecutives'
     elif win_condition == WinCondition.FASTEST_LAP:
-        leaderboard = racecontext.race.results['by_fastest_lap']
+        return 'by_fastest_lap'
     else:
         # WinCondition.MOST_LAPS
         # WinCondition.FIRST_TO_LAP_X
         # WinCondition.NONE
-        leaderboard = racecontext.race.results['by_race_time']
+        return 'by_race_time'
 
-    # get this seat's results
-    result = None
+def leaderboard_gap_rows(racecontext, seat_index, view):
+    '''This seat's results line, the line ranked just ahead of it and the leading line, from the full leaderboard'''
+    leaderboard = racecontext.race.get_results()[view]
     for index, result in enumerate(leaderboard):
         if result['node'] == seat_index:
-            rank_index = index
-            break
-    else: # no break, pilot is duplicated or NONE
+            return result, leaderboard[index - 1] if index else None, leaderboard[0]
+    return None
+
+def get_gap_info(racecontext, seat_index):
+    ''' Assembles current lap information for OSD '''
+
+    # select correct results
+    win_condition = racecontext.race.format.win_condition
+    consecutivesCount = racecontext.rhdata.get_optionInt('consecutivesCount', 3)
+    view = gap_view(win_condition)
+
+    # the race order kept from lap events answers without building the leaderboard,
+    #  unless plugins re-rank the leaderboard
+    rows = None
+    if not racecontext.filters.has_filters(Flt.LEADERBOARD_SORT_AND_RANK):
+        rows = racecontext.race.gap_tracker.gap_rows(seat_index, view, racecontext.race.format, consecutivesCount)
+    if rows is None:
+        rows = leaderboard_gap_rows(racecontext, seat_index, view)
+
+    if rows is None: # pilot is duplicated or NONE
         logger.debug('Failed to find results: Node not in result list')
         return
+    result, ahead_result, leader_result = rows
 
     # check for best lap
     is_best_lap = False
@@ -1228,7 +1847,7 @@ def get_gap_info(racecontext, seat_index):
     next_rank_split = None
     next_rank_split_result = None
     if isinstance(result['position'], int) and result['position'] > 1:
-        next_rank_split_result = leaderboard[rank_index - 1]
+        next_rank_split_result = ahead_result
 
         if next_rank_split_result['total_time_raw']:
             if win_condition == WinCondition.FASTEST_CONSECUTIVE:
@@ -1243,7 +1862,7 @@ def get_gap_info(racecontext, seat_index):
                 next_rank_split = result['total_time_raw'] - next_rank_split_result['total_time_raw']
     else:
         # check split to self
-        next_rank_split_result = leaderboard[rank_index]
+        next_rank_split_result = result
 
         if win_condition == WinCondition.FASTEST_CONSECUTIVE or win_condition == WinCondition.FASTEST_LAP:
             if next_rank_split_result['fastest_lap_raw']:
@@ -1254,7 +1873,7 @@ def get_gap_info(racecontext, seat_index):
     first_rank_split = None
     first_rank_split_result = None
     if isinstance(result['position'], int) and result['position'] > 2:
-        first_rank_split_result = leaderboard[0]
+        first_rank_split_result = leader_result
 
         if first_rank_split_result['total_time_raw']:
             if win_condition == WinCondition.FASTEST_CONSECUTIVE and result['consecutives_base'] == consecutivesCount:
@@ -1303,7 +1922,7 @@ def get_gap_info(racecontext, seat_index):
         pass_info.current.last_lap_time = int(round(result['total_time_raw'], 0))
         pass_info.current.is_best_lap = False
 
-    if result['consecutives']:
+    if result['consecutives_raw'] is not None:
         pass_info.current.consecutives = int(round(result['consecutives_raw'], 0))
         pass_info.current.consecutives_base = int(round(result['consecutives_base'], 0))
 
@@ -1347,12 +1966,482 @@ def get_gap_info(racecontext, seat_index):
 
     return racecontext.filters.run_filters(Flt.GAP_INFO, pass_info)
 
+class SeatStanding:
+    '''
+    Results line for one seat, advanced one crossing at a time with the same
+    arithmetic (sums taken in crossing order, then rounded) as
+    'calc_leaderboard', so its values equal that seat's leaderboard line.
+    '''
+    def __init__(self, pilot_id, callsign, node_index, results_order, start_behavior, consecutivesCount):
+        self.results_order = results_order  # position of the line in leaderboard input, for ties
+        self.row = {
+            'pilot_id': pilot_id,
+            'callsign': callsign,
+            'node': node_index,
+        }
+        self.reset([], start_behavior, consecutivesCount)
+
+    def reset(self, lap_times, start_behavior, consecutivesCount):
+        self.start_behavior = start_behavior
+        self.consecutivesCount = consecutivesCount
+        self.lap_times = []  # active crossings
+        self._time_total = 0
+        self._best_consecutives = None
+        self.row.update({
+            'laps': 0,
+            'total_time_raw': 0,
+            'total_time_laps_raw': 0,
+            'last_lap_raw': None,
+            'fastest_lap_raw': 0,
+            'consecutives_raw': None,
+            'consecutives_base': 0,
+        })
+        for lap_time in lap_times:
+            self.add_crossing(lap_time)
+
+    def add_crossing(self, lap_time):
+        self.lap_times.append(lap_time)
+        if self.consecutivesCount is None:
+            return  # calculated once the ranking settings are known
+        self._time_total += lap_time
+        row = self.row
+        crossings = len(self.lap_times)
+        lap_count = crossings if self.start_behavior == StartBehavior.FIRST_LAP else crossings - 1
+        time_total_laps = self._time_total
+        if lap_count != crossings:
+            time_total_laps -= self.lap_times[0]
+        row['laps'] = lap_count
+        row['total_time_raw'] = round(self._time_total, 3)
+        row['total_time_laps_raw'] = round(time_total_laps, 3)
+
+        if lap_count:
+            row['last_lap_raw'] = lap_time
+            if lap_count == 1 or lap_time < row['fastest_lap_raw']:
+                row['fastest_lap_raw'] = lap_time
+            if lap_count >= self.consecutivesCount:
+                # each crossing adds exactly one window of consecutive laps
+                window = sum(self.lap_times[crossings - self.consecutivesCount:])
+                if self._best_consecutives is None or window < self._best_consecutives:
+                    self._best_consecutives = window
+                row['consecutives_raw'] = round(self._best_consecutives, 3)
+                row['consecutives_base'] = self.consecutivesCount
+            else:
+                row['consecutives_raw'] = row['total_time_laps_raw']
+                row['consecutives_base'] = lap_count
+
+        if self.start_behavior == StartBehavior.STAGGERED:
+            row['total_time_raw'] = row['total_time_laps_raw']
+
+class GapTracker:
+    '''
+    Race order of the seats that have crossed, kept from lap events as a
+    sorted list so the gap to the pilot ahead and to the leader is found by
+    binary search on each lap, without waiting for a full leaderboard
+    build. Standings, sort keys and positions follow 'calc_leaderboard',
+    so the rows match the leaderboard lines for the same seats.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seats = {}  # node index -> SeatStanding
+        self.exact = True  # False once a seat has laps that cannot be matched to a leaderboard line
+        self._ranking = None  # LeaderboardRanking of all seats' rows in one view, by node index
+        self._order_params = None  # (view, start behavior, consecutives count) of '_ranking'
+
+    def add_crossing(self, node_index, crossing, pilot_id, callsign, has_line=True):
+        '''
+        Records an active crossing. 'pilot_id' is None in practice mode, where
+        leaderboard lines are per seat rather than per pilot; 'has_line' is
+        False for a seat whose pilot's line comes from another seat.
+        '''
+        if not has_line:
+            self.exact = False
+            return
+        seat = self.seats.get(node_index)
+        if seat is None:
+            _view, start_behavior, consecutivesCount = self._order_params or (None, None, None)
+            seat = SeatStanding(pilot_id, callsign, node_index, node_index if pilot_id is None else pilot_id,
+                                start_behavior, consecutivesCount)
+            self.seats[node_index] = seat
+        seat.add_crossing(crossing.lap_time)
+        if self._order_params:
+            self._place(node_index)
+
+    def sync(self, node_laps):
+        '''Re-reads the active crossings of every seat (after laps are deleted, restored or replaced)'''
+        for node_index, laps in node_laps.items():
+            lap_times = [lap.lap_time for lap in laps if not lap.deleted]
+            seat = self.seats.get(node_index)
+            if seat:
+                seat.reset(lap_times, seat.start_behavior, seat.consecutivesCount)
+            elif lap_times:
+                self.exact = False  # seat never recorded a crossing here, so it has no pilot details
+        self._order_params = None
+
+    def _place(self, node_index):
+        seat = self.seats[node_index]
+        self._ranking.set_row(node_index, seat.row, seat.results_order)
+
+    def _prepare(self, view, start_behavior, consecutivesCount):
+        params = (view, start_behavior, consecutivesCount)
+        if self._order_params == params:
+            return
+        for seat in self.seats.values():
+            if seat.start_behavior != start_behavior or seat.consecutivesCount != consecutivesCount:
+                seat.reset(seat.lap_times, start_behavior, consecutivesCount)
+        self._order_params = params
+        self._ranking = LeaderboardRanking(consecutivesCount, (view,))
+        for node_index in self.seats:
+            self._place(node_index)
+
+    def _row(self, index):
+        '''Copy of the row at 'index' of the order, with its position'''
+        row, position = self._ranking.row_at(self._order_params[0], index)
+        row = dict(row)
+        row['position'] = position
+        return row
+
+    def gap_rows(self, seat_index, view, race_format, consecutivesCount):
+        '''
+        This seat's results line, the line ranked just ahead of it and the
+        leading line, or None if the seat's line is not tracked here.
+        '''
+        if not self.exact or seat_index not in self.seats:
+            return None
+        self._prepare(view, race_format.start_behavior if race_format else None, consecutivesCount)
+        index = self._ranking.index(seat_index, view)
+        return self._row(index), self._row(index - 1) if index else None, self._row(0)
+
+# individual win conditions decided from the race order alone, kept per race by 'WinConditionState'
+WIN_STATE_CONDITIONS = (WinCondition.MOST_PROGRESS, WinCondition.MOST_LAPS,
+                        WinCondition.MOST_LAPS_OVERTIME, WinCondition.FIRST_TO_LAP_X)
+
+class WinConditionState:
+    '''
+    Per-race win condition state, updated from each recorded crossing.
+
+    For individual races won on progress, lap count (with or without
+    overtime) or first to X laps, it keeps every results line's standing
+    (see 'SeatStanding'), the leading and runner-up lines, the lines on each
+    lap count and the largest total time. A crossing only improves its own
+    line, so these are updated in constant time, and the checks answer from
+    them as the leaderboard checks would from 'by_race_time', without
+    scanning it. Lines are bound from the race results once per race, since
+    the seats and pilots of a running race are fixed.
+
+    Team and co-op races are decided on sums over pilots, and fastest lap and
+    fastest consecutive laps only at the finish; those stay on the
+    leaderboard checks. For them, the state keeps upper bounds on lap counts,
+    so a first-to-X check with no line able to reach the target skips the
+    team or co-op leaderboard, and the team leaderboard built for a set of
+    results, so checks that recurse into a forced determination build it once.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.node_crossings = {}  # node index -> most active crossings seen for node
+        self.lead_crossings = 0   # largest value in 'node_crossings'
+        self.total_crossings = 0  # sum of values in 'node_crossings'
+        self._team_leaderboard_key = None
+        self._team_leaderboard = None
+        self.lines = None  # node index -> SeatStanding of the node's results line, once bound
+        self._bind_key = None
+        self.leader = None  # node index of the line first in race order
+        self.runner_up = None  # node index of the line second in race order
+        self.lap_lines = {}  # lap count -> node indexes of the lines on it
+        self.max_total_time = 0
+
+    def _set_node_crossings(self, node_index, count):
+        prev_count = self.node_crossings.get(node_index, 0)
+        if count > prev_count:
+            self.node_crossings[node_index] = count
+            self.total_crossings += count - prev_count
+            if count > self.lead_crossings:
+                self.lead_crossings = count
+
+    def add_crossing(self, node_index, lap_time=0):
+        self._set_node_crossings(node_index, self.node_crossings.get(node_index, 0) + 1)
+        line = self.lines.get(node_index) if self.lines else None
+        if line:
+            prev_laps = line.row['laps']
+            line.add_crossing(lap_time)
+            self._move_line(node_index, prev_laps)
+
+    def sync(self, node_laps):
+        '''Re-reads the active crossings in 'node_laps' (after laps are deleted, restored or replaced)'''
+        for node_index, laps in node_laps.items():
+            self._set_node_crossings(node_index, sum(1 for lap in laps if not lap.deleted))
+        if self.lines:
+            for node_index, line in self.lines.items():
+                line.reset([lap.lap_time for lap in node_laps.get(node_index, []) if not lap.deleted],
+                           line.start_behavior, line.consecutivesCount)
+            self._order_lines()
+
+    def lap_target_reachable(self, race_format):
+        '''False when no leaderboard line can have 'number_laps_win' laps yet'''
+        if race_format.team_racing_mode in (RacingMode.TEAM_ENABLED, RacingMode.COOP_ENABLED):
+            # team and co-op laps are sums over pilots
+            return self.total_crossings >= race_format.number_laps_win
+        return self.lead_crossings >= race_format.number_laps_win
+
+    def team_leaderboard(self, racecontext):
+        '''Team leaderboard for the current race results, built once per results object'''
+        raceObj = racecontext.race
+        results = raceObj.results
+        settings = (raceObj.format.win_condition if raceObj.format else None,
+                    racecontext.rhdata.get_optionInt('consecutivesCount', 3),
+                    racecontext.serverconfig.get_item('UI', 'timeFormat'))
+        if self._team_leaderboard_key is None or self._team_leaderboard_key[0] is not results or \
+                                                 self._team_leaderboard_key[1] != settings:
+            self._team_leaderboard = calc_team_leaderboard(racecontext)
+            self._team_leaderboard_key = (results, settings)  # holds 'results', so its identity stays unique
+        return self._team_leaderboard
+
+    def ready(self, racecontext):
+        '''
+        True if the win condition of the current race is checked from this
+        state; binds the results lines on first use. False when plugins
+        filter the race results, which may change their order.
+        '''
+        raceObj = racecontext.race
+        race_format = raceObj.format
+        if race_format.team_racing_mode != RacingMode.INDIVIDUAL or \
+                race_format.win_condition not in WIN_STATE_CONDITIONS:
+            return False
+        if racecontext.filters.has_filters(Flt.RACE_RESULTS) or \
+                racecontext.filters.has_filters(Flt.LEADERBOARD_SORT_AND_RANK):
+            return False
+        if raceObj.recorded_laps_pending():
+            return False  # results do not include these laps yet
+        bind_key = (raceObj.current_heat, race_format.start_behavior)
+        if self._bind_key != bind_key:
+            results = raceObj.get_results()
+            self._bind(results['by_race_time'], results['meta'], raceObj.node_laps)
+            self._bind_key = bind_key
+        return True
+
+    def _bind(self, leaderboard, meta, node_laps):
+        self.lines = {}
+        for line in leaderboard:
+            node_index = line['node']
+            pilot_id = line['pilot_id']
+            standing = SeatStanding(pilot_id, line['callsign'], node_index,
+                                    node_index if pilot_id is None else pilot_id,
+                                    meta['start_behavior'], meta['consecutives_count'])
+            standing.reset([lap.lap_time for lap in node_laps.get(node_index, []) if not lap.deleted],
+                           standing.start_behavior, standing.consecutivesCount)
+            self.lines[node_index] = standing
+        self._order_lines()
+
+    def _line_key(self, node_index):
+        line = self.lines[node_index]
+        return _race_time_key(line.row), line.results_order
+
+    def _order_lines(self):
+        '''Leader, runner-up, lap counts and largest total time of all lines'''
+        order = sorted(self.lines, key=self._line_key)
+        self.leader = order[0] if order else None
+        self.runner_up = order[1] if len(order) > 1 else None
+        self.lap_lines = {}
+        self.max_total_time = 0
+        for node_index, line in self.lines.items():
+            self.lap_lines.setdefault(line.row['laps'], set()).add(node_index)
+            self.max_total_time = max(self.max_total_time, line.row['total_time_raw'])
+
+    def _move_line(self, node_index, prev_laps):
+        '''Places a line after a crossing, which can only move it up the race order'''
+        row = self.lines[node_index].row
+        if row['laps'] != prev_laps:
+            self.lap_lines[prev_laps].discard(node_index)
+            self.lap_lines.setdefault(row['laps'], set()).add(node_index)
+        self.max_total_time = max(self.max_total_time, row['total_time_raw'])
+
+        if node_index == self.leader or self.runner_up is None:
+            return
+        key = self._line_key(node_index)
+        if key < self._line_key(self.leader):
+            self.runner_up = self.leader
+            self.leader = node_index
+        elif node_index != self.runner_up and key < self._line_key(self.runner_up):
+            self.runner_up = node_index
+
+    def _row(self, node_index):
+        return self.lines[node_index].row
+
+    def _near_lead_pending(self, interfaceObj, lead_lap):
+        '''True (and logs the first such line in race order) if a line on or one lap behind the lead lap is crossing'''
+        crossing = [node_index for laps in (lead_lap, lead_lap - 1) for node_index in self.lap_lines.get(laps, ())
+                    if node_index != self.leader and interfaceObj.nodes[node_index].pass_crossing_flag]
+        if crossing:
+            logger.info('Waiting for node {0} crossing to decide winner'.format(min(crossing, key=self._line_key)+1))
+            return True
+        return False
+
+    def _count_lines(self, raceObj, laps):
+        '''Lines below the lead on 'laps' laps, and how many of those have not finished'''
+        nodes = [node_index for node_index in self.lap_lines.get(laps, ()) if node_index != self.leader]
+        return len(nodes), sum(1 for node_index in nodes if raceObj.get_node_finished_flag(node_index) == False)
+
+    def _lead_tied(self):
+        lead_row = self._row(self.leader)
+        runner_up_row = self._row(self.runner_up)
+        return runner_up_row['laps'] == lead_row['laps'] and \
+            runner_up_row['total_time_raw'] == lead_row['total_time_raw']
+
+    def _declare(self, raceObj):
+        leaderboard = raceObj.results['by_race_time']
+        if self._lead_tied():
+            logger.info('Race tied at {0}/{1}'.format(leaderboard[0]['laps'], leaderboard[0]['total_time']))
+            return {
+                'status': WinStatus.TIE
+            }
+        return {
+            'status': WinStatus.DECLARED,
+            'data': leaderboard[0]
+        }
+
+    def check(self, raceObj, interfaceObj, **kwargs):
+        '''Same result as the leaderboard check for the race's win condition'''
+        win_condition = raceObj.format.win_condition
+        if win_condition == WinCondition.MOST_PROGRESS:
+            return self.check_laps_and_time(raceObj, interfaceObj, **kwargs)
+        elif win_condition == WinCondition.MOST_LAPS:
+            return self.check_most_laps(raceObj, interfaceObj, **kwargs)
+        elif win_condition == WinCondition.MOST_LAPS_OVERTIME:
+            return self.check_laps_and_overtime(raceObj, interfaceObj, **kwargs)
+        return self.check_first_to_x(raceObj, interfaceObj, **kwargs)
+
+    def check_laps_and_time(self, raceObj, interfaceObj, **kwargs):
+        if raceObj.race_status == RaceStatus.DONE or \
+                    raceObj.check_all_nodes_finished() or 'forced' in kwargs:
+            if len(self.lines) > 1:
+                lead_lap = self._row(self.leader)['laps']
+                if lead_lap > 0: # must have at least one lap
+                    # if race stopped then don't wait for crossing to finish
+                    if raceObj.race_status != RaceStatus.DONE and self._near_lead_pending(interfaceObj, lead_lap):
+                        return {
+                            'status': WinStatus.PENDING_CROSSING
+                        }
+                    return self._declare(raceObj)
+        elif raceObj.race_status == RaceStatus.RACING and raceObj.timer_running == False:
+            # time has ended; check if winning is assured
+            if len(self.lines) > 1:
+                lead_lap = self._row(self.leader)['laps']
+                if lead_lap > 0: # must have at least one lap
+                    if self._near_lead_pending(interfaceObj, lead_lap):
+                        return {
+                            'status': WinStatus.PENDING_CROSSING
+                        }
+                    # check if any pilot below lead can potentially pass or tie
+                    _pilots_tied, pilots_can_pass = self._count_lines(raceObj, lead_lap)
+                    if pilots_can_pass == 0:
+                        return self.check_laps_and_time(raceObj, interfaceObj, forced=True, **kwargs)
+
+        return {
+            'status': WinStatus.NONE
+        }
+
+    def check_most_laps(self, raceObj, interfaceObj, **kwargs):
+        if raceObj.race_status == RaceStatus.DONE or \
+                    raceObj.check_all_nodes_finished() or 'forced' in kwargs: # racing must be completed
+            if len(self.lines) > 1:
+                lead_lap = self._row(self.leader)['laps']
+                if lead_lap > 0: # must have at least one lap
+                    # if race stopped then don't wait for crossing to finish
+                    if raceObj.race_status != RaceStatus.DONE and self._near_lead_pending(interfaceObj, lead_lap):
+                        return {
+                            'status': WinStatus.PENDING_CROSSING
+                        }
+                    if self._row(self.runner_up)['laps'] == lead_lap:
+                        logger.info('Race tied at %d laps', lead_lap)
+                        return {
+                            'status': WinStatus.TIE
+                        }
+                    return {
+                        'status': WinStatus.DECLARED,
+                        'data': raceObj.results['by_race_time'][0]
+                    }
+        elif raceObj.race_status == RaceStatus.RACING and raceObj.timer_running == False:
+            # time has ended; check if winning is assured
+            if len(self.lines) > 1:
+                lead_lap = self._row(self.leader)['laps']
+                if lead_lap > 0: # must have at least one lap
+                    if self._near_lead_pending(interfaceObj, lead_lap):
+                        return {
+                            'status': WinStatus.PENDING_CROSSING
+                        }
+                    # check if any pilot below lead can potentially pass or tie
+                    pilots_tied, pilots_can_pass = self._count_lines(raceObj, lead_lap)
+                    _pilots_behind, pilots_can_tie = self._count_lines(raceObj, lead_lap - 1)
+                    # call race if possible
+                    if pilots_can_pass == 0:
+                        if pilots_can_tie == 0 and pilots_tied == 0:
+                            return self.check_most_laps(raceObj, interfaceObj, forced=True, **kwargs)
+                        elif pilots_tied > 0:
+                            if raceObj.get_node_finished_flag(self.leader) == True:
+                                return self.check_most_laps(raceObj, interfaceObj, forced=True, **kwargs)
+
+        return {
+            'status': WinStatus.NONE
+        }
+
+    def check_laps_and_overtime(self, raceObj, interfaceObj, **kwargs):
+        if (raceObj.race_status == RaceStatus.RACING and raceObj.timer_running == False) or \
+                        raceObj.race_status == RaceStatus.DONE or 'at_finish' in kwargs:
+            if len(self.lines):
+                if self.max_total_time > (raceObj.format.race_time_sec * 1000): # pilot crossed after time
+                    return self.check_laps_and_time(raceObj, interfaceObj, **kwargs)
+
+                win_status = self.check_most_laps(raceObj, interfaceObj, forced=True, **kwargs)
+                if win_status['status'] == WinStatus.TIE and raceObj.race_status == RaceStatus.RACING:
+                    # ties here change status to overtime
+                    win_status['status'] = WinStatus.OVERTIME
+                return win_status
+
+        return {
+            'status': WinStatus.NONE
+        }
+
+    def check_first_to_x(self, raceObj, interfaceObj, **_kwargs):
+        number_laps_win = raceObj.format.number_laps_win
+        if number_laps_win and len(self.lines) > 1: # must have laps > 0 to win
+            lead_lap = self._row(self.leader)['laps']
+            if lead_lap >= number_laps_win: # lead lap passes win threshold
+                # if race stopped then don't wait for crossing to finish
+                if raceObj.race_status != RaceStatus.DONE and self._near_lead_pending(interfaceObj, lead_lap):
+                    return {
+                        'status': WinStatus.PENDING_CROSSING
+                    }
+                return self._declare(raceObj)
+
+        return {
+            'status': WinStatus.NONE
+        }
+
+def get_win_team_leaderboard(racecontext):
+    return racecontext.race.win_state.team_leaderboard(racecontext)
+
 def check_win_condition_result(racecontext, **kwargs):
+    raceObj = racecontext.race
+    race_format = raceObj.format
+    if race_format and raceObj.win_state.ready(racecontext):
+        return raceObj.win_state.check(raceObj, racecontext.interface, **kwargs)
+    return check_win_condition_leaderboard(racecontext, **kwargs)
+
+def check_win_condition_leaderboard(racecontext, **kwargs):
+    '''Checks the win condition from the current race's leaderboards'''
     raceObj = racecontext.race
     rhDataObj = racecontext.rhdata
     interfaceObj = racecontext.interface
     race_format = raceObj.format
     if race_format:
+        if race_format.win_condition == WinCondition.FIRST_TO_LAP_X and race_format.number_laps_win and \
+                not raceObj.win_state.lap_target_reachable(race_format):
+            return {
+                'status': WinStatus.NONE
+            }
         consecutivesCount = rhDataObj.get_optionInt('consecutivesCount', 3)
         if race_format.team_racing_mode == RacingMode.TEAM_ENABLED:
             if race_format.win_condition == WinCondition.MOST_PROGRESS:
@@ -1709,7 +2798,7 @@ def check_win_team_laps_and_time(racecontext, **kwargs):
 
     if raceObj.race_status == RaceStatus.DONE or \
                 raceObj.check_all_nodes_finished() or 'forced' in kwargs: # racing must be completed
-        team_info = calc_team_leaderboard(racecontext)
+        team_info = get_win_team_leaderboard(racecontext)
         team_leaderboard = team_info['by_race_time']
         individual_leaderboard = raceObj.results['by_race_time']
         if len(team_leaderboard) > 1 and len(individual_leaderboard):
@@ -1744,7 +2833,7 @@ def check_win_team_laps_and_time(racecontext, **kwargs):
                 }
     elif raceObj.race_status == RaceStatus.RACING and raceObj.timer_running == False:
         # time has ended; check if winning is assured
-        team_info = calc_team_leaderboard(racecontext)
+        team_info = get_win_team_leaderboard(racecontext)
         team_leaderboard = team_info['by_race_time']
         individual_leaderboard = raceObj.results['by_race_time']
         if len(team_leaderboard) > 1 and len(individual_leaderboard):
@@ -1809,7 +2898,7 @@ def check_win_team_most_laps(racecontext, **kwargs):
 
     if raceObj.race_status == RaceStatus.DONE or \
                 raceObj.check_all_nodes_finished() or 'forced' in kwargs: # racing must be completed
-        team_info = calc_team_leaderboard(racecontext)
+        team_info = get_win_team_leaderboard(racecontext)
         team_leaderboard = team_info['by_race_time']
         individual_leaderboard = raceObj.results['by_race_time']
         if len(team_leaderboard) > 1 and len(individual_leaderboard):
@@ -1842,7 +2931,7 @@ def check_win_team_most_laps(racecontext, **kwargs):
                 }
     elif raceObj.race_status == RaceStatus.RACING and raceObj.timer_running == False:
         # time has ended; check if winning is assured
-        team_info = calc_team_leaderboard(racecontext)
+        team_info = get_win_team_leaderboard(racecontext)
         team_leaderboard = team_info['by_race_time']
         individual_leaderboard = raceObj.results['by_race_time']
         if len(team_leaderboard) > 1 and len(individual_leaderboard):
@@ -1930,7 +3019,7 @@ def check_win_team_first_to_x(racecontext, **_kwargs):
 
     race_format = raceObj.format
     if race_format.number_laps_win: # must have laps > 0 to win
-        team_leaderboard = calc_team_leaderboard(racecontext)['by_race_time']
+        team_leaderboard = get_win_team_leaderboard(racecontext)['by_race_time']
         individual_leaderboard = raceObj.results['by_race_time']
         if len(team_leaderboard) > 1 and len(individual_leaderboard):
             lead_lap = team_leaderboard[0]['laps']
@@ -1970,7 +3059,7 @@ def check_win_team_fastest_lap(racecontext, **kwargs):
 
     if raceObj.race_status == RaceStatus.DONE or \
                 raceObj.check_all_nodes_finished() or 'forced' in kwargs: # racing must be completed
-        team_leaderboard = calc_team_leaderboard(racecontext)['by_avg_fastest_lap']
+        team_leaderboard = get_win_team_leaderboard(racecontext)['by_avg_fastest_lap']
         if len(team_leaderboard) > 1:
             if team_leaderboard[0]['laps'] > 0: # must have at least one lap
                 # check for tie
@@ -1990,7 +3079,7 @@ def check_win_team_fastest_lap(racecontext, **kwargs):
 
     elif 'at_finish' in kwargs:
         race_format = raceObj.format
-        team_leaderboard = calc_team_leaderboard(racecontext)['by_avg_fastest_lap']
+        team_leaderboard = get_win_team_leaderboard(racecontext)['by_avg_fastest_lap']
         if len(team_leaderboard) > 1:
             if team_leaderboard[0]['laps'] > 0: # must have at least one lap
 
@@ -2033,7 +3122,7 @@ def check_win_team_fastest_consecutive(racecontext, consecutivesCount, **kwargs)
 
     if raceObj.race_status == RaceStatus.DONE or \
                 raceObj.check_all_nodes_finished() or 'forced' in kwargs: # racing must be completed
-        team_leaderboard = calc_team_leaderboard(racecontext)['by_avg_consecutives']
+        team_leaderboard = get_win_team_leaderboard(racecontext)['by_avg_consecutives']
         if len(team_leaderboard) > 1:
             race_format = raceObj.format
             if team_leaderboard[0]['laps'] > consecutivesCount or \
@@ -2053,7 +3142,7 @@ def check_win_team_fastest_consecutive(racecontext, consecutivesCount, **kwargs)
                     'data': team_leaderboard[0]
                 }
     elif 'at_finish' in kwargs:
-        team_leaderboard = calc_team_leaderboard(racecontext)['by_avg_consecutives']
+        team_leaderboard = get_win_team_leaderboard(racecontext)['by_avg_consecutives']
         if len(team_leaderboard) > 1:
             fast_consecutives = team_leaderboard[0]['average_consecutives_raw']
             if fast_consecutives and fast_consecutives > 0: # must have recorded time (otherwise impossible to set bounds)
@@ -1,7 +1,7 @@
 ''' builtin Actions '''
 
 import RHData
-import gevent
+from time import monotonic
 from eventmanager import Evt
 from EventActions import ActionEffect
 from RHUI import UIField, UIFieldType, UIFieldSelectOption
@@ -20,11 +20,12 @@ class ActionsBuiltin():
             if len(delay_sec_holder) <= 0 or not isinstance(delay_sec_holder[0], float):
                 self._rhapi.ui.message_speak(text)
             else:
+                start_time = monotonic()  # pieces are spaced from one start time so they don't drift apart
                 if not isinstance(text, list):
-                    gevent.spawn_later(delay_sec_holder[0], self._rhapi.ui.message_speak, text)
+                    self._rhapi.server.call_at(start_time + delay_sec_holder[0], self._rhapi.ui.message_speak, text)
                 else:
                     for i, piece in enumerate(text):
-                        gevent.spawn_later(delay_sec_holder[0]*(i+1), self._rhapi.ui.message_speak, piece)
+                        self._rhapi.server.call_at(start_time + delay_sec_holder[0]*(i+1), self._rhapi.ui.message_speak, piece)
 
     def messageEffect(self, action, args):
         if 'text' in action:
@@ -1,5 +1,6 @@
 ''' Class ranking method: Laps/Time, Best X rounds '''
 
+import heapq
 import logging
 import RHUtils
 from eventmanager import Evt
@@ -9,137 +10,120 @@ from RHUI import UIField, UIFieldType, UIFieldSelectOption
 
 logger = logging.getLogger(__name__)
 
-def rank_best_rounds(rhapi, race_class, args):
+def rank_key(laps, time):
+    return (
+        -laps, # reverse lap count
+        time if time and time > 0 else float('inf') # total time ascending except 0
+    )
+
+def best_rounds_total(pilot_rows, rounds, time_field):
+    '''Sums a pilot's best 'rounds' results; 'pilot_rows' maps (race order, line index) to results lines'''
+    best = heapq.nsmallest(rounds, pilot_rows.items(), key=lambda item: (rank_key(item[1]['laps'], item[1][time_field]), item[0]))
+
+    first = best[0][1]
+    total = {
+        'pilot_id': first['pilot_id'],
+        'callsign': first['callsign'],
+        'team_name': first['team_name'],
+        'node': first['node'],
+        'laps': 0,
+        'starts': 0,
+        'total_time_raw': 0,
+        'total_time_laps_raw': 0,
+    }
+    for _key, race in best:
+        total['laps'] += race['laps']
+        total['starts'] += race['starts']
+        total['total_time_raw'] += race['total_time_raw']
+        total['total_time_laps_raw'] += race['total_time_laps_raw']
+
+    return total
+
+def rank_best_rounds(rhapi, race_class, args, changes):
     if 'rounds' not in args or not args['rounds'] or int(args['rounds']) < 1:
         return False, {}
 
     rounds = int(args['rounds'])
 
     race_format = rhapi.db.raceformat_by_id(race_class.format_id)
-    heats = rhapi.db.heats_by_class(race_class.id)
-
-    pilotresults = {}
-    for heat in heats:
-        races = rhapi.db.races_by_heat(heat.id)
-
-        for race in races:
-            race_result = rhapi.db.race_results(race)
-
-            if race_result:
-                for pilotresult in race_result['by_race_time']:
-                    if pilotresult['pilot_id'] not in pilotresults:
-                        pilotresults[pilotresult['pilot_id']] = []
-                    pilotresults[pilotresult['pilot_id']].append(pilotresult)
-            else:
-                logger.warning("Failed building ranking, race result not available")
-                return False, {}
-
-    leaderboard = []
-    for pilotresultlist in pilotresults:
-        if race_format and race_format.start_behavior == StartBehavior.STAGGERED:
-            pilot_result = sorted(pilotresults[pilotresultlist], key = lambda x: (
-                -x['laps'], # reverse lap count
-                x['total_time_laps_raw'] if x['total_time_laps_raw'] and x['total_time_laps_raw'] > 0 else float('inf') # total time ascending except 0
-            ))
-        else:
-            pilot_result = sorted(pilotresults[pilotresultlist], key = lambda x: (
-                -x['laps'], # reverse lap count
-                x['total_time_raw'] if x['total_time_raw'] and x['total_time_raw'] > 0 else float('inf') # total time ascending except 0
-            ))
-
-        pilot_result = pilot_result[:rounds]
-
-        new_pilot_result = {}
-        new_pilot_result['pilot_id'] = pilot_result[0]['pilot_id']
-        new_pilot_result['callsign'] = pilot_result[0]['callsign']
-        new_pilot_result['team_name'] = pilot_result[0]['team_name']
-        new_pilot_result['node'] = pilot_result[0]['node']
-        new_pilot_result['laps'] = 0
-        new_pilot_result['starts'] = 0
-        new_pilot_result['total_time_raw'] = 0
-        new_pilot_result['total_time_laps_raw'] = 0
-
-        for race in pilot_result:
-            new_pilot_result['laps'] += race['laps']
-            new_pilot_result['starts'] += race['starts']
-            new_pilot_result['total_time_raw'] += race['total_time_raw']
-            new_pilot_result['total_time_laps_raw'] += race['total_time_laps_raw']
-
-        timeFormat = rhapi.config.get('UI', 'timeFormat')
-        new_pilot_result['total_time'] = rhapi.utils.format_time_to_str(new_pilot_result['total_time_raw'], timeFormat)
-        new_pilot_result['total_time_laps'] = rhapi.utils.format_time_to_str(new_pilot_result['total_time_laps_raw'], timeFormat)
-
-        leaderboard.append(new_pilot_result)
-
     if race_format and race_format.start_behavior == StartBehavior.STAGGERED:
-        # Sort by laps time
-        leaderboard = sorted(leaderboard, key = lambda x: (
-            -x['laps'], # reverse lap count
-            x['total_time_laps_raw'] if x['total_time_laps_raw'] and x['total_time_laps_raw'] > 0 else float('inf') # total time ascending except 0
-        ))
-
-        # determine ranking
-        last_rank = None
-        last_rank_laps = 0
-        last_rank_time = 0
-        for i, row in enumerate(leaderboard, start=1):
-            pos = i
-            if last_rank_laps == row['laps'] and last_rank_time == row['total_time_laps_raw']:
-                pos = last_rank
-            last_rank = pos
-            last_rank_laps = row['laps']
-            last_rank_time = row['total_time_laps_raw']
-
-            row['position'] = pos
-
-        meta = {
-            'method_label': F"Best {rounds} Rounds",
-            'rank_fields': [{
-                'name': 'laps',
-                'label': "Laps"
-            },{
-                'name': 'total_time_laps',
-                'label': "Total"
-            },{
-                'name': 'starts',
-                'label': "Starts"
-            }]
-        }
-
+        time_field = 'total_time_laps_raw'
+    else:
+        time_field = 'total_time_raw'
+
+    # kept between rankings: lines of each race, each pilot's lines and best rounds total
+    race_keys = changes.state.setdefault('races', {})
+    pilot_rows = changes.state.setdefault('pilots', {})
+    totals = changes.state.setdefault('totals', {})
+    if changes.state.get('time_field') != time_field:
+        totals.clear()
+        changes.state['time_field'] = time_field
+        changed_pilots = set(pilot_rows)
     else:
-        # Sort by race time
-        leaderboard = sorted(leaderboard, key = lambda x: (
-            -x['laps'], # reverse lap count
-            x['total_time_raw'] if x['total_time_raw'] and x['total_time_raw'] > 0 else float('inf') # total time ascending except 0
-        ))
+        changed_pilots = set()
+
+    for race_id, race_result in changes.race_results().items():
+        if race_result is False:
+            logger.warning("Failed building ranking, race result not available")
+            return False, {}
+
+        for pilot_id, key in race_keys.pop(race_id, []):
+            del pilot_rows[pilot_id][key]
+            changed_pilots.add(pilot_id)
+
+        if race_result:
+            keys = []
+            for idx, pilotresult in enumerate(race_result['by_race_time']):
+                key = (changes.race_order(race_id), idx)
+                pilot_rows.setdefault(pilotresult['pilot_id'], {})[key] = pilotresult
+                keys.append((pilotresult['pilot_id'], key))
+                changed_pilots.add(pilotresult['pilot_id'])
+            race_keys[race_id] = keys
+
+    for pilot_id in changed_pilots:
+        if pilot_rows.get(pilot_id):
+            totals[pilot_id] = best_rounds_total(pilot_rows[pilot_id], rounds, time_field)
+        else:
+            pilot_rows.pop(pilot_id, None)
+            totals.pop(pilot_id, None)
+
+    # pilots tied on laps and time keep the order of their first race
+    leaderboard = [dict(totals[pilot_id]) for pilot_id in sorted(totals, key=lambda pilot_id: (
+        rank_key(totals[pilot_id]['laps'], totals[pilot_id][time_field]),
+        min(pilot_rows[pilot_id])
+    ))]
+
+    timeFormat = rhapi.config.get('UI', 'timeFormat')
+    last_rank = None
+    last_rank_laps = 0
+    last_rank_time = 0
+    for i, row in enumerate(leaderboard, start=1):
+        row['total_time'] = rhapi.utils.format_time_to_str(row['total_time_raw'], timeFormat)
+        row['total_time_laps'] = rhapi.utils.format_time_to_str(row['total_time_laps_raw'], timeFormat)
 
         # determine ranking
-        last_rank = None
-        last_rank_laps = 0
-        last_rank_time = 0
-        for i, row in enumerate(leaderboard, start=1):
-            pos = i
-            if last_rank_laps == row['laps'] and last_rank_time == row['total_time_raw']:
-                pos = last_rank
-            last_rank = pos
-            last_rank_laps = row['laps']
-            last_rank_time = row['total_time_raw']
-
-            row['position'] = pos
-
-        meta = {
-            'method_label': F"Best {rounds} Rounds",
-            'rank_fields': [{
-                'name': 'laps',
-                'label': "Laps"
-            },{
-                'name': 'total_time',
-                'label': "Total"
-            },{
-                'name': 'starts',
-                'label': "Starts"
-            }]
-        }
+        pos = i
+        if last_rank_laps == row['laps'] and last_rank_time == row[time_field]:
+            pos = last_rank
+        last_rank = pos
+        last_rank_laps = row['laps']
+        last_rank_time = row[time_field]
+
+        row['position'] = pos
+
+    meta = {
+        'method_label': F"Best {rounds} Rounds",
+        'rank_fields': [{
+            'name': 'laps',
+            'label': "Laps"
+        },{
+            'name': 'total_time_laps' if time_field == 'total_time_laps_raw' else 'total_time',
+            'label': "Total"
+        },{
+            'name': 'starts',
+            'label': "Starts"
+        }]
+    }
 
     return leaderboard, meta
 
@@ -153,10 +137,10 @@ def register_handlers(args):
             },
             [
                 UIField('rounds', "Number of rounds", UIFieldType.BASIC_INT, placeholder="3"),
-            ]
+            ],
+            incremental=True
         )
     )
 
 def initialize(rhapi):
     rhapi.events.on(Evt.CLASS_RANK_INITIALIZE, register_handlers)
-
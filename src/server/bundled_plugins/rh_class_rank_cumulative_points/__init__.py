@@ -9,50 +9,61 @@ from RHUI import UIField, UIFieldType, UIFieldSelectOption
 
 logger = logging.getLogger(__name__)
 
-def rank_points_total(rhapi, race_class, args):
-
-    heats = rhapi.db.heats_by_class(race_class.id)
-
-    pilotresults = {}
-    for heat in heats:
-        races = rhapi.db.races_by_heat(heat.id)
-
-        for race in races:
-            race_result = rhapi.db.race_results(race)
-
-            if race_result:
-                for pilotresult in race_result[race_result['meta']['primary_leaderboard']]:
-                    if pilotresult['pilot_id'] not in pilotresults:
-                        pilotresults[pilotresult['pilot_id']] = []
-                    pilotresults[pilotresult['pilot_id']].append(pilotresult)
-            else:
-                logger.warning("Failed building ranking, race result not available")
-                return False, {}
+def rank_points_total(rhapi, race_class, args, changes):
+
+    # kept between rankings: lines of each race and each pilot's points per race line
+    race_keys = changes.state.setdefault('races', {})
+    pilot_points = changes.state.setdefault('pilots', {})
+    totals = changes.state.setdefault('totals', {})
+
+    changed_pilots = set()
+    for race_id, race_result in changes.race_results().items():
+        if race_result is False:
+            logger.warning("Failed building ranking, race result not available")
+            return False, {}
+
+        for pilot_id, key in race_keys.pop(race_id, []):
+            del pilot_points[pilot_id][key]
+            changed_pilots.add(pilot_id)
+
+        if race_result:
+            keys = []
+            for idx, pilotresult in enumerate(race_result[race_result['meta']['primary_leaderboard']]):
+                key = (changes.race_order(race_id), idx)
+                pilot_points.setdefault(pilotresult['pilot_id'], {})[key] = pilotresult.get('points', 0)
+                keys.append((pilotresult['pilot_id'], key))
+                changed_pilots.add(pilotresult['pilot_id'])
+
+                totals.setdefault(pilotresult['pilot_id'], {})['callsign'] = pilotresult['callsign']
+                totals[pilotresult['pilot_id']]['team_name'] = pilotresult['team_name']
+            race_keys[race_id] = keys
+
+    for pilot_id in changed_pilots:
+        if pilot_points.get(pilot_id):
+            totals[pilot_id]['points'] = sum(pilot_points[pilot_id].values())
+        else:
+            pilot_points.pop(pilot_id, None)
+            totals.pop(pilot_id, None)
 
     leaderboard = []
-    for pilotresultlist in pilotresults:
-        pilot_result = pilotresults[pilotresultlist]
-
-        new_pilot_result = {}
-        new_pilot_result['pilot_id'] = pilot_result[0]['pilot_id']
-        new_pilot_result['callsign'] = pilot_result[0]['callsign']
-        new_pilot_result['team_name'] = pilot_result[0]['team_name']
-        new_pilot_result['points'] = 0
-
-        for race in pilot_result:
-            if 'points' in race:
-                new_pilot_result['points'] += race['points']
-
-        leaderboard.append(new_pilot_result)
-
-    # Sort by points
+    for pilot_id, total in totals.items():
+        leaderboard.append({
+            'pilot_id': pilot_id,
+            'callsign': total['callsign'],
+            'team_name': total['team_name'],
+            'points': total['points'],
+        })
+
+    # Sort by points; pilots tied on points keep the order of their first race
     if 'ascending' in args and args['ascending']:
         leaderboard = sorted(leaderboard, key = lambda x: (
-            x['points']
+            x['points'],
+            min(pilot_points[x['pilot_id']])
         ))
     else:
         leaderboard = sorted(leaderboard, key = lambda x: (
-            -x['points']
+            -x['points'],
+            min(pilot_points[x['pilot_id']])
         ))
 
     # determine ranking
@@ -86,10 +97,10 @@ def register_handlers(args):
             },
             [
                 UIField('ascending', "Ascending", UIFieldType.CHECKBOX, value=False),
-            ]
+            ],
+            incremental=True
         )
     )
 
 def initialize(rhapi):
     rhapi.events.on(Evt.CLASS_RANK_INITIALIZE, register_handlers)
-
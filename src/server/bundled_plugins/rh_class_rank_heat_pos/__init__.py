@@ -8,31 +8,39 @@ from Results import RaceClassRankMethod
 
 logger = logging.getLogger(__name__)
 
-def rank_heat_pos(rhapi, race_class, _args):
-    heats = rhapi.db.heats_by_class(race_class.id)
+def rank_heat_pos(rhapi, race_class, _args, changes):
+    # kept between rankings: primary leaderboard lines of each heat
+    heat_lines = changes.state.setdefault('heats', {})
+
+    for heat_id, heat_result in changes.heat_results().items():
+        if heat_result:
+            heat_lines[heat_id] = [{
+                'pilot_id': line['pilot_id'],
+                'callsign': line['callsign'],
+                'team_name': line['team_name'],
+                'heat_rank': line['position'],
+            } for line in heat_result[heat_result['meta']['primary_leaderboard']]]
+        else:
+            heat_lines.pop(heat_id, None)
 
     leaderboard = []
-    ranked_pilots = []
+    ranked_pilots = set()
     rank_pos = 1
 
-    for heat in reversed(heats):
-        heat_result = rhapi.db.heat_results(heat)
-        if heat_result:
-            heat_leaderboard = heat_result[heat_result['meta']['primary_leaderboard']]
-    
-            for line in heat_leaderboard:
-                if line['pilot_id'] not in ranked_pilots:
-                    leaderboard.append({
-                        'pilot_id': line['pilot_id'],
-                        'callsign': line['callsign'],
-                        'team_name': line['team_name'],
-                        'heat': heat.display_name,
-                        'heat_rank': line['position'],
-                        'position': rank_pos
-                    })
-    
-                    ranked_pilots.append(line['pilot_id'])
-                    rank_pos += 1
+    for heat in reversed(changes.heats):
+        for line in heat_lines.get(heat.id, []):
+            if line['pilot_id'] not in ranked_pilots:
+                leaderboard.append({
+                    'pilot_id': line['pilot_id'],
+                    'callsign': line['callsign'],
+                    'team_name': line['team_name'],
+                    'heat': heat.display_name,
+                    'heat_rank': line['heat_rank'],
+                    'position': rank_pos
+                })
+
+                ranked_pilots.add(line['pilot_id'])
+                rank_pos += 1
 
     meta = {
         'rank_fields': [{
@@ -52,7 +60,8 @@ def register_handlers(args):
             "Last Heat Position",
             rank_heat_pos,
             None,
-            None
+            None,
+            incremental=True
         )
     )
 
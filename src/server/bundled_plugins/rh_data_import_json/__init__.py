@@ -3,7 +3,6 @@
 import logging
 import json
 import RHUtils
-import Database
 from eventmanager import Evt
 from data_import import DataImporter
 from Database import ProgramMethod
@@ -11,6 +10,9 @@ from RHUI import UIField, UIFieldType, UIFieldSelectOption
 
 logger = logging.getLogger(__name__)
 
+def filter_keys(record, keys):
+    return {key: value for key, value in record.items() if key in keys}
+
 def import_json(importer_class, rhapi, source, args):
     if not source:
         return False
@@ -21,249 +23,151 @@ def import_json(importer_class, rhapi, source, args):
         logger.error("Unable to import file: {}".format(str(ex)))
         return False
 
-    if 'Pilot' in data:
-        logger.debug("Importing Pilots...")
-
-        if 'reset_pilots' in args and args['reset_pilots']:
-            rhapi.db.pilots_reset()
-
-        db_pilots = rhapi.db.pilots
-
-        for input_pilot in data['Pilot']:
-
-            source_id = input_pilot['id']
-
-            db_match = None
-            for db_pilot in db_pilots:
-                if db_pilot.callsign == input_pilot['callsign']:
-                    db_match = db_pilot
-                    break
-
-            for item in list(input_pilot.keys()):
-                if item not in ['name', 
-                    'callsign',
-                    'phonetic',
-                    'team',
-                    'color', 
-                    'attributes'
-                    ]:
-                    del input_pilot[item]
-
-            if db_match:
-                db_pilot, _ = rhapi.db.pilot_alter(db_match.id, **input_pilot)
-            else:
-                if 'attributes' in input_pilot:
-                    del input_pilot['attributes']
-
-                db_pilot = rhapi.db.pilot_add(**input_pilot)
-
-            input_pilot['source_id'] = source_id
-            input_pilot['db_id'] = db_pilot.id
-
-    if 'RaceFormat' in data:
-        logger.debug("Importing Formats...")
-
-        if 'reset_formats' in args and args['reset_formats']:
-            importer_class.raceformats_clear()
-
-        db_formats = rhapi.db.raceformats
-
-        for input_format in data['RaceFormat']:
-            db_match = None
-            for db_format in db_formats:
-                if db_format.name == input_format['name']:
-                    db_match = db_format
-                    break
-
-            for item in list(input_format.keys()):
-                if item not in [
-                    'name', 
-                    'unlimited_time', 
-                    'race_time_sec', 
-                    'lap_grace_sec', 
-                    'staging_fixed_tones', 
-                    'staging_delay_tones', 
-                    'start_delay_min_ms', 
-                    'start_delay_max_ms', 
-                    'start_behavior', 
-                    'win_condition', 
-                    'number_laps_win', 
-                    'team_racing_mode', 
-                    'points_method'
-                    ]:
-                    del input_format[item]
-
-            if db_match:
-                db_format, _ = rhapi.db.raceformat_alter(db_match.id, **input_format)
-            else:
-                db_format = rhapi.db.raceformat_add(**input_format)
-
-            input_format['db_id'] = db_format.id
-
-    if 'Profiles' in data:
-        logger.debug("Importing Profiles...")
-
-        if 'reset_profiles' in args and args['reset_profiles']:
-            importer_class.frequencysets_clear()
-
-        db_profiles = rhapi.db.frequencysets
-
-        for input_profile in data['Profiles']:
-            db_match = None
-            for db_profile in db_profiles:
-                if db_profile.name == input_profile['name']:
-                    db_match = db_profile
-                    break
-
-            for item in list(input_profile.keys()):
-                if item not in [
-                    'name',
-                    'description',
-                    'frequencies',
-                    'enter_ats',
-                    'exit_ats'
-                    ]:
-                    del input_profile[item]
-
-            if db_match:
-                db_profile = rhapi.db.frequencyset_alter(db_match.id, **input_profile)
-            else:
-                db_profile = rhapi.db.frequencyset_add(**input_profile)
-
-            input_profile['db_id'] = db_profile.id
-
-    if 'GlobalSettings' in data:
-        logger.debug("Importing Settings...")
-
-        invalid_settings = [
-            'server_api',
-            'secret_key',
-            'currentProfile',
-            'currentFormat',
-            'currentHeat',
-            'eventResults',
-            'eventResults_cacheStatus',
-        ]
-
-        for setting in data['GlobalSettings']:
-            if setting['option_name'] not in invalid_settings:
-                rhapi.db.option_set(setting['option_name'], setting['option_value'])
-
-    if 'RaceClass' in data:
-        logger.debug("Importing Classes/Heats...")
-
-        if 'reset_classes' in args and args['reset_classes']:
-            rhapi.db.heats_reset()
-            rhapi.db.raceclasses_reset()
-            rhapi.db.races_clear()
-
-        db_race_classes = rhapi.db.raceclasses
-
-        for input_race_class in data['RaceClass']:
-            db_match = None
-            for db_race_class in db_race_classes:
-                if db_race_class.name == input_race_class['name']:
-                    db_match = db_race_class
-                    break
+    # resets commit on their own, ahead of the import batch
+    if 'Pilot' in data and args.get('reset_pilots'):
+        rhapi.db.pilots_reset()
+    if 'RaceFormat' in data and args.get('reset_formats'):
+        importer_class.raceformats_clear()
+    if 'Profiles' in data and args.get('reset_profiles'):
+        importer_class.frequencysets_clear()
+    if 'RaceClass' in data and args.get('reset_classes'):
+        rhapi.db.races_clear()
+        rhapi.db.heats_reset()
+        rhapi.db.raceclasses_reset()
+
+    with importer_class.batch() as batch:
+        pilot_ids = {}
+        if 'Pilot' in data:
+            logger.debug("Importing Pilots...")
+
+            pilot_list = [filter_keys(input_pilot, [
+                'name',
+                'callsign',
+                'phonetic',
+                'team',
+                'color',
+                'attributes'
+                ]) for input_pilot in data['Pilot']]
+
+            db_ids = batch.pilots_upsert(pilot_list)
+            pilot_ids = {input_pilot['id']: db_id for input_pilot, db_id in zip(data['Pilot'], db_ids)}
+
+        if 'RaceFormat' in data:
+            logger.debug("Importing Formats...")
+
+            batch.raceformats_upsert([filter_keys(input_format, [
+                'name',
+                'unlimited_time',
+                'race_time_sec',
+                'lap_grace_sec',
+                'staging_fixed_tones',
+                'staging_delay_tones',
+                'start_delay_min_ms',
+                'start_delay_max_ms',
+                'start_behavior',
+                'win_condition',
+                'number_laps_win',
+                'team_racing_mode',
+                'points_method'
+                ]) for input_format in data['RaceFormat']])
+
+        if 'Profiles' in data:
+            logger.debug("Importing Profiles...")
+
+            batch.frequencysets_upsert([filter_keys(input_profile, [
+                'name',
+                'description',
+                'frequencies',
+                'enter_ats',
+                'exit_ats'
+                ]) for input_profile in data['Profiles']])
+
+        if 'GlobalSettings' in data:
+            logger.debug("Importing Settings...")
+
+            invalid_settings = [
+                'server_api',
+                'secret_key',
+                'currentProfile',
+                'currentFormat',
+                'currentHeat',
+                'eventResults',
+                'eventResults_cacheStatus',
+            ]
 
-            source_id = input_race_class['id']
+            batch.options_set({setting['option_name']: setting['option_value']
+                for setting in data['GlobalSettings'] if setting['option_name'] not in invalid_settings})
 
-            input_race_class['raceformat'] = input_race_class['format_id'] # db_id
+        class_ids = {}
+        heat_ids = {}
+        if 'RaceClass' in data:
+            logger.debug("Importing Classes/Heats...")
 
-            for item in list(input_race_class.keys()):
-                if item not in [
+            class_list = []
+            for input_race_class in data['RaceClass']:
+                class_data = filter_keys(input_race_class, [
                     'name',
                     'description',
-                    'raceformat',
                     'win_condition',
                     'rounds',
                     'heat_advance_type',
                     'rank_settings'
-                    ]:
-                    del input_race_class[item]
-
-            if db_match:
-                db_race_class, _ = rhapi.db.raceclass_alter(db_match.id, **input_race_class)
-            else:
-                if 'rank_settings' in input_race_class:
-                    del input_race_class['rank_settings']
+                    ])
+                class_data['format_id'] = input_race_class['format_id'] # db_id
+                class_list.append(class_data)
 
-                db_race_class = rhapi.db.raceclass_add(**input_race_class)
-
-            input_race_class['source_id'] = source_id
-            input_race_class['db_id'] = db_race_class.id
+            db_ids = batch.raceclasses_upsert(class_list)
+            class_ids = {input_race_class['id']: db_id for input_race_class, db_id in zip(data['RaceClass'], db_ids)}
 
             if 'Heat' in data:
-                for input_heat in data['Heat']:
-                    if input_heat.get('class_id') and input_heat['class_id'] == input_race_class['source_id']:
-                        source_id = input_heat['id']
-
-                        input_heat['raceclass'] = input_race_class['db_id']
-
-                        for item in list(input_heat.keys()):
-                            if item not in [
-                                'name',
-                                'raceclass',
-                                'auto_frequency',
-                                ]:
-                                del input_heat[item]
-
-                        db_heat = rhapi.db.heat_add(**input_heat)
-
-                        input_heat['source_id'] = source_id
-                        input_heat['db_id'] = db_heat.id
-
-    if 'HeatNode' in data and 'Heat' in data and 'RaceClass' in data:
-        logger.debug("Updating HeatNodes...")
-
-        batch = []
-
-        for input_heatnode in data['HeatNode']:
-            db_heatnodes = rhapi.db.slots
-
-            for heat in data['Heat']:
-                if 'source_id' in heat and heat['source_id'] == input_heatnode['heat_id']:
-                    for heatnode in db_heatnodes:
-                        if heatnode.heat_id == heat['db_id'] and heatnode.node_index == input_heatnode['node_index']: 
-                            input_heatnode['slot_id'] = heatnode.id 
-
-                            if input_heatnode['method'] == ProgramMethod.ASSIGN:
-                                input_heatnode['pilot'] = RHUtils.PILOT_ID_NONE
-                                if 'Pilot' in data:
-                                    for p in data['Pilot']:
-                                        if p['source_id'] == input_heatnode['pilot_id']:
-                                            input_heatnode['pilot'] = p['db_id']
-                                            break
-                            elif input_heatnode['method'] == ProgramMethod.HEAT_RESULT:
-                                for h in data['Heat']:
-                                    if h['source_id'] == input_heatnode['seed_id']:
-                                        input_heatnode['seed_heat_id'] = h['db_id']
-                                        break
-
-                            elif input_heatnode['method'] == ProgramMethod.CLASS_RESULT:
-                                for c in data['RaceClass']:
-                                    if c['source_id'] == input_heatnode['seed_id']:
-                                        input_heatnode['seed_raceclass_id'] = c['db_id']
-                                        break
-
-                            for item in list(input_heatnode.keys()):
-                                if item not in [
-                                    'slot_id',
-                                    'pilot',
-                                    'method',
-                                    'seed_heat_id',
-                                    'seed_raceclass_id',
-                                    'seed_rank'
-                                    ]:
-                                    del input_heatnode[item]
-
-                            batch.append(input_heatnode)
-                            break
-                    break
-
-            rhapi.db.slots_alter_fast(batch)
-
-    return True
+                input_heats = [input_heat for input_heat in data['Heat'] if input_heat.get('class_id') in class_ids]
+                heat_list = []
+                for input_heat in input_heats:
+                    heat_data = filter_keys(input_heat, [
+                        'name',
+                        'auto_frequency',
+                        ])
+                    heat_data['class_id'] = class_ids[input_heat['class_id']]
+                    heat_list.append(heat_data)
+
+                db_heats, db_slots = batch.heats_add(heat_list)
+                for input_heat, db_heat in zip(input_heats, db_heats):
+                    heat_ids[input_heat['id']] = db_heat.id
+
+        if 'HeatNode' in data and heat_ids:
+            logger.debug("Updating HeatNodes...")
+
+            slot_ids = {}
+            for heat_id, heat_slots in db_slots.items():
+                for heat_slot in heat_slots:
+                    slot_ids[(heat_id, heat_slot.node_index)] = heat_slot.id
+
+            slot_list = []
+            for input_heatnode in data['HeatNode']:
+                slot_id = slot_ids.get((heat_ids.get(input_heatnode['heat_id']), input_heatnode['node_index']))
+                if slot_id is None:
+                    continue
+
+                slot_data = {
+                    'slot_id': slot_id,
+                    'method': input_heatnode['method'],
+                    'seed_rank': input_heatnode.get('seed_rank'),
+                    }
+
+                if input_heatnode['method'] == ProgramMethod.ASSIGN:
+                    slot_data['pilot'] = pilot_ids.get(input_heatnode['pilot_id'], RHUtils.PILOT_ID_NONE)
+                elif input_heatnode['method'] == ProgramMethod.HEAT_RESULT:
+                    if input_heatnode['seed_id'] in heat_ids:
+                        slot_data['seed_heat_id'] = heat_ids[input_heatnode['seed_id']]
+                elif input_heatnode['method'] == ProgramMethod.CLASS_RESULT:
+                    if input_heatnode['seed_id'] in class_ids:
+                        slot_data['seed_class_id'] = class_ids[input_heatnode['seed_id']]
+
+                slot_list.append(slot_data)
+
+            batch.slots_alter(slot_list)
+
+    return batch.committed
 
 def register_handlers(args):
     for importer in [
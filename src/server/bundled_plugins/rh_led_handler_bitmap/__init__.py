@@ -5,7 +5,8 @@
 
 import logging
 from eventmanager import Evt
-from led_event_manager import LEDEffect, Color, effect_delay
+from led_event_manager import LEDEffect, effect_delay
+from led_panel import get_panel_map
 
 logger = logging.getLogger(__name__)
 
@@ -25,37 +26,15 @@ class BitmapEffects():
         else:
             return False
 
-        def setPixels(img, panel_w):
-            pos = 0
-            for row in range(0, img.height):
-                for col in range(0, img.width):
-                    if pos >= strip.numPixels():
-                        return
-
-                    c = col
-                    if args['RHAPI'].config.get('LED', 'INVERTED_PANEL_ROWS'):
-                        if row % 2 == 0:
-                            c = (panel_w - 1) - col
-
-                    px = img.getpixel((c, row))
-                    strip.setPixelColor(pos, Color(px[0], px[1], px[2]))
-                    pos += 1
-
         bitmaps = args['bitmaps']
         if bitmaps and bitmaps is not None:
             for bitmap in bitmaps:
                 img = Image.open(bitmap['image'])
                 delay = bitmap['delay']
 
-                panel_w = args['RHAPI'].config.get('LED', 'LED_COUNT', as_int=True) // args['RHAPI'].config.get('LED', 'LED_ROWS', as_int=True)
-                panel_h = args['RHAPI'].config.get('LED', 'LED_ROWS', as_int=True)
-
-                if args['RHAPI'].config.get('LED', 'PANEL_ROTATE', as_int=True) % 2:
-                    output_w = panel_h
-                    output_h = panel_w
-                else:
-                    output_w = panel_w
-                    output_h = panel_h
+                panel_map = get_panel_map(args['RHAPI'].config)
+                output_w = panel_map.width
+                output_h = panel_map.height
 
                 size = img.size
 
@@ -71,9 +50,7 @@ class BitmapEffects():
                 pad_left = int((output_w - size[0]) / 2)
                 pad_top = int((output_h - size[1]) / 2)
                 output_img.paste(img, (pad_left, pad_top))
-                output_img = output_img.rotate(90 * args['RHAPI'].config.get('LED', 'PANEL_ROTATE', as_int=True), expand=True)
-
-                setPixels(output_img, panel_w)
+                panel_map.render(strip, output_img)
                 strip.show()
                 effect_delay(delay, args)
 
@@ -6,7 +6,8 @@
 import logging
 from dataclasses import asdict
 from eventmanager import Evt
-from led_event_manager import LEDEffect, LEDEvent, Color, ColorVal, effect_delay
+from led_event_manager import LEDEffect, LEDEvent, ColorVal, effect_delay
+from led_panel import get_panel_map
 from RHRace import RaceStatus, Crossing
 
 import gevent
@@ -117,9 +118,7 @@ def printCharacter(args):
 
     panel['draw'].text((int((panel['width']-w)/2), int((panel['height']-h)/2)), text, font=font, fill=(color))
 
-    img = panel['im'].rotate(90 * args['RHAPI'].config.get('LED', 'PANEL_ROTATE', as_int=True), expand=True)
-
-    setPixels(strip, img, panel['width'], args['RHAPI'].config)
+    panel['map'].render(strip, panel['im'])
     strip.show()
 
 def scrollText(args):
@@ -159,8 +158,7 @@ def scrollText(args):
     for i in range(-panel['width'], w + panel['width']):
         panel['draw'].rectangle((0, 0, panel['width'], panel['height']), fill=(0, 0, 0))
         panel['draw'].text((-i, draw_y), text, font=font, fill=(color))
-        img = panel['im'].rotate(90 * args['RHAPI'].config.get('LED', 'PANEL_ROTATE', as_int=True), expand=True)
-        setPixels(strip, img, panel['width'], args['RHAPI'].config)
+        panel['map'].render(strip, panel['im'])
         strip.show()
         effect_delay(10, args)
 
@@ -236,45 +234,21 @@ def multiLapGrid(args):
 
             panel['draw'].text((pos_x + 1, pos_y), text, font=font, fill=color)
 
-    img = panel['im'].rotate(90 * args['RHAPI'].config.get('LED', 'PANEL_ROTATE', as_int=True), expand=True)
-    setPixels(strip, img, panel['width'], args['RHAPI'].config)
+    panel['map'].render(strip, panel['im'])
     strip.show()
 
 def getPanelImg(strip, config):
-    panel_w = config.get('LED', 'LED_COUNT', as_int=True) // config.get('LED', 'LED_ROWS', as_int=True)
-    panel_h = config.get('LED', 'LED_ROWS', as_int=True)
-
-    if config.get('LED', 'PANEL_ROTATE', as_int=True) % 2:
-        width = panel_h
-        height = panel_w
-    else:
-        width = panel_w
-        height = panel_h
+    panel_map = get_panel_map(config)
 
-    im = Image.new('RGB', [width, height])
+    im = Image.new('RGB', [panel_map.width, panel_map.height])
     return {
-        'width': width,
-        'height': height,
+        'width': panel_map.width,
+        'height': panel_map.height,
         'im': im,
-        'draw': ImageDraw.Draw(im)
+        'draw': ImageDraw.Draw(im),
+        'map': panel_map
     }
 
-def setPixels(strip, img, panel_w, config):
-    pos = 0
-    for row in range(0, img.height):
-        for col in range(0, img.width):
-            if pos >= strip.numPixels():
-                return
-
-            c = col
-            if config.get('LED', 'INVERTED_PANEL_ROWS', as_int=True):
-                if row % 2 == 0:
-                    c = (panel_w - 1) - col
-
-            px = img.getpixel((c, row))
-            strip.setPixelColor(pos, Color(px[0], px[1], px[2]))
-            pos += 1
-
 def clearPixels(strip):
     for i in range(strip.numPixels()):
         strip.setPixelColor(i, ColorVal.NONE)
@@ -10,7 +10,8 @@
 
 import logging
 from eventmanager import Evt
-from led_event_manager import LEDEffect, LEDEvent, Color, ColorVal, effect_delay
+from led_event_manager import LEDEffect, LEDEvent, ColorVal, effect_delay
+from led_panel import get_panel_map
 
 logger = logging.getLogger(__name__)
 
@@ -94,8 +95,7 @@ def rssiGraph(args):
                     point = (rssi_max - rssi_val) / float(rssi_range) * panel['height']
                     panel['draw'].rectangle((barWidth * idx, point, (barWidth * idx) + barWidth - 1, panel['height']), fill=color)
 
-            img = panel['im'].rotate(90 * rhapi.config.get('LED', 'PANEL_ROTATE'), expand=True)
-            setImgPixels(strip, img, rhapi)
+            panel['map'].render(strip, panel['im'])
             strip.show()
             effect_delay(100, args)
 
@@ -179,40 +179,17 @@ def rssiGraph(args):
             effect_delay(100, args)
 
 def getPanelImg(strip, rhapi):
-    panel_w = rhapi.config.get('LED', 'LED_COUNT', as_int=True) // rhapi.config.get('LED', 'LED_ROWS', as_int=True)
-    panel_h = rhapi.config.get('LED', 'LED_ROWS', as_int=True)
+    panel_map = get_panel_map(rhapi.config)
 
-    if rhapi.config.get('LED', 'PANEL_ROTATE', as_int=True) % 2:
-        width = panel_h
-        height = panel_w
-    else:
-        width = panel_w
-        height = panel_h
-
-    im = Image.new('RGB', [width, height])
+    im = Image.new('RGB', [panel_map.width, panel_map.height])
     return {
-        'width': width,
-        'height': height,
+        'width': panel_map.width,
+        'height': panel_map.height,
         'im': im,
-        'draw': ImageDraw.Draw(im)
+        'draw': ImageDraw.Draw(im),
+        'map': panel_map
     }
 
-def setImgPixels(strip, img, rhapi):
-    pos = 0
-    for row in range(0, img.height):
-        for col in range(0, img.width):
-            if pos >= strip.numPixels():
-                return
-
-            c = col
-            if rhapi.config.get('LED', 'INVERTED_PANEL_ROWS', as_int=True):
-                if row % 2 == 0:
-                    c = 15 - col
-
-            px = img.getpixel((c, row))
-            strip.setPixelColor(pos, Color(px[0], px[1], px[2]))
-            pos += 1
-
 def clearPixels(strip):
     for i in range(strip.numPixels()):
         strip.setPixelColor(i, ColorVal.NONE)
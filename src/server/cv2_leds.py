@@ -31,6 +31,9 @@ class cv2_LED_emulation:
     def setPixelColor(self, i, color):
         self.pixels[i] = color
 
+    def setPixels(self, colors):
+        self.pixels[:len(colors)] = colors
+
     def getPixelColor(self, i):
         return self.pixels[i]
 
@@ -4,8 +4,10 @@
 
 from RHUtils import catchLogExceptionsWrapper, cleanVarName
 from typing import List
+from time import monotonic
 from RHUI import UIField
 from eventmanager import Evt
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,10 +41,14 @@ class DataImportManager():
 
     @catchLogExceptionsWrapper
     def run_import(self, importer_id, data, import_args=None):
-        result = self._importers[importer_id].run_import(self._rhapi, data, import_args)
+        importer = self._importers[importer_id]
+        result = importer.run_import(self._rhapi, data, import_args)
 
         if result:
-            self._events.trigger(Evt.DATABASE_IMPORT)
+            self._events.trigger(Evt.DATABASE_IMPORT, {
+                'importer': importer_id,
+                'timing': importer.timing
+                })
         else:
             logger.warning("Failed importing data")
         return result
@@ -58,12 +64,14 @@ class DataImporter():
         self.import_fn = import_fn
         self.default_args = default_args
         self.settings = settings
+        self.timing = {}
 
     def add_racecontext(self, racecontext):
         self._racecontext = racecontext
 
     def run_import(self, rhapi, data, import_args=None):
         args = {**(self.default_args if self.default_args else {}), **(import_args if import_args else {})}
+        self.timing = {}
         result = self.import_fn(self, rhapi, data, args)
         if self.check_integrity():
             return result
@@ -81,3 +89,126 @@ class DataImporter():
     def raceformats_clear(self):
         self._racecontext.rhdata.clear_raceFormats()
 
+    def batch(self):
+        return DataImportBatch(self._racecontext, self.timing)
+
+class DataImportBatch():
+    '''Writes imported records in one transaction, without per-record events
+
+    Records are matched against existing data by name (callsign for pilots)
+    using lookups built once per phase. Nothing is written until commit();
+    an exception inside a 'with' block rolls the whole batch back. Cached
+    options, server config and saved results are updated only once the
+    batch has been committed; 'committed' is set when it was.
+    Elapsed time for each phase is recorded in the supplied timing dict.
+    '''
+    def __init__(self, racecontext, timing):
+        self._racecontext = racecontext
+        self._rhdata = racecontext.rhdata
+        self.timing = timing
+        self._profile_ids = []
+        self._option_values = {}
+        self._config_items = []  # (section, name, value)
+        self._pilot_ids = set()  # pilots whose callsign or team may have changed
+        self._class_changes = {}  # class id -> (results changed, name changed, format id)
+        self._format_ids = set()  # formats whose scoring may have changed
+        self.committed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.committed = self.commit()
+        else:
+            self._rhdata.rollback()
+        return False
+
+    def _run_phase(self, phase, fn, *args):
+        start = monotonic()
+        result = fn(*args)
+        self.timing[phase] = self.timing.get(phase, 0) + monotonic() - start
+        return result
+
+    def pilots_upsert(self, pilot_list):
+        pilot_ids = self._run_phase('pilots', self._rhdata.upsert_pilots_fast, pilot_list)
+        self._pilot_ids.update(pilot_id for pilot_id, pilot_data in zip(pilot_ids, pilot_list)
+                               if 'callsign' in pilot_data or 'team' in pilot_data)
+        return pilot_ids
+
+    def raceformats_upsert(self, format_list):
+        format_ids = self._run_phase('formats', self._rhdata.upsert_raceFormats_fast, format_list)
+        self._format_ids.update(format_id for format_id, format_data in zip(format_ids, format_list)
+                                if 'win_condition' in format_data or 'start_behavior' in format_data or \
+                                    'points_method' in format_data)
+        return format_ids
+
+    def frequencysets_upsert(self, profile_list):
+        profile_ids = self._run_phase('profiles', self._rhdata.upsert_profiles_fast, profile_list)
+        self._profile_ids.extend(profile_ids)
+        return profile_ids
+
+    def options_set(self, options):
+        server_options = {}
+        for name, value in options.items():
+            for item in self._racecontext.serverconfig.migrations:
+                if item.source == name:
+                    self._config_items.append((item.section, name, value))
+                    break
+            else:
+                server_options[name] = value
+
+        self._option_values.update(self._run_phase('options', self._rhdata.set_options_fast, server_options))
+
+    def raceclasses_upsert(self, class_list):
+        class_ids = self._run_phase('classes', self._rhdata.upsert_raceClasses_fast, class_list)
+        for class_id, class_data in zip(class_ids, class_list):
+            self._class_changes[class_id] = (
+                'format_id' in class_data or 'win_condition' in class_data or 'rank_settings' in class_data,
+                'name' in class_data,
+                class_data.get('format_id'))
+        return class_ids
+
+    def heats_add(self, heat_list):
+        return self._run_phase('heats', self._rhdata.add_heats_fast, heat_list)
+
+    def slots_alter(self, slot_list):
+        return self._run_phase('slots', self._rhdata.alter_heatNodes_fast, slot_list, False)
+
+    def commit(self):
+        start = monotonic()
+        if not self._rhdata.commit():
+            self._rhdata.rollback()
+            logger.error("Import not committed; batch rolled back")
+            return False
+
+        self._rhdata.update_options_cache(self._option_values)
+        for section, name, value in self._config_items:
+            self._racecontext.serverconfig.set_item(section, name, value)
+
+        # as when altering each record, clear saved results that show changed values
+        if self._pilot_ids:
+            self._rhdata.clear_results_by_pilots(self._pilot_ids)
+        for format_id in self._format_ids:
+            self._rhdata.clear_results_by_raceFormat(self._rhdata.get_raceFormat(format_id))
+        for class_id, (results_changed, name_changed, format_id) in self._class_changes.items():
+            race_class = self._rhdata.get_raceClass(class_id)
+            race_list = self._rhdata.get_savedRaceMetas_by_raceClass(class_id)
+            if results_changed:
+                self._rhdata.clear_results_by_raceClass(race_class, race_list, format_id)
+            elif name_changed and len(race_list):
+                self._racecontext.pagecache.set_valid(False)
+        self._rhdata.commit()
+
+        race = self._racecontext.race
+        if race.profile and race.profile.id in self._profile_ids:
+            freqs = json.loads(race.profile.frequencies)
+            for idx, value in enumerate(freqs['f']):
+                if idx < race.num_nodes:
+                    self._racecontext.interface.set_frequency(idx, value, freqs['b'][idx], freqs['c'][idx])
+        race.clear_results()
+
+        self.timing['commit'] = monotonic() - start
+        logger.info("Import committed; phase times: {}".format(
+            ", ".join("{}={:.3f}s".format(phase, elapsed) for phase, elapsed in self.timing.items())))
+        return True
@@ -44,6 +44,9 @@ class FilterManager:
 
         return True
 
+    def has_filters(self, filter_type):
+        return bool(self.filters.get(filter_type))
+
     def run_filters(self, filter_type, data, context=None):
         filter_list = []
         if filter_type in self.filterOrder:
@@ -6,6 +6,7 @@ import json
 import RHUtils
 from Database import ProgramMethod, HeatStatus
 from filtermanager import Flt
+from FrequencyPlanner import FrequencyPlanner
 from flask import request
 
 logger = logging.getLogger(__name__)
@@ -33,7 +34,9 @@ class HeatAutomator:
 
             adaptive = bool(self._racecontext.serverconfig.get_item_int('TIMING', 'calibrationMode'))
 
-            if adaptive:
+            if self._racecontext.serverconfig.get_item_int('TIMING', 'autoFrequencyIMD'):
+                calc_fn = FrequencyPlanner()
+            elif adaptive:
                 calc_fn = self.find_best_slot_node_adaptive
             else:
                 calc_fn = self.find_best_slot_node_basic
@@ -77,7 +80,7 @@ class HeatAutomator:
         else:
             return 'no-heat'
 
-    def calc_heat_pilots(self, heat_or_id):
+    def calc_heat_pilots(self, heat_or_id, seed_resolver=None, commit=True):
         heat = self._racecontext.rhdata.resolve_heat_from_heat_or_id(heat_or_id)
 
         result = {
@@ -87,7 +90,7 @@ class HeatAutomator:
              }
 
         if not heat:
-            logger.error('Requested invalid heat {}'.format(heat.id))
+            logger.error('Requested invalid heat {}'.format(heat_or_id))
             result['calc_success'] = False
             return result
 
@@ -105,6 +108,9 @@ class HeatAutomator:
             logger.debug("Skipping pilot recalculation: Races exist (heat {})".format(heat.id))
             return result
 
+        if seed_resolver is None:
+            seed_resolver = SeedResolver(self._racecontext.rhdata)
+
         slots = self._racecontext.rhdata.get_heatNodes_by_heat(heat.id)
         slot_alterations = []
         for slot in slots:
@@ -120,14 +126,12 @@ class HeatAutomator:
                     if slot.seed_rank:
                         result['has_calc_pilots'] = True
                         logger.debug('Seeding Slot {} from Heat {}'.format(slot.id, slot.seed_id))
-                        seed_heat = self._racecontext.rhdata.get_heat(slot.seed_id)
-
-                        if seed_heat:
-                            output = self._racecontext.rhdata.get_results_heat(seed_heat)
-                            if output:
-                                results = output[output['meta']['primary_leaderboard']]
-                                if slot.seed_rank - 1 < len(results):
-                                    slot_alteration['pilot'] = results[slot.seed_rank - 1]['pilot_id']
+                        positions = seed_resolver.heat_positions(slot.seed_id)
+
+                        if positions is not False:
+                            if positions:
+                                if slot.seed_rank - 1 < len(positions):
+                                    slot_alteration['pilot'] = positions[slot.seed_rank - 1]['pilot_id']
                                 else:
                                     slot_alteration['pilot'] = RHUtils.PILOT_ID_NONE
                                     result['unassigned_slots'] += 1
@@ -150,19 +154,9 @@ class HeatAutomator:
                     if slot.seed_rank:
                         result['has_calc_pilots'] = True
                         logger.debug('Seeding Slot {} from Class {}'.format(slot.id, slot.seed_id))
-                        seed_class = self._racecontext.rhdata.get_raceClass(slot.seed_id)
-
-                        if seed_class:
-                            positions = None
-
-                            ranking = self._racecontext.rhdata.get_ranking_raceClass(seed_class)
-                            if ranking: # manual ranking
-                                positions = ranking['ranking']
-                            else: # auto ranking
-                                results = self._racecontext.rhdata.get_results_raceClass(seed_class)
-                                if results:
-                                    positions = results[results['meta']['primary_leaderboard']]
+                        positions = seed_resolver.class_positions(slot.seed_id)
 
+                        if positions is not False:
                             if positions:
                                 if slot.seed_rank - 1 < len(positions):
                                     slot_alteration['pilot'] = positions[slot.seed_rank - 1]['pilot_id']
@@ -187,9 +181,67 @@ class HeatAutomator:
 
             logger.debug('Slot {} Pilot is {}'.format(slot.id, slot.pilot_id if slot.pilot_id else None))
 
-        self._racecontext.rhdata.alter_heatNodes_fast(slot_alterations)
+        self._racecontext.rhdata.alter_heatNodes_fast(slot_alterations, commit=commit)
         return result
 
+    def calc_dependent_heats(self, heat_or_id):
+        # Recalculate every heat seeded (directly or transitively) from the
+        # given heat or its class, sharing one seed lookup and one commit
+        rhdata = self._racecontext.rhdata
+        heat = rhdata.resolve_heat_from_heat_or_id(heat_or_id)
+        if not heat:
+            return []
+
+        heat_dependents = {}
+        class_dependents = {}
+        for slot in rhdata.get_seeded_heatNodes():
+            if slot.method == ProgramMethod.HEAT_RESULT:
+                heat_dependents.setdefault(slot.seed_id, set()).add(slot.heat_id)
+            else:
+                class_dependents.setdefault(slot.seed_id, set()).add(slot.heat_id)
+
+        if not heat_dependents and not class_dependents:
+            return []
+
+        heat_classes = {h.id: h.class_id for h in rhdata.get_heats()}
+
+        def dependents_of(heat_id):
+            dependents = set(heat_dependents.get(heat_id, ()))
+            class_id = heat_classes.get(heat_id)
+            if class_id:
+                dependents.update(class_dependents.get(class_id, ()))
+            dependents.discard(heat_id)
+            return sorted(dependents)
+
+        queue = dependents_of(heat.id)
+        visited = set([heat.id])
+        ordered = []
+        while queue:
+            dep_id = queue.pop(0)
+            if dep_id in visited:
+                continue
+            visited.add(dep_id)
+            ordered.append(dep_id)
+            queue.extend(dependents_of(dep_id))
+
+        if not ordered:
+            return []
+
+        seed_resolver = SeedResolver(rhdata)
+        recalculated = []
+        try:
+            for dep_id in ordered:
+                calc_result = self.calc_heat_pilots(dep_id, seed_resolver=seed_resolver, commit=False)
+                if calc_result['calc_success'] is not None:
+                    recalculated.append(dep_id)
+        except Exception:
+            rhdata.rollback()
+            raise
+
+        rhdata.commit()
+        logger.debug('Recalculated {} heats dependent on heat {}'.format(len(recalculated), heat.id))
+        return recalculated
+
     def run_auto_frequency(self, heat_or_id, current_frequencies, num_nodes, calc_fn, preassigned=None):
         logger.debug('running auto-frequency with {}'.format(calc_fn))
         heat = self._racecontext.rhdata.resolve_heat_from_heat_or_id(heat_or_id)
@@ -232,6 +284,27 @@ class HeatAutomator:
                             'matches': []
                             })
 
+            if callable(getattr(calc_fn, 'plan', None)):
+                # calc function plans whole heat at once
+                pending = []
+                for slot in slots:
+                    if slot.pilot_id and slot.node_index is None:
+                        used_frequencies_json = self._racecontext.rhdata.get_pilot(slot.pilot_id).used_frequencies
+                        pending.append({
+                            'slot': slot,
+                            'history': json.loads(used_frequencies_json) if used_frequencies_json else []
+                        })
+                fixed_frequencies = [profile_freqs["f"][slot.node_index] for slot in slots \
+                                     if slot.node_index is not None and slot.node_index < num_nodes]
+                seat_plan = calc_fn.plan(available_seats, pending, fixed_frequencies)
+                for pilot_entry, node_index in zip(pending, seat_plan):
+                    if node_index is None:
+                        logger.warning("Dropping pilot {}; No remaining available nodes for slot {}".format(
+                            pilot_entry['slot'].pilot_id, pilot_entry['slot']))
+                    pilot_entry['slot'].node_index = node_index
+                self._racecontext.rhdata.commit()
+                return True
+
             # get frequency matches from pilots
             for slot in slots:
                 if slot.pilot_id and slot.node_index is None:
@@ -397,3 +470,39 @@ class HeatAutomator:
 
         return None, None, None
 
+class SeedResolver:
+    '''Loads each seed source result once per seeding operation'''
+    def __init__(self, rhdata):
+        self._rhdata = rhdata
+        self._heat_positions = {}
+        self._class_positions = {}
+
+    def heat_positions(self, heat_id):
+        # False if heat does not exist, None if no results available
+        if heat_id not in self._heat_positions:
+            positions = False
+            seed_heat = self._rhdata.get_heat(heat_id)
+            if seed_heat:
+                positions = None
+                output = self._rhdata.get_results_heat(seed_heat)
+                if output:
+                    positions = output[output['meta']['primary_leaderboard']]
+            self._heat_positions[heat_id] = positions
+        return self._heat_positions[heat_id]
+
+    def class_positions(self, class_id):
+        # False if class does not exist, None if no results available
+        if class_id not in self._class_positions:
+            positions = False
+            seed_class = self._rhdata.get_raceClass(class_id)
+            if seed_class:
+                positions = None
+                ranking = self._rhdata.get_ranking_raceClass(seed_class)
+                if ranking: # manual ranking
+                    positions = ranking['ranking']
+                else: # auto ranking
+                    results = self._rhdata.get_results_raceClass(seed_class)
+                    if results:
+                        positions = results[results['meta']['primary_leaderboard']]
+            self._class_positions[class_id] = positions
+        return self._class_positions[class_id]
@@ -2,6 +2,7 @@
 import dataclasses
 import json
 import Results
+from util.Metrics import metrics
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from flask.blueprints import Blueprint
 
@@ -251,4 +252,12 @@ def createBlueprint(RaceContext, serverInfo):
 
         return json.dumps({"options": payload}, cls=AlchemyEncoder), 201, {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
 
+    @APP.route('/api/metrics')
+    def api_metrics():
+        return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'}
+
+    @APP.route('/api/metrics/json')
+    def api_metrics_json():
+        return json.dumps({"metrics": metrics.snapshot()}), 201, {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
     return APP
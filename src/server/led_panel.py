@@ -0,0 +1,103 @@
+'''LED panel mapping layer.'''
+
+# Maps images drawn for an LED panel onto strip pixel positions. The mapping
+# (panel chaining, rotation and serpentine row inversion) is computed once per
+# LED configuration as a list of source-pixel indices, so a frame is rendered
+# with one 'tobytes()' call on the image and a single pass over the map.
+
+import sys
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# raw mode that packs each pixel as a native-endian 0x00RRGGBB integer
+PACKED_RAW_MODE = 'BGRX' if sys.byteorder == 'little' else 'XRGB'
+
+class PanelMap:
+    def __init__(self, led_count, led_rows, panel_rotate=0, inverted_rows=False, panel_count=1):
+        self.led_count = led_count
+        self.led_rows = max(led_rows, 1)
+        self.panel_rotate = panel_rotate % 4
+        self.inverted_rows = bool(inverted_rows)
+        self.panel_count = max(panel_count, 1)
+
+        # physical display: panels chained left to right, each filled row by row
+        self.panel_width = led_count // self.led_rows // self.panel_count
+        phys_w = self.panel_width * self.panel_count
+        phys_h = self.led_rows
+
+        # drawing image dimensions (before rotation onto the physical display)
+        if self.panel_rotate % 2:
+            self.width, self.height = phys_h, phys_w
+        else:
+            self.width, self.height = phys_w, phys_h
+
+        self.index_map = self._build_index_map()
+
+    def _build_index_map(self):
+        '''Source pixel index in the drawing image for each strip position'''
+        panel_w = self.panel_width
+        panel_size = panel_w * self.led_rows
+        src_w = self.width
+        src_h = self.height
+        index_map = []
+        for pos in range(panel_size * self.panel_count):
+            panel, local = divmod(pos, panel_size)
+            row, col = divmod(local, panel_w)
+            if self.inverted_rows and row % 2 == 0:
+                col = (panel_w - 1) - col
+            x = panel * panel_w + col
+            y = row
+            # same orientation as 'Image.rotate(90 * panel_rotate, expand=True)'
+            if self.panel_rotate == 1:
+                src_x, src_y = src_w - 1 - y, x
+            elif self.panel_rotate == 2:
+                src_x, src_y = src_w - 1 - x, src_h - 1 - y
+            elif self.panel_rotate == 3:
+                src_x, src_y = y, src_h - 1 - x
+            else:
+                src_x, src_y = x, y
+            index_map.append(src_y * src_w + src_x)
+        return index_map
+
+    def frame(self, img):
+        '''Packed 24-bit strip colors for a drawing image of size (width, height)'''
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        pixels = array('I')
+        pixels.frombytes(img.tobytes('raw', PACKED_RAW_MODE))
+        return [pixels[idx] for idx in self.index_map]
+
+    def render(self, strip, img):
+        '''Sets strip pixels from a drawing image (does not call 'show()')'''
+        set_strip_pixels(strip, self.frame(img))
+
+def set_strip_pixels(strip, colors):
+    '''Pushes a frame of packed colors to the strip, in one call when the driver supports it'''
+    colors = colors[:strip.numPixels()]
+    if hasattr(strip, 'setPixels'):
+        strip.setPixels(colors)
+    else:
+        for pos, color in enumerate(colors):
+            strip.setPixelColor(pos, color)
+
+_panel_map_cache = {}
+
+def get_panel_map(config):
+    '''PanelMap for the current 'LED' configuration; rebuilt only when it changes'''
+    key = (
+        config.get('LED', 'LED_COUNT', as_int=True),
+        config.get('LED', 'LED_ROWS', as_int=True),
+        config.get('LED', 'PANEL_ROTATE', as_int=True),
+        bool(config.get('LED', 'INVERTED_PANEL_ROWS')),
+        config.get('LED', 'PANEL_COUNT', as_int=True) or 1,
+    )
+    panel_map = _panel_map_cache.get('map')
+    if panel_map is None or _panel_map_cache.get('key') != key:
+        panel_map = PanelMap(*key)
+        _panel_map_cache['key'] = key
+        _panel_map_cache['map'] = panel_map
+        logger.debug('LED panel map: {}x{} drawing, {} panel(s), rotate={}, inverted_rows={}'.format( \
+            panel_map.width, panel_map.height, panel_map.panel_count, panel_map.panel_rotate, panel_map.inverted_rows))
+    return panel_map
@@ -60,6 +60,14 @@ class LedCtrlrPixel:
         else:
             self.pixels_same_tracker = -1
 
+    def setPixels(self, colors):
+        self.pixels[:len(colors)] = colors
+        self.num_changed_flag += len(colors)
+        if colors and colors.count(colors[0]) == len(self.pixels):
+            self.pixels_same_tracker = len(self.pixels) - 1
+        else:
+            self.pixels_same_tracker = -1
+
     def getPixelColor(self, i):
         return self.pixels[i]
 
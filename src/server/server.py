@@ -91,6 +91,15 @@ if __name__ == '__main__' and len(sys.argv) > 1 and CMDARG_DATA_DIR in sys.argv:
         print("Usage: python server.py --data {0}".format(CMDARG_DATA_DIR))
         sys.exit(1)
 
+# 1a: RH_DATA_DIR environment variable (used by headless tools such as benchmarks)
+if not DATA_DIR and os.environ.get('RH_DATA_DIR'):
+    data_path = os.path.expanduser(os.environ['RH_DATA_DIR'])
+    if os.path.isdir(data_path):
+        DATA_DIR = data_path
+    else:
+        print("Unable to find data location given by RH_DATA_DIR: {0}".format(os.environ['RH_DATA_DIR']))
+        sys.exit(1)
+
 # 2: datapath.ini
 if not DATA_DIR:
     try:
@@ -154,6 +163,7 @@ import FlaskAppObj
 FlaskAppObj.set_flask_app(APP)
 
 import Database
+import DatabaseBackup
 Database.initialize(_DB_URI)
 
 import socket
@@ -173,10 +183,12 @@ import RHData
 import RHUI
 import calibration
 import heat_automation
+import IMDCalc
 import RHAPI
 from ClusterNodeSet import SecondaryNode, ClusterNodeSet
 import PageCache
 from util.ButtonInputHandler import ButtonInputHandler
+from util.Metrics import metrics, MeasuredJSON
 import util.stm32loader as stm32loader
 from interface_mapper import InterfaceMapper, InterfaceType
 
@@ -227,7 +239,6 @@ Filters = FilterManager(RHAPI)
 RaceContext.filters = Filters
 EventActionsObj = None
 LedStripObj = None
-Use_imdtabler_jar_flag = False  # set True if IMDTabler.jar is available
 Server_ipaddress_str = None
 ShutdownButtonInputHandler = None
 Server_secondary_mode = None
@@ -278,7 +289,8 @@ if __name__ == '__main__' and len(sys.argv) > 1:
             sys.exit(1)
 
 # start SocketIO service
-SOCKET_IO = SocketIO(APP, async_mode='gevent', cors_allowed_origins=RaceContext.serverconfig.get_item('GENERAL', 'CORS_ALLOWED_HOSTS'), max_http_buffer_size=5e7)
+metrics.enabled = bool(RaceContext.serverconfig.get_item('GENERAL', 'METRICS'))
+SOCKET_IO = SocketIO(APP, async_mode='gevent', cors_allowed_origins=RaceContext.serverconfig.get_item('GENERAL', 'CORS_ALLOWED_HOSTS'), max_http_buffer_size=5e7, json=MeasuredJSON)
 
 # this is the moment where we can forward log-messages to the frontend, and
 # thus set up logging for good.
@@ -373,7 +385,7 @@ def getFwfileProctypeStr(fileStr):
 # Shows an alert popup if error messages have been logged and popup was not previously shown
 def check_log_error_alert():
     if Auth_succeeded_flag and log.get_log_error_alert_flag():
-        gevent.spawn_later(1.0, RaceContext.rhui.emit_priority_message,\
+        RaceContext.timers.call_later(1.0, RaceContext.rhui.emit_priority_message,\
                 f'{__("An error has occurred.")}<br /><a href="/hardwarelog?log_level=ERROR">{__("View error log")}</a>',\
                 True, False, True)  # admin_only=True
         return True
@@ -717,6 +729,7 @@ def start_background_threads(forceFlag=False):
         if HEARTBEAT_THREAD is None:
             HEARTBEAT_THREAD = gevent.spawn(heartbeat_thread_function)
             logger.debug('Heartbeat thread started')
+        RaceContext.sensors.start_sampling(RaceContext.serverconfig.get_item('GENERAL', 'SENSOR_SAMPLE_INTERVAL'))
         start_shutdown_button_thread()
 
 def stop_background_threads():
@@ -732,6 +745,7 @@ def stop_background_threads():
             logger.info('Stopping heartbeat thread')
             HEARTBEAT_THREAD.kill(block=True, timeout=0.5)
             HEARTBEAT_THREAD = None
+        RaceContext.sensors.stop_sampling()
         if RaceContext.interface:
             RaceContext.interface.stop()
     except:
@@ -888,8 +902,7 @@ def on_load_data(data):
             RaceContext.rhui.emit_environmental_data(nobroadcast=True)
         elif load_type == 'frequency_data':
             RaceContext.rhui.emit_frequency_data(nobroadcast=True)
-            if Use_imdtabler_jar_flag:
-                heartbeat_thread_function.imdtabler_flag = True
+            heartbeat_thread_function.imdtabler_flag = True
         elif load_type == 'heat_list':
             RaceContext.rhui.emit_heat_list(nobroadcast=True)
         elif load_type == 'heat_data':
@@ -945,7 +958,7 @@ def on_load_data(data):
         elif load_type == 'callouts':
             RaceContext.rhui.emit_callouts()
         elif load_type == 'imdtabler_page':
-            RaceContext.rhui.emit_imdtabler_page(IMDTABLER_JAR_NAME, Use_imdtabler_jar_flag, nobroadcast=True)
+            RaceContext.rhui.emit_imdtabler_page(nobroadcast=True)
         elif load_type == 'vrx_list':
             RaceContext.rhui.emit_vrx_list(nobroadcast=True)
         elif load_type == 'backups_list':
@@ -1029,8 +1042,7 @@ def on_set_frequency(data):
         })
 
     RaceContext.rhui.emit_frequency_data()
-    if Use_imdtabler_jar_flag:
-        heartbeat_thread_function.imdtabler_flag = True
+    heartbeat_thread_function.imdtabler_flag = True
 
 @SOCKET_IO.on('set_frequency_preset')
 @catchLogExcWithDBWrapper
@@ -1079,8 +1091,7 @@ def on_set_frequency_preset(data):
 
     set_all_frequencies(payload)
     RaceContext.rhui.emit_frequency_data()
-    if Use_imdtabler_jar_flag:
-        heartbeat_thread_function.imdtabler_flag = True
+    heartbeat_thread_function.imdtabler_flag = True
     RaceContext.interface.set_all_frequencies(payload)
 
 def set_all_frequencies(freqs):
@@ -1490,8 +1501,7 @@ def on_set_profile(data, emit_vals=True):
             RaceContext.rhui.emit_node_tuning()
             RaceContext.rhui.emit_enter_and_exit_at_levels()
             RaceContext.rhui.emit_frequency_data()
-            if Use_imdtabler_jar_flag:
-                heartbeat_thread_function.imdtabler_flag = True
+            heartbeat_thread_function.imdtabler_flag = True
 
         RaceContext.interface.set_all_frequencies(freqs)
         RaceContext.calibration.hardware_set_all_enter_ats(enter_ats)
@@ -1570,7 +1580,7 @@ def on_list_backups(*args):
 
         files.sort(key=str.casefold)
 
-        files = list(filter(lambda x: x.endswith(".db"), files))
+        files = list(filter(DatabaseBackup.is_backup_file_name, files))
 
         emit_payload = {
             'backup_files': files
@@ -1588,7 +1598,9 @@ def restore_database_file(db_file_name):
             RaceContext.race.num_nodes = len(RaceContext.interface.nodes)  # restore number of nodes
             RaceContext.last_race = None
             try:
-                RaceContext.rhdata.recover_database(db_file_name)
+                with DatabaseBackup.open_backup_file(db_file_name) as recover_file_name:
+                    RaceContext.rhdata.recover_database(recover_file_name,
+                                                        progress_fn=RaceContext.rhui.emit_database_recover_progress)
                 gevent.sleep(1)  # pause/yield to allow changes to be committed
                 RaceContext.race.reset_current_laps()
                 clean_results_cache()
@@ -2362,6 +2374,15 @@ def on_current_race_marshal(*args):
 def on_save_race(*args):
     RaceContext.race.save(*args)
 
+# Marshal re-saves within RESAVE_REBUILD_DELAY seconds of each other share one
+#  rebuild of heat, class and event results, page cache and calibration
+RESAVE_REBUILD_DELAY = 1.0
+Resave_rebuild = {
+    'timer': None,
+    'heats': {},  # heat id -> params for build_atomic_results
+    'laps_changed': False,
+}
+
 @SOCKET_IO.on('resave_laps')
 @catchLogExcWithDBWrapper
 def on_resave_laps(data):
@@ -2383,12 +2404,6 @@ def on_resave_laps(data):
         'exit_at': exit_at
         }
 
-    # Clear caches
-    heat = RaceContext.rhdata.get_heat(heat_id)
-    RaceContext.rhdata.clear_results_heat(heat)
-    RaceContext.rhdata.clear_results_raceClass(heat.class_id)
-    RaceContext.rhdata.clear_results_savedRaceMeta(race_id)
-
     RaceContext.rhdata.alter_savedPilotRace(pilotrace_data)
 
     new_racedata = {
@@ -2413,16 +2428,30 @@ def on_resave_laps(data):
             'deleted': lap['deleted']
             })
 
-    RaceContext.rhdata.replace_savedRaceLaps(new_racedata)
+    previous_results = RaceContext.rhdata.get_results_savedRaceMeta(race_id, no_rebuild_flag=True)
+
+    changed_fields = RaceContext.rhdata.replace_savedRaceLaps(new_racedata)
+    if changed_fields:
+        Resave_rebuild['laps_changed'] = True
+        RaceContext.pagecache.set_valid(False)
+
+    if changed_fields & RaceContext.rhdata.SAVED_RACE_LAP_TIMING_FIELDS:
+        # levels above the race are cleared now and rebuilt once the edits
+        #  settle; only this seat's line of the race results is derived again
+        heat = RaceContext.rhdata.get_heat(heat_id)
+        RaceContext.rhdata.clear_results_heat(heat)
+        RaceContext.rhdata.clear_results_raceClass(heat.class_id)
+        RaceContext.rhdata.clear_results_event()
+        RaceContext.rhdata.rebuild_results_savedRaceMeta_seats(race_id, [seat], previous_results)
+        Resave_rebuild['heats'][heat_id] = {
+            'heat_id': heat_id,
+            'round_id': round_id,
+        }
 
     message = __('Race times adjusted for: Heat {0} Round {1} / {2}').format(heat_id, round_id, callsign)
     RaceContext.rhui.emit_priority_message(message, False)
     logger.info(message)
 
-    # run adaptive calibration
-    if RaceContext.serverconfig.get_item_int('TIMING', 'calibrationMode'):
-        RaceContext.calibration.auto_calibrate()
-
     if RaceContext.last_race and RaceContext.last_race.db_id == race_id:
         RaceContext.last_race.results = RaceContext.rhdata.get_results_savedRaceMeta(race_id)
 
@@ -2446,20 +2475,37 @@ def on_resave_laps(data):
         RaceContext.rhui.emit_current_leaderboard()
         RaceContext.rhui.emit_current_laps()
 
-
-    # spawn thread for updating results caches
-    params = {
-        'race_id': race_id,
-        'heat_id': heat_id,
-        'round_id': round_id,
-    }
-    gevent.spawn(build_atomic_result_caches, params)
+    if Resave_rebuild['timer']:
+        Resave_rebuild['timer'].cancel()
+    Resave_rebuild['timer'] = RaceContext.timers.call_later(RESAVE_REBUILD_DELAY, rebuild_after_resave)
 
     Events.trigger(Evt.LAPS_RESAVE, {
         'race_id': race_id,
         'pilot_id': pilot_id,
         })
 
+@catchLogExcWithDBWrapper
+def rebuild_after_resave():
+    Resave_rebuild['timer'] = None
+    heats = Resave_rebuild['heats']
+    laps_changed = Resave_rebuild['laps_changed']
+    Resave_rebuild['heats'] = {}
+    Resave_rebuild['laps_changed'] = False
+
+    # run adaptive calibration
+    if RaceContext.serverconfig.get_item_int('TIMING', 'calibrationMode'):
+        RaceContext.calibration.auto_calibrate()
+
+    if laps_changed:
+        RaceContext.pagecache.set_valid(False)
+        for params in heats.values():
+            Results.build_atomic_results(RaceContext.rhdata, params)
+        RaceContext.rhui.emit_result_data()
+
+        dependent_heats = [heat_id for heat_id in heats if RaceContext.heatautomator.calc_dependent_heats(heat_id)]
+        if dependent_heats:
+            RaceContext.rhui.emit_heat_data()
+
 @SOCKET_IO.on('replace_current_laps')
 def replace_current_laps(data):
     on_set_enter_at_level({
@@ -2472,12 +2518,6 @@ def replace_current_laps(data):
     })
     RaceContext.race.replace_laps(data)
 
-@catchLogExcWithDBWrapper
-def build_atomic_result_caches(params):
-    RaceContext.pagecache.set_valid(False)
-    Results.build_atomic_results(RaceContext.rhdata, params)
-    RaceContext.rhui.emit_result_data()
-
 @SOCKET_IO.on('discard_laps')
 @catchLogExceptionsWrapper
 def on_discard_laps(**kwargs):
@@ -2622,6 +2662,13 @@ def on_set_consecutives_count(data):
         'value': data['count'],
         })
 
+@SOCKET_IO.on('get_sensor_history')
+@catchLogExceptionsWrapper
+def on_get_sensor_history(data):
+    # served from recorded history; never reads sensor hardware
+    RaceContext.rhui.emit_sensor_history(data['sensor'], data.get('reading'),
+        data.get('resolution'), data.get('since'), nobroadcast=True)
+
 @SOCKET_IO.on('get_race_scheduled')
 @catchLogExceptionsWrapper
 def get_race_scheduled(*args):
@@ -2653,17 +2700,18 @@ def play_callout_text(data):
     if len(delay_sec_holder) <= 0 or not isinstance(delay_sec_holder[0], float):
         RaceContext.rhui.emit_phonetic_text(message)
     else:
+        start_time = monotonic()  # pieces are spaced from one start time so they don't drift apart
         if not isinstance(message, list):
-            gevent.spawn_later(delay_sec_holder[0], RaceContext.rhui.emit_phonetic_text, message)
+            RaceContext.timers.call_at(start_time + delay_sec_holder[0], RaceContext.rhui.emit_phonetic_text, message)
         else:
             for i, piece in enumerate(message):
-                gevent.spawn_later(delay_sec_holder[0]*(i+1), RaceContext.rhui.emit_phonetic_text, piece)
+                RaceContext.timers.call_at(start_time + delay_sec_holder[0]*(i+1), RaceContext.rhui.emit_phonetic_text, piece)
 
 @SOCKET_IO.on('imdtabler_update_freqs')
 @catchLogExceptionsWrapper
 def imdtabler_update_freqs(data):
     ''' Update IMDTabler page with new frequencies list '''
-    RaceContext.rhui.emit_imdtabler_data(IMDTABLER_JAR_NAME, data['freq_list'].replace(',',' ').split())
+    RaceContext.rhui.emit_imdtabler_data(data['freq_list'].replace(',',' ').split())
 
 @SOCKET_IO.on('clean_cache')
 @catchLogExcWithDBWrapper
@@ -2929,7 +2977,7 @@ def heartbeat_thread_function():
             if heartbeat_thread_function.imdtabler_flag and \
                     (heartbeat_thread_function.iter_tracker % HEARTBEAT_DATA_RATE_FACTOR) == 0:
                 heartbeat_thread_function.imdtabler_flag = False
-                RaceContext.rhui.emit_imdtabler_rating(IMDTABLER_JAR_NAME)
+                RaceContext.rhui.emit_imdtabler_rating()
 
             # emit rest of node data, but less often:
             if (heartbeat_thread_function.iter_tracker % (4*HEARTBEAT_DATA_RATE_FACTOR)) == 0:
@@ -2949,9 +2997,8 @@ def heartbeat_thread_function():
                 if RaceContext.vrx_manager and RaceContext.vrx_manager.isEnabled():
                     RaceContext.rhui.emit_vrx_list()
 
-            # emit environment data less often:
+            # emit environment data less often (sensors are sampled in their own greenlets):
             if (heartbeat_thread_function.iter_tracker % (20*HEARTBEAT_DATA_RATE_FACTOR)) == 0:
-                RaceContext.sensors.update_environmental_data()
                 RaceContext.rhui.emit_environmental_data()
 
             # log environment data occasionally:
@@ -2960,6 +3007,11 @@ def heartbeat_thread_function():
                     logger.info("Sensor snapshot:")
                     for name, obj in RaceContext.sensors.sensors_dict.items():
                         logger.info(f"{name}: {obj.getReadings()}")
+                if 'i2c_helper' in HardwareHelpers:
+                    for i2c_bus in HardwareHelpers['i2c_helper'].get_buses():
+                        stats = i2c_bus.get_utilization()
+                        logger.debug("I2C bus {}: utilization={:.1%}, transactions={}".format( \
+                            stats['bus'], stats['utilization'], stats['transactions']))
                 RaceContext.rhdata.check_log_db_conns()  # also log status of database connections
 
             time_now = monotonic()
@@ -3054,7 +3106,7 @@ def ms_from_program_start():
     return milli_sec
 
 def pass_record_callback(node, lap_timestamp_absolute, source, **kwargs):
-    RaceContext.race.pass_invoke_func_queue_obj.put(RaceContext.race.add_lap, node, lap_timestamp_absolute, source, **kwargs)
+    RaceContext.race.queue_pass(node, lap_timestamp_absolute, source, **kwargs)
 
 @catchLogExcWithDBWrapper
 def new_enter_or_exit_at_callback(node, is_enter_at_flag):
@@ -3152,6 +3204,20 @@ def db_reset():
     assign_frequencies()
     logger.info('Database reset')
 
+def race_interval_backup(_args):
+    '''Backs up database after every DB_AUTOBKP_RACE_INTERVAL saved races.'''
+    interval = int(RaceContext.serverconfig.get_item('GENERAL', 'DB_AUTOBKP_RACE_INTERVAL') or 0)
+    if interval <= 0:
+        return
+    race_interval_backup.saved_count += 1
+    if race_interval_backup.saved_count >= interval:
+        race_interval_backup.saved_count = 0
+        if RaceContext.rhdata.backup_db_file(True, "autoBkp_", dedupe=True):
+            RaceContext.rhdata.delete_old_db_autoBkp_files(RaceContext.serverconfig.get_item('GENERAL', 'DB_AUTOBKP_NUM_KEEP'), \
+                                                           "autoBkp_", "DB_AUTOBKP_NUM_KEEP")
+
+race_interval_backup.saved_count = 0
+
 def expand_heats():
     ''' ensure loaded data includes enough slots for current nodes '''
     for heat in RaceContext.rhdata.get_heats():
@@ -3680,6 +3746,7 @@ def rh_program_initialize(reg_endpoints_flag=True):
 
         # RotorHazard events dispatch
         Events.on(Evt.UI_DISPATCH, 'ui_dispatch_event', RaceContext.rhui.dispatch_quickbuttons, {}, 50)
+        Events.on(Evt.LAPS_SAVE, 'race_interval_backup', race_interval_backup)
 
         # Plugin handling
         plugin_modules = []
@@ -4036,27 +4103,29 @@ def rh_program_initialize(reg_endpoints_flag=True):
                                                                             start_behavior=0,
                                                                             points_method=None)
 
-        # Import IMDTabler
-        if os.path.exists(IMDTABLER_JAR_NAME):  # if 'IMDTabler.jar' is available
-            try:
-                java_ver = subprocess.check_output('java -version', stderr=subprocess.STDOUT, shell=True).decode("utf-8")
-                logger.debug('Found installed: ' + java_ver.split('\n')[0].strip())
-            except:
-                java_ver = None
-                logger.info('Unable to find java; for IMDTabler functionality try:')
-                logger.info('sudo apt install default-jdk-headless')
-            if java_ver:
+        # Optionally cross-check native IMD calculation against IMDTabler.jar
+        if RaceContext.serverconfig.get_item('GENERAL', 'IMDTABLER_CROSS_CHECK'):
+            if os.path.exists(IMDTABLER_JAR_NAME):  # if 'IMDTabler.jar' is available
                 try:
-                    chk_imdtabler_ver = subprocess.check_output( \
-                        'java -jar ' + IMDTABLER_JAR_NAME + ' -v', \
-                        stderr=subprocess.STDOUT, shell=True).decode("utf-8").rstrip()
-                    global Use_imdtabler_jar_flag
-                    Use_imdtabler_jar_flag = True  # indicate IMDTabler.jar available
-                    logger.debug('Found installed: ' + chk_imdtabler_ver)
-                except Exception:
-                    logger.exception('Error checking IMDTabler:  ')
-        else:
-            logger.warning('IMDTabler lib not found at: ' + IMDTABLER_JAR_NAME)
+                    java_ver = subprocess.check_output('java -version', stderr=subprocess.STDOUT, shell=True).decode("utf-8")
+                    logger.debug('Found installed: ' + java_ver.split('\n')[0].strip())
+                except:
+                    java_ver = None
+                    logger.info('Unable to find java; for IMDTabler cross-check try:')
+                    logger.info('sudo apt install default-jdk-headless')
+                if java_ver:
+                    try:
+                        chk_imdtabler_ver = subprocess.check_output( \
+                            'java -jar ' + IMDTABLER_JAR_NAME + ' -v', \
+                            stderr=subprocess.STDOUT, shell=True).decode("utf-8").rstrip()
+                        logger.debug('Found installed: ' + chk_imdtabler_ver)
+                        fs_list = RaceContext.rhui.get_imdtabler_freqs()
+                        if len(fs_list) > 2 and IMDCalc.jar_cross_check(IMDTABLER_JAR_NAME, fs_list):
+                            logger.debug('IMD rating matches IMDTabler.jar')
+                    except Exception:
+                        logger.exception('Error checking IMDTabler:  ')
+            else:
+                logger.warning('IMDTabler lib not found at: ' + IMDTABLER_JAR_NAME)
 
         # VRx Controllers
         RaceContext.vrx_manager = VRxControlManager(Events, RaceContext, RHAPI, legacy_config=RaceContext.serverconfig.get_section('VRX_CONTROL'))
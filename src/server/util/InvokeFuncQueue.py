@@ -5,11 +5,14 @@
 import gevent
 
 class InvokeFuncQueue:
-    """ Invokes a function sequentially, via a GEvent queue. """
+    """ Invokes a function sequentially, via a GEvent queue.
+        maxQueueSize=None makes the queue unbounded (so 'put' never blocks).
+        If given, 'idleFn' is invoked by the worker each time the queue has been emptied. """
 
-    def __init__(self, logger, maxQueueSize=20):
+    def __init__(self, logger, maxQueueSize=20, idleFn=None):
         self.logger = logger
         self.invokeFuncQueue = gevent.queue.Queue(maxsize=maxQueueSize)
+        self.idleFn = idleFn
         self.invokeInProgressFlag = False
         gevent.spawn(self.queueWorkerFn)
 
@@ -19,6 +22,10 @@ class InvokeFuncQueue:
         except:
             self.logger.exception("InvokeFuncQueue 'put' error")
 
+    # number of invocations waiting in the queue (not including one in progress)
+    def pendingCount(self):
+        return self.invokeFuncQueue.qsize()
+
     def queueWorkerFn(self):
         while True:
             try:
@@ -26,6 +33,8 @@ class InvokeFuncQueue:
                 try:
                     self.invokeInProgressFlag = True
                     funct(*args, **kwargs)
+                    if self.idleFn and self.invokeFuncQueue.empty():
+                        self.idleFn()
                     self.invokeInProgressFlag = False
                     gevent.sleep(0.001)
                 except (KeyboardInterrupt, SystemExit):
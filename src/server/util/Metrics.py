@@ -0,0 +1,231 @@
+'''Lightweight counters, gauges and histograms for hot-path instrumentation'''
+
+import json
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+
+# seconds
+DEFAULT_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# bytes
+DEFAULT_SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+def _label_str(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) \
+                          for k, v in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield name, self.labels, self.value
+
+    def snapshot(self):
+        return self.value
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self, name):
+        yield name, self.labels, self.value
+
+    def snapshot(self):
+        return self.value
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, labels=(), buckets=DEFAULT_TIME_BUCKETS):
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last entry is +Inf
+        self.sum = 0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def samples(self, name):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield name + '_bucket', self.labels + (('le', _format_value(bound)),), cumulative
+        yield name + '_sum', self.labels, self.sum
+        yield name + '_count', self.labels, self.count
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': {_format_value(bound): count for bound, count in \
+                        zip(self.buckets + (float('inf'),), self.counts)},
+        }
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = 0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.observe(perf_counter() - self._start)
+        return False
+
+class MetricsRegistry:
+    '''Holds all metrics. Recording is a no-op until 'enabled' is set.'''
+    def __init__(self):
+        self.enabled = False
+        self._families = {}  # name -> {'kind', 'help', 'metrics': {labels: metric}}
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = {
+                'kind': cls.kind,
+                'help': help_text,
+                'metrics': {},
+            }
+        elif family['kind'] != cls.kind:
+            raise ValueError("Metric '{}' already registered as {}".format(name, family['kind']))
+        key = tuple(sorted(labels.items())) if labels else ()
+        metric = family['metrics'].get(key)
+        if metric is None:
+            metric = family['metrics'][key] = cls(key, **kwargs)
+        return metric
+
+    def counter(self, name, help_text='', labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', labels=None):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', labels=None, buckets=DEFAULT_TIME_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def inc(self, name, amount=1, help_text='', labels=None):
+        if self.enabled:
+            self.counter(name, help_text, labels).inc(amount)
+
+    def set(self, name, value, help_text='', labels=None):
+        if self.enabled:
+            self.gauge(name, help_text, labels).set(value)
+
+    def observe(self, name, value, help_text='', labels=None, buckets=DEFAULT_TIME_BUCKETS):
+        if self.enabled:
+            self.histogram(name, help_text, labels, buckets).observe(value)
+
+    def timer(self, name, help_text='', labels=None):
+        '''Context manager recording elapsed seconds into a histogram'''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(name, help_text, labels))
+
+    def timed(self, name, help_text='', labels=None):
+        '''Decorator recording call duration in seconds into a histogram'''
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.histogram(name, help_text, labels).observe(perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        self._families = {}
+
+    def render_prometheus(self):
+        lines = []
+        for name, family in sorted(self._families.items()):
+            if family['help']:
+                lines.append('# HELP {} {}'.format(name, family['help']))
+            lines.append('# TYPE {} {}'.format(name, family['kind']))
+            for _key, metric in sorted(family['metrics'].items()):
+                for sample_name, labels, value in metric.samples(name):
+                    lines.append('{}{} {}'.format(sample_name, _label_str(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        payload = {}
+        for name, family in self._families.items():
+            values = []
+            for key, metric in family['metrics'].items():
+                values.append({
+                    'labels': dict(key),
+                    'value': metric.snapshot(),
+                })
+            payload[name] = {
+                'type': family['kind'],
+                'help': family['help'],
+                'values': values,
+            }
+        return {
+            'enabled': self.enabled,
+            'metrics': payload,
+        }
+
+metrics = MetricsRegistry()
+
+class MeasuredJSON:
+    '''JSON module for socket.io packets; records encoded size of each emitted event'''
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        encoded = json.dumps(obj, *args, **kwargs)
+        if metrics.enabled:
+            event = obj[0] if isinstance(obj, list) and obj and isinstance(obj[0], str) else 'other'
+            metrics.observe('rh_socket_emit_bytes', len(encoded), 'Encoded size of socket.io emits',
+                            labels={'event': event}, buckets=DEFAULT_SIZE_BUCKETS)
+        return encoded
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
@@ -0,0 +1,34 @@
+'''Cooperative sleep to a precise monotonic instant'''
+
+# Sleeping the whole interval in one 'gevent.sleep()' wakes late by however
+#  long the hub takes to get back to this greenlet, and spinning on the clock
+#  starves every other greenlet. Instead the remaining time is repeatedly
+#  halved with real sleeps (each one yields to the hub), so wake-up latency
+#  only ever eats into the unslept half, and just the last fraction of a
+#  millisecond is spent polling the clock.
+
+import gevent
+from time import monotonic
+
+COARSE_LEAD = 0.05      # seconds before target at which halving sleeps begin
+SPIN_WINDOW = 0.0005    # seconds before target that are polled instead of slept
+MIN_SLEEP = 0.0001      # shortest sleep worth handing to the hub
+
+def sleep_until(target, clock=monotonic, spin_window=SPIN_WINDOW):
+    '''
+    Waits until 'clock()' reaches 'target' (seconds) without blocking other
+    greenlets for more than 'spin_window'. Returns how late the wait ended,
+    in seconds (never negative).
+    '''
+    while True:
+        remaining = target - clock()
+        if remaining <= spin_window:
+            break
+        if remaining > COARSE_LEAD:
+            gevent.sleep(remaining - COARSE_LEAD)
+        else:
+            gevent.sleep(max((remaining - spin_window) / 2, MIN_SLEEP))
+    now = clock()
+    while now < target:
+        now = clock()
+    return now - target
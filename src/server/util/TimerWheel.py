@@ -0,0 +1,172 @@
+'''Hierarchical timer wheel for callbacks at absolute monotonic deadlines'''
+
+# All timers share one driver greenlet, which sleeps until the earliest
+#  deadline (or the next point where far-off timers are cascaded down a
+#  level) instead of each timer holding its own sleeping greenlet. Deadlines
+#  are absolute, so a timer does not drift when the code that set it ran
+#  late, and cancelling a timer only removes it from its slot.
+#
+#  Level 0 has one slot per tick; each slot of a higher level spans a full
+#  revolution of the level below. Timers beyond the top level wait in an
+#  overflow slot that is re-examined on each top-level cascade.
+
+import logging
+import gevent
+import gevent.event
+from time import monotonic
+from util.Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK = 0.01  # seconds
+DEFAULT_LEVEL_SIZES = (256, 64, 64)  # slots per level; ~2.5 seconds, ~2.7 minutes and ~2.9 hours per revolution
+LATE_WARNING_SECS = 0.25  # timers firing later than this are logged
+
+LATENESS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+class Timer:
+    '''Handle for a scheduled callback'''
+    __slots__ = ('deadline', 'tick', 'name', 'fn', 'args', 'kwargs', 'lateness', '_slot', '_wheel')
+
+    def __init__(self, wheel, deadline, tick, name, fn, args, kwargs):
+        self.deadline = deadline
+        self.tick = tick
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.lateness = None  # seconds past deadline when fired
+        self._slot = None
+        self._wheel = wheel
+
+    @property
+    def pending(self):
+        return self._slot is not None
+
+    @property
+    def fired(self):
+        return self.lateness is not None
+
+    def cancel(self):
+        '''Removes the timer if it has not fired; returns True if it was pending'''
+        return self._wheel.cancel(self)
+
+class TimerWheel:
+    def __init__(self, tick=DEFAULT_TICK, level_sizes=DEFAULT_LEVEL_SIZES, clock=monotonic):
+        self.tick = tick
+        self.level_sizes = tuple(level_sizes)
+        self.clock = clock
+        # ticks spanned by one slot of each level
+        self._spans = []
+        span = 1
+        for size in self.level_sizes:
+            self._spans.append(span)
+            span *= size
+        self._levels = [[{} for _ in range(size)] for size in self.level_sizes]  # slot: id(timer) -> timer
+        self._overflow = {}
+        self._current_tick = self._to_tick(clock())
+        self._count = 0
+        self._wake_event = gevent.event.Event()
+        self._wake_at = None
+        self._greenlet = None
+
+    def __len__(self):
+        return self._count
+
+    def _to_tick(self, when):
+        return int(when // self.tick)
+
+    def call_at(self, deadline, fn, *args, name=None, **kwargs):
+        '''Calls 'fn(*args, **kwargs)' in a new greenlet once 'clock()' reaches 'deadline' '''
+        if self._count == 0:  # wheel is empty, so it can jump straight to the present
+            self._current_tick = self._to_tick(self.clock())
+        timer = Timer(self, deadline, self._to_tick(deadline), name or getattr(fn, '__name__', 'timer'), fn, args, kwargs)
+        self._insert(timer)
+        self._count += 1
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+        elif self._wake_at is None or deadline < self._wake_at:
+            self._wake_event.set()
+        return timer
+
+    def call_later(self, delay, fn, *args, name=None, **kwargs):
+        return self.call_at(self.clock() + delay, fn, *args, name=name, **kwargs)
+
+    def cancel(self, timer):
+        slot = timer._slot
+        if slot is None:
+            return False
+        del slot[id(timer)]
+        timer._slot = None
+        self._count -= 1
+        return True
+
+    def _insert(self, timer):
+        tick = max(timer.tick, self._current_tick)
+        slot = self._overflow
+        for level, size in enumerate(self.level_sizes):
+            span = self._spans[level]
+            if tick // span - self._current_tick // span < size:
+                slot = self._levels[level][(tick // span) % size]
+                break
+        slot[id(timer)] = timer
+        timer._slot = slot
+
+    def _cascade(self, slot):
+        timers = list(slot.values())
+        slot.clear()
+        for timer in timers:
+            self._insert(timer)
+
+    def _advance_to(self, tick):
+        '''Moves the wheel to 'tick', cascading higher levels at each revolution of the level below'''
+        self._current_tick = tick
+        for level in range(len(self.level_sizes) - 1, 0, -1):
+            span = self._spans[level]
+            if tick % span == 0:
+                if level == len(self.level_sizes) - 1 and tick % (span * self.level_sizes[level]) == 0:
+                    self._cascade(self._overflow)
+                self._cascade(self._levels[level][(tick // span) % self.level_sizes[level]])
+
+    def _next_tick(self):
+        '''Next tick after the current one with level-0 timers, or the next cascade point'''
+        size = self.level_sizes[0]
+        boundary = (self._current_tick // size + 1) * size
+        slots = self._levels[0]
+        for tick in range(self._current_tick + 1, boundary):
+            if slots[tick % size]:
+                return tick
+        return boundary
+
+    def _fire_due(self, now):
+        slot = self._levels[0][self._current_tick % self.level_sizes[0]]
+        due = [timer for timer in slot.values() if timer.deadline <= now]
+        for timer in sorted(due, key=lambda t: t.deadline):
+            self.cancel(timer)
+            timer.lateness = now - timer.deadline
+            metrics.observe('rh_timer_lateness_seconds', timer.lateness, 'Time timer callbacks fired after their deadline',
+                            buckets=LATENESS_BUCKETS)
+            if timer.lateness > LATE_WARNING_SECS:
+                logger.warning("Timer '{}' fired {:.3f}s late".format(timer.name, timer.lateness))
+            gevent.spawn(timer.fn, *timer.args, **timer.kwargs)
+        return min((timer.deadline for timer in slot.values()), default=None)
+
+    def _run(self):
+        while self._count > 0:
+            now = self.clock()
+            now_tick = self._to_tick(now)
+            wake_at = self._fire_due(now)
+            while wake_at is None and self._current_tick < now_tick:
+                self._advance_to(min(self._next_tick(), now_tick))
+                wake_at = self._fire_due(now)
+            if self._count == 0:
+                break
+            if wake_at is None:
+                next_tick = self._next_tick()
+                slot = self._levels[0][next_tick % self.level_sizes[0]]
+                wake_at = min((timer.deadline for timer in slot.values()), default=next_tick * self.tick)
+            self._wake_at = wake_at
+            self._wake_event.clear()
+            self._wake_event.wait(max(wake_at - self.clock(), 0))
+            self._wake_at = None
+        self._greenlet = None
@@ -63,6 +63,9 @@ def get_pixel_interface(config, brightness, *args, **kwargs):
                           config['LED_INVERT'], int(brightness), config['LED_CHANNEL'], led_strip)
         pixel_obj.begin()
         pixel_obj.begin = lambda : None  # don't allow 'begin()' to be invoked again
+        if hasattr(pixel_obj, '_led_data'):
+            # set a whole frame via the library's slice assignment
+            pixel_obj.setPixels = lambda colors : pixel_obj._led_data.__setitem__(slice(0, len(colors)), colors)
         logger.info('LED: selecting library "rpi_ws281x"')
         logger.info('LED: hardware GPIO enabled, count={0}, pin={1}, freqHz={2}, dma={3}, invert={4}, chan={5}, strip={6}/{7}'. \
                 format(config['LED_COUNT'], config['LED_GPIO'], config['LED_FREQ_HZ'], config['LED_DMA'], \
@@ -0,0 +1,120 @@
+'''Heat list emit benchmark
+
+Boots the server stack in a private data directory, grows the event to each
+of the given heat counts and times 'heat_data' emits: "cold" right after a
+slot edit (heat list rebuilt from the database) and "warm" with nothing
+changed since the previous emit. Database statements run by each emit are
+counted, so it shows whether the cost stays flat as heats are added.
+
+python benchmark_heat_data.py --heats 25,50,100,150 --output heats.json
+'''
+import os
+import sys
+import json
+import argparse
+import tempfile
+from time import perf_counter
+
+# absolute paths; the server changes to its data directory on import
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(SRC_DIR, 'server'))
+sys.path.append(os.path.join(SRC_DIR, 'server', 'util'))
+sys.path.append(os.path.join(SRC_DIR, 'server', 'plugins'))
+sys.path.append(os.path.join(SRC_DIR, 'interface'))
+
+# the server routes sys.stdout through its logger
+CONSOLE = sys.__stdout__
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='RotorHazard heat list emit benchmark')
+    parser.add_argument('--heats', default='25,50,100,150', help='comma-separated heat counts to measure')
+    parser.add_argument('--pilots', type=int, default=32, help='number of pilots')
+    parser.add_argument('--nodes', type=int, default=8, help='number of mock nodes')
+    parser.add_argument('--repeat', type=int, default=5, help='emits timed per heat count')
+    parser.add_argument('--data', help='data directory (default: new temporary directory)')
+    parser.add_argument('--output', help='write results JSON to this file')
+    return parser.parse_args(argv)
+
+class HeatDataBenchmark:
+    def __init__(self, args):
+        self.args = args
+        self.statements = 0
+
+        import server
+        import Database
+        self.server = server
+        self.ctx = server.RaceContext
+        server.rh_program_initialize(reg_endpoints_flag=False)
+        Database.DB.event.listen(Database.DB_engine, 'before_cursor_execute', self.count_statement)
+
+        rhapi = server.RHAPI
+        self.rhapi = rhapi
+        self.raceclass = rhapi.db.raceclass_add(name='Benchmark')
+        self.pilots = [rhapi.db.pilot_add(callsign='Bench {}'.format(idx + 1)) for idx in range(args.pilots)]
+        self.slots = []
+
+    def count_statement(self, *_args):
+        self.statements += 1
+
+    def add_heats(self, count):
+        rhapi = self.rhapi
+        while len(rhapi.db.heats) < count:
+            heat = rhapi.db.heat_add(raceclass=self.raceclass.id)
+            slot_list = []
+            for idx, slot in enumerate(rhapi.db.slots_by_heat(heat.id)):
+                slot_list.append({'slot_id': slot.id, 'pilot': self.pilots[(heat.id + idx) % len(self.pilots)].id})
+            rhapi.db.slots_alter_fast(slot_list)
+            self.slots = slot_list
+
+    def timed_emit(self):
+        self.statements = 0
+        start = perf_counter()
+        self.ctx.rhui.emit_heat_data()
+        return perf_counter() - start, self.statements
+
+    def measure(self, count):
+        self.add_heats(count)
+        cold, warm = [], []
+        for rep in range(self.args.repeat):
+            slot = self.slots[rep % len(self.slots)]
+            self.rhapi.db.slot_alter(slot['slot_id'], pilot=self.pilots[rep % len(self.pilots)].id)
+            cold.append(self.timed_emit())
+            warm.append(self.timed_emit())
+        return {
+            'heats': len(self.rhapi.db.heats),
+            'cold_ms': min(sample[0] for sample in cold) * 1000,
+            'cold_statements': max(sample[1] for sample in cold),
+            'warm_ms': min(sample[0] for sample in warm) * 1000,
+            'warm_statements': max(sample[1] for sample in warm),
+        }
+
+    def run(self):
+        return [self.measure(int(count)) for count in self.args.heats.split(',')]
+
+def main(argv=None):
+    args = parse_args(argv)
+    for name in ('data', 'output'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    data_dir = args.data or tempfile.mkdtemp(prefix='rh-bench-')
+    os.environ['RH_DATA_DIR'] = data_dir
+    os.environ['RH_NODES'] = str(args.nodes)
+
+    results = HeatDataBenchmark(args).run()
+
+    print('{:>6} {:>10} {:>10} {:>10} {:>10}'.format('heats', 'cold ms', 'cold stmts', 'warm ms', 'warm stmts'), file=CONSOLE)
+    for row in results:
+        print('{heats:>6} {cold_ms:>10.2f} {cold_statements:>10} {warm_ms:>10.2f} {warm_statements:>10}'.format(**row),
+              file=CONSOLE)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    result = main()
+    CONSOLE.flush()
+    # exit directly; server background threads are not shut down
+    os._exit(result)
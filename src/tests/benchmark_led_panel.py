@@ -0,0 +1,126 @@
+'''LED panel frame render benchmark
+
+Times rendering of a full drawing image onto an LED strip, comparing the
+per-pixel path formerly used by the panel effects (rotate, then getpixel and
+setPixelColor for each pixel with a config lookup per pixel) against the
+precomputed panel map. Requires the 'pillow' module.
+
+python benchmark_led_panel.py --count 256 --rows 16 --rotate 1 --inverted
+python benchmark_led_panel.py --count 1024 --rows 16 --panels 4 --frames 500
+'''
+import os
+import sys
+import argparse
+from time import perf_counter
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(SRC_DIR, 'server'))
+
+from PIL import Image, ImageDraw  #pylint: disable=import-error
+from led_panel import PanelMap, get_panel_map
+
+class FrameStrip:
+    '''Strip that only stores pixel values.'''
+    def __init__(self, count):
+        self.pixels = [0] * count
+
+    def numPixels(self):
+        return len(self.pixels)
+
+    def setPixelColor(self, i, color):
+        self.pixels[i] = color
+
+    def setPixels(self, colors):
+        self.pixels[:len(colors)] = colors
+
+class LEDConfig:
+    '''Answers 'rhapi.config.get()' for the LED section.'''
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, section, name, as_int=False):
+        val = self.values[name]
+        return int(val) if as_int else val
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='RotorHazard LED panel render benchmark')
+    parser.add_argument('--count', type=int, default=256, help='LED count')
+    parser.add_argument('--rows', type=int, default=16, help='rows per panel')
+    parser.add_argument('--panels', type=int, default=1, help='number of chained panels')
+    parser.add_argument('--rotate', type=int, default=0, help='panel rotation (0-3)')
+    parser.add_argument('--inverted', action='store_true', help='even rows right-to-left')
+    parser.add_argument('--frames', type=int, default=200, help='frames to render per method')
+    return parser.parse_args(argv)
+
+def legacy_render(strip, img, config):
+    img = img.rotate(90 * config.get('LED', 'PANEL_ROTATE', as_int=True), expand=True)
+    pos = 0
+    for row in range(0, img.height):
+        for col in range(0, img.width):
+            if pos >= strip.numPixels():
+                return
+            c = col
+            if config.get('LED', 'INVERTED_PANEL_ROWS', as_int=True):
+                if row % 2 == 0:
+                    c = (img.width - 1) - col
+            px = img.getpixel((c, row))
+            strip.setPixelColor(pos, (px[0] << 16) | (px[1] << 8) | px[2])
+            pos += 1
+
+def draw_frame(draw, width, height, frame_num):
+    # moving bars, similar to the RSSI graph effect
+    draw.rectangle((0, 0, width, height), fill=(0, 0, 0))
+    for x in range(width):
+        top = (x * 7 + frame_num) % max(height, 1)
+        draw.rectangle((x, top, x, height), fill=((x * 40) % 256, 255 - top, 128))
+
+def time_frames(render_fn, img, draw, args):
+    times = []
+    for frame_num in range(args.frames):
+        draw_frame(draw, img.width, img.height, frame_num)
+        start = perf_counter()
+        render_fn(img)
+        times.append(perf_counter() - start)
+    times.sort()
+    return {
+        'mean_ms': 1000 * sum(times) / len(times),
+        'p95_ms': 1000 * times[int(len(times) * 0.95) - 1] if len(times) > 1 else 1000 * times[0],
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = LEDConfig({
+        'LED_COUNT': args.count,
+        'LED_ROWS': args.rows,
+        'PANEL_ROTATE': args.rotate,
+        'INVERTED_PANEL_ROWS': args.inverted,
+        'PANEL_COUNT': args.panels,
+    })
+
+    start = perf_counter()
+    panel_map = PanelMap(args.count, args.rows, args.rotate, args.inverted, args.panels)
+    build_ms = 1000 * (perf_counter() - start)
+
+    img = Image.new('RGB', [panel_map.width, panel_map.height])
+    draw = ImageDraw.Draw(img)
+
+    legacy_strip = FrameStrip(args.count)
+    mapped_strip = FrameStrip(args.count)
+    results = {}
+    if args.panels == 1:  # legacy path has no notion of chained panels
+        results['legacy'] = time_frames(lambda frame: legacy_render(legacy_strip, frame, config), img, draw, args)
+    results['panel_map'] = time_frames(lambda frame: get_panel_map(config).render(mapped_strip, frame), img, draw, args)
+
+    if args.panels == 1 and legacy_strip.pixels != mapped_strip.pixels:
+        print('WARNING: rendered frames differ between methods')
+
+    print('{} LEDs, {}x{} drawing, {} panel(s), rotate={}, inverted={}; map built in {:.2f} ms'.format( \
+        args.count, panel_map.width, panel_map.height, args.panels, args.rotate, args.inverted, build_ms))
+    for name, result in results.items():
+        print('  {:10s} mean {:8.3f} ms  p95 {:8.3f} ms'.format(name, result['mean_ms'], result['p95_ms']))
+    if 'legacy' in results:
+        print('  speedup    {:.1f}x'.format(results['legacy']['mean_ms'] / results['panel_map']['mean_ms']))
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+'''Headless race simulation benchmark
+
+Boots the server stack against MockInterface nodes in a private data
+directory and drives synthetic races through it. Lap passes are injected
+with timestamps on a simulated clock, so races run as fast as the server
+can process them and repeat exactly for a given seed.
+
+python benchmark_race.py --pilots 16 --heats 4 --laps 5 --clients 10 --output bench.json
+python benchmark_race.py --compare bench.json
+'''
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import resource
+import tempfile
+from time import monotonic, perf_counter
+
+# absolute paths; the server changes to its data directory on import
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(SRC_DIR, 'server'))
+sys.path.append(os.path.join(SRC_DIR, 'server', 'util'))
+sys.path.append(os.path.join(SRC_DIR, 'server', 'plugins'))
+sys.path.append(os.path.join(SRC_DIR, 'interface'))
+
+# the server routes sys.stdout through its logger
+CONSOLE = sys.__stdout__
+
+class NullSecondaryTransport:
+    '''Stands in for the socket.io client of a simulated split secondary.'''
+    connected = False
+
+    def emit(self, *args, **kwargs):
+        pass
+
+    def disconnect(self):
+        pass
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='RotorHazard race simulation benchmark')
+    parser.add_argument('--pilots', type=int, default=16, help='number of pilots')
+    parser.add_argument('--heats', type=int, default=4, help='number of heats')
+    parser.add_argument('--nodes', type=int, default=8, help='number of mock nodes')
+    parser.add_argument('--laps', type=int, default=5, help='laps flown by each pilot per race')
+    parser.add_argument('--lap-dist', choices=['normal', 'uniform', 'lognormal'], default='normal',
+                        help='lap time distribution')
+    parser.add_argument('--lap-mean', type=float, default=30.0, help='mean lap time (seconds)')
+    parser.add_argument('--lap-spread', type=float, default=3.0,
+                        help='lap time spread (seconds; std dev, or half-range for uniform)')
+    parser.add_argument('--splits', type=int, default=0, help='number of simulated split secondaries')
+    parser.add_argument('--clients', type=int, default=1, help='number of connected socket clients')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds to wait for a leaderboard emit')
+    parser.add_argument('--data', help='data directory (default: new temporary directory)')
+    parser.add_argument('--output', help='write results JSON to this file')
+    parser.add_argument('--compare', help='compare results with a previous results JSON file')
+    parser.add_argument('--tolerance', type=float, default=20.0,
+                        help='allowed regression in percent when comparing')
+    return parser.parse_args(argv)
+
+def summarize(samples):
+    '''Summary statistics of a list of durations in seconds, reported in ms.'''
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def pct(p):
+        return ordered[min(count - 1, int(round(p / 100.0 * (count - 1))))] * 1000
+
+    return {
+        'count': count,
+        'min': ordered[0] * 1000,
+        'mean': sum(ordered) / count * 1000,
+        'p50': pct(50),
+        'p95': pct(95),
+        'p99': pct(99),
+        'max': ordered[-1] * 1000,
+    }
+
+class LapTimeGenerator:
+    def __init__(self, rng, dist, mean, spread):
+        self._rng = rng
+        self._dist = dist
+        self._mean = mean
+        self._spread = spread
+
+    def next(self):
+        if self._dist == 'uniform':
+            value = self._rng.uniform(self._mean - self._spread, self._mean + self._spread)
+        elif self._dist == 'lognormal':
+            value = self._mean * self._rng.lognormvariate(0, self._spread / self._mean)
+        else:
+            value = self._rng.gauss(self._mean, self._spread)
+        return max(value, 1.0)
+
+class RaceBenchmark:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.lap_times = LapTimeGenerator(self.rng, args.lap_dist, args.lap_mean, args.lap_spread)
+        self.samples = {
+            'pass_to_leaderboard': [],
+            'split_pass': [],
+            'save_to_results': [],
+            'page_cache_build': [],
+        }
+        self.timeouts = 0
+
+        import gevent
+        import server
+        import RHUtils
+        from interface_mapper import InterfaceType
+        from ClusterNodeSet import SecondaryNode
+
+        self.gevent = gevent
+        self.RHUtils = RHUtils
+        self.server = server
+        self.ctx = server.RaceContext
+        server.rh_program_initialize(reg_endpoints_flag=False)
+
+        self.mock = None
+        for ifmeta in self.ctx.interface.mapped_interfaces:
+            if ifmeta.type == InterfaceType.MOCK:
+                self.mock = ifmeta.interface
+        if self.mock is None:
+            raise RuntimeError('MockInterface not initialized')
+        self.mock.stop()  # all passes come from the simulation
+        self.num_nodes = len(self.mock.nodes)
+
+        self.ctx.serverconfig.set_item('GENERAL', 'RACE_START_DELAY_EXTRA_SECS', 0)
+        self.ctx.rhdata.set_option('MinLapSec', 0)
+
+        self.probe = server.SOCKET_IO.test_client(server.APP)
+        self.clients = [server.SOCKET_IO.test_client(server.APP) for _i in range(max(args.clients - 1, 0))]
+
+        self.secondaries = []
+        for split_idx in range(args.splits):
+            secondary = SecondaryNode(split_idx, {'address': '127.0.0.1:9', 'mode': SecondaryNode.SPLIT_MODE},
+                self.ctx, self.ctx.serverstate.monotonic_to_epoch_millis, server.RELEASE_VERSION)
+            secondary.runningFlag = False  # no connection; passes are injected directly
+            secondary.sio = NullSecondaryTransport()
+            self.secondaries.append(secondary)
+
+    def setup_event(self):
+        rhapi = self.server.RHAPI
+        race_format = rhapi.db.raceformat_add(name='Benchmark', unlimited_time=1, race_time_sec=0,
+            staging_fixed_tones=0, start_delay_min_ms=0, start_delay_max_ms=0)
+        raceclass = rhapi.db.raceclass_add(name='Benchmark', raceformat=race_format.id)
+
+        pilots = [rhapi.db.pilot_add(callsign='Bench {}'.format(idx + 1)) for idx in range(self.args.pilots)]
+
+        # only seats with a frequency in the current profile register passes
+        profile_freqs = json.loads(self.ctx.race.profile.frequencies)
+        self.seats = [idx for idx in range(self.num_nodes) if profile_freqs['f'][idx] != self.RHUtils.FREQUENCY_ID_NONE]
+        per_heat = min(len(self.seats), len(pilots))
+
+        heats = []
+        pilot_idx = 0
+        for heat_idx in range(self.args.heats):
+            heat = rhapi.db.heat_add(name='Benchmark {}'.format(heat_idx + 1), raceclass=raceclass.id)
+            slots = {slot.node_index: slot for slot in rhapi.db.slots_by_heat(heat.id)}
+            slot_list = []
+            for seat in self.seats[:per_heat]:
+                slot_list.append({'slot_id': slots[seat].id, 'pilot': pilots[pilot_idx % len(pilots)].id})
+                pilot_idx += 1
+            rhapi.db.slots_alter_fast(slot_list)
+            heats.append(heat)
+
+        self.ctx.race.format = self.ctx.rhdata.get_raceFormat(race_format.id)
+        return heats
+
+    def drain_clients(self):
+        for client in self.clients:
+            client.get_received()
+
+    def wait_for_leaderboard(self):
+        deadline = monotonic() + self.args.timeout
+        while monotonic() < deadline:
+            for msg in self.probe.get_received():
+                if msg['name'] == 'leaderboard':
+                    return True
+            self.gevent.sleep(0)
+        return False
+
+    def inject_pass(self, node_index, timestamp):
+        self.probe.get_received()
+        start = perf_counter()
+        self.mock.mock_pass(node_index, timestamp)
+        if self.wait_for_leaderboard():
+            self.samples['pass_to_leaderboard'].append(perf_counter() - start)
+        else:
+            self.timeouts += 1
+
+    def inject_split(self, secondary, node_index, timestamp):
+        start = perf_counter()
+        secondary.on_pass_record({
+            'node': node_index,
+            'timestamp': self.ctx.serverstate.monotonic_to_epoch_millis(timestamp),
+        })
+        self.samples['split_pass'].append(perf_counter() - start)
+
+    def run_heat(self, heat):
+        race = self.ctx.race
+        race.set_heat(heat.id)
+        race.stage(immediate=True)
+
+        # simulated clock: every pilot's pass times laid out from the race start
+        passes = []
+        for node_index in self.seats:
+            if race.node_pilots.get(node_index, 0):
+                timestamp = race.start_time_monotonic
+                for lap in range(self.args.laps + 1):
+                    lap_time = self.lap_times.next()
+                    for split_idx, secondary in enumerate(self.secondaries):
+                        split_ts = timestamp + lap_time * (split_idx + 1) / (len(self.secondaries) + 1)
+                        if lap:
+                            passes.append((split_ts, node_index, secondary))
+                    timestamp += lap_time
+                    passes.append((timestamp, node_index, None))
+
+        for timestamp, node_index, secondary in sorted(passes, key=lambda p: (p[0], p[1])):
+            if secondary:
+                self.inject_split(secondary, node_index, timestamp)
+            else:
+                self.inject_pass(node_index, timestamp)
+        race.pass_invoke_func_queue_obj.waitForQueueEmpty()
+
+        race.stop()
+        start = perf_counter()
+        race.do_save_actions()
+        self.ctx.rhdata.get_results_heat(heat.id)
+        self.samples['save_to_results'].append(perf_counter() - start)
+
+        self.ctx.pagecache.set_valid(False)
+        start = perf_counter()
+        self.ctx.pagecache.get_cache()
+        self.samples['page_cache_build'].append(perf_counter() - start)
+
+        self.drain_clients()
+
+    def run(self):
+        heats = self.setup_event()
+        start = perf_counter()
+        for heat in heats:
+            self.run_heat(heat)
+        total = perf_counter() - start
+
+        db_file = os.path.join(self.server.DATA_DIR, self.server.DB_FILE_NAME)
+        return {
+            'meta': {
+                'params': {key: value for key, value in vars(self.args).items()
+                           if key not in ('data', 'output', 'compare', 'tolerance')},
+                'active_seats': len(self.seats),
+                'release_version': self.server.RELEASE_VERSION,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'metrics': {
+                'total_time_s': total,
+                'pass_timeouts': self.timeouts,
+                'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                'db_size_bytes': os.path.getsize(db_file) if os.path.exists(db_file) else None,
+                **{name: summarize(samples) for name, samples in self.samples.items()},
+            },
+        }
+
+def compare(current, baseline, tolerance):
+    '''Prints per-metric change against a baseline; returns names of regressed metrics.'''
+    regressions = []
+    for name, value in current['metrics'].items():
+        base = baseline.get('metrics', {}).get(name)
+        if isinstance(value, dict) and isinstance(base, dict):
+            cur_val, base_val = value.get('p95'), base.get('p95')
+            label = name + '.p95'
+        else:
+            cur_val, base_val = value, base
+            label = name
+        if not isinstance(cur_val, (int, float)) or not isinstance(base_val, (int, float)) or not base_val:
+            continue
+        change = (cur_val - base_val) / base_val * 100
+        flag = ''
+        if change > tolerance:
+            flag = '  << REGRESSION'
+            regressions.append(label)
+        print('{:<28} {:>14.3f} {:>14.3f} {:>+8.1f}%{}'.format(label, base_val, cur_val, change, flag), file=CONSOLE)
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    for name in ('data', 'output', 'compare'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    data_dir = args.data or tempfile.mkdtemp(prefix='rh-bench-')
+    os.environ['RH_DATA_DIR'] = data_dir
+    os.environ['RH_NODES'] = str(args.nodes)
+    os.environ['RH_MOCK_SEED'] = str(args.seed)
+    random.seed(args.seed)
+
+    results = RaceBenchmark(args).run()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2), file=CONSOLE)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print('{:<28} {:>14} {:>14} {:>9}'.format('metric', 'baseline', 'current', 'change'), file=CONSOLE)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    result = main()
+    CONSOLE.flush()
+    # exit directly; server background threads are not shut down
+    os._exit(result)
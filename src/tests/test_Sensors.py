@@ -4,7 +4,9 @@ import unittest
 
 sys.path.append('../interface')
 
+import gevent
 from Sensors import Sensors
+from SensorHistory import ReadingHistory
 
 class SensorsTest(unittest.TestCase):
     def setUp(self):
@@ -22,5 +24,48 @@ class SensorsTest(unittest.TestCase):
         after = self.sensors[0].getReadings()
         self.assertEqual(after['counter']['value'], before['counter']['value']+1)
 
+    def test_history(self):
+        self.sensors.discover()
+        sensor = self.sensors[0]
+        sensor.value = 0
+        for second in range(120):
+            sensor.value = second
+            self.sensors.record(sensor, 6000 + second)
+            self.sensors.record(sensor, 6000.5 + second)
+
+        fine = self.sensors.get_history(sensor.name, 'counter', 1)
+        self.assertEqual(fine['resolution'], 1)
+        self.assertEqual(len(fine['time']), 120)
+        self.assertEqual(fine['time'][0], 6000)
+        self.assertEqual(fine['mean'][5], 5)
+
+        coarse = self.sensors.get_history(sensor.name, 'counter', 60)
+        self.assertEqual(coarse['resolution'], 60)
+        self.assertEqual(coarse['time'], [6000, 6060])
+        self.assertEqual(coarse['min'], [0, 60])
+        self.assertEqual(coarse['max'], [59, 118])  # last second still open in finer tier
+        self.assertEqual(coarse['mean'][0], 29.5)
+
+        self.assertEqual(self.sensors.get_history(sensor.name, 'counter', 1, since=6110)['time'][0], 6110)
+        self.assertIn('counter', self.sensors.get_history(sensor.name))
+        self.assertIsNone(self.sensors.get_history('nonexistent'))
+
+    def test_ring_buffer_wraps(self):
+        history = ReadingHistory(tiers=((1, 5),))
+        for second in range(12):
+            history.add(second, second)
+        result = history.get(1)
+        self.assertEqual(result['time'], [6, 7, 8, 9, 10, 11])  # 5 closed buckets plus open bucket
+
+    def test_sampling(self):
+        self.sensors.discover()
+        sensor = self.sensors[0]
+        before = sensor.value
+        self.sensors.start_sampling(0.01)
+        gevent.sleep(0.1)
+        self.sensors.stop_sampling()
+        self.assertGreater(sensor.value, before + 1)
+        self.assertGreater(len(self.sensors.get_history(sensor.name, 'counter', 1)['time']), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+'''python -m unittest discover'''
+import sys
+import unittest
+import gevent
+from time import monotonic
+
+sys.path.append('../server')
+sys.path.append('../interface')
+
+try:
+    import i2c_helper
+except ImportError:  # smbus not installed
+    i2c_helper = None
+
+@unittest.skipIf(i2c_helper is None, 'smbus not installed')
+class I2CHelperTest(unittest.TestCase):
+    def setUp(self):
+        self.chill_time = i2c_helper.I2C_CHILL_TIME
+
+    def tearDown(self):
+        i2c_helper.I2C_CHILL_TIME = self.chill_time
+
+    def test_node_priority_first(self):
+        i2c_helper.I2C_CHILL_TIME = 0
+        bus = i2c_helper.I2CBus(1, i2c=object())
+        order = []
+        def transaction(name, duration=0):
+            def callback():
+                order.append(name)
+                gevent.sleep(duration)
+            return callback
+
+        holder = gevent.spawn(bus.with_i2c, transaction('holder', 0.05), 0x08, i2c_helper.PRIORITY_NODE)
+        gevent.sleep(0.01)
+        sensor = gevent.spawn(bus.with_i2c, transaction('sensor'), 0x40, i2c_helper.PRIORITY_SENSOR)
+        gevent.sleep(0.01)
+        node = gevent.spawn(bus.with_i2c, transaction('node'), 0x0A, i2c_helper.PRIORITY_NODE)
+        gevent.joinall([holder, sensor, node], timeout=2)
+        self.assertEqual(order, ['holder', 'node', 'sensor'])  # queued sensor read waits for later node read
+
+        # sensor transaction nested in a node transaction does not wait on the bus it holds
+        nested = bus.with_i2c(lambda: bus.with_i2c(lambda: 'inner', 0x40, i2c_helper.PRIORITY_SENSOR), 0x08)
+        self.assertEqual(nested, 'inner')
+        self.assertIsNone(bus.i2c_owner)
+        self.assertEqual(bus.i2c_depth, 0)
+
+    def test_chill_time_per_device(self):
+        i2c_helper.I2C_CHILL_TIME = 0.05
+        bus = i2c_helper.I2CBus(1, i2c=object())
+        times = {}
+        def transaction(name):
+            return lambda: times.setdefault(name, monotonic())
+
+        bus.with_i2c(transaction('first'), 0x08)
+        bus.with_i2c(transaction('other'), 0x0A)
+        bus.with_i2c(transaction('again'), 0x08)
+        self.assertLess(times['other'] - times['first'], 0.04)  # other device is not held back
+        self.assertGreaterEqual(times['again'] - times['first'], 0.05)
+
+    def test_bus_group(self):
+        i2c_helper.I2C_CHILL_TIME = 0
+        buses = [i2c_helper.I2CBus(1, i2c=object()), i2c_helper.I2CBus(3, i2c=object())]
+        group = i2c_helper.I2CBusGroup(buses)
+        self.assertEqual(group.get_buses(), buses)
+        self.assertEqual(group.get_i2c_busnum(), 1)  # single-bus callers get the first bus
+        self.assertIs(group.i2c, buses[0].i2c)
+
+        # a transaction on one bus does not wait for another bus
+        done = []
+        def hold():
+            gevent.sleep(0.1)
+            done.append(1)
+        holder = gevent.spawn(buses[0].with_i2c, hold, 0x08)
+        gevent.sleep(0.01)
+        buses[1].with_i2c(lambda: done.append(3), 0x08)
+        holder.join(timeout=2)
+        self.assertEqual(done, [3, 1])
+        self.assertEqual([(stats['bus'], stats['transactions']) for stats in group.get_utilization()], [(1, 1), (3, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,18 @@
 '''python -m unittest discover'''
 import os
 import sys
+import logging
+import json
+import itertools
+import random
+import shutil
+import sqlite3
+import tempfile
 import unittest
 import gevent
+import sqlalchemy
 from datetime import datetime
+from time import monotonic
 from flask.blueprints import Blueprint
 
 sys.path.append('../server')
@@ -16,6 +25,19 @@ os.environ['RH_NODES'] = '8'
 import server
 from Node import Node
 from RHUI import UIField, UIFieldType
+import Database
+from Database import ProgramMethod
+from util.Metrics import metrics
+from util.InvokeFuncQueue import InvokeFuncQueue
+from util.PreciseSleep import sleep_until
+from util.TimerWheel import TimerWheel
+import IMDCalc
+import DatabaseBackup
+from FrequencyPlanner import FrequencyPlanner
+from HeatGenerator import HeatPlan, HeatPlanSlot, SeedMethod
+from led_panel import PanelMap
+import RHUtils
+import Results
 
 class ServerTest(unittest.TestCase):
     def setUp(self):
@@ -32,6 +54,20 @@ class ServerTest(unittest.TestCase):
                 return resp['args'][0]
         self.fail('No response of type {0}'.format(event))
 
+    def delete_saved_race(self, race):
+        '''Deletes one saved race added by a test, leaving the other saved races in place'''
+        rhdata = server.RaceContext.rhdata
+        heat_id, class_id = race.heat_id, race.class_id
+        Database.DB_session.query(Database.SavedRaceMetaAttribute).filter_by(id=race.id).delete()
+        Database.DB_session.query(Database.SavedRaceLap).filter_by(race_id=race.id).delete()
+        Database.DB_session.query(Database.SavedPilotRace).filter_by(race_id=race.id).delete()
+        Database.DB_session.query(Database.SavedRaceMeta).filter_by(id=race.id).delete()
+        rhdata.commit()
+        rhdata.clear_results_heat(heat_id)
+        if class_id != RHUtils.CLASS_ID_NONE:
+            rhdata.clear_results_raceClass(class_id)
+        rhdata.clear_results_event()
+
     def test_sensors(self):
         self.assertTrue(any(s.name == 'TestSensor' for s in server.RaceContext.sensors))
 
@@ -75,6 +111,29 @@ class ServerTest(unittest.TestCase):
         resp = self.get_response('pilot_data')
         self.assertEqual(len(resp['pilots']), num_pilots-1)
 
+    def test_pilot_data_cache(self):
+        rhapi = server.RHAPI
+        rhui = server.RaceContext.rhui
+        rhui.register_pilot_attribute(UIField('cache_test', 'Cache Test', UIFieldType.TEXT))
+        first = rhapi.db.pilot_add(callsign='First')
+        second = rhapi.db.pilot_add(callsign='Second')
+
+        self.client.emit('load_data', {'load_types': ['pilot_data']})
+        resp = self.get_response('pilot_data')
+        self.assertEqual(resp['teams'], server.RaceContext.rhdata.TEAM_NAMES_LIST)
+        views = rhui.get_pilot_views({'cache_test': UIFieldType.TEXT})
+        second_view = views[second.id]
+
+        rhapi.db.pilot_alter(first.id, callsign='Patched', attributes={'cache_test': 'value'})
+        views = rhui.get_pilot_views({'cache_test': UIFieldType.TEXT})
+        self.assertEqual(views[first.id]['callsign'], 'Patched')
+        self.assertEqual(views[first.id]['cache_test'], 'value')
+        self.assertIs(views[second.id], second_view)
+
+        rhapi.db.pilot_delete(second.id)
+        views = rhui.get_pilot_views({'cache_test': UIFieldType.TEXT})
+        self.assertNotIn(second.id, views)
+
     def test_add_profile(self):
         self.client.emit('load_data', {'load_types': ['node_tuning']})
         resp = self.get_response('node_tuning')
@@ -224,6 +283,60 @@ class ServerTest(unittest.TestCase):
         resp = self.get_response('heat_data')
         self.assertEqual(len(resp['heats']), num_heats-1)
 
+    def test_heat_data_cache(self):
+        rhapi = server.RHAPI
+        rhui = server.RaceContext.rhui
+        pilot = rhapi.db.pilot_add()
+        heat = rhapi.db.heat_add()
+        slot = rhapi.db.slots_by_heat(heat.id)[0]
+
+        views = rhui.get_heat_views({})
+        self.assertIs(rhui.get_heat_views({}), views)
+
+        rhapi.db.slot_alter(slot.id, pilot=pilot.id)
+        self.client.emit('load_data', {'load_types': ['heat_data']})
+        resp = self.get_response('heat_data')
+        heat_data = next(h for h in resp['heats'] if h['id'] == heat.id)
+        self.assertEqual(heat_data['slots'][0]['pilot_id'], pilot.id)
+        self.assertFalse(heat_data['locked'])
+        self.assertIsNot(rhui.get_heat_views({}), views)
+
+        rhapi.db.heat_alter(heat.id, name='Cached')
+        heat_data = next(h for h in rhui.get_heat_views({}) if h['id'] == heat.id)
+        self.assertEqual(heat_data['displayname'], 'Cached')
+
+    def test_data_version_connection_writes(self):
+        rhapi = server.RHAPI
+        rhui = server.RaceContext.rhui
+        heat = rhapi.db.heat_add()
+        version = Database.data_version(Database.Heat)
+        self.assertEqual(Database.rows_written_since(Database.Heat, version[1]), set())
+        rhapi.db.heat_alter(heat.id, name='Session')
+        self.assertEqual(Database.rows_written_since(Database.Heat, version[1]), {heat.id})  # session writes keep row ids
+
+        # written on an engine connection without a session, as by restore or migration helpers
+        views = rhui.get_heat_views({})
+        version = Database.data_version(Database.Heat)
+        with Database.DB_engine.begin() as conn:
+            conn.execute(sqlalchemy.text('SELECT note FROM heat WHERE id = :id'), {'id': heat.id})
+            self.assertEqual(Database.data_version(Database.Heat), version)
+            conn.execute(sqlalchemy.text('UPDATE heat SET note = :name WHERE id = :id'), {'name': 'Raw', 'id': heat.id})
+        self.assertNotEqual(Database.data_version(Database.Heat), version)
+        self.assertIsNone(Database.rows_written_since(Database.Heat, version[1]))
+        self.assertIsNot(rhui.get_heat_views({}), views)
+
+        version = Database.data_version(Database.Heat, Database.Pilot)
+        with Database.DB_engine.begin() as conn:
+            conn.execute(Database.Heat.__table__.update().where(Database.Heat.__table__.c.id == heat.id).values(note='Core'))
+        self.assertEqual(Database.data_version(Database.Heat, Database.Pilot)[2], version[2])  # other tables unchanged
+        self.assertNotEqual(Database.data_version(Database.Heat), version[:2])
+
+        # writes outside the engine are noted explicitly
+        version = Database.data_version(Database.Heat)
+        Database.note_writes(Database.Heat)
+        self.assertIsNone(Database.rows_written_since(Database.Heat, version[1]))
+        rhapi.db.heat_delete(heat)
+
 # scanner
 
     def test_scanner(self):
@@ -274,6 +387,71 @@ class ServerTest(unittest.TestCase):
 
         resp = self.client.emit('ts_race_stage', {'start_time_s': server_ts + 2})
 
+    def test_race_start_precision(self):
+        ticks = []
+        def ticker():
+            while True:
+                ticks.append(monotonic())
+                gevent.sleep(0.001)
+        ticker_greenlet = gevent.spawn(ticker)
+        try:
+            target = monotonic() + 0.2
+            late = sleep_until(target)
+            self.assertGreaterEqual(late, 0)
+            self.assertLess(late, 0.005)
+            self.assertGreater(len(ticks), 20)  # other greenlets ran while waiting
+
+            start_time = monotonic() + 1.5  # after the configured extra start delay
+            server.RHAPI.race.stage({'start_time_s': start_time})
+            self.assertEqual(server.RaceContext.race.race_status, server.RaceStatus.STAGING)
+            ticks.clear()
+            gevent.sleep(start_time + 0.2 - monotonic())
+            self.assertEqual(server.RaceContext.race.race_status, server.RaceStatus.RACING)
+            self.assertIsNotNone(server.RHAPI.race.start_jitter)
+            self.assertLess(server.RHAPI.race.start_jitter, 0.005)
+            # no gap in the ticker around the start instant
+            self.assertFalse([t for t0, t in zip(ticks, ticks[1:]) if t - t0 > 0.1 and t0 < start_time < t])
+        finally:
+            ticker_greenlet.kill()
+            server.RaceContext.race.stop()
+
+    def test_timer_wheel(self):
+        wheel = TimerWheel(tick=0.005, level_sizes=(4, 4, 2))  # small levels so deadlines cascade and overflow
+        fired = []
+        start = monotonic()
+        delays = [0.3, 0.01, 0.25, 0.0, 0.12, 0.05, 0.2, 0.33]
+        timers = [wheel.call_at(start + delay, fired.append, delay) for delay in delays]
+        self.assertEqual(len(wheel), len(delays))
+        self.assertTrue(timers[2].cancel())
+        self.assertFalse(timers[2].cancel())
+        gevent.sleep(0.4)
+        self.assertEqual(fired, sorted(delay for delay in delays if delay != 0.25))
+        self.assertEqual(len(wheel), 0)
+        for timer in timers:
+            if timer is not timers[2]:
+                self.assertTrue(timer.fired)
+                self.assertGreaterEqual(timer.lateness, 0)
+                self.assertLess(timer.lateness, 0.05)
+        self.assertFalse(timers[2].fired)
+
+        # race timers are cancelled when the race stops
+        race = server.RaceContext.race
+        timer = race.call_at(monotonic() + 0.05, fired.append, 'race')
+        race.stop()
+        gevent.sleep(0.1)
+        self.assertFalse(timer.pending)
+        self.assertNotIn('race', fired)
+
+        # plugins schedule on the shared timers
+        timer = server.RHAPI.server.call_later(0.02, fired.append, 'plugin')
+        self.assertTrue(timer.pending)
+        gevent.sleep(0.1)
+        self.assertIn('plugin', fired)
+        timer = server.RHAPI.server.call_at(monotonic() + 0.02, fired.append, 'deadline')
+        self.assertTrue(timer.pending)
+        gevent.sleep(0.1)
+        self.assertIn('deadline', fired)
+
     def test_trackside_stop_race(self):
         resp = self.client.emit('ts_race_stop')
 
@@ -582,6 +760,330 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(result, True)
         self.assertEqual(num_formats, len(server.RHAPI.db.raceformats))
 
+    def test_data_import_json(self):
+        test_name = 'Import ' + str(datetime.now())
+        pilot = server.RHAPI.db.pilot_add(callsign=test_name)
+        race_class = server.RHAPI.db.raceclass_add(name=test_name)
+        heat = server.RHAPI.db.heat_add(name=test_name, raceclass=race_class.id)
+        slot = server.RHAPI.db.slots_by_heat(heat.id)[0]
+        server.RHAPI.db.slot_alter(slot.id, pilot=pilot.id)
+
+        export = server.RHAPI.io.run_export('JSON__Complete____All')
+        num_pilots = len(server.RHAPI.db.pilots)
+        num_heats = len([h for h in server.RHAPI.db.heats if h.class_id])
+
+        result = server.RHAPI.io.run_import('RotorHazard_4_0_JSON__Complete_', export['data'], {'reset_classes': True})
+        self.assertTrue(result)
+        self.assertEqual(len(server.RHAPI.db.pilots), num_pilots)
+        self.assertEqual(len(server.RHAPI.db.heats), num_heats)  # unclassified heats are not imported
+        self.assertIn('pilots', server.RaceContext.import_manager.importers['RotorHazard_4_0_JSON__Complete_'].timing)
+
+        new_heat = [h for h in server.RHAPI.db.heats if h.name == test_name][0]
+        new_class = server.RHAPI.db.raceclass_by_id(new_heat.class_id)
+        self.assertEqual(new_class.name, test_name)
+        self.assertEqual(len(server.RHAPI.db.slots_by_heat(new_heat.id)), server.RaceContext.race.num_nodes)
+        self.assertEqual(server.RHAPI.db.slots_by_heat(new_heat.id)[0].pilot_id, pilot.id)
+
+    def test_data_import_clears_results(self):
+        rhdata = server.RaceContext.rhdata
+        test_name = 'Import results ' + str(datetime.now())
+        pilot = server.RHAPI.db.pilot_add(callsign=test_name, team='A')
+        heat = server.RHAPI.db.heat_add(name=test_name)
+        slot = server.RHAPI.db.slots_by_heat(heat.id)[0]
+        server.RHAPI.db.slot_alter(slot.id, pilot=pilot.id)
+        race = rhdata.add_savedRaceMeta({'round_id': 1, 'heat_id': heat.id, 'class_id': heat.class_id,
+            'format_id': server.RaceContext.race.format.id, 'start_time': 0, 'start_time_formatted': ''})
+        rhdata.add_race_data({slot.node_index: {'race_id': race.id, 'pilot_id': pilot.id, 'history_values': '[]',
+            'history_times': '[]', 'enter_at': 0, 'exit_at': 0, 'frequency': 0, 'laps': [server.RHRace.Crossing(
+                lap_time_stamp=(idx + 1) * 10000.0, lap_time=10000.0, lap_time_formatted='', source=0, deleted=False,
+                peak_rssi=100) for idx in range(3)]}})
+        try:
+            self.assertEqual(rhdata.get_results_heat(heat.id)['by_race_time'][0]['team_name'], 'A')
+            self.assertEqual(rhdata.get_results_savedRaceMeta(race.id)['by_race_time'][0]['team_name'], 'A')
+
+            importer = server.RaceContext.import_manager.importers['RotorHazard_4_0_JSON__Complete_']
+            with importer.batch() as batch:
+                batch.pilots_upsert([{'callsign': test_name, 'team': 'B'}])
+            self.assertEqual(rhdata.get_results_heat(heat.id)['by_race_time'][0]['team_name'], 'B')
+            self.assertEqual(rhdata.get_results_savedRaceMeta(race.id)['by_race_time'][0]['team_name'], 'B')
+
+            # options are cached only once the batch commits
+            rhdata.set_option('importTestOption', 'before')
+            with self.assertRaises(RuntimeError):
+                with importer.batch() as batch:
+                    batch.options_set({'importTestOption': 'rolled back'})
+                    raise RuntimeError()
+            self.assertEqual(rhdata.get_option('importTestOption'), 'before')
+            with importer.batch() as batch:
+                batch.options_set({'importTestOption': 'committed'})
+            self.assertTrue(batch.committed)
+            self.assertEqual(rhdata.get_option('importTestOption'), 'committed')
+
+            # an import whose commit fails is reported as failed, without an import event
+            imported = []
+            server.RaceContext.events.on(server.Evt.DATABASE_IMPORT, 'test_import_commit', imported.append)
+            rhdata.commit = lambda: False
+            try:
+                result = server.RHAPI.io.run_import('RotorHazard_4_0_JSON__Complete_',
+                    json.dumps({'Pilot': [{'id': 1, 'callsign': test_name}]}))
+                gevent.sleep(0.1)
+            finally:
+                del rhdata.commit
+                server.RaceContext.events.off(server.Evt.DATABASE_IMPORT, 'test_import_commit')
+            self.assertFalse(result)
+            self.assertEqual(imported, [])
+        finally:
+            self.delete_saved_race(race)
+
+    def test_heat_generate(self):
+        num_heats = len(server.RHAPI.db.heats)
+        output_class_id = server.RHAPI.heatgen.generate('Regulation_bracket__double_elimination', {
+            'input_class': None,
+            'output_class': None,
+            'available_seats': 4,
+            'standard': 'fai16',
+            })
+        self.assertTrue(output_class_id)
+        heats = server.RHAPI.db.heats_by_class(output_class_id)
+        self.assertEqual(len(server.RHAPI.db.heats), num_heats + len(heats))
+        self.assertEqual(len(set(heat.auto_name for heat in heats)), len(heats))
+        seeded_slots = [slot for heat in heats for slot in server.RHAPI.db.slots_by_heat(heat.id)
+                        if slot.method == ProgramMethod.HEAT_RESULT]
+        self.assertGreater(len(seeded_slots), 0)
+        self.assertTrue(all(slot.seed_id in [heat.id for heat in heats] for slot in seeded_slots))
+        self.assertTrue(server.RHAPI.db.raceclass_attribute_value(output_class_id, 'generate_args'))
+
+        # a failed apply leaves no output class behind
+        rhdata = server.RaceContext.rhdata
+        manager = server.RaceContext.heat_generate_manager
+        num_classes = len(server.RHAPI.db.raceclasses)
+        plans = [HeatPlan(name='Failed', slots=[HeatPlanSlot(method=SeedMethod.INPUT, seed_rank=1)])]
+        self.assertFalse(manager.apply('Regulation_bracket__double_elimination',
+            [HeatPlan(name='Unsupported', slots=[HeatPlanSlot(method=None, seed_rank=1)])], {'output_class': None}))
+        self.assertEqual(len(server.RHAPI.db.raceclasses), num_classes)
+        def fail(*args):
+            raise RuntimeError()
+        rhdata.set_raceclass_attribute_fast = fail
+        try:
+            self.assertFalse(manager.apply('Regulation_bracket__double_elimination', plans, {'output_class': None}))
+        finally:
+            del rhdata.set_raceclass_attribute_fast
+        self.assertEqual(len(server.RHAPI.db.raceclasses), num_classes)
+
+    def test_calc_dependent_heats(self):
+        source_heat = server.RHAPI.db.heat_add()
+        seeded_heat = server.RHAPI.db.heat_add()
+        final_heat = server.RHAPI.db.heat_add()
+        for heat, seed_heat in [(seeded_heat, source_heat), (final_heat, seeded_heat)]:
+            slot = server.RHAPI.db.slots_by_heat(heat.id)[0]
+            server.RHAPI.db.slot_alter(slot.id, method=ProgramMethod.HEAT_RESULT, seed_heat_id=seed_heat.id, seed_rank=1)
+        recalculated = server.RaceContext.heatautomator.calc_dependent_heats(source_heat.id)
+        self.assertEqual(recalculated, [seeded_heat.id, final_heat.id])
+        self.assertEqual(server.RaceContext.heatautomator.calc_dependent_heats(final_heat.id), [])
+
+    def test_frequency_planner(self):
+        seats = [{'idx': idx, 'frq': {'f': f, 'b': 'R', 'c': idx + 1}, 'matches': []}
+                 for idx, f in enumerate([5658, 5695, 5732, 5769, 5806, 5843, 5880, 5917])]
+        pilots = [{'slot': None, 'history': []} for _ in range(3)]
+        plan = FrequencyPlanner().plan(seats, pilots)
+        best = max(IMDCalc.imd_rating([seats[i]['frq']['f'] for i in combo])
+                   for combo in itertools.combinations(range(len(seats)), 3))
+        self.assertEqual(len(set(plan)), 3)
+        self.assertEqual(IMDCalc.imd_rating([seats[i]['frq']['f'] for i in plan]), best)
+        # pilot keeps last frequency unless IMD cost outweighs the change
+        pilots[0]['history'] = [{'f': 5880, 'b': 'R', 'c': 7}, {'f': 5695, 'b': 'R', 'c': 2}]
+        plan = FrequencyPlanner().plan(seats, pilots)
+        self.assertEqual(plan[0], 1)
+        # D-band pilots stay on D-band seats
+        seats[5]['frq']['b'] = 'D'
+        pilots[1]['history'] = [{'f': 5843, 'b': 'D', 'c': 6}]
+        plan = FrequencyPlanner().plan(seats, pilots, fixed_frequencies=[5917])
+        self.assertEqual(plan[1], 5)
+        self.assertNotIn(7, plan)
+
+        heat = server.RHAPI.db.heat_add()
+        server.RHAPI.db.heat_alter(heat.id, auto_frequency=True)
+        pilot_ids = [server.RHAPI.db.pilot_add().id for _ in range(3)]
+        for slot, pilot_id in zip(server.RHAPI.db.slots_by_heat(heat.id), pilot_ids):
+            server.RHAPI.db.slot_alter(slot.id, pilot=pilot_id)
+        server.RaceContext.rhdata.set_pilot_used_frequency(pilot_ids[0], {'f': 5695, 'b': 'R', 'c': 2})
+        profile_freqs = server.RaceContext.race.profile.frequencies
+        server.RaceContext.heatautomator.run_auto_frequency(heat.id, profile_freqs,
+            server.RaceContext.race.num_nodes, FrequencyPlanner())
+        seat_by_pilot = {slot.pilot_id: slot.node_index for slot in server.RHAPI.db.slots_by_heat(heat.id)
+                         if slot.pilot_id in pilot_ids}
+        self.assertEqual(len(set(seat_by_pilot.values())), 3)
+        self.assertTrue(all(seat is not None for seat in seat_by_pilot.values()))
+        if 5695 in json.loads(profile_freqs)['f']:
+            self.assertEqual(json.loads(profile_freqs)['f'][seat_by_pilot[pilot_ids[0]]], 5695)
+
+    def test_invoke_func_queue_batching(self):
+        processed = []
+        batches = []
+        func_queue = InvokeFuncQueue(logging.getLogger(__name__), maxQueueSize=None,
+                                     idleFn=lambda: batches.append(len(processed)))
+        for idx in range(50):
+            func_queue.put(processed.append, idx)  # unbounded; never blocks
+        self.assertEqual(func_queue.pendingCount(), 50)
+        func_queue.waitForQueueEmpty()
+        self.assertEqual(processed, list(range(50)))
+        self.assertEqual(batches, [50])
+        self.assertEqual(func_queue.pendingCount(), 0)
+
+    def test_deferred_laps_discarded(self):
+        rhapi = server.RHAPI
+        race = server.RaceContext.race
+        profile_freqs = json.loads(race.profile.frequencies)
+        seats = [idx for idx in range(race.num_nodes) if profile_freqs['f'][idx] != RHUtils.FREQUENCY_ID_NONE][:3]
+        heat = rhapi.db.heat_add()
+        slots = {slot.node_index: slot for slot in rhapi.db.slots_by_heat(heat.id)}
+        pilots = [rhapi.db.pilot_add(callsign='Deferred {}'.format(seat)) for seat in seats]
+        rhapi.db.slots_alter_fast([{'slot_id': slots[seat].id, 'pilot': pilot.id} for seat, pilot in zip(seats, pilots)])
+        race.set_heat(heat.id)
+        race.stage(immediate=True)
+        race = server.RaceContext.race
+        self.assertEqual(race.race_status, server.RaceStatus.RACING)
+
+        recorded = []
+        server.RaceContext.events.on(server.Evt.RACE_LAP_RECORDED, 'test_deferred_laps',
+                                     lambda args: recorded.append(args['node_index']))
+        try:
+            gate = gevent.event.Event()
+            nodes = server.RaceContext.interface.nodes
+            race.queue_pass(nodes[seats[0]], race.start_time_monotonic + 1, 0)
+            race.pass_invoke_func_queue_obj.put(gate.wait)  # queued work that is not a pass record
+            gevent.sleep(0.2)
+            self.assertEqual(race._recorded_laps, [])  # not deferred
+            self.assertEqual(recorded, [seats[0]])
+            gate.set()
+            race.pass_invoke_func_queue_obj.waitForQueueEmpty()
+
+            gate = gevent.event.Event()
+            for seat in seats[1:]:
+                race.queue_pass(nodes[seat], race.start_time_monotonic + 1, 0)
+            race.pass_invoke_func_queue_obj.put(gate.wait)  # holds the queue ahead of the last pass
+            race.queue_pass(nodes[seats[0]], race.start_time_monotonic + 2, 0)
+            gevent.sleep(0.2)
+            self.assertEqual(len(race._recorded_laps), len(seats) - 1)  # deferred while a pass is queued
+            self.assertEqual(recorded, [seats[0]])
+
+            race.discard_laps()  # stopping processes the recorded laps while the race is still running
+            gevent.sleep(0.1)
+            self.assertEqual(sorted(recorded), seats)
+            self.assertEqual(race._recorded_laps, [])
+            gate.set()
+            race.pass_invoke_func_queue_obj.waitForQueueEmpty()
+            gevent.sleep(0.1)
+            self.assertEqual(sorted(recorded), seats)  # no lap events once the race is discarded
+            self.assertEqual(race._queued_passes, 0)
+            self.assertEqual(race.get_results()['by_race_time'][0]['laps'], 0)
+        finally:
+            server.RaceContext.events.off(server.Evt.RACE_LAP_RECORDED, 'test_deferred_laps')
+            rhapi.db.heat_delete(heat.id)
+
+    def test_database_backup(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db_name = os.path.join(tmp_dir, 'database.db')
+            conn = sqlite3.connect(db_name)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE lap (id INTEGER PRIMARY KEY, time REAL)')
+            conn.executemany('INSERT INTO lap (time) VALUES (?)', [(idx * 1.5,) for idx in range(5000)])
+            conn.commit()
+            db_backup = DatabaseBackup.DatabaseBackup(db_name, compress=True, pages_per_step=4)
+            first = db_backup.backup(os.path.join(tmp_dir, 'bkp_1.db'), 'autoBkp_')
+            self.assertTrue(first.endswith('bkp_1.db.gz'))
+            self.assertTrue(DatabaseBackup.is_backup_file_name(os.path.basename(first)))
+            # unchanged database is not backed up again
+            self.assertEqual(db_backup.backup(os.path.join(tmp_dir, 'bkp_2.db'), 'autoBkp_'), first)
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'bkp_2.db.gz')))
+            # live connection stays writable
+            conn.execute('INSERT INTO lap (time) VALUES (1.0)')
+            conn.commit()
+            second = db_backup.backup(os.path.join(tmp_dir, 'bkp_3.db'), 'autoBkp_')
+            self.assertTrue(second.endswith('bkp_3.db.gz'))
+            conn.close()
+            with DatabaseBackup.open_backup_file(second) as file_name:
+                bkp_conn = sqlite3.connect(file_name)
+                self.assertEqual(bkp_conn.execute('SELECT COUNT(*) FROM lap').fetchone()[0], 5001)
+                bkp_conn.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_recover_database_streaming(self):
+        rhdata = server.RaceContext.rhdata
+        heat_id = rhdata.get_first_heat().id
+        pilot_id = rhdata.get_pilots()[0].id
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            src_name = DatabaseBackup.DatabaseBackup(server.DB_FILE_NAME).backup(os.path.join(tmp_dir, 'source.db'))
+            conn = sqlite3.connect(src_name)
+            for table in ('saved_race_lap', 'saved_pilot_race', 'saved_race_meta_attribute', 'saved_race_meta'):
+                conn.execute('DELETE FROM ' + table)
+            conn.execute("INSERT INTO saved_race_meta (id, round_id, heat_id, start_time, start_time_formatted, results, cacheStatus) "
+                         "VALUES (1, 1, ?, 0, '', ?, 'stale')", (heat_id, b'not a pickle'))
+            conn.execute("INSERT INTO saved_pilot_race (id, race_id, node_index, pilot_id, penalty_time, enter_at, exit_at) "
+                         "VALUES (1, 1, 0, ?, 0, 0, 0)", (pilot_id,))
+            conn.executemany("INSERT INTO saved_race_lap (id, race_id, pilotrace_id, node_index, pilot_id, lap_time_stamp, "
+                             "lap_time, lap_time_formatted, source, deleted) VALUES (?, 1, 1, 0, ?, ?, ?, '', 0, 0)",
+                             [(idx + 1, pilot_id, idx * 10000.0, 10000.0 if idx else '') for idx in range(2500)])
+            conn.commit()
+            conn.close()
+
+            progress = []
+            rhdata.recover_database(src_name, progress_fn=lambda *args: progress.append(args))
+            race = rhdata.get_savedRaceMeta(1)
+            self.assertIsNone(race.results)  # results caches are rebuilt, not copied
+            self.assertNotEqual(race._cache_status, 'stale')
+            laps = rhdata.get_savedRaceLaps()
+            self.assertEqual(len(laps), 2500)
+            self.assertEqual(laps[0].lap_time, 0)
+            self.assertEqual([p for p in progress if p[0] == 'saved_race_lap'],
+                             [('saved_race_lap', 1000, 2500), ('saved_race_lap', 2000, 2500), ('saved_race_lap', 2500, 2500)])
+        finally:
+            rhdata.clear_race_data()
+            shutil.rmtree(tmp_dir)
+
+    def test_metrics(self):
+        metrics.reset()
+        metrics.enabled = True
+        try:
+            server.RHAPI.db.pilot_add()
+            self.client.emit('load_data', {'load_types': ['pilot_data']})
+        finally:
+            metrics.enabled = False
+        text = metrics.render_prometheus()
+        self.assertIn('# TYPE rh_db_commit_seconds histogram', text)
+        self.assertIn('rh_db_commit_seconds_bucket{le="+Inf"}', text)
+        self.assertIn('rh_socket_emit_bytes_count{event="pilot_data"}', text)
+        snapshot = metrics.snapshot()
+        self.assertGreater(snapshot['metrics']['rh_db_commit_seconds']['values'][0]['value']['count'], 0)
+        # nothing is recorded while disabled
+        count = metrics.histogram('rh_db_commit_seconds').count
+        server.RHAPI.db.pilot_add()
+        self.assertEqual(metrics.histogram('rh_db_commit_seconds').count, count)
+
+    def test_imdtabler(self):
+        # reference values from IMDTabler.jar 1.3 ('-r' / '-t')
+        self.assertEqual(IMDCalc.imd_rating('5658 5732 5843 5917'), 100)
+        self.assertEqual(IMDCalc.imd_rating('5645 5685 5760 5800 5860 5905'), -14)
+        self.assertEqual(IMDCalc.imd_rating('5658,5695,5732,5769,5806,5843,5880,5917'), -635)
+        html = IMDCalc.imd_table_html(['5740', '5760', '5780'])
+        self.assertTrue(html.startswith('<b>Warning:  Minimum separation for entered frequencies is 20MHz</b><br><br>'))
+        self.assertIn('      <td align="center" title="5720 is 20MHz away from 5740" bgcolor="#FFbfbf">5720</td>\n', html)
+        self.assertIn('      <td align="center" title="5700 is 40MHz away from 5740">5700</td>\n', html)
+        self.assertIn('      <td align="center" title="5760"></td>\n', html)
+        self.assertIn('IMD rating (100=best): -93<br><br>5720 is 20MHz away from 5740<br>\n', html)
+        self.assertIs(IMDCalc.get_imd_table('5740 5760 5780'), IMDCalc.get_imd_table([5740, 5760, 5780]))
+
+        self.client.emit('imdtabler_update_freqs', {'freq_list': '5740, 5760, 5780'})
+        resp = self.get_response('imdtabler_data')
+        self.assertEqual(resp['freq_list'], '5740 5760 5780')
+        self.assertEqual(resp['table_data'], html)
+        self.client.emit('imdtabler_update_freqs', {'freq_list': '5740 5760'})
+        resp = self.get_response('imdtabler_data')
+        self.assertIsNone(resp['table_data'])
+
     def test_sensors_api(self):
         self.assertGreaterEqual(len(server.RHAPI.sensors.sensors_dict), 0)
         self.assertEqual(server.RHAPI.sensors.sensor_names[0], 'TestSensor')
@@ -595,6 +1097,436 @@ class ServerTest(unittest.TestCase):
         readings = sensor.getReadings()
         self.assertEqual(readings['counter']['value'], count+1)
 
+    def test_leaderboard_ranking(self):
+        rand = random.Random(5)
+        def make_row():
+            laps = rand.randint(0, 4)
+            return {'laps': laps, 'total_time_raw': rand.choice((0, 9000, 12000, 12000.5)) * (laps + 1),
+                    'fastest_lap_raw': rand.choice((0, 3000, 3500)), 'consecutives_raw': rand.choice((None, 9000, 9500)),
+                    'consecutives_base': min(laps, 3)}
+        rows = [make_row() for _idx in range(12)]
+        ranking = Results.LeaderboardRanking(3)
+        for row_id, row in enumerate(rows):
+            ranking.set_row(row_id, row, row_id)
+        for _step in range(100):
+            # single-row updates keep the order and positions of a full rank
+            for view, rank_fn in Results.LEADERBOARD_VIEW_RANKERS:
+                ordered_rows, positions = rank_fn(rows, 3)
+                self.assertEqual([id(row) for row in ranking.ordered_rows(view)], [id(row) for row in ordered_rows])
+                self.assertEqual(ranking.positions(view), positions)
+            row_id = rand.randrange(len(rows))
+            rows[row_id] = make_row()
+            ranking.set_row(row_id, rows[row_id], row_id)
+
+    def test_leaderboard_build_incremental(self):
+        def make_result(rows):
+            result = {}
+            for view, rank_fn in Results.LEADERBOARD_VIEW_RANKERS:
+                ordered_rows, positions = rank_fn(rows, 3)
+                result[view] = Results.materialize_view(view, ordered_rows, positions)
+            result['meta'] = {'primary_leaderboard': 'by_race_time', 'consecutives_count': 3}
+            return result
+
+        def make_row(pilot_id, laps, total, fastest, heat_id):
+            source = {'round': 1, 'heat': heat_id, 'displayname': 'Heat'}
+            return {
+                'pilot_id': pilot_id, 'callsign': str(pilot_id), 'laps': laps, 'starts': 1,
+                'total_time_raw': total, 'total_time_laps_raw': total, 'average_lap_raw': total / laps,
+                'fastest_lap_raw': fastest, 'consecutives_raw': None, 'consecutives_base': 0,
+                'consecutive_lap_start': None, 'fastest_lap_source': source, 'consecutives_source': source,
+            }
+
+        heat_a = make_result([make_row(1, 3, 90.0, 28.0, 1), make_row(2, 2, 70.0, 31.0, 1)])
+        heat_b = make_result([make_row(2, 3, 80.0, 25.0, 2), make_row(3, 1, 40.0, 40.0, 2)])
+        self.assertEqual([row['pilot_id'] for row in heat_a['by_race_time']], [1, 2])
+        self.assertEqual([row['pilot_id'] for row in heat_a['by_fastest_lap']], [1, 2])
+        self.assertEqual(heat_a['by_race_time'][1]['behind'], 1)
+        self.assertIsNot(heat_a['by_race_time'][0], heat_a['by_fastest_lap'][0])
+        snapshot = json.dumps([heat_a, heat_b])
+
+        merged = Results.build_incremental(server.RaceContext, heat_b, heat_a)
+        self.assertEqual(json.dumps([heat_a, heat_b]), snapshot)  # inputs are not modified
+        by_race_time = merged['by_race_time']
+        self.assertEqual([row['pilot_id'] for row in by_race_time], [2, 1, 3])
+        self.assertEqual(by_race_time[0]['laps'], 5)
+        self.assertEqual(by_race_time[0]['position'], 1)
+        self.assertEqual(merged['by_fastest_lap'][0]['pilot_id'], 2)
+        self.assertEqual(merged['by_fastest_lap'][0]['fastest_lap_source']['heat'], 2)
+
+    def test_resave_laps(self):
+        rhdata = server.RaceContext.rhdata
+        heat = rhdata.get_first_heat()
+        pilots = rhdata.get_pilots()[:2]
+        num_races = len(rhdata.get_savedRaceMetas())
+        race = rhdata.add_savedRaceMeta({'round_id': 1, 'heat_id': heat.id, 'class_id': heat.class_id,
+            'format_id': server.RaceContext.race.format.id, 'start_time': 0, 'start_time_formatted': ''})
+        try:
+            race_data = {}
+            for seat, pilot in enumerate(pilots):
+                race_data[seat] = {'race_id': race.id, 'pilot_id': pilot.id, 'history_values': '[]', 'history_times': '[]',
+                    'enter_at': 0, 'exit_at': 0, 'frequency': 0, 'laps': [server.RHRace.Crossing(
+                        lap_time_stamp=(idx + 1) * 10000.0, lap_time=10000.0 + seat * 500 * idx,
+                        lap_time_formatted='', source=0, deleted=False, peak_rssi=100) for idx in range(4)]}
+            rhdata.add_race_data(race_data)
+            pilotrace = rhdata.get_savedPilotRaces_by_savedRaceMeta(race.id)[1]
+            laps = [{field: getattr(lap, field) for field in rhdata.SAVED_RACE_LAP_FIELDS}
+                    for lap in rhdata.get_savedRaceLaps_by_savedPilotRace(pilotrace.id)]
+            lap_data = {'race_id': race.id, 'pilotrace_id': pilotrace.id, 'node_index': 1, 'pilot_id': pilotrace.pilot_id,
+                        'laps': laps}
+            previous_results = rhdata.get_results_savedRaceMeta(race)
+
+            self.assertEqual(rhdata.replace_savedRaceLaps(lap_data), set())
+            laps[0]['peak_rssi'] = 90
+            self.assertEqual(rhdata.replace_savedRaceLaps(lap_data), {'peak_rssi'})
+            laps[2]['lap_time'] = 8000.0
+            laps[3]['deleted'] = True
+            self.assertEqual(rhdata.replace_savedRaceLaps(lap_data), {'lap_time', 'deleted'})
+
+            # rebuilding the edited seat matches a full rebuild
+            results = rhdata.rebuild_results_savedRaceMeta_seats(race, [1], previous_results)
+            self.assertNotEqual(results, previous_results)
+            rhdata.clear_results_savedRaceMeta(race)
+            self.assertEqual(rhdata.get_results_savedRaceMeta(race), results)
+        finally:
+            self.delete_saved_race(race)
+        self.assertEqual(len(rhdata.get_savedRaceMetas()), num_races)
+
+    def test_class_rank_incremental(self):
+        rhapi = server.RHAPI
+        rhdata = server.RaceContext.rhdata
+        race_format = server.RaceContext.race.format
+        race_class = rhapi.db.raceclass_add(name='Ranked', raceformat=race_format.id)
+        heat = rhapi.db.heat_add(raceclass=race_class.id)
+        pilots = rhdata.get_pilots()[:2]
+
+        def add_race(round_id, lap_times):
+            race = rhdata.add_savedRaceMeta({'round_id': round_id, 'heat_id': heat.id, 'class_id': race_class.id,
+                'format_id': race_format.id, 'start_time': 0, 'start_time_formatted': ''})
+            rhdata.add_race_data({seat: {'race_id': race.id, 'pilot_id': pilot.id, 'history_values': '[]',
+                'history_times': '[]', 'enter_at': 0, 'exit_at': 0, 'frequency': 0, 'laps': [server.RHRace.Crossing(
+                    lap_time_stamp=(idx + 1) * lap_time, lap_time=lap_time, lap_time_formatted='', source=0,
+                    deleted=False, peak_rssi=100) for idx in range(3)]} for seat, (pilot, lap_time) in enumerate(zip(pilots, lap_times))})
+            return race
+
+        try:
+            race_a = add_race(1, (10000.0, 12000.0))
+            race_b = add_race(2, (11000.0, 10500.0))
+            args = {'rounds': 1}
+            changes = Results.RaceClassRankChanges(rhapi, race_class.id)
+            self.assertFalse(changes.update(args))
+            self.assertEqual(set(changes.race_results()), {race_a.id, race_b.id})
+            self.assertTrue(changes.update(args))
+            self.assertEqual(changes.race_results(), {})
+
+            rank_manager = server.RaceContext.raceclass_rank_manager
+            method_name = [name for name, method in rank_manager.methods.items() if method.label == 'Laps/Time: Best X Rounds'][0]
+            ranking, _meta = rank_manager.rank(method_name, race_class, args)
+            self.assertEqual([row['pilot_id'] for row in ranking], [pilots[0].id, pilots[1].id])
+
+            # slow down the second pilot's better race
+            pilotrace = rhdata.get_savedPilotRaces_by_savedRaceMeta(race_b.id)[1]
+            laps = [{field: getattr(lap, field) for field in rhdata.SAVED_RACE_LAP_FIELDS}
+                    for lap in rhdata.get_savedRaceLaps_by_savedPilotRace(pilotrace.id)]
+            laps[2]['lap_time'] = 20000.0
+            rhdata.replace_savedRaceLaps({'race_id': race_b.id, 'pilotrace_id': pilotrace.id, 'node_index': 1,
+                                          'pilot_id': pilotrace.pilot_id, 'laps': laps})
+            rhdata.clear_results_savedRaceMeta(race_b.id)
+            self.assertTrue(changes.update(args))
+            self.assertEqual(set(changes.race_results()), {race_b.id})
+
+            race_class = rhdata.get_raceClass(race_class.id)
+            ranking, _meta = rank_manager.rank(method_name, race_class, args)
+            fresh_ranking, _meta = Results.RaceClassRankManager(rhapi, server.Events).rank(method_name, race_class, args)
+            self.assertEqual(ranking, fresh_ranking)
+            self.assertEqual(ranking[1]['total_time_raw'], 36000.0)
+        finally:
+            for race in rhdata.get_savedRaceMetas_by_raceClass(race_class.id):
+                self.delete_saved_race(race)
+            rhapi.db.heat_delete(heat)
+            rhapi.db.raceclass_delete(race_class)
+
+    def test_class_rank_tie_order(self):
+        rhapi = server.RHAPI
+        rhdata = server.RaceContext.rhdata
+        race_format = server.RaceContext.race.format
+        race_class = rhapi.db.raceclass_add(name='Tied', raceformat=race_format.id)
+        heats = [rhapi.db.heat_add(raceclass=race_class.id) for _ in range(2)]
+        pilots = rhdata.get_pilots()[:2]
+
+        def add_race(heat, lap_times):
+            race = rhdata.add_savedRaceMeta({'round_id': 1, 'heat_id': heat.id, 'class_id': race_class.id,
+                'format_id': race_format.id, 'start_time': 0, 'start_time_formatted': ''})
+            rhdata.add_race_data({seat: {'race_id': race.id, 'pilot_id': pilot.id, 'history_values': '[]',
+                'history_times': '[]', 'enter_at': 0, 'exit_at': 0, 'frequency': 0, 'laps': [server.RHRace.Crossing(
+                    lap_time_stamp=(idx + 1) * lap_time, lap_time=lap_time, lap_time_formatted='', source=0,
+                    deleted=False, peak_rssi=100) for idx in range(3)]} for seat, (pilot, lap_time) in enumerate(zip(pilots, lap_times))})
+            return race
+
+        rank_manager = server.RaceContext.raceclass_rank_manager
+        method_name = [name for name, method in rank_manager.methods.items() if method.label == 'Cumulative Points'][0]
+        try:
+            # second heat is raced first, so race ids run against heat order
+            add_race(heats[1], (11000.0, 10000.0))
+            ranking, _meta = rank_manager.rank(method_name, race_class, {})
+            self.assertEqual([row['pilot_id'] for row in ranking], [pilots[1].id, pilots[0].id])
+
+            # pilots tied on points keep their order in the first heat, whether ranked incrementally or in full
+            add_race(heats[0], (10000.0, 11000.0))
+            ranking, _meta = rank_manager.rank(method_name, race_class, {})
+            fresh_ranking, _meta = Results.RaceClassRankManager(rhapi, server.Events).rank(method_name, race_class, {})
+            self.assertEqual(ranking, fresh_ranking)
+            self.assertEqual([row['pilot_id'] for row in ranking], [pilots[0].id, pilots[1].id])
+        finally:
+            for race in rhdata.get_savedRaceMetas_by_raceClass(race_class.id):
+                self.delete_saved_race(race)
+            for heat in heats:
+                rhapi.db.heat_delete(heat)
+            rhapi.db.raceclass_delete(race_class)
+
+    def test_win_condition_state(self):
+        state = Results.WinConditionState()
+        race_format = server.RHRace.RHRaceFormat(name='test', unlimited_time=1, race_time_sec=0, lap_grace_sec=-1,
+            staging_fixed_tones=0, start_delay_min_ms=0, start_delay_max_ms=0, staging_delay_tones=0,
+            number_laps_win=3, win_condition=server.WinCondition.FIRST_TO_LAP_X,
+            team_racing_mode=server.RHRace.RacingMode.INDIVIDUAL, start_behavior=0, points_method=None)
+        for node_index in (0, 0, 1, 1):
+            state.add_crossing(node_index)
+        self.assertFalse(state.lap_target_reachable(race_format))
+        state.add_crossing(1)
+        self.assertTrue(state.lap_target_reachable(race_format))
+
+        race_format.team_racing_mode = server.RHRace.RacingMode.TEAM_ENABLED
+        race_format.number_laps_win = 6
+        self.assertFalse(state.lap_target_reachable(race_format))  # team laps bounded by all crossings
+        laps = [server.RHRace.Crossing(lap_number=idx) for idx in range(4)]
+        laps[1].deleted = True
+        state.sync({2: laps})  # e.g. after laps are restored
+        self.assertEqual(state.node_crossings[2], 3)
+        self.assertTrue(state.lap_target_reachable(race_format))
+
+        state.reset()
+        self.assertEqual(state.total_crossings, 0)
+
+    def test_win_condition_replay(self):
+        rhapi = server.RHAPI
+        race = server.RaceContext.race
+        nodes = server.RaceContext.interface.nodes
+        profile_freqs = json.loads(race.profile.frequencies)
+        seats = [idx for idx in range(race.num_nodes) if profile_freqs['f'][idx] != RHUtils.FREQUENCY_ID_NONE][:4]
+        heat = rhapi.db.heat_add()
+        slots = {slot.node_index: slot for slot in rhapi.db.slots_by_heat(heat.id)}
+        pilots = [rhapi.db.pilot_add(callsign='Replay {}'.format(idx)) for idx in range(len(seats))]
+        # pilots in reverse seat order, so ties in race order differ from seat order
+        rhapi.db.slots_alter_fast([{'slot_id': slots[seat].id, 'pilot': pilot.id} for seat, pilot in zip(seats, reversed(pilots))])
+        prev_heat = race.current_heat
+        race_format = race.format
+        prev_format = dict(vars(race_format))
+
+        def check(fn, kwargs):
+            try:
+                return fn(server.RaceContext, **kwargs)
+            except TypeError as ex:
+                return type(ex)  # e.g. 'forced' passed again to a forced determination
+
+        decisions = 0
+        try:
+            for trial in range(60):
+                rand = random.Random(trial)
+                race.race_status = server.RaceStatus.READY  # heat is only set while the race is ready
+                race.set_heat(RHUtils.HEAT_ID_NONE if trial % 4 == 3 else heat.id, silent=True)
+                race_format.win_condition = rand.choice(Results.WIN_STATE_CONDITIONS)
+                race_format.team_racing_mode = server.RHRace.RacingMode.INDIVIDUAL
+                race_format.start_behavior = rand.choice((server.RHRace.StartBehavior.HOLESHOT,
+                    server.RHRace.StartBehavior.FIRST_LAP, server.RHRace.StartBehavior.STAGGERED))
+                race_format.number_laps_win = rand.choice((0, 1, 3, 5))
+                race_format.race_time_sec = rand.choice((20, 40))
+                race.clear_laps()
+                race.race_status = server.RaceStatus.RACING
+                race.timer_running = True
+                race.node_has_finished = {seat: False for seat in seats}
+                race_nodes = [idx for idx in range(race.num_nodes) if profile_freqs['f'][idx] != RHUtils.FREQUENCY_ID_NONE] \
+                             if race.current_heat == RHUtils.HEAT_ID_NONE else seats
+                stamps = dict.fromkeys(race_nodes, 0)
+
+                for _step in range(rand.randint(10, 40)):
+                    event = rand.random()
+                    node_index = rand.choice(race_nodes)
+                    laps = race.node_laps[node_index]
+                    if event < 0.7:
+                        lap_time = rand.choice((3000, 4000, 5000, 5000.5))
+                        stamps[node_index] += lap_time
+                        laps.append(server.RHRace.Crossing(lap_number=len(laps), lap_time_stamp=stamps[node_index],
+                                                           lap_time=lap_time))
+                        race.win_state.add_crossing(node_index, lap_time)
+                    elif event < 0.78 and laps:
+                        rand.choice(laps).deleted = True
+                        race.win_state.sync(race.node_laps)
+                    elif event < 0.84 and laps:
+                        rand.choice(laps).deleted = False
+                        race.win_state.sync(race.node_laps)
+                    elif event < 0.92:
+                        race.set_node_finished_flag(rand.choice(seats))
+                    elif race.timer_running:
+                        race.timer_running = False
+                    elif event > 0.97:
+                        race.race_status = server.RaceStatus.DONE
+                    for node in nodes:
+                        node.pass_crossing_flag = rand.random() < 0.1
+
+                    race.clear_results()
+                    race.get_results()
+                    self.assertTrue(race.win_state.ready(server.RaceContext))
+                    for kwargs in ({}, {'forced': True}, {'at_finish': True}, {'deletedLap': True}):
+                        result = check(Results.check_win_condition_result, kwargs)
+                        self.assertEqual(result, check(Results.check_win_condition_leaderboard, kwargs),
+                                         'trial {} kwargs {}'.format(trial, kwargs))
+                        if isinstance(result, dict) and result['status'] != server.RHRace.WinStatus.NONE:
+                            decisions += 1
+            self.assertGreater(decisions, 100)
+        finally:
+            for node in nodes:
+                node.pass_crossing_flag = False
+            vars(race_format).update(prev_format)
+            race.race_status = server.RaceStatus.READY
+            race.timer_running = False
+            race.set_heat(prev_heat, silent=True)
+            race.clear_laps()
+            rhapi.db.heat_delete(heat.id)
+
+    def test_team_aggregates(self):
+        race_format = server.RHRace.RHRaceFormat(name='test', unlimited_time=1, race_time_sec=0, lap_grace_sec=-1,
+            staging_fixed_tones=0, start_delay_min_ms=0, start_delay_max_ms=0, staging_delay_tones=0,
+            number_laps_win=0, win_condition=server.WinCondition.MOST_LAPS,
+            team_racing_mode=server.RHRace.RacingMode.TEAM_ENABLED, start_behavior=0, points_method=None)
+        def line(node, team, laps, total):
+            return {'pilot_id': node + 1, 'node': node, 'team_name': team, 'laps': laps,
+                    'total_time_raw': total, 'total_time': str(total),
+                    'average_lap_raw': total / laps if laps else 0, 'fastest_lap_raw': total / laps if laps else 0,
+                    'consecutives_raw': total if laps else None, 'consecutives_base': laps}
+        def full_sums(results):
+            return {team: Results.sum_team_lines([l for l in results if l['team_name'] == team], race_format, 3)
+                    for team in dict.fromkeys(l['team_name'] for l in results)}
+        results = [line(0, 'A', 2, 20000), line(2, 'A', 1, 9000), line(1, 'B', 1, 11000)]
+        aggregates = Results.TeamAggregates()
+        teams, leaderboard = aggregates.build(results, race_format, 3, '{m}:{s}.{d}')
+        self.assertEqual(list(teams), ['A', 'B'])
+        self.assertEqual((teams['A']['laps'], teams['A']['members']), (3, 2))
+        self.assertEqual(teams, full_sums(results))
+
+        # only the changed seat's line is read again, and only its team summed again
+        row_b = leaderboard[1]
+        results = [line(0, 'A', 3, 30000)] + results[1:]
+        aggregates.results_built(results, {0})
+        teams, leaderboard = aggregates.build(results, race_format, 3, '{m}:{s}.{d}')
+        self.assertEqual(teams['A']['laps'], 4)
+        self.assertIs(leaderboard[1], row_b)
+        self.assertEqual(leaderboard[0]['laps'], 4)
+        self.assertEqual(teams, full_sums(results))
+
+        coop_sums, coop_row = aggregates.build_coop(results, race_format, '{m}:{s}.{d}')
+        self.assertEqual((coop_sums, coop_row), Results.coop_leaderboard_row(results, race_format, '{m}:{s}.{d}'))
+        self.assertEqual(coop_row['laps'], 5)
+        coop_row['laps'] = 0  # callers get copies
+        self.assertEqual(aggregates.build_coop(results, race_format, '{m}:{s}.{d}')[1]['laps'], 5)
+
+        # lines moving between teams, and results lines not reported, are read in full
+        results = [line(0, 'A', 3, 30000), line(1, 'A', 2, 21000), line(2, 'B', 1, 9000)]
+        teams, leaderboard = aggregates.build(results, race_format, 3, '{m}:{s}.{d}')
+        self.assertEqual(teams, full_sums(results))
+        self.assertEqual(aggregates.build_coop(results, race_format, '{m}:{s}.{d}'),
+                         Results.coop_leaderboard_row(results, race_format, '{m}:{s}.{d}'))
+
+        # sums kept from lap differences equal sums of the lines, in any order
+        random.seed(44)
+        for _trial in range(200):
+            seat = random.randrange(6)
+            laps = random.randrange(5)
+            results = [l for l in results if l['node'] != seat] + \
+                [line(seat, random.choice('ABC'), laps, random.uniform(1000, 90000) if laps else 0)]
+            results.sort(key=lambda l: (-l['laps'], l['total_time_raw'] or float('inf')))
+            aggregates.results_built(results, {seat} if random.random() < 0.9 else None)
+            teams, leaderboard = aggregates.build(results, race_format, 3, '{m}:{s}.{d}')
+            self.assertEqual(teams, full_sums(results))
+            self.assertEqual(aggregates.build_coop(results, race_format, '{m}:{s}.{d}'),
+                             Results.coop_leaderboard_row(results, race_format, '{m}:{s}.{d}'))
+
+    def test_gap_tracker(self):
+        race_format = server.RHRace.RHRaceFormat(name='test', unlimited_time=1, race_time_sec=0, lap_grace_sec=-1,
+            staging_fixed_tones=0, start_delay_min_ms=0, start_delay_max_ms=0, staging_delay_tones=0,
+            number_laps_win=0, win_condition=server.WinCondition.MOST_LAPS,
+            team_racing_mode=server.RHRace.RacingMode.INDIVIDUAL, start_behavior=server.RHRace.StartBehavior.HOLESHOT,
+            points_method=None)
+        tracker = Results.GapTracker()
+        node_laps = {0: [], 1: [], 2: []}
+        def cross(node_index, lap_time):
+            lap = server.RHRace.Crossing(lap_number=len(node_laps[node_index]), lap_time=lap_time)
+            node_laps[node_index].append(lap)
+            tracker.add_crossing(node_index, lap, node_index + 10, 'P{}'.format(node_index))
+        for node_index, lap_time in ((0, 2000), (1, 1500), (2, 1800), (0, 6000), (1, 5000), (2, 5000), (1, 4000)):
+            cross(node_index, lap_time)
+
+        result, ahead, leader = tracker.gap_rows(0, 'by_race_time', race_format, 3)
+        self.assertEqual((result['position'], result['laps'], result['total_time_raw']), (3, 1, 8000))
+        self.assertEqual((ahead['node'], ahead['position']), (2, 2))
+        self.assertEqual((leader['callsign'], leader['laps']), ('P1', 2))
+        self.assertIsNone(tracker.gap_rows(1, 'by_race_time', race_format, 3)[1])
+        result, ahead, _leader = tracker.gap_rows(2, 'by_fastest_lap', race_format, 3)
+        self.assertEqual((result['position'], ahead['node'], ahead['fastest_lap_raw']), (2, 1, 4000))
+
+        # deleted laps are re-read
+        node_laps[1][2].deleted = True
+        tracker.sync(node_laps)
+        result, ahead, leader = tracker.gap_rows(0, 'by_race_time', race_format, 3)
+        self.assertEqual((result['position'], ahead['node'], leader['node']), (3, 2, 1))
+
+        tracker.add_crossing(2, node_laps[2][0], 10, 'P0', has_line=False)
+        self.assertIsNone(tracker.gap_rows(0, 'by_race_time', race_format, 3))
+        tracker.reset()
+        self.assertIsNone(tracker.gap_rows(0, 'by_race_time', race_format, 3))
+
+    def test_time_format(self):
+        self.assertEqual(RHUtils.format_time_to_str(83456.6), '1:23.457')
+        self.assertEqual(RHUtils.format_time_to_str(5007, '{s}.{d}s'), '05.007s')
+        self.assertEqual(RHUtils.format_time_to_str(65007, '{s}s {m}m 100%'), '05s 1m 100%')
+        self.assertEqual(RHUtils.format_time_to_str(None), '')
+        self.assertEqual(RHUtils.format_split_time_to_str(5007), '5.007')
+        self.assertEqual(RHUtils.format_phonetic_time_to_str(5079), ' 5.0')
+        self.assertEqual(RHUtils.format_phonetic_time_to_str(65999), '1 05.9')
+        self.assertEqual(RHUtils.format_phonetic_time_to_str(65999, '{s} {m}'), '05 1')
+        self.assertIs(RHUtils.compile_time_format('{m}:{s}.{d}'), RHUtils.compile_time_format('{m}:{s}.{d}'))
+        self.assertEqual(RHUtils.format_times_to_str([61000, None, 999.6], '{m}:{s}.{d}'), ['1:01.000', '', '0:01.000'])
+        self.assertEqual(RHUtils.format_phonetic_times_to_str([61000, ''], '{m} {s}.{d}'), ['1 01.0', ''])
+        # templates beyond plain fields still format as str.format() does
+        self.assertEqual(RHUtils.format_time_to_str(61000, '{m:>3}:{s}'), '  1:01')
+        with self.assertRaises(KeyError):
+            RHUtils.format_time_to_str(61000, '{x}')
+
+    def test_led_panel_map(self):
+        # two 2x2 panels, even rows reversed
+        panel_map = PanelMap(8, 2, panel_rotate=0, inverted_rows=True, panel_count=2)
+        self.assertEqual((panel_map.width, panel_map.height), (4, 2))
+        self.assertEqual(panel_map.index_map, [1, 0, 4, 5, 3, 2, 6, 7])
+
+        try:
+            from PIL import Image
+        except ModuleNotFoundError:
+            return
+
+        # must match rotating the image and walking it row by row
+        for rotate in range(4):
+            for inverted in (False, True):
+                panel_map = PanelMap(24, 4, panel_rotate=rotate, inverted_rows=inverted)
+                img = Image.new('RGB', (panel_map.width, panel_map.height))
+                img.putdata([(idx, 255 - idx, idx * 3 % 256) for idx in range(24)])
+                rotated = img.rotate(90 * rotate, expand=True)
+                expected = []
+                for row in range(rotated.height):
+                    for col in range(rotated.width):
+                        c = (rotated.width - 1) - col if inverted and row % 2 == 0 else col
+                        px = rotated.getpixel((c, row))
+                        expected.append((px[0] << 16) | (px[1] << 8) | px[2])
+                self.assertEqual(panel_map.frame(img), expected)
+
         
 if __name__ == '__main__':
     unittest.main()